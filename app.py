@@ -1,20 +1,22 @@
 # app.py (mantener el original pero actualizar los imports)
-import io
+# Perfil de arranque: primero, para que sus fases cuenten desde aquí
+from modbus_app.startup import phase, mark, start_warm_up
 import sys
 import threading
 import time
 from collections import deque
-from flask import Flask, render_template, request, jsonify
+with phase("import.flask"):
+    from flask import Flask, render_template, request, jsonify
 
 # Importar sistema de logging centralizado
-from modbus_app.logger_config import setup_logging, log_to_cmd
+from modbus_app.logger_config import setup_logging, log_to_cmd, ConsoleCapturer
 
 # Configurar el sistema de logging y obtener el buffer de consola
-console_messages = setup_logging()
+with phase("logging"):
+    console_messages = setup_logging()
 
 # Import original modules
-from modbus_app.battery_monitor import BatteryMonitor
-from modbus_app.battery_initializer import BatteryInitializer
+# (la pila serie, SQLite, NumPy y el historial se cargan al usarlos o en start_warm_up)
 from modbus_app.authentication_status import (
     format_all_batteries_status_for_api,
     format_battery_status_for_api,
@@ -27,39 +29,34 @@ from modbus_app.authentication_status import (
 # Initialize Flask app
 app = Flask(__name__)
 
-# Clase para capturar salida stdout (mantenida por compatibilidad)
-class ConsoleCapturer(io.StringIO):
-    def write(self, text):
-        if text.strip():  # Ignorar líneas vacías
-            console_messages.append(text.rstrip())
-        return super().write(text)
-
 # Verificar si ya se ha reemplazado stdout
 if not isinstance(sys.stdout, ConsoleCapturer):
     # Guardar stdout original
     original_stdout = sys.stdout
     # Reemplazar sys.stdout para capturar todos los print()
-    sys.stdout = ConsoleCapturer()
+    sys.stdout = ConsoleCapturer(console_messages)
 
 # Mensaje de inicio
 log_to_cmd("Aplicación Modbus RTU iniciada", "INFO", "APP")
 
-# Create battery monitor instance
-battery_monitor = BatteryMonitor()
-
 # Option 1: Keep all routes in app.py for now (easiest way to keep it working)
 # ...existing route handlers...
 
 # Option 2: Load routes from modular structure
 try:
     # Import routes from new structure
-    from modbus_app.routes import register_routes
-    # Register all routes with the app
-    register_routes(app)
+    with phase("routes"):
+        from modbus_app.routes import register_routes
+        # Register all routes with the app
+        register_routes(app)
+    # Instancia única del monitor: la de las rutas
+    from modbus_app.routes.battery_routes import battery_monitor
     log_to_cmd("Rutas cargadas desde estructura modular", "INFO", "APP")
 except ImportError as e:
     log_to_cmd(f"Error al cargar rutas modulares: {e}", "ERROR", "APP")
     log_to_cmd("Usando rutas integradas", "WARNING", "APP")
+    # Sin rutas modulares no hay monitor: el calentamiento carga el resto sin él
+    battery_monitor = None
     # Keep using the original routes (backup option)
     # ...original route handlers...
 
@@ -69,7 +66,15 @@ def index():
     """Serve the main page."""
     return render_template('index.html')
 
+mark("app_ready")
+
 if __name__ == '__main__':
+    import os
+    DEBUG = True  # False for production (o usar serve.py)
     # Make sure the path to your templates and static files is correct
     log_to_cmd("Iniciando servidor Flask", "INFO", "APP")
-    app.run(host='0.0.0.0', port=5000, debug=True)  # debug=False for production
\ No newline at end of file
+    # Pila serie, SQLite, historial (incluida la retención programada) y analítica en
+    # segundo plano; con el recargador, solo en el proceso que sirve
+    if not DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warm_up(battery_monitor)
+    app.run(host='0.0.0.0', port=5000, debug=DEBUG)
\ No newline at end of file
@@ -1,9 +1,21 @@
 # modbus_app/__init__.py
 
-# Import key modules to make them accessible via modbus_app
-from . import config_manager
-from . import client
-from . import operations
-from . import authentication_status
-from . import battery_initializer
-from . import device_info
\ No newline at end of file
+# Módulos clave accesibles como atributos (modbus_app.client, ...). Se importan al
+# primer acceso: importar cualquier submódulo ligero (logger_config, metrics) no
+# arrastra la pila serie ni el cliente Modbus.
+import importlib
+
+_LAZY_SUBMODULES = (
+    "config_manager",
+    "client",
+    "operations",
+    "authentication_status",
+    "battery_initializer",
+    "device_info"
+)
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,406 @@
+# modbus_app/alarms.py
+"""
+Motor de alarmas evaluado sobre cada lectura de polling.
+
+Las reglas se definen en la sección `alarms` de config.json y se compilan una vez:
+
+- threshold: valor comparado con un umbral ("current" < -50).
+- rate: variación por `per_seconds` frente a la lectura anterior ("pack_voltage"
+  cae más de 0.5 V por minuto).
+- bitmask: bits activos en una palabra de estado (0x0046/0x0048/0x0049/0x004A).
+
+Cualquier regla admite `for_seconds` (la condición debe mantenerse ese tiempo antes
+de disparar) y `batteries` (lista de IDs; por defecto todas).
+
+La evaluación es incremental: cada par regla-batería guarda un estado de tamaño fijo
+(activa, desde cuándo se cumple, último valor) y por lectura solo se evalúan las reglas
+de los campos presentes. Una alarma se eleva una sola vez mientras siga activa y se
+cierra cuando la condición deja de cumplirse. Los eventos van al flujo en vivo
+(/api/alarms/events) y a la consola de inmediato, y a la tabla `alarm_events` a través
+de una cola que vacía un hilo propio, sin bloquear el polling.
+"""
+
+import operator
+import queue
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from modbus_app.logger_config import log_to_cmd, ConsoleBuffer
+
+logger = logging.getLogger('modbus_app.alarms')
+
+ALARM_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS alarm_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        battery_id INTEGER NOT NULL,
+        rule_id TEXT NOT NULL,
+        severity TEXT,
+        message TEXT,
+        value REAL,
+        raised_at DATETIME NOT NULL,
+        cleared_at DATETIME,
+        clear_value REAL
+    )
+"""
+ALARM_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_alarm_events_battery ON alarm_events(battery_id, raised_at)",
+    "CREATE INDEX IF NOT EXISTS idx_alarm_events_active ON alarm_events(cleared_at) WHERE cleared_at IS NULL"
+]
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne
+}
+RULE_TYPES = ("threshold", "rate", "bitmask")
+SEVERITIES = ("INFO", "WARNING", "CRITICAL")
+
+# Campos de las palabras de estado (columnas de historial del grupo "faults")
+FAULT_FIELDS = ("hardware_faults", "sensor_status", "operation_mode", "subsystem_status")
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    # Lectura de las palabras de estado en el polling (solo si hay reglas bitmask)
+    "fault_poll_interval_seconds": 60,
+    "live_events": 500,
+    "rules": []
+}
+
+
+class AlarmRuleError(ValueError):
+    """Definición de regla no válida."""
+
+
+class AlarmRule:
+    """Regla compilada: la condición se resuelve en una sola llamada por lectura."""
+
+    __slots__ = ('index', 'id', 'type', 'field', 'severity', 'message', 'for_seconds',
+                 'per_seconds', 'batteries', '_compare', '_threshold', '_mask', '_expected')
+
+    def __init__(self, index: int, spec: Dict[str, Any]):
+        self.index = index
+        self.id = spec.get("id") or f"rule_{index}"
+        self.type = spec.get("type", "threshold")
+        if self.type not in RULE_TYPES:
+            raise AlarmRuleError(f"Regla '{self.id}': tipo desconocido '{self.type}'")
+        self.field = spec.get("field")
+        if not self.field:
+            raise AlarmRuleError(f"Regla '{self.id}': falta 'field'")
+        self.severity = str(spec.get("severity", "WARNING")).upper()
+        if self.severity not in SEVERITIES:
+            raise AlarmRuleError(f"Regla '{self.id}': severidad desconocida '{self.severity}'")
+        self.message = spec.get("message") or self.id
+        self.for_seconds = float(spec.get("for_seconds", 0))
+        self.per_seconds = float(spec.get("per_seconds", 60))
+        self.batteries = frozenset(spec["batteries"]) if spec.get("batteries") else None
+
+        self._compare = self._threshold = self._mask = self._expected = None
+        if self.type == "bitmask":
+            self._mask = _integer(spec.get("mask", 0xFFFF))
+            # Sin 'equals': basta con cualquier bit de la máscara activo
+            self._expected = _integer(spec["equals"]) if "equals" in spec else None
+        else:
+            op = spec.get("op", ">")
+            if op not in OPERATORS or "value" not in spec:
+                raise AlarmRuleError(f"Regla '{self.id}': se requieren 'op' válido y 'value'")
+            self._compare = OPERATORS[op]
+            self._threshold = float(spec["value"])
+
+    def test(self, value, state: list, timestamp: float) -> Optional[bool]:
+        """Condición de la regla para una lectura (None si no se puede evaluar aún)."""
+        if self.type == "bitmask":
+            bits = int(value) & self._mask
+            return bits != 0 if self._expected is None else bits == self._expected
+        if self.type == "threshold":
+            return self._compare(value, self._threshold)
+        # rate: variación escalada a per_seconds frente a la lectura anterior
+        last_value, last_time = state[STATE_LAST_VALUE], state[STATE_LAST_TIME]
+        state[STATE_LAST_VALUE], state[STATE_LAST_TIME] = value, timestamp
+        if last_time is None or timestamp <= last_time:
+            return None
+        return self._compare((value - last_value) * self.per_seconds / (timestamp - last_time),
+                             self._threshold)
+
+    def describe(self) -> Dict[str, Any]:
+        data = {"id": self.id, "type": self.type, "field": self.field, "severity": self.severity,
+                "message": self.message, "for_seconds": self.for_seconds}
+        if self.type == "bitmask":
+            data["mask"] = f"0x{self._mask:04X}"
+            if self._expected is not None:
+                data["equals"] = f"0x{self._expected:04X}"
+        else:
+            data["threshold"] = self._threshold
+            if self.type == "rate":
+                data["per_seconds"] = self.per_seconds
+        if self.batteries is not None:
+            data["batteries"] = sorted(self.batteries)
+        return data
+
+
+def _integer(value) -> int:
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+# Posiciones del estado por par regla-batería (lista de tamaño fijo)
+STATE_ACTIVE, STATE_SINCE, STATE_LAST_VALUE, STATE_LAST_TIME, STATE_EVENT = range(5)
+
+
+class AlarmEngine:
+    """Evalúa las reglas compiladas sobre las lecturas y emite eventos deduplicados."""
+
+    def __init__(self, rules: List[Dict[str, Any]], live_events: int = 500):
+        self.rules = []
+        self._by_field = {}
+        for index, spec in enumerate(rules):
+            try:
+                rule = AlarmRule(index, spec)
+            except (AlarmRuleError, KeyError, TypeError, ValueError) as e:
+                log_to_cmd(f"ALARMAS: Regla ignorada: {str(e)}", "WARNING", "ALARMS")
+                continue
+            self.rules.append(rule)
+            self._by_field.setdefault(rule.field, []).append(rule)
+        self._state = {}  # (índice de regla, battery_id) -> estado
+        self._active = {}  # (rule_id, battery_id) -> evento
+        self.events = ConsoleBuffer(maxlen=live_events)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+        self.stats = {"samples": 0, "evaluations": 0, "raised": 0, "cleared": 0}
+        self.fault_poll_interval = DEFAULT_SETTINGS["fault_poll_interval_seconds"]
+
+    @property
+    def fields(self) -> frozenset:
+        return frozenset(self._by_field)
+
+    # ==================== EVALUACIÓN ====================
+
+    def evaluate(self, battery_id: int, sample: Dict[str, Any], timestamp: float = None) -> int:
+        """
+        Evalúa una lectura de una batería. Devuelve el número de eventos emitidos.
+        """
+        timestamp = timestamp or time.time()
+        emitted = 0
+        with self._lock:
+            self.stats["samples"] += 1
+            for field, value in sample.items():
+                rules = self._by_field.get(field)
+                if not rules or value is None or isinstance(value, str):
+                    continue
+                for rule in rules:
+                    if rule.batteries is not None and battery_id not in rule.batteries:
+                        continue
+                    self.stats["evaluations"] += 1
+                    key = (rule.index, battery_id)
+                    state = self._state.get(key)
+                    if state is None:
+                        state = self._state[key] = [False, None, None, None, None]
+                    condition = rule.test(value, state, timestamp)
+                    if condition is None:
+                        continue
+                    if condition:
+                        if state[STATE_SINCE] is None:
+                            state[STATE_SINCE] = timestamp
+                        if not state[STATE_ACTIVE] and timestamp - state[STATE_SINCE] >= rule.for_seconds:
+                            state[STATE_ACTIVE] = True
+                            state[STATE_EVENT] = self._raise(rule, battery_id, value, timestamp)
+                            emitted += 1
+                    else:
+                        state[STATE_SINCE] = None
+                        if state[STATE_ACTIVE]:
+                            state[STATE_ACTIVE] = False
+                            self._clear(rule, battery_id, value, timestamp, state[STATE_EVENT])
+                            state[STATE_EVENT] = None
+                            emitted += 1
+        return emitted
+
+    def _raise(self, rule: AlarmRule, battery_id: int, value, timestamp: float) -> Dict[str, Any]:
+        event = {
+            "event": "raised",
+            "rule_id": rule.id,
+            "battery_id": battery_id,
+            "severity": rule.severity,
+            "message": rule.message,
+            "value": value,
+            "timestamp": datetime.fromtimestamp(timestamp).isoformat(timespec='seconds'),
+            "db_id": None
+        }
+        self._active[(rule.id, battery_id)] = event
+        self.stats["raised"] += 1
+        self.events.append(dict(event))
+        self._queue.put(("raise", event))
+        log_to_cmd(f"ALARMA [{rule.severity}] batería {battery_id}: {rule.message} (valor={value})",
+                   "CRITICAL" if rule.severity == "CRITICAL" else "WARNING", "ALARMS")
+        return event
+
+    def _clear(self, rule: AlarmRule, battery_id: int, value, timestamp: float, raised: Optional[Dict]):
+        self._active.pop((rule.id, battery_id), None)
+        self.stats["cleared"] += 1
+        event = {
+            "event": "cleared",
+            "rule_id": rule.id,
+            "battery_id": battery_id,
+            "severity": rule.severity,
+            "message": rule.message,
+            "value": value,
+            "timestamp": datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+        }
+        self.events.append(event)
+        self._queue.put(("clear", dict(event, raised=raised)))
+        log_to_cmd(f"ALARMA despejada batería {battery_id}: {rule.message} (valor={value})", "INFO", "ALARMS")
+
+    # ==================== PERSISTENCIA ====================
+
+    def restore_active(self):
+        """
+        Recupera las alarmas sin cerrar de la tabla para no duplicarlas tras reiniciar:
+        la condición se considera activa hasta que una lectura la despeje.
+        """
+        from modbus_app.history.database import get_db
+        by_id = {rule.id: rule for rule in self.rules}
+        try:
+            with get_db().get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, battery_id, rule_id, severity, message, value, raised_at "
+                    "FROM alarm_events WHERE cleared_at IS NULL"
+                ).fetchall()
+        except Exception as e:
+            logger.warning(f"No se pudieron recuperar alarmas activas: {str(e)}")
+            return 0
+        restored = 0
+        with self._lock:
+            for row in rows:
+                rule = by_id.get(row["rule_id"])
+                if rule is None:
+                    continue
+                event = {"event": "raised", "rule_id": row["rule_id"], "battery_id": row["battery_id"],
+                         "severity": row["severity"], "message": row["message"], "value": row["value"],
+                         "timestamp": str(row["raised_at"]), "db_id": row["id"]}
+                self._active[(rule.id, row["battery_id"])] = event
+                self._state[(rule.index, row["battery_id"])] = [True, None, None, None, event]
+                restored += 1
+        return restored
+
+    def start(self):
+        """Arranca el hilo que persiste los eventos."""
+        if self._writer and self._writer.is_alive():
+            return
+        self._writer = threading.Thread(target=self._writer_worker, name="alarm-writer", daemon=True)
+        self._writer.start()
+
+    def _writer_worker(self):
+        while True:
+            kind, event = self._queue.get()
+            try:
+                self._persist(kind, event)
+            except Exception as e:
+                logger.error(f"Error guardando evento de alarma: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _persist(self, kind: str, event: Dict[str, Any]):
+        from modbus_app.history.database import get_db
+        with get_db().get_connection() as conn:
+            if kind == "raise":
+                cursor = conn.execute(
+                    "INSERT INTO alarm_events (battery_id, rule_id, severity, message, value, raised_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (event["battery_id"], event["rule_id"], event["severity"], event["message"],
+                     event["value"], event["timestamp"].replace('T', ' '))
+                )
+                event["db_id"] = cursor.lastrowid
+            else:
+                raised = event.get("raised") or {}
+                if raised.get("db_id") is not None:
+                    conn.execute("UPDATE alarm_events SET cleared_at = ?, clear_value = ? WHERE id = ?",
+                                 (event["timestamp"].replace('T', ' '), event["value"], raised["db_id"]))
+                else:
+                    conn.execute(
+                        "UPDATE alarm_events SET cleared_at = ?, clear_value = ? "
+                        "WHERE battery_id = ? AND rule_id = ? AND cleared_at IS NULL",
+                        (event["timestamp"].replace('T', ' '), event["value"],
+                         event["battery_id"], event["rule_id"])
+                    )
+            conn.commit()
+
+    def flush(self, timeout: float = None):
+        """Espera a que se persistan los eventos pendientes (si el hilo está activo)."""
+        if self._writer and self._writer.is_alive():
+            deadline = time.time() + timeout if timeout else None
+            while self._queue.unfinished_tasks and (deadline is None or time.time() < deadline):
+                time.sleep(0.01)
+
+    # ==================== CONSULTAS ====================
+
+    def get_active(self, battery_id: int = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(event) for (_, bid), event in self._active.items()
+                    if battery_id is None or bid == battery_id]
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rules": [rule.describe() for rule in self.rules],
+                "tracked_pairs": len(self._state),
+                "active_count": len(self._active),
+                "pending_writes": self._queue.qsize(),
+                "stats": dict(self.stats)
+            }
+
+
+def get_history(battery_id: int = None, limit: int = 100, active_only: bool = False) -> List[Dict[str, Any]]:
+    """Eventos guardados en alarm_events, del más reciente al más antiguo."""
+    from modbus_app.history.database import get_db
+    clauses, params = [], []
+    if battery_id is not None:
+        clauses.append("battery_id = ?")
+        params.append(battery_id)
+    if active_only:
+        clauses.append("cleared_at IS NULL")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with get_db().get_connection() as conn:
+        rows = conn.execute(f"SELECT * FROM alarm_events {where} ORDER BY id DESC LIMIT ?",
+                            params + [limit]).fetchall()
+    return [dict(row) for row in rows]
+
+
+def load_settings() -> Dict[str, Any]:
+    """Sección `alarms` de config.json combinada con los valores por defecto."""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        from modbus_app import config_manager
+        settings.update(config_manager.load_config().get("alarms", {}))
+    except Exception as e:
+        logger.warning(f"No se pudo leer la configuración de alarmas: {str(e)}")
+    return settings
+
+
+_engine = None
+_engine_loaded = False
+_engine_lock = threading.Lock()
+
+
+def get_alarm_engine() -> Optional[AlarmEngine]:
+    """Instancia global del motor (None si las alarmas están deshabilitadas)."""
+    global _engine, _engine_loaded
+    if _engine_loaded:
+        return _engine
+    with _engine_lock:
+        if not _engine_loaded:
+            settings = load_settings()
+            _engine_loaded = True
+            if not settings.get("enabled", True):
+                return None
+            engine = AlarmEngine(settings.get("rules", []), settings.get("live_events", 500))
+            engine.fault_poll_interval = float(settings.get("fault_poll_interval_seconds", 60))
+            _engine = engine
+            restored = _engine.restore_active()
+            if restored:
+                log_to_cmd(f"ALARMAS: {restored} alarmas activas recuperadas", "INFO", "ALARMS")
+            _engine.start()
+        return _engine
@@ -10,6 +10,7 @@ import time
 import datetime
 import struct
 from modbus_app.logger_config import log_to_cmd
+from modbus_app.register_schema import get_schema
 
 def run_diagnostics(battery_id, serial_connection):
     """
@@ -133,26 +134,21 @@ def diagnose_battery(battery_id, serial_connection, log):
     try:
         # 1. Lectura de registros básicos de estado
         log.write("REGISTROS BÁSICOS DE ESTADO:\n")
-        basic_registers = [
-            {"addr": 0x0046, "name": "Estado Alarmas", "count": 1},
-            {"addr": 0x0047, "name": "SOC Alternativo", "count": 1},
-            {"addr": 0x0048, "name": "SOH Alternativo", "count": 1},
-            {"addr": 0x0049, "name": "Corriente Alt", "count": 1},
-            {"addr": 0x004A, "name": "Info Descarga", "count": 1},
-            {"addr": 0x000A, "name": "Contador Alarmas", "count": 1}
-        ]
+        schema = get_schema()
         
-        for reg in basic_registers:
+        for reg in schema.group("diagnostics"):
             try:
                 # Realizar la lectura con registro del tráfico raw
-                result = read_register_detailed(serial_connection, battery_id, reg["addr"], reg["count"], log)
+                result = read_register_detailed(serial_connection, battery_id, reg.address, reg.width, log)
                 if result["success"]:
                     values = result["data"]
-                    log.write(f"  0x{reg['addr']:04X} {reg['name']}: {[hex(x) for x in values]} (dec: {values})\n")
+                    meaning = (reg.bit_interpretation or {}).get(values[0], "")
+                    log.write(f"  0x{reg.address:04X} {reg.name}: {[hex(x) for x in values]} (dec: {values})"
+                              f"{' - ' + meaning if meaning else ''}\n")
                 else:
-                    log.write(f"  0x{reg['addr']:04X} {reg['name']}: Error - {result['error']}\n")
+                    log.write(f"  0x{reg.address:04X} {reg.name}: Error - {result['error']}\n")
             except Exception as e:
-                log.write(f"  Error al leer 0x{reg['addr']:04X} {reg['name']}: {str(e)}\n")
+                log.write(f"  Error al leer 0x{reg.address:04X} {reg.name}: {str(e)}\n")
             
             # Separador entre registros para mejor legibilidad
             log.write("\n")
@@ -160,16 +156,15 @@ def diagnose_battery(battery_id, serial_connection, log):
         # 2. Registros de estado general
         try:
             log.write("\nESTADO GENERAL:\n")
-            result = read_register_detailed(serial_connection, battery_id, 0x0000, 7, log)
+            decoder = schema.block_decoder("basic")
+            result = read_register_detailed(serial_connection, battery_id, decoder.start, decoder.count, log)
             if result["success"]:
-                values = result["data"]
-                log.write(f"  Voltaje: {values[0]/100:.2f}V\n")
-                log.write(f"  Voltaje Pack: {values[1]/100:.2f}V\n")
-                log.write(f"  Corriente: {(values[2] if values[2] < 32768 else values[2]-65536)/100:.2f}A\n")
-                log.write(f"  SOC: {values[3]}%\n")
-                log.write(f"  SOH: {values[4]}%\n")
-                log.write(f"  Estado: 0x{values[5]:04X}\n")
-                log.write(f"  Reservado: 0x{values[6]:04X}\n")
+                values = decoder.decode(result["data"])
+                for reg, name in zip(decoder.fields, decoder.names):
+                    value = values[name]
+                    if isinstance(value, float):
+                        value = f"{value:.2f}"
+                    log.write(f"  {reg.name}: {value}{reg.unit if reg.unit != '-' else ''}\n")
             else:
                 log.write(f"  Error leyendo estado general: {result['error']}\n")
         except Exception as e:
@@ -10,6 +10,7 @@ from modbus_app.authentication_status import update_phase_status, PHASE_STATES
 from modbus_app.device_info.device_cache import update_device_info, get_device_info, reset_device_info
 from modbus_app.logger_config import log_to_cmd
 from modbus_app.huawei_client import create_huawei_client
+from modbus_app.huawei_client.arbiter import bus_priority, PRIORITY_HISTORY
 
 # Variable global para almacenar la instancia
 _initializer_instance = None
@@ -52,6 +53,7 @@ class BatteryInitializer:
             if self._huawei_client.connect():
                 self._is_connected = True
                 logger.info(f"Conexión establecida con {self.port}")
+                self._start_bus_recording_if_enabled()
                 return True
             else:
                 logger.error("Fallo al conectar HuaweiModbusClient")
@@ -63,10 +65,24 @@ class BatteryInitializer:
             self._huawei_client = None
             return False
     
+    def _start_bus_recording_if_enabled(self):
+        """Inicia la grabación del bus si está habilitada en config.json (logging.bus_recording_enabled)."""
+        try:
+            from modbus_app import config_manager
+            from modbus_app.huawei_client.recorder import default_recording_path
+            logging_config = config_manager.load_config().get("logging", {})
+            if logging_config.get("bus_recording_enabled", False):
+                directory = logging_config.get("bus_recording_directory", "bus_recordings")
+                path = self._huawei_client.start_recording(default_recording_path(directory))
+                log_to_cmd(f"Grabación del bus activa: {path}", "INFO", "INIT")
+        except Exception as e:
+            logger.error(f"No se pudo iniciar la grabación del bus: {str(e)}")
+    
     def disconnect(self):
         """Cierra la conexión."""
         if self._huawei_client:
             try:
+                self._huawei_client.stop_recording()
                 self._huawei_client.close()
                 logger.info("Puerto cerrado")
                 self._huawei_client = None
@@ -309,6 +325,7 @@ class BatteryInitializer:
         
         return results
     
+    @bus_priority(PRIORITY_HISTORY)
     def _read_all_device_info_simplified(self, battery_id):
         """Lee información del dispositivo usando HuaweiModbusClient."""
         try:
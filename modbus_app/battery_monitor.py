@@ -4,11 +4,32 @@ import threading
 import time
 import json
 import sys
+import logging
 from datetime import datetime
-from . import client
-from . import operations
-from . import device_info
+from . import metrics
 from modbus_app.logger_config import log_to_cmd
+from .register_schema import get_schema
+from .history.recording import HistoryRecorder, DEFAULT_MIN_INTERVAL_SECONDS
+from .alarms import get_alarm_engine, FAULT_FIELDS
+from .energy_estimator import get_energy_estimator
+
+# Nombres de campos del esquema usados en el caché de baterías
+CACHE_FIELD_NAMES = {
+    "battery_voltage": "voltage",
+    "battery_current": "current",
+    "battery_soc": "soc",
+    "battery_soh": "soh"
+}
+
+# Mínimo de registros aceptado en el polling (voltaje, pack, corriente, SOC y SOH);
+# las temperaturas 0x0005-0x0006 son opcionales
+MIN_BASIC_REGISTERS = 5
+
+logger = logging.getLogger('modbus_app.battery_monitor')
+
+# Segundos entre lecturas de los bloques de celdas de cada batería en el polling
+DEFAULT_CELL_REFRESH_SECONDS = 60
+
 # Función para escribir directamente en stdout
 def log_stdout(message):
     sys.stdout.write(f"{message}\n")
@@ -40,22 +61,20 @@ class BatteryMonitor:
         self.history_interval = 120  # Intervalo en segundos (2 minutos)
         self.last_history_save = {}  # Timestamp de última grabación por batería
         self.history_include_cells = True  # Incluir datos de celdas individuales
-        self.additional_registers = [
-            (0x0042, 2),  # discharge_times - 32-bit
-            (0x0044, 2),  # discharge_ah - 32-bit  
-            (0x0046, 1),  # hardware_faults
-            (0x0049, 1),  # operation_mode
-            (0x0048, 1),  # sensor_status
-            (0x004A, 1),  # subsystem_status
-        ]
-        self.register_to_field = {
-            0x0042: "discharge_times_total",
-            0x0044: "discharge_ah_accumulated", 
-            0x0046: "hardware_faults",
-            0x0048: "sensor_status",
-            0x0049: "operation_mode",
-            0x004A: "subsystem_status"
-        }
+        self.recent_window_hours = None  # Ventana en memoria a resolución de polling (None = por defecto)
+        self.history_recording = {}  # Modo de grabación (intervalo fijo o por cambio)
+        # Decodificadores compilados desde el esquema de registros
+        schema = get_schema()
+        self.basic_decoder = schema.block_decoder("basic", rename=CACHE_FIELD_NAMES)
+        # Registros expandidos 0x0042-0x004A en un solo bloque (0x0047 se lee y descarta)
+        self.history_read_plan = schema.read_plan("history", max_gap=1, key_attr="history_column")
+        # Palabras de estado 0x0046-0x004A para las reglas de alarma bitmask
+        self.fault_read_plan = schema.read_plan("faults", max_gap=1, key_attr="history_column")
+        self.last_fault_poll = {}  # Timestamp de última lectura de palabras de estado por ID
+        # Bloques de celdas (analítica de la flota, instantánea, segmento compartido e historial)
+        self.cell_refresh_interval = DEFAULT_CELL_REFRESH_SECONDS  # 0 = solo bajo demanda
+        self.last_cell_read = {}  # Timestamp del último intento de lectura de celdas por ID
+        self.cell_readings = {}  # Última lectura de celdas correcta (read_cells_data) por ID
         self.history_active = False  # Estado actual de grabación
         self.history_stats = {  # Estadísticas de grabación
             "total_records_saved": 0,
@@ -68,8 +87,36 @@ class BatteryMonitor:
         # Cargar configuración de historial desde config.json
         self._load_history_config()
         
+        # Series recientes en memoria (cada lectura de polling, sin pasar por SQLite);
+        # se crean al primer uso porque importan NumPy
+        self._recent_series = None
+        self._lazy_lock = threading.Lock()
+        
+        # Decide en cada lectura si se graba (intervalo, banda muerta o puerta giratoria)
+        mode = self.history_recording.get("mode", "interval")
+        max_minutes = self.history_recording.get("max_interval_minutes") if mode != "interval" else None
+        self.history_recorder = HistoryRecorder(
+            mode,
+            max_interval=max_minutes * 60 if max_minutes else self.history_interval,
+            deadbands=self.history_recording.get("deadbands"),
+            min_interval=self.history_recording.get("min_interval_seconds", DEFAULT_MIN_INTERVAL_SECONDS)
+        )
+        
         log_stdout(f"MONITOR-DEBUG: BatteryMonitor inicializado con historial {'habilitado' if self.history_enabled else 'deshabilitado'}")
     
+    @property
+    def recent_series(self):
+        """Almacén de series recientes (creado en el primer acceso)."""
+        if self._recent_series is None:
+            with self._lazy_lock:
+                if self._recent_series is None:
+                    from .recent_series import RecentSeriesStore, DEFAULT_WINDOW_HOURS
+                    self._recent_series = RecentSeriesStore(
+                        self.basic_decoder.names,
+                        (self.recent_window_hours or DEFAULT_WINDOW_HOURS) * 3600,
+                        self.polling_interval)
+        return self._recent_series
+
     def _load_history_config(self):
         """Carga la configuración de historial desde config.json"""
         try:
@@ -80,6 +127,9 @@ class BatteryMonitor:
             self.history_enabled = monitoring_config.get("history_enabled", True)
             self.history_interval = monitoring_config.get("history_interval_minutes", 2) * 60
             self.history_include_cells = monitoring_config.get("history_include_cells", True)
+            self.recent_window_hours = monitoring_config.get("recent_window_hours")
+            self.history_recording = monitoring_config.get("history_recording", {})
+            self.cell_refresh_interval = monitoring_config.get("cell_refresh_seconds", DEFAULT_CELL_REFRESH_SECONDS)
             
             log_stdout(f"MONITOR-DEBUG: Configuración de historial cargada - Intervalo: {self.history_interval}s")
             
@@ -122,6 +172,7 @@ class BatteryMonitor:
             current_time = time.time()
             for battery_id in battery_ids:
                 self.last_history_save[battery_id] = current_time - self.history_interval  # Permitir grabación inmediata
+                self.history_recorder.reset(battery_id)
         
         log_stdout(f"MONITOR-DEBUG: Grabación de historial iniciada para baterías: {battery_ids}")
         
@@ -138,6 +189,7 @@ class BatteryMonitor:
             was_active = self.history_active
             self.history_active = False
             self.last_history_save.clear()
+            self.history_recorder.reset()
         
         if was_active:
             log_stdout("MONITOR-DEBUG: Grabación de historial detenida")
@@ -168,6 +220,7 @@ class BatteryMonitor:
                 "include_cells": self.history_include_cells,
                 "monitored_batteries": list(self.last_history_save.keys()),
                 "stats": self.history_stats.copy(),
+                "recording": self.history_recorder.get_status(),
                 "next_save_in_seconds": self._get_seconds_until_next_save()
             }
     
@@ -179,22 +232,27 @@ class BatteryMonitor:
         current_time = time.time()
         next_saves = []
         
-        for battery_id, last_save in self.last_history_save.items():
-            next_save = last_save + self.history_interval
-            if next_save > current_time:
+        for battery_id in self.last_history_save:
+            # Intervalo o latido: en modos por cambio se puede grabar antes
+            next_save = self.history_recorder.next_due(battery_id)
+            if next_save is None:
+                next_saves.append(0)
+            elif next_save > current_time:
                 next_saves.append(next_save - current_time)
         
         return min(next_saves) if next_saves else 0
     
-    def _should_save_history(self, battery_id):
+    def _should_save_history(self, battery_id, values, sample_time):
         """
-        Determina si es momento de guardar historial para una batería.
+        Determina si la lectura actual de una batería debe guardarse en el historial.
         
         Args:
             battery_id (int): ID de la batería
+            values (dict): Valores decodificados de la lectura
+            sample_time (float): Instante de la lectura
             
         Returns:
-            bool: True si debe guardar historial
+            str | bool: Motivo de la grabación, o False si no debe guardarse
         """
         if not self.history_enabled or not self.history_active:
             return False
@@ -202,67 +260,72 @@ class BatteryMonitor:
         if battery_id not in self.last_history_save:
             return False
         
-        current_time = time.time()
-        last_save = self.last_history_save[battery_id]
-        time_diff = current_time - last_save
+        reason = self.history_recorder.evaluate(battery_id, sample_time, values)
+        logger.debug("Historial check batería %s: modo=%s, motivo=%s",
+                     battery_id, self.history_recorder.mode, reason)
         
-        # ← AGREGAR ESTAS LÍNEAS
-        from modbus_app.logger_config import log_to_cmd
-        log_to_cmd(f"Historial Check batería {battery_id}: diff={time_diff:.1f}s, interval={self.history_interval}s", "INFO", "HISTORY")
-        
-        result = time_diff >= self.history_interval
-        log_to_cmd(f"Should save? {result} para batería {battery_id}", "INFO", "HISTORY")
-        
-        return result
+        return reason or False
     
     
     def _save_to_history(self, battery_id, battery_data):
         """
         Guarda los datos de una batería en el historial CON REGISTROS EXPANDIDOS.
         """
-        log_to_cmd(f"NUEVO CÓDIGO EJECUTÁNDOSE para batería {battery_id}", "INFO", "HISTORY")
+        # Pila serie importada al usarla (arranque de la aplicación sin pyserial)
+        from . import operations
+        from .huawei_client.arbiter import bus_priority, PRIORITY_HISTORY
         try:
             # 1. USAR datos básicos del caché (ya disponibles)
             basic_data = self._format_basic_data_for_history(battery_data)
             
             # 2. LEER REGISTROS ADICIONALES
-            log_stdout(f"HISTORY: Leyendo registros expandidos para batería {battery_id}")
-            
-            for register, count in self.additional_registers:
-                try:
-                    result = operations.execute_read_operation(
-                        slave_id=battery_id,
-                        function='holding',
-                        address=register,
-                        count=count
-                    )
+            logger.debug("HISTORY: Leyendo registros expandidos para batería %s", battery_id)
+            
+            try:
+                with bus_priority(PRIORITY_HISTORY):
+                    plan_result = operations.execute_read_plan(battery_id, self.history_read_plan)
+                
+                for field_name, (raw_value, processed_value) in plan_result["values"].items():
+                    basic_data[field_name] = processed_value
+                    logger.debug("HISTORY: %s = %s", field_name, processed_value)
+                
+                for field_name, error in plan_result["errors"].items():
+                    logger.warning("HISTORY: Error leyendo %s: %s", field_name, error)
+                
+                # Las palabras de estado ya leídas alimentan también las alarmas
+                alarm_engine = get_alarm_engine()
+                if alarm_engine:
+                    alarm_engine.evaluate(battery_id, {field: processed for field, (raw, processed)
+                                                       in plan_result["values"].items()})
+                
+                # Control cruzado del conteo de culombios con el contador del BMS (0x0044)
+                estimator = get_energy_estimator()
+                if estimator and "discharge_ah_accumulated" in plan_result["values"]:
+                    estimator.observe_bms_counter(battery_id, plan_result["values"]["discharge_ah_accumulated"][1])
                     
-                    if result.get("status") == "success":
-                        field_name = self.register_to_field.get(register)
-                        if field_name:
-                            processed_value = self._process_register_value(
-                                result["data"], register, count
-                            )
-                            basic_data[field_name] = processed_value
-                            log_stdout(f"HISTORY: {field_name} = {processed_value}")
-                            
-                except Exception as e:
-                    log_stdout(f"HISTORY: Error leyendo 0x{register:04X}: {str(e)}")
+            except Exception as e:
+                logger.error("HISTORY: Error leyendo registros expandidos: %s", e)
+            
+            # 3. CELDAS (lectura reciente del polling o una nueva)
+            cell_data = self._get_cell_data_for_history(battery_id) if self.history_include_cells else None
             
-            # 3. GUARDAR CON AUTO-EXPAND
-            record_id = self._save_with_auto_expand(battery_id, datetime.now(), basic_data)
+            # 4. GUARDAR CON AUTO-EXPAND
+            record_id = self._save_with_auto_expand(battery_id, datetime.now(), basic_data, cell_data)
             
             if record_id:
-                self.history_stats["total_records_saved"] += 1
-                self.history_stats["last_save_time"] = datetime.now()
-                self.last_history_save[battery_id] = time.time()
-                log_stdout(f"HISTORY: Registro expandido guardado para batería {battery_id}")
+                # Se llama fuera del lock del caché: las estadísticas se actualizan con él
+                with self.lock:
+                    self.history_stats["total_records_saved"] += 1
+                    self.history_stats["last_save_time"] = datetime.now()
+                    if battery_id in self.last_history_save:
+                        self.last_history_save[battery_id] = time.time()
+                logger.debug("HISTORY: Registro expandido guardado para batería %s", battery_id)
                 return True
             else:
                 return False
                 
         except Exception as e:
-            log_stdout(f"HISTORY: Error general: {str(e)}")
+            logger.error("HISTORY: Error general: %s", e)
             return False
 
     
@@ -294,7 +357,8 @@ class BatteryMonitor:
     
     def _get_cell_data_for_history(self, battery_id):
         """
-        Obtiene datos detallados de celdas para el historial.
+        Obtiene datos detallados de celdas para el historial: la lectura del polling si
+        es de este intervalo de refresco o, si no, una lectura nueva.
         
         Args:
             battery_id (int): ID de la batería
@@ -303,28 +367,57 @@ class BatteryMonitor:
             dict: Datos de celdas formateados para historial
         """
         try:
-            # Usar el endpoint optimizado para obtener datos de celdas
-            import requests
-            response = requests.get(f"http://127.0.0.1:5000/api/batteries/cells_data/{battery_id}", timeout=5)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("status") in ["success", "partial"]:
-                    return self._format_cell_data_for_history(data)
+            with self.lock:
+                data = self.cell_readings.get(battery_id)
+            max_age = self.cell_refresh_interval or self.polling_interval
+            if data is None or time.time() - data["timestamp"] > max_age:
+                data = self._refresh_cells(battery_id)
+            if data is not None:
+                return self._format_cell_data_for_history(data)
             
-            log_stdout(f"MONITOR-WARNING: No se pudieron obtener datos de celdas para batería {battery_id}")
+            logger.warning("No se pudieron obtener datos de celdas para batería %s", battery_id)
             return {"voltages": [], "temperatures": []}
             
         except Exception as e:
-            log_stdout(f"MONITOR-ERROR: Error obteniendo datos de celdas: {str(e)}")
+            logger.error("Error obteniendo datos de celdas: %s", e)
             return {"voltages": [], "temperatures": []}
     
+    def _refresh_cells(self, battery_id):
+        """
+        Lee los bloques de celdas a prioridad de historial y alimenta la matriz de la
+        analítica de la flota (y con ella la instantánea y el segmento compartido).
+        
+        Returns:
+            dict | None: Resultado de operations.read_cells_data si hubo datos
+        """
+        from . import operations
+        from .huawei_client.arbiter import bus_priority, PRIORITY_HISTORY
+        from .cell_analytics import get_cell_analytics
+        self.last_cell_read[battery_id] = time.time()
+        with bus_priority(PRIORITY_HISTORY):
+            data = operations.read_cells_data(battery_id, include_basic=False)
+        if data.get("status") not in ("success", "partial"):
+            logger.warning("Lectura de celdas de batería %s fallida: %s", battery_id, data.get("message"))
+            return None
+        get_cell_analytics().update_from_cells(battery_id, data["cell_data"], data["timestamp"])
+        with self.lock:
+            self.cell_readings[battery_id] = data
+        return data
+    
+    def _poll_cells(self, battery_id):
+        """Refresca las celdas de una batería como mucho cada cell_refresh_interval segundos."""
+        if not self.cell_refresh_interval:
+            return
+        if time.time() - self.last_cell_read.get(battery_id, 0) < self.cell_refresh_interval:
+            return
+        self._refresh_cells(battery_id)
+    
     def _format_cell_data_for_history(self, cell_data):
         """
         Formatea los datos de celdas para el historial.
         
         Args:
-            cell_data (dict): Datos del endpoint cells_data
+            cell_data (dict): Resultado de operations.read_cells_data
             
         Returns:
             dict: Datos de celdas formateados para historial
@@ -379,31 +472,7 @@ class BatteryMonitor:
         return {"voltages": voltages, "temperatures": temperatures}
     
 
-    def _process_register_value(self, raw_data, register, count):
-        """
-        Procesa el valor crudo de un registro según su tipo.
-        
-        Args:
-            raw_data: Lista con valores crudos del registro
-            register: Dirección del registro (ej: 0x0042)
-            count: Número de words leídos (1 para 16-bit, 2 para 32-bit)
-        
-        Returns:
-            Valor procesado para guardar en DB
-        """
-        try:
-            if count == 2:  # Registro de 32-bit
-                # Combinar dos words en un valor de 32-bit
-                msw = raw_data[0]  # Most Significant Word
-                lsw = raw_data[1]  # Least Significant Word
-                return (msw << 16) | lsw
-            else:  # Registro de 16-bit
-                return raw_data[0]
-        except Exception as e:
-            log_stdout(f"HISTORY: Error procesando registro 0x{register:04X}: {str(e)}")
-            return None
-
-    def _save_with_auto_expand(self, battery_id, timestamp, data):
+    def _save_with_auto_expand(self, battery_id, timestamp, data, cell_data=None):
         """
         Guarda datos en DB con auto-expansión de campos faltantes.
         
@@ -411,6 +480,7 @@ class BatteryMonitor:
             battery_id: ID de la batería
             timestamp: Timestamp del registro
             data: Diccionario con todos los datos a guardar
+            cell_data: Celdas de _get_cell_data_for_history (opcional)
             
         Returns:
             ID del registro insertado o None si falla
@@ -424,7 +494,9 @@ class BatteryMonitor:
                 battery_id=battery_id,
                 timestamp=timestamp,
                 source="live_monitor",
-                basic_data=data
+                basic_data=data,
+                cell_voltages=(cell_data or {}).get("voltages") or None,
+                cell_temperatures=(cell_data or {}).get("temperatures") or None
             )
             
         except Exception as e:
@@ -443,12 +515,15 @@ class BatteryMonitor:
         """Inicia el monitoreo de un conjunto de baterías."""
         # Verificar si ya hay polling activo
         if self.polling_active:
-            print("WARNING: El monitoreo ya está activo")
+            logger.warning("El monitoreo ya está activo")
             return False
         
         # Guardar la lista de baterías a monitorear
         self.monitored_battery_ids = battery_ids
-        print(f"INFO: Iniciando monitoreo para {len(battery_ids)} baterías: {battery_ids}")
+        logger.info("Iniciando monitoreo para %d baterías: %s", len(battery_ids), battery_ids)
+        
+        # Exponer la antigüedad del caché de este monitor en /metrics
+        metrics.cache_age.set_function(self._cache_ages)
         
         # Iniciar thread de polling
         self.polling_active = True
@@ -467,10 +542,10 @@ class BatteryMonitor:
     def stop_polling(self):
         """Detiene el monitoreo de baterías."""
         if not self.polling_active:
-            print("WARNING: No hay monitoreo activo para detener")
+            logger.warning("No hay monitoreo activo para detener")
             return False
         
-        print("INFO: Deteniendo monitoreo de baterías")
+        logger.info("Deteniendo monitoreo de baterías")
         self.polling_active = False
         
         # Detener grabación de historial
@@ -482,68 +557,93 @@ class BatteryMonitor:
             self.polling_thread.join(timeout=2.0)
         
         self.polling_thread = None
+        
+        # Guardar los acumuladores del estimador de energía
+        estimator = get_energy_estimator()
+        if estimator:
+            estimator.checkpoint()
         return True
 
     def _polling_worker(self):
         """Función de trabajo para el polling de baterías - MODIFICADA para incluir historial."""
         log_to_cmd("POLLING WORKER INICIADO", "INFO", "MONITOR")
+        from . import operations
+        from .huawei_client.arbiter import bus_priority, PRIORITY_CRITICAL
         
         while self.polling_active:
             try:
                 # Importación tardía para evitar ciclos
                 from . import operations
                 
+                cycle_start = time.perf_counter()
+                
                 # Para cada batería, actualizar su estado
                 for battery_id in self.monitored_battery_ids:
                     try:
                         # Leer registros básicos (0-6)
-                        result = operations.execute_read_operation(
-                            slave_id=battery_id,
-                            function='holding',
-                            address=0,
-                            count=7
-                        )
+                        with bus_priority(PRIORITY_CRITICAL):
+                            result = operations.execute_read_operation(
+                                slave_id=battery_id,
+                                function='holding',
+                                address=self.basic_decoder.start,
+                                count=self.basic_decoder.count
+                            )
+                        sample_time = time.time()
                         
                         # Actualizar caché con los nuevos datos
+                        save_reason = None
                         with self.lock:
                             if result.get("status") == "success":
                                 # Convertir datos crudos a valores interpretados
                                 raw_data = result.get("data", [])
                                 
-                                if len(raw_data) >= 5:
+                                if len(raw_data) >= MIN_BASIC_REGISTERS:
                                     # Crear/actualizar entrada en caché
                                     if battery_id not in self.battery_cache:
                                         self.battery_cache[battery_id] = {}
                                     
+                                    # Respuestas cortas (sin temperaturas) se aceptan con esos campos en None
+                                    values = self.basic_decoder.decode_available(raw_data)
+                                    self.recent_series.record(battery_id, values, sample_time)
+                                    
+                                    alarm_engine = get_alarm_engine()
+                                    if alarm_engine:
+                                        alarm_engine.evaluate(battery_id, values, sample_time)
+                                    
+                                    # Conteo de culombios (trapecio desde la lectura anterior)
+                                    estimator = get_energy_estimator()
+                                    if estimator:
+                                        estimator.update(battery_id, values["current"], values["voltage"], sample_time)
+                                    
                                     # Actualizar valores
+                                    self.battery_cache[battery_id].update(values)
                                     self.battery_cache[battery_id].update({
                                         "id": battery_id,
-                                        "voltage": raw_data[0] * 0.01 if raw_data[0] is not None else None,
-                                        "pack_voltage": raw_data[1] * 0.01 if raw_data[1] is not None else None,
-                                        "current": self._convert_current(raw_data[2]) if raw_data[2] is not None else None,
-                                        "soc": raw_data[3] if raw_data[3] is not None else None,
-                                        "soh": raw_data[4] if raw_data[4] is not None else None,
                                         "raw_values": raw_data,
                                         "last_updated": time.time(),
-                                        "status": self._determine_status(raw_data[2]) if raw_data[2] is not None else "Desconocido"
+                                        "status": self._determine_status(values["current"])
                                     })
                                     
-                                    print(f"INFO: Actualizada batería {battery_id}: V={self.battery_cache[battery_id]['voltage']:.2f}V, SOC={self.battery_cache[battery_id]['soc']}%")
+                                    logger.info("Actualizada batería %s: V=%.2fV, SOC=%s%%",
+                                                battery_id, values["voltage"], values["soc"])
                                     
                                     # ========== NUEVA FUNCIONALIDAD: VERIFICAR HISTORIAL ==========
-                                    if self._should_save_history(battery_id):
-                                        print(f"INFO: Guardando historial para batería {battery_id}")
-                                        self._save_to_history(battery_id, self.battery_cache[battery_id])
+                                    # Solo se decide aquí: el guardado lee más registros del bus y
+                                    # escribe en SQLite, y se hace fuera del lock del caché
+                                    save_reason = self._should_save_history(battery_id, values, sample_time)
+                                    if save_reason:
+                                        history_entry = dict(self.battery_cache[battery_id])
                                     
                                 else:
-                                    print(f"WARNING: Datos insuficientes para batería {battery_id}")
+                                    logger.warning("Datos insuficientes para batería %s", battery_id)
                                     self.battery_cache[battery_id] = {
                                         "id": battery_id,
                                         "error": "Datos insuficientes",
                                         "last_updated": time.time()
                                     }
                             else:
-                                print(f"WARNING: Error al leer batería {battery_id}: {result.get('message', 'Error desconocido')}")
+                                logger.warning("Error al leer batería %s: %s", battery_id,
+                                               result.get('message', 'Error desconocido'))
                                 self.battery_cache[battery_id] = {
                                     "id": battery_id,
                                     "error": result.get("message", "Error de lectura"),
@@ -552,9 +652,17 @@ class BatteryMonitor:
                             
                             # Actualizar timestamp
                             self.last_poll_time[battery_id] = time.time()
+                        
+                        if save_reason:
+                            logger.info("Guardando historial para batería %s (%s)", battery_id, save_reason)
+                            if self._save_to_history(battery_id, history_entry):
+                                self.history_recorder.recorded(battery_id, sample_time, values, save_reason)
+                        
+                        self._poll_fault_words(battery_id)
+                        self._poll_cells(battery_id)
                     
                     except Exception as e:
-                        print(f"ERROR: Excepción al procesar batería {battery_id}: {str(e)}")
+                        logger.error("Excepción al procesar batería %s: %s", battery_id, e)
                         with self.lock:
                             self.battery_cache[battery_id] = {
                                 "id": battery_id,
@@ -565,6 +673,17 @@ class BatteryMonitor:
                     # Pequeña pausa entre lecturas para no saturar el bus
                     time.sleep(0.5)
                 
+                metrics.poll_cycle.observe(time.perf_counter() - cycle_start)
+                
+                # Una pasada de analítica de celdas por ciclo (solo si hubo lecturas nuevas)
+                from .cell_analytics import get_cell_analytics
+                cell_result = get_cell_analytics().analyze_if_stale()
+                
+                # Instantánea de la flota para los handlers HTTP (una vez por ciclo)
+                self.publish_fleet_snapshot(cell_result)
+                # Estado en memoria compartida para lectores en otros procesos
+                self.publish_shared_state()
+                
                 # Esperar el intervalo configurado antes de la siguiente ronda
                 polling_interval_remaining = self.polling_interval
                 while polling_interval_remaining > 0 and self.polling_active:
@@ -572,22 +691,74 @@ class BatteryMonitor:
                     polling_interval_remaining -= 1.0
                     
             except Exception as e:
-                print(f"ERROR en thread de monitoreo: {str(e)}")
+                logger.error("Error en thread de monitoreo: %s", e)
                 time.sleep(5.0)  # Pausa más larga en caso de error
         
-        print("INFO: Thread de monitoreo finalizado")
+        logger.info("Thread de monitoreo finalizado")
 
-    # ========== FUNCIONES EXISTENTES SIN CAMBIOS ==========
+    def _poll_fault_words(self, battery_id):
+        """
+        Lee las palabras de estado para las reglas bitmask, como mucho una vez cada
+        fault_poll_interval segundos por batería (no añade tráfico si no hay reglas).
+        """
+        alarm_engine = get_alarm_engine()
+        if not alarm_engine or alarm_engine.fields.isdisjoint(FAULT_FIELDS):
+            return
+        from . import operations
+        from .huawei_client.arbiter import bus_priority, PRIORITY_CRITICAL
+        now = time.time()
+        if now - self.last_fault_poll.get(battery_id, 0) < alarm_engine.fault_poll_interval:
+            return
+        self.last_fault_poll[battery_id] = now
+        with bus_priority(PRIORITY_CRITICAL):
+            plan_result = operations.execute_read_plan(battery_id, self.fault_read_plan)
+        values = {field: processed for field, (raw, processed) in plan_result["values"].items()}
+        if values:
+            alarm_engine.evaluate(battery_id, values, now)
     
-    def _convert_current(self, raw_current):
-        """Convierte el valor crudo de corriente a valor real con signo."""
-        if raw_current > 32767:  # Valor negativo en complemento a 2
-            return (raw_current - 65536) * 0.01
-        return raw_current * 0.01
+    def publish_fleet_snapshot(self, cell_result=None):
+        """Publica la instantánea de la flota con el contenido actual de la caché."""
+        try:
+            from . import config_manager
+            from .fleet_snapshot import get_snapshot_publisher
+            with self.lock:
+                batteries = [data.copy() for data in self.battery_cache.values()]
+            discovered_devices = config_manager.load_config().get("application", {}).get("discovered_devices", [])
+            cell_stats = (cell_result or {}).get("batteries")
+            return get_snapshot_publisher().publish(batteries, discovered_devices, cell_stats)
+        except Exception as e:
+            log_to_cmd(f"Error publicando la instantánea de la flota: {str(e)}", "ERROR", "MONITOR")
+            return None
+
+    def publish_shared_state(self):
+        """Escribe el estado actual en el segmento de memoria compartida."""
+        try:
+            from .cell_analytics import get_cell_analytics
+            from .shared_state import get_shared_state_writer
+            writer = get_shared_state_writer()
+            if writer is None:
+                return 0
+            with self.lock:
+                batteries = [data.copy() for data in self.battery_cache.values()]
+            return writer.publish(batteries, get_cell_analytics().cell_arrays())
+        except Exception as e:
+            log_to_cmd(f"Error publicando el segmento de estado: {str(e)}", "ERROR", "MONITOR")
+            return 0
 
-    def _determine_status(self, raw_current):
-        """Determina el estado de la batería basado en la corriente."""
-        current = self._convert_current(raw_current)
+    def _cache_ages(self):
+        """Antigüedad (segundos) de la entrada de caché de cada batería, para métricas."""
+        now = time.time()
+        with self.lock:
+            return {(battery_id,): now - entry["last_updated"]
+                    for battery_id, entry in self.battery_cache.items()
+                    if "last_updated" in entry}
+
+    # ========== FUNCIONES EXISTENTES SIN CAMBIOS ==========
+    
+    def _determine_status(self, current):
+        """Determina el estado de la batería basado en la corriente (A, con signo)."""
+        if current is None:
+            return "Desconocido"
         if current > 0.05:
             return "Cargando"
         elif current < -0.05:
@@ -623,6 +794,23 @@ class BatteryMonitor:
                     "message": f"Batería {battery_id} no está siendo monitoreada"
                 }
     
+    def get_recent_series(self, battery_id, fields=None, seconds=None):
+        """Lecturas recientes de una batería a resolución de polling (desde memoria)."""
+        try:
+            result = self.recent_series.query(battery_id, fields, seconds)
+        except ValueError as e:
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+        if result is None:
+            return {
+                "status": "error",
+                "message": f"Batería {battery_id} no tiene lecturas recientes"
+            }
+        result["status"] = "success"
+        return result
+    
     # ========== FUNCIONES EXISTENTES DE INFORMACIÓN DETALLADA (SIN CAMBIOS) ==========
     
     def load_all_detailed_info(self, battery_ids=None):
@@ -0,0 +1,295 @@
+# modbus_app/cell_analytics.py
+"""
+Analítica de celdas de toda la flota, vectorizada con NumPy.
+
+Se mantiene una matriz (baterías × celdas) con las últimas tensiones y temperaturas
+leídas. Cada análisis es una sola pasada sobre la matriz completa:
+
+- Por batería: mínimo, máximo, media, mediana y dispersión (max - min).
+- z-scores robustos (mediana y MAD) de cada celda frente a la flota y frente a su
+  propia batería.
+- Deriva: desviación actual de la celda respecto a la mediana de su batería menos
+  su desviación habitual (media móvil exponencial de lecturas anteriores). Restar la
+  mediana del pack elimina los cambios de SOC comunes a todas las celdas.
+- Ranking de celdas débiles combinando tensión baja en el pack, deriva a la baja y
+  temperatura alta.
+
+Las lecturas llegan del polling (BatteryMonitor lee los bloques de celdas de cada
+batería cada `monitoring.cell_refresh_seconds`, a prioridad de historial) y de la
+pestaña de celdas; el análisis se recalcula como mucho una vez por ciclo de polling y
+solo si hubo lecturas nuevas.
+"""
+
+import threading
+import time
+import logging
+import warnings
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger('modbus_app.cell_analytics')
+
+# Escala de la MAD a desviación típica para datos normales
+MAD_SCALE = 1.4826
+# Suelo de la escala robusta (V y °C) para packs casi perfectamente equilibrados
+MIN_VOLTAGE_SCALE = 0.002
+MIN_TEMPERATURE_SCALE = 0.5
+# Peso de cada lectura nueva en la desviación habitual de la celda
+DRIFT_ALPHA = 0.05
+OUTLIER_Z = 3.0
+WEAK_CELLS = 10
+
+
+def _row_median(values: np.ndarray) -> np.ndarray:
+    """
+    Mediana por fila ignorando NaN, como columna (filas x 1).
+    np.nanmedian por ejes recorre las filas con NaN en Python; aquí basta una
+    ordenación (los NaN quedan al final) y dos índices por fila.
+    """
+    if not values.shape[1]:
+        return np.full((len(values), 1), np.nan)
+    ordered = np.sort(values, axis=1)
+    valid = np.count_nonzero(~np.isnan(values), axis=1)
+    low = np.maximum(valid - 1, 0) // 2
+    high = np.maximum(valid // 2, low)
+    rows = np.arange(len(values))
+    median = (ordered[rows, low] + ordered[rows, high]) / 2
+    median[valid == 0] = np.nan
+    return median[:, None]
+
+
+def _robust_z(values: np.ndarray, center: np.ndarray, floor: float) -> np.ndarray:
+    """(x - mediana) / (MAD * 1.4826) por fila, con la escala acotada inferiormente."""
+    mad = _row_median(np.abs(values - center))
+    return (values - center) / np.maximum(mad * MAD_SCALE, floor)
+
+
+def _column(values: np.ndarray, digits: int) -> List[Optional[float]]:
+    """Array redondeado a lista, con NaN como None."""
+    return [None if v != v else v for v in np.round(values, digits).tolist()]
+
+
+class FleetCellAnalytics:
+    """Matriz de la flota y resultado del último análisis."""
+
+    def __init__(self, capacity: int = 16, cells: int = 16):
+        self._index = {}  # battery_id -> fila
+        self._ids = []
+        self.voltages = np.full((capacity, cells), np.nan)
+        self.temperatures = np.full((capacity, cells), np.nan)
+        self.baseline = np.full((capacity, cells), np.nan)  # Desviación habitual frente al pack
+        self.updated_at = np.zeros(capacity)
+        self._fresh = np.zeros(capacity, dtype=bool)
+        self._dirty = False
+        self._result = None
+        self._lock = threading.Lock()
+
+    # ==================== ENTRADA ====================
+
+    def _grow(self, rows: int, cells: int):
+        """Amplía las matrices (duplicando) para `rows` baterías y `cells` celdas."""
+        old_rows, old_cells = self.voltages.shape
+        new_rows = max(old_rows, rows if rows <= old_rows else max(rows, old_rows * 2))
+        new_cells = max(old_cells, cells)
+        if (new_rows, new_cells) == (old_rows, old_cells):
+            return
+        for name in ("voltages", "temperatures", "baseline"):
+            grown = np.full((new_rows, new_cells), np.nan)
+            grown[:old_rows, :old_cells] = getattr(self, name)
+            setattr(self, name, grown)
+        self.updated_at = np.concatenate((self.updated_at, np.zeros(new_rows - old_rows)))
+        self._fresh = np.concatenate((self._fresh, np.zeros(new_rows - old_rows, dtype=bool)))
+
+    def update(self, battery_id: int, voltages: Sequence[Optional[float]],
+               temperatures: Sequence[Optional[float]] = (), timestamp: float = None):
+        """
+        Sustituye las lecturas de una batería (celda i en la posición i-1; None = sin dato).
+        """
+        voltages = np.array([np.nan if v is None else v for v in voltages], dtype=np.float64)
+        temperatures = np.array([np.nan if t is None else t for t in temperatures], dtype=np.float64)
+        with self._lock:
+            row = self._index.get(battery_id)
+            if row is None:
+                row = len(self._ids)
+                self._index[battery_id] = row
+                self._ids.append(battery_id)
+            self._grow(row + 1, max(len(voltages), len(temperatures)))
+            self.voltages[row] = np.nan
+            self.voltages[row, :len(voltages)] = voltages
+            if len(temperatures):
+                self.temperatures[row] = np.nan
+                self.temperatures[row, :len(temperatures)] = temperatures
+            self.updated_at[row] = timestamp or time.time()
+            self._fresh[row] = True
+            self._dirty = True
+
+    def update_from_cells(self, battery_id: int, cell_data: Dict[str, Any], timestamp: float = None):
+        """Lecturas en el formato de `cell_data` de /api/batteries/cells_data."""
+        series = {"voltage": [], "temperature": []}
+        for key, block in sorted(cell_data.items()):
+            if not block.get("success"):
+                continue
+            target = series["voltage" if "voltage" in key else "temperature"]
+            for cell in block.get("cells", []):
+                number = cell["cell_number"]
+                target.extend([None] * (number - len(target)))
+                target[number - 1] = cell.get("processed_value")
+        if series["voltage"] or series["temperature"]:
+            self.update(battery_id, series["voltage"], series["temperature"], timestamp)
+
+    def remove(self, battery_id: int):
+        """Quita una batería de la matriz."""
+        with self._lock:
+            row = self._index.pop(battery_id, None)
+            if row is None:
+                return
+            last = len(self._ids) - 1
+            if row != last:
+                # La última fila ocupa el hueco
+                moved = self._ids[last]
+                for array in (self.voltages, self.temperatures, self.baseline, self.updated_at, self._fresh):
+                    array[row] = array[last]
+                self._ids[row] = moved
+                self._index[moved] = row
+            self._ids.pop()
+            for array in (self.voltages, self.temperatures, self.baseline):
+                array[last] = np.nan
+            self._dirty = True
+
+    def cell_arrays(self) -> Dict[int, tuple]:
+        """Copia de las últimas lecturas: battery_id -> (tensiones, temperaturas, updated_at)."""
+        with self._lock:
+            return {battery_id: (self.voltages[row].copy(), self.temperatures[row].copy(),
+                                 float(self.updated_at[row]))
+                    for battery_id, row in self._index.items()}
+
+    # ==================== ANÁLISIS ====================
+
+    def analyze(self, weak_cells: int = WEAK_CELLS) -> Dict[str, Any]:
+        """Una pasada vectorizada sobre toda la flota."""
+        start = time.perf_counter()
+        with self._lock:
+            count = len(self._ids)
+            ids = np.array(self._ids, dtype=np.int64)
+            v = self.voltages[:count]
+            t = self.temperatures[:count]
+            baseline = self.baseline[:count]
+            fresh = self._fresh[:count].copy()
+            updated_at = self.updated_at[:count].copy()
+
+            # Filas o columnas sin datos (all-NaN) dan NaN sin avisos
+            with np.errstate(all='ignore'), warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                # Estadísticas por batería
+                pack_median = _row_median(v)
+                v_min, v_max = np.nanmin(v, axis=1), np.nanmax(v, axis=1)
+                t_median = _row_median(t)
+                t_min, t_max = np.nanmin(t, axis=1), np.nanmax(t, axis=1)
+
+                # z-scores robustos frente a la flota y frente al pack
+                fleet = v.reshape(1, -1)
+                fleet_median = _row_median(fleet)[0, 0]
+                z_fleet = _robust_z(fleet, fleet_median, MIN_VOLTAGE_SCALE).reshape(v.shape)
+                z_pack = _robust_z(v, pack_median, MIN_VOLTAGE_SCALE)
+                zt_pack = _robust_z(t, t_median, MIN_TEMPERATURE_SCALE)
+
+                # Deriva frente a la historia propia de cada celda
+                deviation = v - pack_median
+                drift = np.where(np.isnan(baseline), 0.0, deviation - baseline)
+                drift_scale = float(np.fmax(_row_median(np.abs(drift).reshape(1, -1))[0, 0] * MAD_SCALE,
+                                            MIN_VOLTAGE_SCALE))
+
+                # Actualizar la desviación habitual solo con lecturas nuevas
+                update = fresh[:, None] & ~np.isnan(deviation)
+                blended = np.where(np.isnan(baseline), deviation,
+                                   baseline + DRIFT_ALPHA * (deviation - baseline))
+                baseline[update] = blended[update]
+                self._fresh[:count] = False
+                self._dirty = False
+
+                # Puntuación de debilidad: tensión baja, deriva a la baja, temperatura alta
+                score = (np.clip(-z_pack, 0, None)
+                         + 0.5 * np.clip(-drift / drift_scale, 0, None)
+                         + 0.5 * np.clip(np.nan_to_num(zt_pack), 0, None))
+                score = np.where(np.isnan(v), -np.inf, score)
+
+                outlier_rows, outlier_cols = np.nonzero(np.abs(z_pack) > OUTLIER_Z)
+            elapsed = time.perf_counter() - start
+
+            flat = score.ravel()
+            top = min(weak_cells, int(np.isfinite(flat).sum()))
+            ranked = []
+            if top:
+                candidates = np.argpartition(-flat, top - 1)[:top]
+                candidates = candidates[np.argsort(-flat[candidates])]
+                rows, cols = np.unravel_index(candidates, score.shape)
+                ranked = [
+                    {
+                        "battery_id": int(ids[r]),
+                        "cell_number": int(c) + 1,
+                        "voltage": round(float(v[r, c]), 4),
+                        "temperature": None if np.isnan(t[r, c]) else round(float(t[r, c]), 2),
+                        "z_pack": round(float(z_pack[r, c]), 2),
+                        "z_fleet": round(float(z_fleet[r, c]), 2),
+                        "drift_mv": round(float(drift[r, c]) * 1000, 1),
+                        "score": round(float(flat[r * score.shape[1] + c]), 3)
+                    }
+                    for r, c in zip(rows.tolist(), cols.tolist())
+                ]
+
+            outliers = {}
+            for r, c in zip(outlier_rows.tolist(), outlier_cols.tolist()):
+                outliers.setdefault(r, []).append(c + 1)
+            columns = {
+                "voltage_min": _column(v_min, 4),
+                "voltage_max": _column(v_max, 4),
+                "voltage_median": _column(pack_median[:, 0], 4),
+                "voltage_spread_mv": _column((v_max - v_min) * 1000, 1),
+                "temperature_min": _column(t_min, 2),
+                "temperature_max": _column(t_max, 2),
+                "temperature_spread": _column(t_max - t_min, 2)
+            }
+            batteries = {}
+            for i, battery_id in enumerate(ids.tolist()):
+                entry = {name: values[i] for name, values in columns.items()}
+                entry["outlier_cells"] = outliers.get(i, [])
+                entry["updated_at"] = float(updated_at[i])
+                batteries[battery_id] = entry
+
+        self._result = {
+            "battery_count": count,
+            "cells_per_battery": int(v.shape[1]),
+            "fleet": {
+                "voltage_median": None if np.isnan(fleet_median) else round(float(fleet_median), 4),
+                "drift_scale_mv": round(float(drift_scale) * 1000, 2) if count else None
+            },
+            "batteries": batteries,
+            "weak_cells": ranked,
+            "computed_at": time.time(),
+            # Pasada vectorizada (sin construir la respuesta)
+            "compute_time_us": round(elapsed * 1e6, 1)
+        }
+        return self._result
+
+    def analyze_if_stale(self) -> Optional[Dict[str, Any]]:
+        """Recalcula solo si hubo lecturas nuevas desde el último análisis."""
+        if self._dirty or self._result is None:
+            return self.analyze()
+        return self._result
+
+    def get_result(self) -> Dict[str, Any]:
+        return self.analyze_if_stale()
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_cell_analytics() -> FleetCellAnalytics:
+    """Instancia global de la analítica de celdas."""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = FleetCellAnalytics()
+        return _analytics
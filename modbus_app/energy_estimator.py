@@ -0,0 +1,256 @@
+# modbus_app/energy_estimator.py
+"""
+Estimador de carga y energía por conteo de culombios.
+
+Integra la corriente de cada lectura de polling (regla del trapecio entre lecturas
+consecutivas) en Ah y Wh de carga y de descarga por batería, y deriva el número de
+ciclos equivalentes completos (throughput / 2 / capacidad nominal). Si la corriente
+cambia de signo dentro de un intervalo, el trapecio se parte en el cruce por cero
+para repartir correctamente carga y descarga.
+
+Los intervalos mayores que `max_gap_seconds` (polling detenido, errores de lectura)
+no se integran: la siguiente lectura solo fija el nuevo punto de partida.
+
+El contador de descarga del BMS (0x0044, Ah acumulados) se compara con la descarga
+estimada desde la primera vez que se observa, como control de calidad de ambos.
+
+El estado se guarda en un archivo JSON (escritura atómica) como mucho cada
+`checkpoint_interval_seconds`, de modo que el coste en el polling es despreciable.
+"""
+
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('modbus_app.energy_estimator')
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "nominal_capacity_ah": 100,
+    "capacity_ah": {},              # Capacidad por batería: {"214": 150}
+    "max_gap_seconds": 120,
+    "checkpoint_file": "energy_estimator.json",
+    "checkpoint_interval_seconds": 300
+}
+
+_PERSISTED = ("charge_ah", "discharge_ah", "charge_wh", "discharge_wh", "integrated_seconds",
+              "samples", "started_at", "bms_discharge_ah_base", "estimated_discharge_ah_base",
+              "bms_discharge_ah_last")
+
+
+class BatteryCounter:
+    """Acumuladores de una batería (estado O(1))."""
+
+    __slots__ = ('last_time', 'last_current', 'last_voltage') + _PERSISTED
+
+    def __init__(self, started_at: float = None):
+        self.last_time = None
+        self.last_current = None
+        self.last_voltage = None
+        self.charge_ah = 0.0
+        self.discharge_ah = 0.0
+        self.charge_wh = 0.0
+        self.discharge_wh = 0.0
+        self.integrated_seconds = 0.0
+        self.samples = 0
+        self.started_at = started_at or time.time()
+        self.bms_discharge_ah_base = None
+        self.estimated_discharge_ah_base = None
+        self.bms_discharge_ah_last = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in _PERSISTED}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BatteryCounter':
+        counter = cls()
+        for name in _PERSISTED:
+            if name in data:
+                setattr(counter, name, data[name])
+        return counter
+
+
+def _split_trapezoid(i0: float, i1: float, p0: float, p1: float, dt: float):
+    """
+    Área (A·s y W·s) positiva y negativa del trapecio entre (0, i0) y (dt, i1).
+    Si la corriente cruza cero, cada lado es un triángulo hasta el instante del cruce.
+    """
+    if i0 * i1 >= 0:
+        ah = (i0 + i1) / 2 * dt
+        wh = (p0 + p1) / 2 * dt
+        return (ah, 0.0, wh, 0.0) if i0 + i1 >= 0 else (0.0, ah, 0.0, wh)
+    crossing = dt * abs(i0) / (abs(i0) + abs(i1))
+    first_ah, second_ah = i0 / 2 * crossing, i1 / 2 * (dt - crossing)
+    first_wh, second_wh = p0 / 2 * crossing, p1 / 2 * (dt - crossing)
+    if i0 > 0:
+        return first_ah, second_ah, first_wh, second_wh
+    return second_ah, first_ah, second_wh, first_wh
+
+
+class EnergyEstimator:
+    """Conteo de culombios para toda la flota."""
+
+    def __init__(self, settings: Dict[str, Any] = None):
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._last_checkpoint = time.time()
+        self.checkpoint_path = self.settings["checkpoint_file"]
+        self._load_checkpoint()
+
+    def capacity(self, battery_id: int) -> float:
+        capacities = self.settings.get("capacity_ah") or {}
+        return float(capacities.get(str(battery_id), self.settings["nominal_capacity_ah"]))
+
+    # ==================== INTEGRACIÓN ====================
+
+    def update(self, battery_id: int, current: Optional[float], voltage: Optional[float],
+               timestamp: float = None):
+        """Integra una lectura (corriente en A, positiva cargando; tensión en V)."""
+        if current is None:
+            return
+        timestamp = timestamp or time.time()
+        voltage = voltage or 0.0
+        with self._lock:
+            counter = self._counters.get(battery_id)
+            if counter is None:
+                counter = self._counters[battery_id] = BatteryCounter(timestamp)
+            if counter.last_time is not None:
+                dt = timestamp - counter.last_time
+                if 0 < dt <= self.settings["max_gap_seconds"]:
+                    charge_as, discharge_as, charge_ws, discharge_ws = _split_trapezoid(
+                        counter.last_current, current,
+                        counter.last_current * counter.last_voltage, current * voltage, dt)
+                    counter.charge_ah += charge_as / 3600
+                    counter.discharge_ah -= discharge_as / 3600
+                    counter.charge_wh += charge_ws / 3600
+                    counter.discharge_wh -= discharge_ws / 3600
+                    counter.integrated_seconds += dt
+            counter.last_time = timestamp
+            counter.last_current = current
+            counter.last_voltage = voltage
+            counter.samples += 1
+
+        if timestamp - self._last_checkpoint >= self.settings["checkpoint_interval_seconds"]:
+            self.checkpoint()
+
+    def observe_bms_counter(self, battery_id: int, discharge_ah: Optional[float]):
+        """Registra el contador de descarga del BMS (0x0044) para el control cruzado."""
+        if discharge_ah is None:
+            return
+        with self._lock:
+            counter = self._counters.get(battery_id)
+            if counter is None:
+                counter = self._counters[battery_id] = BatteryCounter()
+            if counter.bms_discharge_ah_base is None or discharge_ah < counter.bms_discharge_ah_base:
+                # Primera observación (o contador reiniciado): nueva referencia
+                counter.bms_discharge_ah_base = discharge_ah
+                counter.estimated_discharge_ah_base = counter.discharge_ah
+            counter.bms_discharge_ah_last = discharge_ah
+
+    # ==================== PERSISTENCIA ====================
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._counters = {int(battery_id): BatteryCounter.from_dict(values)
+                              for battery_id, values in data.get("batteries", {}).items()}
+            logger.info(f"Estado del estimador recuperado: {len(self._counters)} baterías")
+        except Exception as e:
+            logger.warning(f"No se pudo leer el checkpoint del estimador: {str(e)}")
+
+    def checkpoint(self) -> bool:
+        """Guarda los acumuladores (archivo temporal + os.replace)."""
+        with self._lock:
+            data = {"saved_at": time.time(),
+                    "batteries": {str(battery_id): counter.to_dict()
+                                  for battery_id, counter in self._counters.items()}}
+            self._last_checkpoint = data["saved_at"]
+        temp_path = f"{self.checkpoint_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.checkpoint_path)
+            return True
+        except Exception as e:
+            logger.error(f"Error guardando checkpoint del estimador: {str(e)}")
+            return False
+
+    # ==================== CONSULTAS ====================
+
+    def _report(self, battery_id: int, counter: BatteryCounter) -> Dict[str, Any]:
+        capacity = self.capacity(battery_id)
+        report = {
+            "battery_id": battery_id,
+            "charge_ah": round(counter.charge_ah, 3),
+            "discharge_ah": round(counter.discharge_ah, 3),
+            "charge_wh": round(counter.charge_wh, 1),
+            "discharge_wh": round(counter.discharge_wh, 1),
+            "net_ah": round(counter.charge_ah - counter.discharge_ah, 3),
+            "nominal_capacity_ah": capacity,
+            "equivalent_full_cycles": round((counter.charge_ah + counter.discharge_ah) / 2 / capacity, 4)
+            if capacity else None,
+            "integrated_hours": round(counter.integrated_seconds / 3600, 3),
+            "samples": counter.samples,
+            "started_at": counter.started_at,
+            "bms_cross_check": None
+        }
+        if counter.bms_discharge_ah_base is not None:
+            bms_delta = counter.bms_discharge_ah_last - counter.bms_discharge_ah_base
+            estimated_delta = counter.discharge_ah - counter.estimated_discharge_ah_base
+            report["bms_cross_check"] = {
+                "bms_discharge_ah": counter.bms_discharge_ah_last,
+                "bms_delta_ah": round(bms_delta, 3),
+                "estimated_delta_ah": round(estimated_delta, 3),
+                "difference_ah": round(estimated_delta - bms_delta, 3),
+                "ratio": round(estimated_delta / bms_delta, 4) if bms_delta > 0 else None
+            }
+        return report
+
+    def get_battery(self, battery_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            counter = self._counters.get(battery_id)
+            return self._report(battery_id, counter) if counter else None
+
+    def get_fleet(self) -> Dict[str, Any]:
+        with self._lock:
+            batteries = [self._report(battery_id, counter)
+                         for battery_id, counter in sorted(self._counters.items())]
+        return {
+            "batteries": batteries,
+            "totals": {
+                name: round(sum(b[name] for b in batteries), 3)
+                for name in ("charge_ah", "discharge_ah", "charge_wh", "discharge_wh")
+            }
+        }
+
+
+_estimator = None
+_estimator_loaded = False
+_estimator_lock = threading.Lock()
+
+
+def get_energy_estimator() -> Optional[EnergyEstimator]:
+    """Instancia global del estimador (None si está deshabilitado en config.json)."""
+    global _estimator, _estimator_loaded
+    if _estimator_loaded:
+        return _estimator
+    with _estimator_lock:
+        if not _estimator_loaded:
+            settings = {}
+            try:
+                from modbus_app import config_manager
+                settings = config_manager.load_config().get("energy_estimator", {})
+            except Exception as e:
+                logger.warning(f"No se pudo leer la configuración del estimador: {str(e)}")
+            if settings.get("enabled", True):
+                _estimator = EnergyEstimator(settings)
+            _estimator_loaded = True
+        return _estimator
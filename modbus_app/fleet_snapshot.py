@@ -0,0 +1,142 @@
+# modbus_app/fleet_snapshot.py
+"""
+Instantáneas precalculadas del estado de la flota.
+
+Una vez por ciclo de polling se construye un resumen inmutable (estado por batería,
+potencia total, SOC medio, celdas extremas del sitio y recuento por estado), se
+serializa a JSON una sola vez y se publica con un número de versión y un ETag. Los
+handlers HTTP sirven esos bytes tal cual: sin tomar el lock del monitor, sin rehacer
+diccionarios ni volver a codificar, y con 304 si el cliente ya tiene la versión.
+
+La versión solo avanza cuando cambia el contenido.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import logging
+from collections import namedtuple
+from typing import Any, Dict, List, Optional
+
+from .responses import dumps_bytes
+
+logger = logging.getLogger('modbus_app.fleet_snapshot')
+
+# Instantánea publicada (inmutable: se sustituye entera, nunca se modifica)
+FleetSnapshot = namedtuple("FleetSnapshot", ["version", "etag", "body", "built_at", "summary"])
+
+
+def _device_info(discovered_devices: List[Dict], battery_id: int) -> Optional[Dict]:
+    for device in discovered_devices:
+        if device.get("id") == battery_id:
+            return {
+                "manufacturer": "Huawei",
+                "model": device.get("type", "ESM Battery"),
+                "custom_name": device.get("custom_name", f"Battery {battery_id}"),
+                "discovery_date": device.get("discovery_date", "N/A"),
+                "last_seen": device.get("last_seen", "N/A")
+            }
+    return None
+
+
+def _extreme(values: List[tuple], pick) -> Optional[Dict[str, Any]]:
+    """(valor, battery_id) extremo según pick (min/max), o None si no hay valores."""
+    if not values:
+        return None
+    value, battery_id = pick(values)
+    return {"value": value, "battery_id": battery_id}
+
+
+def summarize(batteries: List[Dict[str, Any]], cell_stats: Dict[int, Dict] = None) -> Dict[str, Any]:
+    """Totales del sitio a partir de las entradas de battery_cache."""
+    power = 0.0
+    soc = []
+    states = {}
+    temps_high, temps_low, cells_high, cells_low = [], [], [], []
+    for battery in batteries:
+        battery_id = battery.get("id")
+        state = "Error" if "error" in battery else battery.get("status", "Desconocido")
+        states[state] = states.get(state, 0) + 1
+        if "error" in battery:
+            continue
+        voltage, current = battery.get("voltage"), battery.get("current")
+        if voltage is not None and current is not None:
+            power += voltage * current
+        if battery.get("soc") is not None:
+            soc.append(battery["soc"])
+        if battery.get("highest_cell_temp") is not None:
+            temps_high.append((battery["highest_cell_temp"], battery_id))
+        if battery.get("lowest_cell_temp") is not None:
+            temps_low.append((battery["lowest_cell_temp"], battery_id))
+        cells = (cell_stats or {}).get(battery_id)
+        if cells:
+            if cells.get("voltage_max") is not None:
+                cells_high.append((cells["voltage_max"], battery_id))
+            if cells.get("voltage_min") is not None:
+                cells_low.append((cells["voltage_min"], battery_id))
+
+    return {
+        "battery_count": len(batteries),
+        "total_power_w": round(power, 1),
+        "mean_soc": round(sum(soc) / len(soc), 2) if soc else None,
+        "cell_voltage_min": _extreme(cells_low, min),
+        "cell_voltage_max": _extreme(cells_high, max),
+        "cell_temp_min": _extreme(temps_low, min),
+        "cell_temp_max": _extreme(temps_high, max),
+        "states": states
+    }
+
+
+class SnapshotPublisher:
+    """Construye y publica la instantánea vigente."""
+
+    def __init__(self):
+        self._current = None
+        self._digest = None
+        self._version = 0
+        self._build_lock = threading.Lock()  # Solo entre constructores; los lectores no lo toman
+
+    @property
+    def current(self) -> Optional[FleetSnapshot]:
+        return self._current
+
+    def publish(self, batteries: List[Dict[str, Any]], discovered_devices: List[Dict] = None,
+                cell_stats: Dict[int, Dict] = None) -> FleetSnapshot:
+        """
+        Publica una instantánea con las entradas de battery_cache dadas (copias).
+        Si el contenido no cambió se conserva la versión anterior.
+        """
+        discovered_devices = discovered_devices or []
+        for battery in batteries:
+            battery["device_info"] = _device_info(discovered_devices, battery.get("id"))
+        summary = summarize(batteries, cell_stats)
+        content = json.dumps({"batteries": batteries, "summary": summary},
+                             separators=(',', ':'), sort_keys=True, default=str)
+        digest = hashlib.blake2b(content.encode('utf-8'), digest_size=12).hexdigest()
+
+        with self._build_lock:
+            if digest == self._digest and self._current is not None:
+                return self._current
+            version = self._version + 1
+            built_at = time.time()
+            body = dumps_bytes({
+                "status": "success",
+                "version": version,
+                "last_updated": built_at,
+                "summary": summary,
+                "batteries": batteries
+            }, default=str)
+            snapshot = FleetSnapshot(version, f"{version}-{digest}", body, built_at, summary)
+            # Publicación por asignación atómica de referencia
+            self._current = snapshot
+            self._digest = digest
+            self._version = version
+            return snapshot
+
+
+_publisher = SnapshotPublisher()
+
+
+def get_snapshot_publisher() -> SnapshotPublisher:
+    return _publisher
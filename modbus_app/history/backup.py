@@ -0,0 +1,375 @@
+# modbus_app/history/backup.py
+"""
+Backups en caliente de la base de datos de historial.
+
+- Completo: API de backup de SQLite (`Connection.backup`) por pasos de N páginas.
+  La conexión origen mantiene una transacción de lectura durante toda la copia, de
+  modo que (en WAL) el backup es una instantánea consistente que incluye lo que aún
+  está en el archivo -wal, y el monitor puede seguir escribiendo mientras tanto.
+- Incremental / diferencial: exporta a un archivo SQLite independiente solo los
+  registros de battery_history (y sus celdas) con id mayor que el del último backup
+  (incremental) o que el del último completo (diferencial).
+- Con historial particionado por meses, el backup completo es una carpeta con una
+  copia de cada archivo y los incrementales leen todas las particiones.
+
+Opcionalmente comprime el resultado con gzip y rota los backups antiguos. El estado
+y el progreso del trabajo en curso se consultan con get_status().
+"""
+
+import os
+import gzip
+import json
+import time
+import shutil
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, List
+
+from modbus_app.logger_config import log_to_cmd
+
+logger = logging.getLogger('history.backup')
+
+MODES = ("full", "incremental", "differential")
+
+DEFAULT_SETTINGS = {
+    "directory": "database_backups",
+    "pages_per_step": 256,
+    "step_pause_seconds": 0.005,
+    "keep": 10,                     # Backups completos a conservar (con sus incrementales)
+    "compress": False,
+    "rows_per_chunk": 20000
+}
+
+MANIFEST_NAME = "manifest.json"
+
+# Tablas exportadas en incrementales: (tabla, columna de clave sobre battery_history.id)
+INCREMENTAL_TABLES = (
+    ("battery_history", "id"),
+    ("cell_voltages_history", "battery_history_id"),
+    ("cell_temperatures_history", "battery_history_id")
+)
+
+
+class BackupError(Exception):
+    """Error de configuración o ejecución de un backup."""
+
+
+class BackupService:
+    """Crea backups completos e incrementales sin bloquear la ingesta de historial."""
+
+    def __init__(self, db, settings: Dict[str, Any] = None):
+        self.db = db
+        self.settings = dict(DEFAULT_SETTINGS)
+        if settings:
+            self.settings.update(settings)
+        self.job = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # ==================== MANIFIESTO ====================
+
+    @property
+    def directory(self) -> str:
+        return self.settings["directory"]
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def list_backups(self) -> List[Dict[str, Any]]:
+        """Backups registrados (más antiguo primero)."""
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                return json.load(f).get("backups", [])
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def _save_manifest(self, backups: List[Dict[str, Any]]):
+        path = self._manifest_path()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"backups": backups}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _base_id(self, mode: str) -> int:
+        """Último battery_history.id cubierto por la cadena de backups según el modo."""
+        backups = self.list_backups()
+        if mode == "differential":
+            backups = [b for b in backups if b["mode"] == "full"]
+        if not backups:
+            raise BackupError(f"No existe un backup previo para un backup {mode}; cree primero uno completo")
+        return backups[-1]["max_id"]
+
+    # ==================== TRABAJOS ====================
+
+    def start(self, mode: str = "full", name: str = None, compress: bool = None,
+              wait: bool = False) -> Dict[str, Any]:
+        """
+        Inicia un backup en segundo plano (o lo ejecuta en el hilo actual con wait=True).
+        Devuelve el estado del trabajo.
+        """
+        if mode not in MODES:
+            raise BackupError(f"Modo de backup no soportado: {mode} ({', '.join(MODES)})")
+        compress = self.settings["compress"] if compress is None else bool(compress)
+
+        with self._lock:
+            if self.job and self.job["state"] == "running":
+                raise BackupError("Ya hay un backup en curso")
+            if not name:
+                suffix = "" if mode == "full" else f"_{mode}"
+                name = f"battery_history_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}.db"
+            self.job = {
+                "mode": mode,
+                "name": name,
+                "compress": compress,
+                "state": "running",
+                "progress": 0.0,
+                "started_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+
+        if wait:
+            self._run(self.job)
+        else:
+            self._thread = threading.Thread(target=self._run, args=(self.job,),
+                                            name="history-backup", daemon=True)
+            self._thread.start()
+        return self.get_status()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "job": dict(self.job) if self.job else None,
+            "backups": self.list_backups()
+        }
+
+    def _run(self, job: Dict[str, Any]):
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, job["name"])
+        bundle = job["mode"] == "full" and self.db.partitioned
+        if bundle:
+            # Con particionado el backup completo es una carpeta con un archivo por base
+            path = path[:-3] if path.endswith(".db") else path
+        tmp_path = path + ".part"
+        try:
+            if os.path.exists(path) or os.path.exists(path + ".gz"):
+                raise BackupError(f"El backup ya existe: {job['name']}")
+
+            if bundle:
+                info = self._bundle_backup(tmp_path, job)
+            elif job["mode"] == "full":
+                info = self._full_backup(self.db.db_path, tmp_path, job)
+            else:
+                info = self._incremental_backup(tmp_path, job, self._base_id(job["mode"]))
+
+            if job["compress"]:
+                if bundle:
+                    for name in os.listdir(tmp_path):
+                        self._gzip(os.path.join(tmp_path, name))
+                    os.replace(tmp_path, path)
+                else:
+                    path = self._gzip(tmp_path, path + ".gz")
+            else:
+                os.replace(tmp_path, path)
+
+            entry = {
+                "file": os.path.basename(path),
+                "mode": job["mode"],
+                "created_at": datetime.now().isoformat(),
+                "size_bytes": _size(path),
+                "duration_seconds": round(time.perf_counter() - started, 3)
+            }
+            entry.update(info)
+            backups = self.list_backups() + [entry]
+            removed = self._rotate(backups)
+            self._save_manifest(backups)
+
+            job["result"] = dict(entry, backup_path=path, rotated=removed)
+            job["progress"] = 1.0
+            job["state"] = "done"
+            log_to_cmd(f"Backup {job['mode']} creado: {path} "
+                       f"({entry['size_bytes'] / 1048576:.1f} MB, {entry['duration_seconds']} s)",
+                       "INFO", "DB_BACKUP")
+        except Exception as e:
+            job["state"] = "error"
+            job["error"] = str(e)
+            log_to_cmd(f"Error creando backup: {str(e)}", "ERROR", "DB_BACKUP")
+            _remove(tmp_path)
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+
+    @staticmethod
+    def _gzip(path: str, target: str = None) -> str:
+        """Comprime un archivo con gzip y elimina el original. Devuelve la ruta comprimida."""
+        target = target or path + ".gz"
+        with open(path, 'rb') as src, gzip.open(target, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(path)
+        return target
+
+    def _sources(self) -> List[str]:
+        """Archivos con historial: base principal y, con particionado, un archivo por mes."""
+        sources = [self.db.db_path]
+        if self.db.partitioned:
+            sources += [self.db.partitions.path_for(month) for month in self.db.partitions.months()]
+        return sources
+
+    # ==================== COMPLETO ====================
+
+    def _full_backup(self, source_path: str, path: str, job: Dict[str, Any],
+                     done: int = 0, parts: int = 1) -> Dict[str, Any]:
+        """Copia una base con la API de backup. `done`/`parts` escalan el progreso en carpetas."""
+        pause = self.settings["step_pause_seconds"]
+
+        def progress(status, remaining, total):
+            fraction = (total - remaining) / total if total else 1.0
+            job["progress"] = round((done + fraction) / parts, 4)
+            if pause:
+                # Entre pasos no se retiene ningún bloqueo de escritura
+                time.sleep(pause)
+
+        source = sqlite3.connect(source_path, timeout=30.0, isolation_level=None)
+        target = sqlite3.connect(path)
+        try:
+            # Transacción de lectura: instantánea fija (los escritores en WAL no esperan y
+            # el backup no se reinicia por sus cambios)
+            source.execute("BEGIN")
+            max_id = source.execute("SELECT COALESCE(MAX(id), 0) FROM battery_history").fetchone()[0]
+            source.backup(target, pages=self.settings["pages_per_step"], progress=progress)
+            source.execute("COMMIT")
+            # El archivo de backup queda autónomo (sin -wal)
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            source.close()
+        return {"max_id": max_id, "base_id": 0}
+
+    def _bundle_backup(self, directory: str, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Backup completo con particionado: cada archivo con la API de backup en una carpeta."""
+        os.makedirs(directory)
+        sources = self._sources()
+        max_id = 0
+        for done, source_path in enumerate(sources):
+            info = self._full_backup(source_path, os.path.join(directory, os.path.basename(source_path)),
+                                     job, done, len(sources))
+            max_id = max(max_id, info["max_id"])
+        return {"max_id": max_id, "base_id": 0, "files": len(sources)}
+
+    # ==================== INCREMENTAL ====================
+
+    @staticmethod
+    def _align_table(target, table: str) -> List[str]:
+        """
+        Crea (o amplía con columnas auto-expandidas) la tabla del backup a partir de la
+        de `src`. Devuelve las columnas de origen.
+        """
+        columns = [(row[1], row[2]) for row in target.execute(f"PRAGMA src.table_info({table})")]
+        present = {row[1] for row in target.execute(f"PRAGMA main.table_info({table})")}
+        if not present:
+            target.execute(f"CREATE TABLE main.{table} AS SELECT * FROM src.{table} WHERE 0")
+        else:
+            for name, col_type in columns:
+                if name not in present:
+                    target.execute(f"ALTER TABLE main.{table} ADD COLUMN {name} {col_type}")
+        return [name for name, _ in columns]
+
+    def _incremental_backup(self, path: str, job: Dict[str, Any], base_id: int) -> Dict[str, Any]:
+        chunk = self.settings["rows_per_chunk"]
+        pause = self.settings["step_pause_seconds"]
+        rows = {table: 0 for table, _ in INCREMENTAL_TABLES}
+        max_id = base_id
+        sources = self._sources()
+
+        target = sqlite3.connect(path, isolation_level=None)
+        try:
+            for done, source_path in enumerate(sources):
+                target.execute("ATTACH DATABASE ? AS src", (source_path,))
+                try:
+                    # Transacción de lectura sobre el origen: instantánea consistente
+                    target.execute("BEGIN")
+                    columns = {table: self._align_table(target, table) for table, _ in INCREMENTAL_TABLES}
+                    source_max = target.execute("SELECT COALESCE(MAX(id), 0) FROM src.battery_history").fetchone()[0]
+                    low = base_id
+                    while low < source_max:
+                        # Límite del bloque por keyset (los id pueden tener huecos)
+                        high = target.execute(
+                            "SELECT id FROM src.battery_history WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?",
+                            (low, chunk - 1)
+                        ).fetchone()
+                        high = high[0] if high else source_max
+                        for table, key in INCREMENTAL_TABLES:
+                            names = ", ".join(columns[table])
+                            rows[table] += target.execute(
+                                f"INSERT INTO main.{table} ({names}) SELECT {names} FROM src.{table} "
+                                f"WHERE {key} > ? AND {key} <= ?",
+                                (low, high)
+                            ).rowcount
+                        low = high
+                        if pause:
+                            time.sleep(pause)
+                    target.execute("COMMIT")
+                    max_id = max(max_id, source_max)
+                finally:
+                    target.execute("DETACH DATABASE src")
+                job["progress"] = round((done + 1) / len(sources), 4)
+        finally:
+            target.close()
+        return {"max_id": max_id, "base_id": base_id, "rows": rows}
+
+    # ==================== ROTACIÓN ====================
+
+    def _rotate(self, backups: List[Dict[str, Any]]) -> List[str]:
+        """
+        Conserva los `keep` completos más recientes y los incrementales que dependen de
+        ellos. Modifica la lista en sitio y devuelve los archivos eliminados.
+        """
+        keep = self.settings["keep"]
+        full_indexes = [i for i, b in enumerate(backups) if b["mode"] == "full"]
+        if not keep or len(full_indexes) <= keep:
+            return []
+        # Todo lo anterior al completo más antiguo conservado sobra
+        cutoff = full_indexes[-keep]
+        removed = []
+        for entry in backups[:cutoff]:
+            _remove(os.path.join(self.directory, entry["file"]))
+            removed.append(entry["file"])
+        del backups[:cutoff]
+        return removed
+
+
+def _size(path: str) -> int:
+    """Tamaño en bytes de un archivo o de una carpeta de backup."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def _remove(path: str):
+    """Elimina un archivo o carpeta de backup si existe."""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+# Instancia global (se renueva si la base de datos se reinicializa)
+_service_instance = None
+
+
+def get_backup_service() -> BackupService:
+    """Devuelve el servicio de backups global (configurado desde config.json)."""
+    global _service_instance
+    from .database import get_db
+    db = get_db()
+    if _service_instance is None or _service_instance.db is not db:
+        settings = None
+        try:
+            from modbus_app import config_manager
+            settings = config_manager.load_config().get("backup")
+        except Exception as e:
+            logger.warning(f"No se pudo leer la configuración de backups: {str(e)}")
+        _service_instance = BackupService(db, settings)
+    return _service_instance
@@ -8,69 +8,266 @@ import sqlite3
 import json
 import os
 import threading
-from datetime import datetime
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from contextlib import contextmanager
 from typing import Dict, List, Optional, Any
 import logging
 
+from .. import metrics
+from ..tracing import span
+from .retention import ROLLUP_TABLE_SQL, ROLLUP_INDEX_SQL
+from .partitions import PartitionManager, HistoryWindow, month_start, ID_SHIFT
+from .schema_registry import HistorySchemaRegistry, detect_column_type
+from ..alarms import ALARM_TABLE_SQL, ALARM_INDEX_SQL
+
 # Configurar logger
 logger = logging.getLogger('history.database')
 
+# Índices de las tablas de historial (base principal y particiones)
+HISTORY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_battery_timestamp ON battery_history(battery_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_battery_source ON battery_history(battery_id, source)",
+    "CREATE INDEX IF NOT EXISTS idx_timestamp_range ON battery_history(timestamp)",
+    # Índice de cobertura para las gráficas (SOC/tensión/corriente por batería y tiempo)
+    "CREATE INDEX IF NOT EXISTS idx_history_chart ON battery_history(battery_id, timestamp, id, soc, pack_voltage, battery_current)",
+    "CREATE INDEX IF NOT EXISTS idx_cell_voltages_history ON cell_voltages_history(battery_history_id, cell_number)",
+    "CREATE INDEX IF NOT EXISTS idx_cell_temperatures_history ON cell_temperatures_history(battery_history_id, cell_number)"
+]
+
+# Conexiones de escritura persistentes (mes actual y meses de backfill con particionado)
+MAX_WRITERS = 4
+
 class BatteryHistoryDB:
     """
     Gestor de base de datos SQLite para historial de baterías.
     Thread-safe y optimizado para operaciones de historial.
     """
     
-    def __init__(self, db_path: str = "battery_history.db"):
+    def __init__(self, db_path: str = "battery_history.db", partitioning: str = None,
+                 partition_dir: str = None):
         """
         Inicializa el gestor de base de datos.
         
         Args:
             db_path (str): Ruta al archivo de base de datos SQLite
+            partitioning (str, optional): 'monthly' para un archivo de historial por mes
+            partition_dir (str, optional): Carpeta de las particiones (relativa a db_path)
         """
         self.db_path = db_path
         self.lock = threading.RLock()
+        self.schema = HistorySchemaRegistry()
+        self._writers = OrderedDict()  # ruta -> conexión de escritura
+        self.partitions = None
+        if partitioning == "monthly":
+            directory = partition_dir or "history_partitions"
+            if not os.path.isabs(directory):
+                directory = os.path.join(os.path.dirname(os.path.abspath(db_path)), directory)
+            self.partitions = PartitionManager(directory, self._create_history_tables,
+                                               self._configure_connection, self._close_writer)
         self._ensure_database_exists()
+    
+    @property
+    def partitioned(self) -> bool:
+        return self.partitions is not None
         
     def _ensure_database_exists(self):
         """Crea la base de datos y tablas si no existen."""
         try:
+            if not os.path.exists(self.db_path):
+                # auto_vacuum solo se puede fijar antes de crear la primera tabla y de pasar a WAL
+                conn = sqlite3.connect(self.db_path)
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+                conn.close()
             with self.get_connection() as conn:
                 self._create_tables(conn)
+                legacy_rows = conn.execute("SELECT EXISTS (SELECT 1 FROM battery_history)").fetchone()[0]
                 logger.info(f"Base de datos inicializada: {self.db_path}")
+            if self.partitioned and legacy_rows:
+                # Historial previo al particionado: se reparte una vez en archivos mensuales
+                moved = self.partitions.migrate_legacy(self.db_path)
+                logger.info(f"Historial migrado a particiones mensuales: {moved['rows']} registros "
+                            f"en {moved['months']} meses")
         except Exception as e:
             logger.error(f"Error al inicializar base de datos: {str(e)}")
             raise
     
+    @staticmethod
+    def _configure_connection(conn: sqlite3.Connection):
+        """Configuraciones de optimización comunes a la base principal y las particiones."""
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA cache_size = 10000")
+        conn.execute("PRAGMA foreign_keys = ON")
+    
     @contextmanager
     def get_connection(self):
         """
         Context manager para obtener conexión a la base de datos.
         Garantiza que la conexión se cierre automáticamente.
         """
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            conn.row_factory = sqlite3.Row  # Para acceso por nombre de columna
-            # Configuraciones de optimización
-            conn.execute("PRAGMA journal_mode = WAL")
-            conn.execute("PRAGMA synchronous = NORMAL")
-            conn.execute("PRAGMA cache_size = 10000")
-            conn.execute("PRAGMA foreign_keys = ON")
+        with span("db.connection"):
+            conn = None
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=30.0)
+                conn.row_factory = sqlite3.Row  # Para acceso por nombre de columna
+                self._configure_connection(conn)
+                yield conn
+            except Exception as e:
+                if conn:
+                    conn.rollback()
+                logger.error(f"Error en conexión a base de datos: {str(e)}")
+                raise
+            finally:
+                if conn:
+                    conn.close()
+    
+    # ==================== PARTICIONES ====================
+    
+    def history_windows(self, start=None, end=None, descending: bool = False) -> List[HistoryWindow]:
+        """
+        Ventanas de lectura que cubren [start, end]. Sin particionado hay una sola ventana;
+        con particionado, una por cada grupo de meses que cabe en una conexión.
+        """
+        if not self.partitioned:
+            return [HistoryWindow(None, None, None)]
+        return self.partitions.windows(start, end, descending)
+    
+    @contextmanager
+    def history_connection(self, start=None, end=None, window: HistoryWindow = None):
+        """
+        Conexión para consultar battery_history y las tablas de celdas.
+        Con particionado adjunta solo los meses que solapan [start, end] (o los de la
+        ventana indicada); las tablas se leen con sus nombres habituales.
+        """
+        with self.get_connection() as conn:
+            if self.partitioned:
+                months = window.months if window is not None else self.partitions.overlapping(start, end)
+                self.partitions.attach(conn, months, self.db_path)
             yield conn
-        except Exception as e:
-            if conn:
+    
+    def _write_path(self, timestamp) -> str:
+        """Archivo que recibe un registro de historial (partición de su mes si aplica)."""
+        if self.partitioned:
+            return self.partitions.ensure(month_start(timestamp))
+        return self.db_path
+    
+    @contextmanager
+    def _write_connection(self, path: str):
+        """
+        Conexión de escritura persistente para un archivo de historial.
+        Se reutiliza entre inserciones para que sqlite3 conserve las sentencias
+        preparadas; el acceso se serializa con self.lock.
+        """
+        with self.lock:
+            conn = self._writers.get(path)
+            if conn is None:
+                conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                self._configure_connection(conn)
+                self._writers[path] = conn
+                while len(self._writers) > MAX_WRITERS:
+                    _, oldest = self._writers.popitem(last=False)
+                    oldest.close()
+            else:
+                self._writers.move_to_end(path)
+            try:
+                yield conn
+            except Exception:
                 conn.rollback()
-            logger.error(f"Error en conexión a base de datos: {str(e)}")
-            raise
-        finally:
-            if conn:
+                raise
+    
+    def _close_writer(self, path: str):
+        """Cierra la conexión de escritura de un archivo (p. ej. antes de borrarlo)."""
+        with self.lock:
+            conn = self._writers.pop(path, None)
+            if conn is not None:
                 conn.close()
+            self.schema.invalidate(path)
+    
+    def close(self):
+        """Cierra las conexiones de escritura persistentes."""
+        with self.lock:
+            for path in list(self._writers):
+                self._close_writer(path)
+    
+    def get_history_columns(self) -> List[tuple]:
+        """(nombre, tipo declarado) de battery_history, incluidas columnas auto-expandidas."""
+        if self.partitioned:
+            return self.partitions.columns(self.db_path)
+        with self.get_connection() as conn:
+            return [(row[1], row[2] or "") for row in conn.execute("PRAGMA table_info(battery_history)")]
     
     def _create_tables(self, conn: sqlite3.Connection):
         """Crea todas las tablas necesarias."""
         
+        # Historial y celdas (en modo particionado quedan vacías en la base principal)
+        self._create_history_tables(conn)
+        
+        # Tabla para control de sincronización
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_status (
+                battery_id INTEGER PRIMARY KEY,
+                manufacturer TEXT,
+                model TEXT,
+                serial_number TEXT,
+                cell_count INTEGER,
+                
+                -- Control de sincronización inicial
+                initial_sync_completed BOOLEAN DEFAULT FALSE,
+                initial_sync_date DATETIME,
+                total_records_imported INTEGER DEFAULT 0,
+                last_record_number INTEGER,
+                
+                -- Control de monitoreo continuo
+                continuous_monitoring BOOLEAN DEFAULT FALSE,
+                monitoring_start_date DATETIME,
+                last_monitor_reading DATETIME,
+                total_monitor_records INTEGER DEFAULT 0,
+                
+                -- Metadatos
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Tabla para metadatos de exportación
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS export_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                battery_id INTEGER,
+                export_type TEXT,           -- 'full', 'range', 'filtered'
+                start_date DATETIME,
+                end_date DATETIME,
+                records_exported INTEGER,
+                file_format TEXT,           -- 'json', 'csv'
+                file_path TEXT,
+                export_duration_seconds REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Tabla de agregados por intervalo (retención por niveles, ver retention.py)
+        conn.execute(ROLLUP_TABLE_SQL)
+        conn.execute(ROLLUP_INDEX_SQL)
+        
+        # Eventos de alarma (ver modbus_app/alarms.py)
+        conn.execute(ALARM_TABLE_SQL)
+        for index_sql in ALARM_INDEX_SQL:
+            conn.execute(index_sql)
+        
+        # Crear índices para optimización
+        self._create_indexes(conn)
+        
+        # Confirmar cambios
+        conn.commit()
+        logger.info("Tablas creadas exitosamente")
+    
+    def _create_history_tables(self, conn: sqlite3.Connection):
+        """Crea las tablas de historial y celdas (base principal o partición mensual)."""
+        
         # Tabla principal de histórico
         conn.execute("""
             CREATE TABLE IF NOT EXISTS battery_history (
@@ -142,64 +339,17 @@ class BatteryHistoryDB:
             )
         """)
         
-        # Tabla para control de sincronización
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS sync_status (
-                battery_id INTEGER PRIMARY KEY,
-                manufacturer TEXT,
-                model TEXT,
-                serial_number TEXT,
-                cell_count INTEGER,
-                
-                -- Control de sincronización inicial
-                initial_sync_completed BOOLEAN DEFAULT FALSE,
-                initial_sync_date DATETIME,
-                total_records_imported INTEGER DEFAULT 0,
-                last_record_number INTEGER,
-                
-                -- Control de monitoreo continuo
-                continuous_monitoring BOOLEAN DEFAULT FALSE,
-                monitoring_start_date DATETIME,
-                last_monitor_reading DATETIME,
-                total_monitor_records INTEGER DEFAULT 0,
-                
-                -- Metadatos
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Tabla para metadatos de exportación
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS export_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                battery_id INTEGER,
-                export_type TEXT,           -- 'full', 'range', 'filtered'
-                start_date DATETIME,
-                end_date DATETIME,
-                records_exported INTEGER,
-                file_format TEXT,           -- 'json', 'csv'
-                file_path TEXT,
-                export_duration_seconds REAL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Crear índices para optimización
-        self._create_indexes(conn)
+        for index_sql in HISTORY_INDEXES:
+            try:
+                conn.execute(index_sql)
+            except Exception as e:
+                logger.warning(f"Error creando índice: {str(e)}")
         
-        # Confirmar cambios
         conn.commit()
-        logger.info("Tablas creadas exitosamente")
     
     def _create_indexes(self, conn: sqlite3.Connection):
         """Crea índices para optimizar consultas."""
         indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_battery_timestamp ON battery_history(battery_id, timestamp)",
-            "CREATE INDEX IF NOT EXISTS idx_battery_source ON battery_history(battery_id, source)",
-            "CREATE INDEX IF NOT EXISTS idx_timestamp_range ON battery_history(timestamp)",
-            "CREATE INDEX IF NOT EXISTS idx_cell_voltages_history ON cell_voltages_history(battery_history_id, cell_number)",
-            "CREATE INDEX IF NOT EXISTS idx_cell_temperatures_history ON cell_temperatures_history(battery_history_id, cell_number)",
             "CREATE INDEX IF NOT EXISTS idx_sync_battery ON sync_status(battery_id)"
         ]
         
@@ -209,65 +359,54 @@ class BatteryHistoryDB:
             except Exception as e:
                 logger.warning(f"Error creando índice: {str(e)}")
 
-    def auto_add_column(self, column_name, column_type="INTEGER"):
+    def auto_add_column(self, column_name, column_type="INTEGER", timestamp=None):
         """
-        Agrega automáticamente una columna a la tabla battery_history.
+        Agrega una columna a la tabla battery_history.
         
         Args:
             column_name: Nombre de la columna
             column_type: Tipo SQL (INTEGER, REAL, TEXT)
+            timestamp: Con particionado, registro cuyo mes recibe la columna (por defecto el actual)
         """
         try:
-            with self.get_connection() as conn:
-                sql = f"ALTER TABLE battery_history ADD COLUMN {column_name} {column_type}"
-                conn.execute(sql)
+            path = self._write_path(timestamp or datetime.now())
+            with self._write_connection(path) as conn:
+                if column_name in self.schema.columns(conn, path):
+                    print(f"AUTO-EXPAND: Columna '{column_name}' ya existe")
+                    return True  # No es error, ya existía
+                conn.execute(f"ALTER TABLE battery_history ADD COLUMN {column_name} {column_type}")
                 conn.commit()
-                print(f"AUTO-EXPAND: Columna '{column_name}' ({column_type}) agregada exitosamente")
-                return True
+                self.schema.invalidate(path)
+            if self.partitioned:
+                self.partitions.invalidate()
+            print(f"AUTO-EXPAND: Columna '{column_name}' ({column_type}) agregada exitosamente")
+            return True
         except Exception as e:
-            error_msg = str(e).lower()
-            if "duplicate column name" in error_msg:
-                print(f"AUTO-EXPAND: Columna '{column_name}' ya existe")
-                return True  # No es error, ya existía
-            else:
-                print(f"AUTO-EXPAND: Error agregando columna '{column_name}': {str(e)}")
-                return False
-    
-    def _extract_missing_column(self, error_message):
-        """
-        Extrae el nombre de la columna faltante del mensaje de error SQLite.
-        """
-        try:
-            # SQLite error: "no such column: hardware_faults"
-            if "no such column:" in error_message:
-                return error_message.split("no such column:")[1].strip()
-            # Otros formatos posibles
-            elif "unknown column" in error_message:
-                return error_message.split("unknown column")[1].strip().strip("'\"")
-            return None
-        except:
-            return None
+            print(f"AUTO-EXPAND: Error agregando columna '{column_name}': {str(e)}")
+            return False
 
     def _detect_column_type(self, value):
         """
         Detecta automáticamente el tipo de columna SQL basado en el valor.
         """
-        if value is None:
-            return "INTEGER"  # Tipo por defecto
-        elif isinstance(value, bool):
-            return "INTEGER"  # SQLite guarda bool como INTEGER
-        elif isinstance(value, int):
-            return "INTEGER"
-        elif isinstance(value, float):
-            return "REAL"
-        elif isinstance(value, str):
-            return "TEXT"
-        else:
-            return "TEXT"  # Tipo por defecto para casos desconocidos
-        
-    def _insert_normal(self, conn, battery_id, timestamp, source, basic_data, cell_voltages=None, cell_temperatures=None):
+        return detect_column_type(value)
+        
+    def _ensure_history_columns(self, conn, path, values: Dict):
+        """
+        Añade por adelantado, en una transacción, las columnas de `values` que el
+        archivo aún no tiene (campos auto-expandidos).
+        """
+        added = self.schema.ensure_columns(conn, path, values)
+        if added:
+            if self.partitioned:
+                self.partitions.invalidate()
+            for column_name in added:
+                print(f"AUTO-EXPAND: Columna '{column_name}' "
+                      f"({detect_column_type(values[column_name])}) agregada exitosamente")
+    
+    def _insert_normal(self, conn, path, battery_id, timestamp, source, basic_data, cell_voltages=None, cell_temperatures=None):
         """
-        Inserción normal sin auto-expand (lógica original).
+        Inserción de un registro con la sentencia cacheada de su conjunto de columnas.
         """
         # Calcular estadísticas de celdas
         cell_stats = self._calculate_cell_stats(cell_voltages, cell_temperatures)
@@ -297,13 +436,11 @@ class BatteryHistoryDB:
             if key not in base_values:  # Solo campos nuevos
                 base_values[key] = value
         
-        # Construir SQL dinámico
-        columns = ', '.join(base_values.keys())
-        placeholders = ', '.join(['?' for _ in base_values])
-        values = list(base_values.values())
+        # Columnas nuevas antes de insertar: el INSERT no falla por esquema
+        self._ensure_history_columns(conn, path, base_values)
         
-        sql = f"INSERT INTO battery_history ({columns}) VALUES ({placeholders})"
-        cursor = conn.execute(sql, values)
+        sql = self.schema.insert_sql(base_values.keys())
+        cursor = conn.execute(sql, list(base_values.values()))
         history_id = cursor.lastrowid
         
         # Insertar datos de celdas (sin cambios)
@@ -374,28 +511,22 @@ class BatteryHistoryDB:
         """
         Inserta un registro completo de historial CON AUTO-EXPAND.
         """
+        metrics.db_pending_writes.inc()
+        start_time = time.perf_counter()
         try:
-            with self.get_connection() as conn:
-                # Intentar insertar normalmente primero
-                try:
-                    return self._insert_normal(conn, battery_id, timestamp, source, basic_data, 
-                                            cell_voltages, cell_temperatures)
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    if "no such column" in error_msg or "unknown column" in error_msg:
-                        # Extraer nombre de columna faltante
-                        missing_column = self._extract_missing_column(str(e))
-                        if missing_column and missing_column in basic_data:
-                            print(f"AUTO-EXPAND: Detectada columna faltante: {missing_column}")
-                            
-                            # Agregar columna automáticamente
-                            column_type = self._detect_column_type(basic_data[missing_column])
-                            if self.auto_add_column(missing_column, column_type):
-                                # Reintentar inserción
-                                return self._insert_normal(conn, battery_id, timestamp, source, basic_data,
-                                                        cell_voltages, cell_temperatures)
-                    raise e  # Re-lanzar si no se pudo resolver
-                    
+            return self._insert_history_record(battery_id, timestamp, source, basic_data,
+                                               cell_voltages, cell_temperatures)
+        finally:
+            metrics.db_pending_writes.dec()
+            metrics.db_commit_latency.observe(time.perf_counter() - start_time)
+    
+    def _insert_history_record(self, battery_id, timestamp, source, basic_data,
+                               cell_voltages, cell_temperatures) -> Optional[int]:
+        try:
+            path = self._write_path(timestamp)
+            with self._write_connection(path) as conn:
+                return self._insert_normal(conn, path, battery_id, timestamp, source, basic_data,
+                                           cell_voltages, cell_temperatures)
         except Exception as e:
             logger.error(f"Error insertando registro de historial: {str(e)}")
             return None
@@ -478,26 +609,46 @@ class BatteryHistoryDB:
             limit: Número máximo de registros
             
         Returns:
-            Lista de registros de historial
+            Lista de registros de historial (los anteriores al corte de retención,
+            agregados por intervalo con id None)
         """
         try:
-            with self.get_connection() as conn:
-                sql = "SELECT * FROM battery_history WHERE battery_id = ?"
-                params = [battery_id]
-                
-                if start_date:
-                    sql += " AND timestamp >= ?"
-                    params.append(start_date)
-                
-                if end_date:
-                    sql += " AND timestamp <= ?"
-                    params.append(end_date)
-                
-                sql += " ORDER BY timestamp DESC LIMIT ?"
-                params.append(limit)
-                
-                cursor = conn.execute(sql, params)
-                return [dict(row) for row in cursor.fetchall()]
+            sql = "SELECT * FROM battery_history WHERE battery_id = ?"
+            params = [battery_id]
+            
+            if start_date:
+                sql += " AND timestamp >= ?"
+                params.append(start_date)
+            
+            if end_date:
+                sql += " AND timestamp <= ?"
+                params.append(end_date)
+            
+            sql += " ORDER BY timestamp DESC LIMIT ?"
+            
+            # Con particionado se recorren los meses del más reciente al más antiguo
+            records = []
+            for window in self.history_windows(start_date, end_date, descending=True):
+                with self.history_connection(window=window) as conn:
+                    cursor = conn.execute(sql, params + [limit - len(records)])
+                    records.extend(dict(row) for row in cursor.fetchall())
+                if len(records) >= limit:
+                    break
+            
+            # Parte del rango ya agregada por la retención: un registro por intervalo
+            if len(records) < limit:
+                from .retention import read_rollup, rollup_field_column
+                fields = [name for name, _ in self.get_history_columns()
+                          if rollup_field_column(name)]
+                with self.get_connection() as conn:
+                    rows = read_rollup(conn, battery_id, fields, start_date, end_date,
+                                       descending=True, limit=limit - len(records))
+                for bucket_start, resolution, samples, *values in rows:
+                    record = {"id": None, "battery_id": battery_id, "timestamp": bucket_start,
+                              "rollup_resolution": resolution, "rollup_samples": samples}
+                    record.update(zip(fields, values))
+                    records.append(record)
+            return records
                 
         except Exception as e:
             logger.error(f"Error consultando historial: {str(e)}")
@@ -506,110 +657,184 @@ class BatteryHistoryDB:
     def get_cell_data_for_history(self, history_id: int) -> Dict:
         """Obtiene datos detallados de celdas para un registro específico."""
         try:
-            with self.get_connection() as conn:
-                # Obtener voltajes
-                voltage_cursor = conn.execute(
-                    "SELECT * FROM cell_voltages_history WHERE battery_history_id = ? ORDER BY cell_number",
-                    (history_id,)
-                )
-                voltages = [dict(row) for row in voltage_cursor.fetchall()]
-                
-                # Obtener temperaturas
-                temp_cursor = conn.execute(
-                    "SELECT * FROM cell_temperatures_history WHERE battery_history_id = ? ORDER BY cell_number",
-                    (history_id,)
-                )
-                temperatures = [dict(row) for row in temp_cursor.fetchall()]
-                
-                return {
-                    'voltages': voltages,
-                    'temperatures': temperatures
-                }
+            window = None
+            if self.partitioned and history_id >> ID_SHIFT:
+                # El id indica el mes de su partición
+                month_index = history_id >> ID_SHIFT
+                month = datetime(month_index // 12, month_index % 12 + 1, 1)
+                window = HistoryWindow(month, None, [month] if month in self.partitions.months() else [])
+            for window in [window] if window else self.history_windows():
+                result = self._cell_data(window, history_id)
+                if result['voltages'] or result['temperatures']:
+                    return result
+            return {'voltages': [], 'temperatures': []}
                 
         except Exception as e:
             logger.error(f"Error obteniendo datos de celdas: {str(e)}")
             return {'voltages': [], 'temperatures': []}
     
+    def _cell_data(self, window: HistoryWindow, history_id: int) -> Dict:
+        with self.history_connection(window=window) as conn:
+            # Obtener voltajes
+            voltage_cursor = conn.execute(
+                "SELECT * FROM cell_voltages_history WHERE battery_history_id = ? ORDER BY cell_number",
+                (history_id,)
+            )
+            voltages = [dict(row) for row in voltage_cursor.fetchall()]
+            
+            # Obtener temperaturas
+            temp_cursor = conn.execute(
+                "SELECT * FROM cell_temperatures_history WHERE battery_history_id = ? ORDER BY cell_number",
+                (history_id,)
+            )
+            temperatures = [dict(row) for row in temp_cursor.fetchall()]
+            
+            return {
+                'voltages': voltages,
+                'temperatures': temperatures
+            }
+    
     # ==================== UTILIDADES ====================
     
     def get_database_stats(self) -> Dict:
         """Obtiene estadísticas de la base de datos."""
         try:
+            stats = {}
+            
+            # Tablas de la base principal
             with self.get_connection() as conn:
-                stats = {}
-                
-                # Estadísticas por tabla
-                tables = ['battery_history', 'cell_voltages_history', 'cell_temperatures_history', 'sync_status']
-                
-                for table in tables:
+                for table in ['sync_status', 'history_rollup']:
                     cursor = conn.execute(f"SELECT COUNT(*) FROM {table}")
                     stats[f"{table}_count"] = cursor.fetchone()[0]
-                
-                # Estadísticas por batería
-                cursor = conn.execute("""
-                    SELECT battery_id, COUNT(*) as record_count, 
-                           MIN(timestamp) as first_record, 
-                           MAX(timestamp) as last_record
-                    FROM battery_history 
-                    GROUP BY battery_id
-                """)
-                
-                stats['batteries'] = [dict(row) for row in cursor.fetchall()]
-                
-                # Tamaño del archivo
-                if os.path.exists(self.db_path):
-                    stats['file_size_mb'] = round(os.path.getsize(self.db_path) / (1024 * 1024), 2)
-                
-                return stats
+            
+            # Tablas de historial (sumadas sobre todas las particiones si las hay)
+            history_tables = ['battery_history', 'cell_voltages_history', 'cell_temperatures_history']
+            for table in history_tables:
+                stats[f"{table}_count"] = 0
+            batteries = {}
+            for window in self.history_windows():
+                with self.history_connection(window=window) as conn:
+                    for table in history_tables:
+                        cursor = conn.execute(f"SELECT COUNT(*) FROM {table}")
+                        stats[f"{table}_count"] += cursor.fetchone()[0]
+                    
+                    # Estadísticas por batería
+                    cursor = conn.execute("""
+                        SELECT battery_id, COUNT(*) as record_count, 
+                               MIN(timestamp) as first_record, 
+                               MAX(timestamp) as last_record
+                        FROM battery_history 
+                        GROUP BY battery_id
+                    """)
+                    for row in cursor.fetchall():
+                        entry = batteries.setdefault(row['battery_id'], dict(row, record_count=0))
+                        entry['record_count'] += row['record_count']
+                        entry['first_record'] = min(entry['first_record'], row['first_record'])
+                        entry['last_record'] = max(entry['last_record'], row['last_record'])
+            
+            stats['batteries'] = [batteries[battery_id] for battery_id in sorted(batteries)]
+            
+            # Tamaño del archivo
+            if os.path.exists(self.db_path):
+                stats['file_size_mb'] = round(os.path.getsize(self.db_path) / (1024 * 1024), 2)
+            
+            if self.partitioned:
+                months = self.partitions.months()
+                partition_bytes = sum(os.path.getsize(self.partitions.path_for(m)) for m in months)
+                stats['partitions'] = [m.strftime('%Y-%m') for m in months]
+                stats['partitions_size_mb'] = round(partition_bytes / (1024 * 1024), 2)
+            
+            return stats
                 
         except Exception as e:
             logger.error(f"Error obteniendo estadísticas: {str(e)}")
             return {}
     
-    def cleanup_old_records(self, battery_id: int, keep_days: int = 365) -> int:
+    def cleanup_old_records(self, battery_id: int, keep_days: int = 365, batch_size: int = 900) -> int:
         """
         Limpia registros antiguos para mantener el tamaño de la DB.
+        Borra por lotes (celdas incluidas) para no bloquear las escrituras del monitor.
+        Para retención por niveles con agregados ver history.retention.
         
         Args:
             battery_id: ID de la batería
             keep_days: Días de historial a mantener
+            batch_size: Registros eliminados por transacción
             
         Returns:
             Número de registros eliminados
         """
         try:
+            cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            cutoff = cutoff - timedelta(days=keep_days)
+            cutoff_date = cutoff.strftime('%Y-%m-%d %H:%M:%S')
+            deleted_count = 0
+            
             with self.get_connection() as conn:
-                cutoff_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                cutoff_date = cutoff_date.replace(day=cutoff_date.day - keep_days)
+                deleted_count += self._delete_batches(conn, battery_id, cutoff_date, batch_size)
+            if self.partitioned:
+                for month in self.partitions.overlapping(None, cutoff):
+                    with self.partitions.connect(month) as conn:
+                        deleted_count += self._delete_batches(conn, battery_id, cutoff_date, batch_size)
                 
-                cursor = conn.execute(
-                    "DELETE FROM battery_history WHERE battery_id = ? AND timestamp < ?",
-                    (battery_id, cutoff_date)
-                )
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                logger.info(f"Eliminados {deleted_count} registros antiguos de batería {battery_id}")
-                return deleted_count
+            logger.info(f"Eliminados {deleted_count} registros antiguos de batería {battery_id}")
+            return deleted_count
                 
         except Exception as e:
             logger.error(f"Error limpiando registros antiguos: {str(e)}")
             return 0
+    
+    def _delete_batches(self, conn, battery_id: int, cutoff_date: str, batch_size: int) -> int:
+        """Elimina por lotes los registros de una batería anteriores al corte en una base."""
+        deleted_count = 0
+        while True:
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM battery_history WHERE battery_id = ? AND timestamp < ? "
+                "ORDER BY timestamp LIMIT ?",
+                (battery_id, cutoff_date, batch_size)
+            )]
+            if not ids:
+                break
+            placeholders = ",".join("?" * len(ids))
+            conn.execute(f"DELETE FROM cell_voltages_history WHERE battery_history_id IN ({placeholders})", ids)
+            conn.execute(f"DELETE FROM cell_temperatures_history WHERE battery_history_id IN ({placeholders})", ids)
+            deleted_count += conn.execute(f"DELETE FROM battery_history WHERE id IN ({placeholders})", ids).rowcount
+            conn.commit()
+            if len(ids) < batch_size:
+                break
+        return deleted_count
 
 
 # Instancia global del gestor de base de datos
 _db_instance = None
+_db_lock = threading.Lock()
+
+def _storage_settings() -> Dict:
+    """Sección `storage` de config.json (particionado del historial)."""
+    try:
+        from modbus_app import config_manager
+        storage = config_manager.load_config().get("storage", {})
+    except Exception as e:
+        logger.warning(f"No se pudo leer la configuración de almacenamiento: {str(e)}")
+        storage = {}
+    return {
+        "partitioning": storage.get("partitioning"),
+        "partition_dir": storage.get("partition_dir")
+    }
 
 def get_db() -> BatteryHistoryDB:
     """Obtiene la instancia global de la base de datos."""
     global _db_instance
     if _db_instance is None:
-        _db_instance = BatteryHistoryDB()
+        # El calentamiento y las primeras peticiones pueden llegar a la vez
+        with _db_lock:
+            if _db_instance is None:
+                _db_instance = BatteryHistoryDB(**_storage_settings())
     return _db_instance
 
 def initialize_database(db_path: str = "battery_history.db") -> BatteryHistoryDB:
     """Inicializa la base de datos con una ruta específica."""
     global _db_instance
-    _db_instance = BatteryHistoryDB(db_path)
-    return _db_instance
\ No newline at end of file
+    with _db_lock:
+        _db_instance = BatteryHistoryDB(db_path, **_storage_settings())
+    return _db_instance
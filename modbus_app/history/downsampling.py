@@ -0,0 +1,86 @@
+# modbus_app/history/downsampling.py
+"""
+Reducción de series temporales para gráficas.
+
+- LTTB (Largest-Triangle-Three-Buckets): elige en cada intervalo el punto que forma
+  el triángulo de mayor área con el punto elegido en el intervalo anterior y la
+  media del siguiente. Conserva la forma visual (picos, escalones) con `points`
+  puntos reales de la serie.
+- Envolvente min/max: por intervalo devuelve el mínimo y el máximo, útil para
+  dibujar bandas sin perder extremos (picos de corriente, caídas de tensión).
+
+Las operaciones se vectorizan con NumPy: límites, sumas y medias de intervalo se
+calculan de una vez para toda la serie, y LTTB solo itera sobre los intervalos
+(no sobre los puntos).
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+METHODS = ("lttb", "minmax")
+
+
+def _bucket_edges(n: int, buckets: int, first: int = 0, last: int = None) -> np.ndarray:
+    """Límites [inicio, fin) de `buckets` intervalos de igual número de puntos en [first, last)."""
+    last = n if last is None else last
+    return np.linspace(first, last, buckets + 1).astype(np.int64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce la serie (x, y) a `points` puntos con LTTB.
+    x debe estar ordenado y sin NaN en y.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return x, y
+
+    # El primer y el último punto se conservan; el resto se reparte en points-2 intervalos
+    buckets = points - 2
+    edges = _bucket_edges(n, buckets, 1, n - 1)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Medias de cada intervalo (ancla "siguiente" del triángulo), vectorizadas
+    counts = (ends - starts).astype(np.float64)
+    x_avg = np.add.reduceat(x, starts) / counts
+    y_avg = np.add.reduceat(y, starts) / counts
+    # El ancla del último intervalo es el último punto
+    next_x = np.append(x_avg[1:], x[-1])
+    next_y = np.append(y_avg[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(buckets):
+        start, end = starts[i], ends[i]
+        ax, ay = x[a], y[a]
+        bx, by = x[start:end], y[start:end]
+        # Doble del área del triángulo (a, b, siguiente); el factor 1/2 no cambia el máximo
+        area = np.abs((ax - next_x[i]) * (by - ay) - (ax - bx) * (next_y[i] - ay))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return x[selected], y[selected]
+
+
+def minmax_envelope(x: np.ndarray, y: np.ndarray, points: int) -> Dict[str, np.ndarray]:
+    """
+    Envolvente min/max en `points` intervalos de igual número de muestras.
+    Devuelve inicio de intervalo (x), mínimo, máximo y media por intervalo.
+    """
+    n = len(x)
+    if n == 0:
+        empty = np.empty(0)
+        return {"x": empty, "min": empty, "max": empty, "mean": empty}
+    buckets = min(points, n)
+    starts = _bucket_edges(n, buckets)[:-1]
+    starts = np.unique(starts)
+    counts = np.diff(np.append(starts, n)).astype(np.float64)
+    return {
+        "x": x[starts],
+        "min": np.minimum.reduceat(y, starts),
+        "max": np.maximum.reduceat(y, starts),
+        "mean": np.add.reduceat(y, starts) / counts
+    }
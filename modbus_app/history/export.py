@@ -0,0 +1,553 @@
+# modbus_app/history/export.py
+"""
+Exportación en streaming del historial de baterías (CSV, Parquet, Arrow IPC).
+
+Los registros de battery_history (y opcionalmente las celdas) se leen por bloques
+ordenados por clave (battery_id, timestamp, id) mediante paginación keyset, y cada
+bloque se serializa y entrega antes de leer el siguiente. La memoria usada es la de
+un bloque, independientemente del tamaño de la exportación.
+
+Resoluciones:
+    raw      Registros tal como se grabaron (con celdas si se solicitan)
+    15min, 1h, 1d
+             Agregados por intervalo (media de cada columna numérica, mínimo y
+             máximo de tensión, corriente y SOC). La parte del rango anterior al
+             corte de retención se toma de history_rollup.
+
+Parquet y Arrow IPC requieren pyarrow (dependencia opcional).
+"""
+
+import calendar
+import csv
+import io
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, List, Optional, Sequence
+
+from modbus_app.register_schema import get_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger('history.export')
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows")
+}
+
+# Segundos por intervalo de cada resolución agregada
+RESOLUTIONS = {
+    "raw": None,
+    "15min": 900,
+    "1h": 3600,
+    "1d": 86400
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Columnas con mínimo/máximo además de la media en resoluciones agregadas
+ENVELOPE_COLUMNS = ("pack_voltage", "battery_current", "soc")
+
+# Columnas omitidas en la exportación
+EXCLUDED_COLUMNS = ("created_at",)
+
+# Columnas de clave (enteras, no se agregan)
+KEY_COLUMNS = ("id", "battery_id", "timestamp")
+
+# Máximo de variables por sentencia al consultar celdas de un bloque
+_IN_BATCH = 900
+
+
+class ExportError(Exception):
+    """Parámetros de exportación inválidos o formato no disponible."""
+
+
+def _column_kind(col_type: str, name: str = None) -> str:
+    """
+    Tipo de exportación de una columna: 'int' para claves, 'float' para columnas
+    numéricas (SQLite no garantiza enteros en columnas INTEGER) y 'str' para el resto.
+    """
+    if name in ("id", "battery_id"):
+        return "int"
+    if any(token in col_type for token in ("INT", "REAL", "FLOA", "DOUB", "NUM", "BOOL")):
+        return "float"
+    return "str"
+
+
+def _db_time(value: datetime) -> str:
+    """Formato de texto con el que se almacenan los timestamps en SQLite."""
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _epoch(text: str) -> int:
+    """Segundos desde epoch de un timestamp almacenado (como strftime('%s') de SQLite)."""
+    return calendar.timegm(datetime.fromisoformat(text).timetuple())
+
+
+def _cell_count(prefix: str) -> int:
+    """Número máximo de celdas declarado en el esquema para un tipo de array."""
+    return max((array.first_cell + array.count - 1
+                for key, array in get_schema().arrays.items() if key.startswith(prefix)),
+               default=0)
+
+
+def _merge_buckets(names: List[str], first: tuple, second: tuple) -> tuple:
+    """
+    Une dos filas agregadas del mismo intervalo (el intervalo que cruza el corte de
+    retención tiene una parte en history_rollup y otra en registros crudos).
+    """
+    first_samples, second_samples = first[2], second[2]
+    merged = list(second)
+    merged[2] = first_samples + second_samples
+    for index in range(3, len(names)):
+        a, b = first[index], second[index]
+        name = names[index]
+        if a is None or b is None:
+            merged[index] = b if a is None else a
+        elif name.endswith("_min") and name[:-4] in ENVELOPE_COLUMNS:
+            merged[index] = min(a, b)
+        elif name.endswith("_max") and name[:-4] in ENVELOPE_COLUMNS:
+            merged[index] = max(a, b)
+        else:
+            merged[index] = (a * first_samples + b * second_samples) / (first_samples + second_samples)
+    return tuple(merged)
+
+
+class HistoryExporter:
+    """
+    Genera una exportación en streaming. `stream()` produce bloques de bytes listos
+    para enviar o escribir; al terminar registra la sesión en export_sessions.
+    """
+
+    def __init__(self, db, battery_ids: Sequence[int] = None, start_date: datetime = None,
+                 end_date: datetime = None, resolution: str = "raw", file_format: str = "csv",
+                 include_cells: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        if resolution not in RESOLUTIONS:
+            raise ExportError(f"Resolución no soportada: {resolution} ({', '.join(RESOLUTIONS)})")
+        if file_format not in EXPORT_FORMATS:
+            raise ExportError(f"Formato no soportado: {file_format} ({', '.join(EXPORT_FORMATS)})")
+        if file_format != "csv" and not PYARROW_AVAILABLE:
+            raise ExportError(f"El formato {file_format} requiere pyarrow (pip install pyarrow)")
+
+        self.db = db
+        self.battery_ids = sorted(set(battery_ids)) if battery_ids else None
+        self.start_date = start_date
+        self.end_date = end_date
+        self.resolution = resolution
+        self.file_format = file_format
+        self.include_cells = include_cells and resolution == "raw"
+        self.chunk_size = chunk_size
+
+        self.rows_exported = 0
+        self.bytes_exported = 0
+        self.duration = 0.0
+        self.session_id = None
+
+    # ==================== INFORMACIÓN DEL FORMATO ====================
+
+    @property
+    def mimetype(self) -> str:
+        return EXPORT_FORMATS[self.file_format][0]
+
+    def suggested_filename(self) -> str:
+        scope = "_".join(str(b) for b in self.battery_ids) if self.battery_ids else "all"
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f"history_{scope}_{self.resolution}_{stamp}.{EXPORT_FORMATS[self.file_format][1]}"
+
+    # ==================== CONSULTAS ====================
+
+    def _history_columns(self) -> List[tuple]:
+        """(nombre, tipo declarado) de battery_history, incluidas columnas auto-expandidas."""
+        return [(name, col_type.upper()) for name, col_type in self.db.get_history_columns()
+                if name not in EXCLUDED_COLUMNS]
+
+    def _windows(self):
+        """Ventanas de lectura del rango exportado (una sin particionado)."""
+        return self.db.history_windows(self.start_date, self.end_date)
+
+    def _raw_chunks(self, columns, cells: tuple = None) -> Iterator[tuple]:
+        """
+        Bloques (nombres, tipos, filas) de registros crudos en orden (battery_id, timestamp, id).
+        Por cada batería se pagina con keyset sobre (timestamp, id), que SQLite resuelve
+        como búsqueda en el índice (battery_id, timestamp). `cells` = (celdas de tensión,
+        celdas de temperatura) añade las columnas anchas de celdas.
+        """
+        names = [name for name, _ in columns]
+        kinds = [_column_kind(col_type, name) for name, col_type in columns]
+        timestamp_index = names.index("timestamp")
+        id_index = names.index("id")
+
+        clauses = ["battery_id = ?", "(timestamp, id) > (?, ?)"]
+        bounds = []
+        if self.end_date:
+            clauses.append("timestamp <= ?")
+            bounds.append(self.end_date)
+        sql = (f"SELECT {', '.join(names)} FROM battery_history WHERE {' AND '.join(clauses)} "
+               f"ORDER BY timestamp, id LIMIT ?")
+
+        for battery_id in self._battery_ids():
+            # id >= 0 siempre: (start, -1) incluye los registros con timestamp == start
+            last_key = (self.start_date or "", -1)
+            for window in self._windows():
+                with self.db.history_connection(window=window) as conn:
+                    while True:
+                        rows = conn.execute(sql, (battery_id, *last_key, *bounds, self.chunk_size)).fetchall()
+                        if not rows:
+                            break
+                        last = rows[-1]
+                        last_key = (last[timestamp_index], last[id_index])
+                        rows = [tuple(row) for row in rows]
+                        if cells:
+                            yield self._with_cells(conn, names, kinds, rows, *cells)
+                        else:
+                            yield names, kinds, rows
+                        if len(rows) < self.chunk_size:
+                            break
+
+    def _battery_ids(self, include_rollup: bool = False) -> List[int]:
+        if self.battery_ids:
+            return self.battery_ids
+        battery_ids = set()
+        for window in self._windows():
+            with self.db.history_connection(window=window) as conn:
+                battery_ids.update(row[0] for row in conn.execute(
+                    "SELECT DISTINCT battery_id FROM battery_history"))
+        if include_rollup:
+            # Baterías cuyo historial ya solo existe agregado
+            with self.db.get_connection() as conn:
+                battery_ids.update(row[0] for row in conn.execute(
+                    "SELECT DISTINCT battery_id FROM history_rollup"))
+        return sorted(battery_ids)
+
+    def _rollup_chunks(self, battery_id: int, numeric: List[str]) -> Iterator[list]:
+        """
+        Filas de history_rollup (la parte del rango que la retención ya agregó) con las
+        mismas columnas que _aggregate_chunks. Los intervalos de 15 min se combinan a
+        la resolución pedida; los de 1 día se entregan tal cual si esta es menor.
+        """
+        from .retention import ROLLUP_MERGE, rollup_field_column
+        seconds = RESOLUTIONS[self.resolution]
+        span = f"MAX(resolution, {seconds})"
+        bucket = f"(CAST(strftime('%s', bucket_start) AS INTEGER) / {span})"
+        selects = ["battery_id", f"datetime({bucket} * {span}, 'unixepoch')", "SUM(samples)"]
+        for name in numeric:
+            column = rollup_field_column(name)
+            selects.append(ROLLUP_MERGE[column] if column else "NULL")
+            if name in ENVELOPE_COLUMNS:
+                selects.extend([ROLLUP_MERGE.get(f"{name}_min", "NULL"),
+                                ROLLUP_MERGE.get(f"{name}_max", "NULL")])
+        clauses = ["battery_id = ?"]
+        params = [battery_id]
+        if self.start_date:
+            clauses.append("bucket_start >= ?")
+            params.append(_db_time(self.start_date))
+        if self.end_date:
+            clauses.append("bucket_start <= ?")
+            params.append(_db_time(self.end_date))
+        with self.db.get_connection() as conn:
+            cursor = conn.execute(
+                f"SELECT {', '.join(selects)} FROM history_rollup WHERE {' AND '.join(clauses)} "
+                f"GROUP BY {span}, {bucket} ORDER BY 2", params)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+
+    def _aggregate_chunks(self, columns) -> Iterator[tuple]:
+        """
+        Bloques (nombres, tipos, filas) agregados por intervalo, en orden (battery_id, intervalo).
+        Cada consulta agrega una ventana de `chunk_size` intervalos de una batería usando
+        el índice (battery_id, timestamp); los huecos sin datos se saltan.
+        """
+        seconds = RESOLUTIONS[self.resolution]
+        numeric = [name for name, col_type in columns
+                   if name not in KEY_COLUMNS and _column_kind(col_type) != "str"]
+        bucket = f"(CAST(strftime('%s', timestamp) AS INTEGER) / {seconds})"
+
+        names = ["battery_id", "timestamp", "samples"]
+        kinds = ["int", "str", "int"]
+        selects = ["battery_id", f"datetime({bucket} * {seconds}, 'unixepoch')", "COUNT(*)"]
+        for name in numeric:
+            selects.append(f"AVG({name})")
+            names.append(name)
+            kinds.append("float")
+            if name in ENVELOPE_COLUMNS:
+                selects.extend([f"MIN({name})", f"MAX({name})"])
+                names.extend([f"{name}_min", f"{name}_max"])
+                kinds.extend(["float", "float"])
+
+        sql = (f"SELECT {', '.join(selects)} FROM battery_history "
+               f"WHERE battery_id = ? AND timestamp >= ? AND timestamp < ? "
+               f"GROUP BY {bucket} ORDER BY {bucket}")
+        window = seconds * self.chunk_size
+        end_limit = _db_time(self.end_date) if self.end_date else None
+
+        for battery_id in self._battery_ids(include_rollup=True):
+            # Primero lo agregado por la retención (siempre anterior a los crudos); la
+            # última fila espera por si el primer intervalo crudo es el mismo
+            pending = None
+            for rows in self._rollup_chunks(battery_id, numeric):
+                if pending is not None:
+                    rows.insert(0, pending)
+                pending = rows.pop()
+                if rows:
+                    yield names, kinds, rows
+            position = _db_time(self.start_date) if self.start_date else ""
+            for partition_window in self._windows():
+                # Los intervalos (alineados a UTC) nunca cruzan un límite de mes
+                window_end = _db_time(partition_window.hi) if partition_window.hi else None
+                with self.db.history_connection(window=partition_window) as conn:
+                    while True:
+                        first = conn.execute(
+                            "SELECT MIN(timestamp) FROM battery_history WHERE battery_id = ? AND timestamp >= ?",
+                            (battery_id, position)
+                        ).fetchone()[0]
+                        if first is None or (end_limit and first > end_limit):
+                            break
+                        window_start = _epoch(first) // seconds * seconds
+                        start_text = _db_time(datetime.fromtimestamp(window_start, timezone.utc))
+                        end_text = _db_time(datetime.fromtimestamp(window_start + window, timezone.utc))
+                        if window_end and window_end < end_text:
+                            end_text = window_end
+                        if self.start_date and start_text < position:
+                            start_text = position
+                        upper = end_text
+                        if end_limit and end_limit < upper:
+                            # timestamp <= end_date  ->  timestamp < end_date + ε
+                            upper = end_limit + "\x7f"
+                        rows = [tuple(row) for row in conn.execute(sql, (battery_id, start_text, upper))]
+                        if rows and pending is not None:
+                            if rows[0][1] == pending[1]:
+                                rows[0] = _merge_buckets(names, pending, rows[0])
+                            else:
+                                rows.insert(0, pending)
+                            pending = None
+                        if rows:
+                            yield names, kinds, rows
+                        position = end_text
+            if pending is not None:
+                yield names, kinds, [pending]
+
+    def _cell_values(self, conn, table: str, value_column: str, history_ids: List[int]) -> Dict[int, dict]:
+        """{history_id: {cell_number: valor}} para los registros de un bloque."""
+        cells = {}
+        for i in range(0, len(history_ids), _IN_BATCH):
+            batch = history_ids[i:i + _IN_BATCH]
+            cursor = conn.execute(
+                f"SELECT battery_history_id, cell_number, {value_column} FROM {table} "
+                f"WHERE battery_history_id IN ({', '.join('?' * len(batch))})",
+                batch
+            )
+            for history_id, cell_number, value in cursor:
+                cells.setdefault(history_id, {})[cell_number] = value
+        return cells
+
+    def _with_cells(self, conn, names, kinds, rows, voltage_cells, temp_cells):
+        """Añade columnas anchas cell_v_NN / cell_t_NN a un bloque de registros crudos."""
+        id_index = names.index("id")
+        history_ids = [row[id_index] for row in rows]
+        voltages = self._cell_values(conn, "cell_voltages_history", "voltage", history_ids)
+        temperatures = self._cell_values(conn, "cell_temperatures_history", "temperature", history_ids)
+
+        names = names + [f"cell_v_{n:02d}" for n in range(1, voltage_cells + 1)] \
+                      + [f"cell_t_{n:02d}" for n in range(1, temp_cells + 1)]
+        kinds = kinds + ["float"] * (voltage_cells + temp_cells)
+        empty = {}
+        out = []
+        for row, history_id in zip(rows, history_ids):
+            v = voltages.get(history_id, empty)
+            t = temperatures.get(history_id, empty)
+            out.append(row + tuple(v.get(n) for n in range(1, voltage_cells + 1))
+                           + tuple(t.get(n) for n in range(1, temp_cells + 1)))
+        return names, kinds, out
+
+    def iter_chunks(self) -> Iterator[tuple]:
+        """Bloques (nombres de columna, tipos, filas) según la resolución elegida."""
+        columns = self._history_columns()
+        if RESOLUTIONS[self.resolution] is None:
+            cells = None
+            if self.include_cells:
+                cells = (_cell_count("cell_voltages"), _cell_count("cell_temperatures"))
+            yield from self._raw_chunks(columns, cells)
+        else:
+            yield from self._aggregate_chunks(columns)
+
+    # ==================== SERIALIZACIÓN ====================
+
+    def stream(self) -> Iterator[bytes]:
+        """Genera el archivo exportado por bloques y registra la sesión al terminar."""
+        started = time.perf_counter()
+        writer = _WRITERS[self.file_format]()
+        try:
+            for names, kinds, rows in self.iter_chunks():
+                data = writer.write_chunk(names, kinds, rows)
+                self.rows_exported += len(rows)
+                if data:
+                    self.bytes_exported += len(data)
+                    yield data
+            data = writer.close()
+            if data:
+                self.bytes_exported += len(data)
+                yield data
+        finally:
+            self.duration = time.perf_counter() - started
+            self._record_session()
+
+    def export_to_file(self, path: str) -> Dict[str, Any]:
+        """Escribe la exportación en un archivo local."""
+        self.file_path = path
+        with open(path, 'wb') as f:
+            for data in self.stream():
+                f.write(data)
+        return {
+            "status": "success",
+            "file_path": path,
+            "records_exported": self.rows_exported,
+            "bytes": self.bytes_exported,
+            "duration_seconds": round(self.duration, 3),
+            "session_id": self.session_id
+        }
+
+    def _record_session(self):
+        if self.battery_ids:
+            export_type = "filtered" if len(self.battery_ids) > 1 else "range"
+        else:
+            export_type = "range" if (self.start_date or self.end_date) else "full"
+        if self.resolution != "raw":
+            export_type = f"{export_type}:{self.resolution}"
+        try:
+            with self.db.get_connection() as conn:
+                cursor = conn.execute(
+                    """INSERT INTO export_sessions
+                       (battery_id, export_type, start_date, end_date, records_exported,
+                        file_format, file_path, export_duration_seconds)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (self.battery_ids[0] if self.battery_ids and len(self.battery_ids) == 1 else None,
+                     export_type, self.start_date, self.end_date, self.rows_exported,
+                     self.file_format, getattr(self, 'file_path', None), round(self.duration, 3))
+                )
+                conn.commit()
+                self.session_id = cursor.lastrowid
+            logger.info(f"Exportación {self.file_format}/{self.resolution}: {self.rows_exported} "
+                        f"registros en {self.duration:.2f}s")
+        except Exception as e:
+            logger.error(f"Error registrando sesión de exportación: {str(e)}")
+
+
+# ==================== ESCRITORES POR FORMATO ====================
+
+class _CsvWriter:
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._header_written = False
+
+    def write_chunk(self, names, kinds, rows) -> bytes:
+        if not self._header_written:
+            self._writer.writerow(names)
+            self._header_written = True
+        self._writer.writerows(rows)
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def close(self) -> bytes:
+        return b''
+
+
+class _DrainSink(io.RawIOBase):
+    """Destino escribible que acumula bytes hasta que se drenan."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+_ARROW_TYPES = {
+    "int": lambda: pa.int64(),
+    "float": lambda: pa.float64(),
+    "str": lambda: pa.string()
+}
+
+
+class _ArrowWriterBase:
+    def __init__(self):
+        self._sink = _DrainSink()
+        self._schema = None
+        self._writer = None
+
+    def _batch(self, names, kinds, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in names]
+        if self._schema is None:
+            self._schema = pa.schema([pa.field(name, _ARROW_TYPES[kind]())
+                                      for name, kind in zip(names, kinds)])
+            self._writer = self._open(self._schema)
+        arrays = []
+        for field, kind, values in zip(self._schema, kinds, columns):
+            if kind == "str":
+                values = [None if v is None else str(v) for v in values]
+            elif kind == "float":
+                values = [None if v is None else float(v) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self._schema)
+
+    def write_chunk(self, names, kinds, rows) -> bytes:
+        batch = self._batch(names, kinds, rows)
+        self._write(batch)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        if self._writer is not None:
+            self._writer.close()
+        return self._sink.drain()
+
+
+class _ArrowIpcWriter(_ArrowWriterBase):
+    def _open(self, schema):
+        return pa.ipc.new_stream(self._sink, schema)
+
+    def _write(self, batch):
+        self._writer.write_batch(batch)
+
+
+class _ParquetWriter(_ArrowWriterBase):
+    def _open(self, schema):
+        return pq.ParquetWriter(self._sink, schema, compression='zstd')
+
+    def _write(self, batch):
+        # Cada bloque es un row group: el lector puede filtrar por estadísticas
+        self._writer.write_table(pa.Table.from_batches([batch]))
+
+
+_WRITERS = {
+    "csv": _CsvWriter,
+    "arrow": _ArrowIpcWriter,
+    "parquet": _ParquetWriter
+}
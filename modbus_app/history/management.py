@@ -39,6 +39,7 @@ def reset_total_database() -> Dict[str, Any]:
             }
         
         db_path = current_db.db_path
+        partitions = current_db.partitions
         log_to_cmd(f"Base de datos encontrada: {db_path}", "INFO", "DB_RESET")
         
         # Paso 2: Verificar si el archivo existe
@@ -61,6 +62,7 @@ def reset_total_database() -> Dict[str, Any]:
         
         try:
             # Intentar cerrar conexiones limpiamente
+            current_db.close()
             del current_db
             
             # Forzar garbage collection para liberar conexiones
@@ -91,6 +93,12 @@ def reset_total_database() -> Dict[str, Any]:
                     os.remove(aux_file)
                     log_to_cmd(f"Archivo auxiliar eliminado: {aux_file}", "INFO", "DB_RESET")
             
+            # Particiones mensuales del historial
+            if partitions:
+                for month in partitions.months(refresh=True):
+                    partitions.drop(month)
+                log_to_cmd(f"Particiones de historial eliminadas: {partitions.directory}", "INFO", "DB_RESET")
+            
         except OSError as e:
             return {
                 "status": "error",
@@ -215,58 +223,64 @@ def get_database_info() -> Dict[str, Any]:
         }
 
 
-def create_backup(backup_name: str = None) -> Dict[str, Any]:
+def create_backup(backup_name: str = None, mode: str = "full", compress: bool = None,
+                  wait: bool = True) -> Dict[str, Any]:
     """
-    Crea un backup de la base de datos actual.
+    Crea un backup de la base de datos actual con la API de backup de SQLite
+    (ver history.backup): consistente con el -wal y sin bloquear la ingesta.
     
     Args:
         backup_name (str, optional): Nombre del backup. Si es None, usa timestamp.
+        mode (str): 'full', 'incremental' o 'differential'
+        compress (bool, optional): Comprimir con gzip (por defecto según config.json)
+        wait (bool): Si es False, el backup continúa en segundo plano y el progreso
+            se consulta con get_backup_status()
         
     Returns:
         dict: Resultado de la operación de backup
     """
     try:
-        from modbus_app.history.database import get_db
-        import shutil
+        from modbus_app.history.backup import get_backup_service, BackupError
         
-        db = get_db()
-        if not db or not os.path.exists(db.db_path):
+        service = get_backup_service()
+        if not os.path.exists(service.db.db_path):
             return {
                 "status": "error",
                 "message": "Base de datos no encontrada para backup"
             }
         
-        # Generar nombre de backup si no se proporciona
-        if not backup_name:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_name = f"battery_history_backup_{timestamp}.db"
-        
-        # Crear directorio de backups si no existe
-        backup_dir = "database_backups"
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-        
-        backup_path = os.path.join(backup_dir, backup_name)
-        
-        # Crear backup
-        shutil.copy2(db.db_path, backup_path)
-        
-        # Verificar backup
-        if not os.path.exists(backup_path):
+        try:
+            status = service.start(mode=mode, name=backup_name, compress=compress, wait=wait)
+        except BackupError as e:
             return {
                 "status": "error",
-                "message": "Backup no se creó correctamente"
+                "message": str(e)
             }
         
-        backup_size = os.path.getsize(backup_path)
+        job = status["job"]
+        if not wait:
+            return {
+                "status": "success",
+                "message": "Backup iniciado",
+                "job": job,
+                "timestamp": datetime.now().isoformat()
+            }
         
-        log_to_cmd(f"Backup creado exitosamente: {backup_path}", "INFO", "DB_BACKUP")
+        if job["state"] != "done":
+            return {
+                "status": "error",
+                "message": f"Error creando backup: {job['error']}"
+            }
         
+        result = job["result"]
         return {
             "status": "success",
             "message": "Backup creado exitosamente",
-            "backup_path": backup_path,
-            "backup_size_mb": round(backup_size / (1024 * 1024), 2),
+            "backup_path": result["backup_path"],
+            "backup_size_mb": round(result["size_bytes"] / (1024 * 1024), 2),
+            "mode": result["mode"],
+            "max_id": result["max_id"],
+            "rotated": result["rotated"],
             "timestamp": datetime.now().isoformat()
         }
         
@@ -276,4 +290,25 @@ def create_backup(backup_name: str = None) -> Dict[str, Any]:
         return {
             "status": "error",
             "message": error_msg
-        }
\ No newline at end of file
+        }
+
+
+def get_backup_status() -> Dict[str, Any]:
+    """
+    Estado del backup en curso o del último ejecutado y backups registrados.
+    
+    Returns:
+        dict: Progreso del trabajo y lista de backups
+    """
+    try:
+        from modbus_app.history.backup import get_backup_service
+        
+        status = get_backup_service().get_status()
+        status["status"] = "success"
+        return status
+        
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error obteniendo estado de backup: {str(e)}"
+        }
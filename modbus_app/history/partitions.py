@@ -0,0 +1,294 @@
+# modbus_app/history/partitions.py
+"""
+Almacenamiento particionado del historial: un archivo SQLite por mes.
+
+Cada partición (`battery_history_AAAA_MM.db`) contiene battery_history y las tablas
+de celdas de ese mes; la base principal conserva sync_status, export_sessions y
+history_rollup. Las escrituras van directamente al archivo del mes del registro y
+las lecturas adjuntan (ATTACH) solo las particiones que solapan el rango pedido,
+expuestas mediante vistas TEMP con los nombres de siempre (battery_history,
+cell_voltages_history, cell_temperatures_history), de modo que el SQL existente
+funciona sin cambios.
+
+SQLite limita los ATTACH por conexión (10 en la mayoría de compilaciones): los
+rangos amplios se recorren por ventanas de WINDOW_PARTITIONS particiones
+(ver BatteryHistoryDB.history_windows).
+
+Los id de battery_history son globales: cada partición arranca su AUTOINCREMENT en
+(índice del mes << ID_SHIFT), así los id de celdas y cursores no colisionan.
+Eliminar un mes entero es borrar su archivo.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import logging
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List
+
+logger = logging.getLogger('history.partitions')
+
+FILE_PATTERN = re.compile(r"^battery_history_(\d{4})_(\d{2})\.db$")
+
+HISTORY_TABLES = ("battery_history", "cell_voltages_history", "cell_temperatures_history")
+
+# Particiones adjuntas por conexión (se reservan ATTACH para backups/retención)
+WINDOW_PARTITIONS = 8
+
+# Bits reservados a los id de cada mes (4.294.967.296 registros por mes)
+ID_SHIFT = 32
+
+# Ventana de lectura: [lo, hi) y meses adjuntos. En modo no particionado todo es None.
+HistoryWindow = namedtuple("HistoryWindow", ["lo", "hi", "months"])
+
+
+class PartitionError(Exception):
+    """Rango de particiones no válido para una conexión."""
+
+
+def month_start(value) -> datetime:
+    """Primer instante del mes de un datetime o texto de timestamp."""
+    if isinstance(value, str):
+        value = datetime(int(value[0:4]), int(value[5:7]), 1)
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def id_base(month: datetime) -> int:
+    """Primer id de battery_history reservado para un mes."""
+    return (month.year * 12 + month.month - 1) << ID_SHIFT
+
+
+def _db_time(value: datetime) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class PartitionManager:
+    """Gestiona los archivos mensuales de historial de una base de datos."""
+
+    def __init__(self, directory: str, create_tables: Callable, configure: Callable,
+                 on_drop: Callable = None):
+        """
+        Args:
+            directory: Carpeta de las particiones
+            create_tables: create_tables(conn) crea las tablas de historial en un archivo nuevo
+            configure: configure(conn) aplica los PRAGMA de conexión
+            on_drop: on_drop(path) se llama antes de borrar una partición (cierre de escritores)
+        """
+        self.directory = directory
+        self._create_tables = create_tables
+        self._configure = configure
+        self._on_drop = on_drop
+        self._lock = threading.RLock()
+        self._months = None
+        self._columns = None
+        os.makedirs(directory, exist_ok=True)
+
+    # ==================== ARCHIVOS ====================
+
+    def path_for(self, month: datetime) -> str:
+        return os.path.join(self.directory, f"battery_history_{month.year:04d}_{month.month:02d}.db")
+
+    def months(self, refresh: bool = False) -> List[datetime]:
+        """Meses con partición, en orden cronológico."""
+        with self._lock:
+            if self._months is None or refresh:
+                months = []
+                for name in os.listdir(self.directory):
+                    match = FILE_PATTERN.match(name)
+                    if match:
+                        months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+                self._months = sorted(months)
+            return list(self._months)
+
+    def ensure(self, month: datetime) -> str:
+        """Crea la partición del mes si no existe y devuelve su ruta."""
+        path = self.path_for(month)
+        with self._lock:
+            if self._months is not None and month in self._months:
+                return path
+            if not os.path.exists(path):
+                conn = sqlite3.connect(path)
+                try:
+                    # auto_vacuum antes de crear tablas y de pasar a WAL
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    self._configure(conn)
+                    self._create_tables(conn)
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('battery_history', ?)",
+                                 (id_base(month),))
+                    conn.commit()
+                finally:
+                    conn.close()
+                logger.info(f"Partición de historial creada: {path}")
+                self._months = None
+                self._columns = None
+        return path
+
+    def drop(self, month: datetime) -> int:
+        """Elimina la partición de un mes. Devuelve los bytes liberados."""
+        path = self.path_for(month)
+        freed = 0
+        if self._on_drop:
+            # Fuera de self._lock: el escritor toma su propio lock antes que el de particiones
+            self._on_drop(path)
+        with self._lock:
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    freed += os.path.getsize(path + suffix)
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+            self._months = None
+            self._columns = None
+        return freed
+
+    def invalidate(self):
+        """Descarta la caché de meses y columnas (p. ej. tras un ALTER TABLE)."""
+        with self._lock:
+            self._months = None
+            self._columns = None
+
+    @contextmanager
+    def connect(self, month: datetime):
+        """Conexión directa a la partición de un mes (creándola si no existe)."""
+        conn = sqlite3.connect(self.ensure(month), timeout=30.0)
+        try:
+            conn.row_factory = sqlite3.Row
+            self._configure(conn)
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # ==================== COLUMNAS ====================
+
+    def columns(self, main_path: str) -> List[tuple]:
+        """
+        (nombre, tipo) de battery_history como unión de la base principal y todas las
+        particiones (las columnas auto-expandidas pueden existir solo en algunos meses).
+        """
+        with self._lock:
+            if self._columns is None:
+                columns = {}
+                for path in [main_path] + [self.path_for(m) for m in self.months()]:
+                    conn = sqlite3.connect(path)
+                    try:
+                        for row in conn.execute("PRAGMA table_info(battery_history)"):
+                            columns.setdefault(row[1], row[2] or "")
+                    finally:
+                        conn.close()
+                self._columns = list(columns.items())
+            return list(self._columns)
+
+    # ==================== LECTURA ====================
+
+    def overlapping(self, start=None, end=None) -> List[datetime]:
+        """Meses con partición que solapan [start, end]."""
+        first = month_start(start) if start else None
+        last = month_start(end) if end else None
+        return [m for m in self.months()
+                if (first is None or m >= first) and (last is None or m <= last)]
+
+    def windows(self, start=None, end=None, descending: bool = False) -> List[HistoryWindow]:
+        """Grupos de hasta WINDOW_PARTITIONS meses consecutivos que cubren [start, end]."""
+        months = self.overlapping(start, end)
+        if not months:
+            return [HistoryWindow(None, None, [])]
+        groups = [months[i:i + WINDOW_PARTITIONS] for i in range(0, len(months), WINDOW_PARTITIONS)]
+        windows = [HistoryWindow(group[0], next_month(group[-1]), group) for group in groups]
+        return windows[::-1] if descending else windows
+
+    def attach(self, conn, months: List[datetime], main_path: str):
+        """
+        Adjunta las particiones indicadas y crea las vistas TEMP que sustituyen a las
+        tablas de historial de la base principal en las consultas sin esquema.
+        """
+        if len(months) > WINDOW_PARTITIONS:
+            raise PartitionError(f"Demasiadas particiones para una conexión ({len(months)} > "
+                                 f"{WINDOW_PARTITIONS}); use history_windows()")
+        aliases = []
+        for i, month in enumerate(months):
+            alias = f"p{i}"
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (self.path_for(month),))
+            aliases.append(alias)
+
+        # Las tablas de la base principal (vacías tras migrar) forman parte de la vista
+        sources = ["main"] + aliases
+        names = [name for name, _ in self.columns(main_path)]
+        arms = []
+        for source in sources:
+            present = {row[1] for row in conn.execute(f"PRAGMA {source}.table_info(battery_history)")}
+            select = ", ".join(name if name in present else f"NULL AS {name}" for name in names)
+            arms.append(f"SELECT {select} FROM {source}.battery_history")
+        conn.execute(f"CREATE TEMP VIEW battery_history AS {' UNION ALL '.join(arms)}")
+        for table in HISTORY_TABLES[1:]:
+            conn.execute(f"CREATE TEMP VIEW {table} AS " +
+                         " UNION ALL ".join(f"SELECT * FROM {source}.{table}" for source in sources))
+
+    # ==================== MIGRACIÓN ====================
+
+    def migrate_legacy(self, main_path: str) -> Dict[str, int]:
+        """
+        Mueve los registros de battery_history de la base principal a sus particiones
+        mensuales (una transacción por mes; los id se conservan).
+        """
+        moved = {"months": 0, "rows": 0}
+        conn = sqlite3.connect(main_path, timeout=30.0, isolation_level=None)
+        try:
+            self._configure(conn)
+            months = [row[0] for row in conn.execute(
+                "SELECT DISTINCT substr(timestamp, 1, 7) FROM battery_history ORDER BY 1")]
+            main_columns = [row[1] for row in conn.execute("PRAGMA main.table_info(battery_history)")]
+            for text in months:
+                month = month_start(text)
+                conn.execute("ATTACH DATABASE ? AS part", (self.ensure(month),))
+                try:
+                    present = {row[1] for row in conn.execute("PRAGMA part.table_info(battery_history)")}
+                    for row in conn.execute("PRAGMA main.table_info(battery_history)").fetchall():
+                        if row[1] not in present:
+                            conn.execute(f"ALTER TABLE part.battery_history ADD COLUMN {row[1]} {row[2]}")
+                    columns = ", ".join(main_columns)
+                    selection = ("SELECT id FROM main.battery_history WHERE timestamp >= ? AND timestamp < ?")
+                    bounds = (_db_time(month), _db_time(next_month(month)))
+
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        rows = conn.execute(
+                            f"INSERT OR IGNORE INTO part.battery_history ({columns}) "
+                            f"SELECT {columns} FROM main.battery_history WHERE timestamp >= ? AND timestamp < ?",
+                            bounds
+                        ).rowcount
+                        for table in HISTORY_TABLES[1:]:
+                            # Si un intento anterior se interrumpió, no se duplican celdas
+                            conn.execute(
+                                f"INSERT INTO part.{table} SELECT * FROM main.{table} "
+                                f"WHERE battery_history_id IN ({selection}) AND battery_history_id NOT IN "
+                                f"(SELECT battery_history_id FROM part.{table})",
+                                bounds
+                            )
+                            conn.execute(f"DELETE FROM main.{table} WHERE battery_history_id IN ({selection})",
+                                         bounds)
+                        conn.execute("DELETE FROM main.battery_history WHERE timestamp >= ? AND timestamp < ?",
+                                     bounds)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                finally:
+                    conn.execute("DETACH DATABASE part")
+                moved["months"] += 1
+                moved["rows"] += rows
+            # Devuelve al sistema el espacio liberado (sin efecto si auto_vacuum no es INCREMENTAL)
+            conn.executescript("PRAGMA incremental_vacuum;")
+        finally:
+            conn.close()
+        self.invalidate()
+        return moved
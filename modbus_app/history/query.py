@@ -0,0 +1,358 @@
+# modbus_app/history/query.py
+"""
+Consultas de historial para gráficas: proyección de columnas, paginación keyset y
+resultados columnares.
+
+- Solo se leen las columnas pedidas; las proyecciones habituales de las gráficas
+  (SOC, tensión, corriente) están cubiertas por un índice, por lo que SQLite no
+  toca la tabla principal.
+- La paginación usa un cursor opaco sobre (timestamp, id): cada página es una
+  búsqueda en el índice, sin OFFSET.
+- La parte del rango que la retención ya agregó se lee de history_rollup (una fila
+  por intervalo con id 0 y la media de cada campo).
+- El resultado es columnar (un array por campo) en JSON o en un formato binario
+  de arrays float64 que el navegador lee directamente con Float64Array.
+"""
+
+import base64
+import calendar
+import json
+import struct
+import sys
+import logging
+from array import array
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence
+
+logger = logging.getLogger('history.query')
+
+DEFAULT_FIELDS = ("soc", "pack_voltage", "battery_current")
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 20000
+
+# Reducción en servidor: puntos máximos por serie y filas leídas como máximo
+MAX_POINTS = 10000
+MAX_DOWNSAMPLE_ROWS = 2000000
+
+# Índice de cobertura de las proyecciones habituales (ver database._create_indexes)
+CHART_INDEX = "idx_history_chart"
+CHART_INDEX_FIELDS = ("soc", "pack_voltage", "battery_current")
+
+# Columnas que no se pueden proyectar
+HIDDEN_COLUMNS = ("battery_id", "created_at")
+
+# Formato binario:
+#   magic b'HHQ1' + <I longitud de cabecera> + cabecera JSON (rellena a múltiplo de 8)
+#   + un bloque float64 little-endian de `count` valores por campo (timestamp en
+#   segundos epoch; NaN = nulo)
+BINARY_MAGIC = b'HHQ1'
+BINARY_MIMETYPE = 'application/vnd.huawei-history.columnar'
+
+
+class QueryError(Exception):
+    """Parámetros de consulta inválidos."""
+
+
+def encode_cursor(timestamp: str, record_id: int) -> str:
+    """Cursor opaco para continuar después de (timestamp, id)."""
+    raw = f"{timestamp}|{record_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, record_id = base64.urlsafe_b64decode(padded).decode('utf-8').rsplit('|', 1)
+        return timestamp, int(record_id)
+    except Exception:
+        raise QueryError("Cursor inválido")
+
+
+def decode_cursor_month(cursor_key: tuple) -> Optional[datetime]:
+    """Mes del registro de un cursor: con particionado, primer mes que hay que leer."""
+    try:
+        return datetime(int(cursor_key[0][0:4]), int(cursor_key[0][5:7]), 1)
+    except (ValueError, TypeError):
+        return None
+
+
+def _epoch(text: str) -> float:
+    """Segundos desde epoch de un timestamp almacenado."""
+    value = datetime.fromisoformat(text)
+    return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+
+
+class HistoryQuery:
+    """Consulta columnar de una batería con proyección y paginación keyset."""
+
+    def __init__(self, db):
+        self.db = db
+        self._columns = None
+
+    def available_fields(self, refresh: bool = False) -> List[str]:
+        """Columnas proyectables (incluye columnas auto-expandidas)."""
+        if self._columns is None or refresh:
+            if refresh and self.db.partitioned:
+                self.db.partitions.invalidate()
+            self._columns = [name for name, _ in self.db.get_history_columns()
+                             if name not in HIDDEN_COLUMNS]
+        return self._columns
+
+    def _resolve_fields(self, fields: Optional[Sequence[str]]) -> List[str]:
+        fields = list(fields) if fields else list(DEFAULT_FIELDS)
+        available = set(self.available_fields())
+        if any(field not in available for field in fields):
+            # Puede haber columnas nuevas (auto-expand): refrescar antes de rechazar
+            available = set(self.available_fields(refresh=True))
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            raise QueryError(f"Campos desconocidos: {', '.join(unknown)}")
+        return [field for field in dict.fromkeys(fields) if field not in ("timestamp", "id")]
+
+    def _index_hint(self, fields: Sequence[str]) -> str:
+        """
+        Sin estadísticas, SQLite elegiría idx_battery_timestamp y leería cada fila de la
+        tabla; si la proyección está cubierta se fuerza el índice de cobertura. Sobre las
+        vistas de particiones no se admite INDEXED BY.
+        """
+        if self.db.partitioned or not set(fields) <= set(CHART_INDEX_FIELDS):
+            return ""
+        return f"INDEXED BY {CHART_INDEX}"
+
+    def fetch(self, battery_id: int, fields: Sequence[str] = None, start: datetime = None,
+              end: datetime = None, limit: int = DEFAULT_LIMIT, cursor: str = None,
+              order: str = "asc") -> Dict[str, Any]:
+        """
+        Devuelve una página columnar:
+            {"fields": [...], "count": n, "columns": {"timestamp": [...], "id": [...], campo: [...]},
+             "next_cursor": str | None}
+        """
+        if order not in ("asc", "desc"):
+            raise QueryError("order debe ser 'asc' o 'desc'")
+        limit = max(1, min(int(limit), MAX_LIMIT))
+
+        fields = self._resolve_fields(fields)
+        cursor_key = decode_cursor(cursor) if cursor else None
+
+        clauses = ["battery_id = ?"]
+        params = [battery_id]
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            clauses.append("timestamp <= ?")
+            params.append(end)
+        if cursor_key:
+            clauses.append(f"(timestamp, id) {'>' if order == 'asc' else '<'} (?, ?)")
+            params.extend(cursor_key)
+        direction = "ASC" if order == "asc" else "DESC"
+        sql = (f"SELECT {', '.join(['timestamp', 'id'] + fields)} FROM battery_history {self._index_hint(fields)} "
+               f"WHERE {' AND '.join(clauses)} ORDER BY timestamp {direction}, id {direction} LIMIT ?")
+
+        # Intervalos agregados por la retención (anteriores a todo registro crudo): al
+        # principio de una página ascendente o al final de una descendente
+        rows = []
+        if order == "asc":
+            rows.extend(self._rollup_rows(battery_id, fields, start, end, cursor_key, False, limit + 1))
+
+        # Con particionado, los meses se leen en el orden pedido hasta completar la página
+        first_month = decode_cursor_month(cursor_key) if cursor_key else None
+        window_start, window_end = start, end
+        if first_month:
+            if order == "asc":
+                window_start = max(first_month, start) if start else first_month
+            else:
+                window_end = min(first_month, end) if end else first_month
+        for window in self.db.history_windows(window_start, window_end, descending=(order == "desc")):
+            with self.db.history_connection(window=window) as conn:
+                query_cursor = conn.cursor()
+                query_cursor.row_factory = None
+                rows.extend(query_cursor.execute(sql, params + [limit + 1 - len(rows)]).fetchall())
+            if len(rows) > limit:
+                break
+        if order == "desc" and len(rows) <= limit:
+            rows.extend(self._rollup_rows(battery_id, fields, start, end, cursor_key, True, limit + 1 - len(rows)))
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        names = ["timestamp", "id"] + fields
+        columns = {name: list(values) for name, values in zip(names, zip(*rows))} if rows \
+            else {name: [] for name in names}
+
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+
+        return {
+            "battery_id": battery_id,
+            "fields": fields,
+            "order": order,
+            "count": len(rows),
+            # Filas que son intervalos agregados (id 0, medias del intervalo)
+            "rollup_count": sum(1 for row in rows if row[1] == 0),
+            "columns": columns,
+            "next_cursor": next_cursor
+        }
+
+    def _rollup_rows(self, battery_id: int, fields: Sequence[str], start, end, cursor_key,
+                     descending: bool, limit: int) -> List[tuple]:
+        """Intervalos agregados como filas (timestamp, id 0, campos...)."""
+        from .retention import read_rollup
+        with self.db.get_connection() as conn:
+            rows = read_rollup(conn, battery_id, fields, start, end, cursor_key, descending, limit)
+        return [(row[0], 0) + tuple(row[3:]) for row in rows]
+
+
+    def fetch_downsampled(self, battery_id: int, fields: Sequence[str] = None, start: datetime = None,
+                          end: datetime = None, points: int = 500, method: str = "lttb") -> Dict[str, Any]:
+        """
+        Lee el rango completo de las columnas pedidas y reduce cada serie a `points` puntos.
+
+        Devuelve {"series": {campo: {"timestamp": [...], "value": [...]}}} para LTTB o
+        {"series": {campo: {"timestamp": [...], "min": [...], "max": [...], "mean": [...]}}}
+        para la envolvente min/max.
+        """
+        from .downsampling import METHODS, lttb, minmax_envelope
+        import numpy as np
+
+        if method not in METHODS:
+            raise QueryError(f"Método de reducción no soportado: {method} ({', '.join(METHODS)})")
+        points = max(3, min(int(points), MAX_POINTS))
+        fields = self._resolve_fields(fields)
+
+        clauses = ["battery_id = ?"]
+        params = [battery_id]
+        if start:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end:
+            clauses.append("timestamp <= ?")
+            params.append(end)
+        sql = (f"SELECT {', '.join(['timestamp'] + fields)} FROM battery_history {self._index_hint(fields)} "
+               f"WHERE {' AND '.join(clauses)} ORDER BY timestamp, id LIMIT ?")
+        # Parte del rango ya agregada por la retención (medias de cada intervalo)
+        from .retention import read_rollup
+        with self.db.get_connection() as conn:
+            rows = [(row[0],) + tuple(row[3:]) for row in
+                    read_rollup(conn, battery_id, fields, start, end, limit=MAX_DOWNSAMPLE_ROWS + 1)]
+        rollup_count = len(rows)
+        for window in self.db.history_windows(start, end):
+            with self.db.history_connection(window=window) as conn:
+                query_cursor = conn.cursor()
+                query_cursor.row_factory = None
+                rows.extend(query_cursor.execute(sql, params + [MAX_DOWNSAMPLE_ROWS + 1 - len(rows)]).fetchall())
+            if len(rows) > MAX_DOWNSAMPLE_ROWS:
+                break
+
+        truncated = len(rows) > MAX_DOWNSAMPLE_ROWS
+        if truncated:
+            rows = rows[:MAX_DOWNSAMPLE_ROWS]
+            logger.warning(f"Reducción de historial de batería {battery_id} truncada a {MAX_DOWNSAMPLE_ROWS} filas")
+
+        columns = list(zip(*rows)) if rows else [()] * (len(fields) + 1)
+        timestamps = np.array(columns[0], dtype='datetime64[ms]')
+        x = timestamps.astype(np.int64).astype(np.float64) / 1000.0
+
+        series = {}
+        for name, values in zip(fields, columns[1:]):
+            y = np.array([np.nan if v is None or isinstance(v, str) else v for v in values], dtype=np.float64)
+            valid = ~np.isnan(y)
+            sx, sy = x[valid], y[valid]
+            if method == "lttb":
+                rx, ry = lttb(sx, sy, points)
+                series[name] = {"timestamp": rx, "value": ry}
+            else:
+                envelope = minmax_envelope(sx, sy, points)
+                series[name] = {"timestamp": envelope["x"], "min": envelope["min"],
+                                "max": envelope["max"], "mean": envelope["mean"]}
+
+        return {
+            "battery_id": battery_id,
+            "fields": fields,
+            "method": method,
+            "points": points,
+            "source_count": len(rows),
+            "rollup_count": min(rollup_count, len(rows)),
+            "truncated": truncated,
+            "series": series
+        }
+
+
+def downsampled_to_json(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Convierte los arrays NumPy de fetch_downsampled() a listas (timestamps ISO)."""
+    import numpy as np
+
+    series = {}
+    for name, arrays in result["series"].items():
+        timestamps = (arrays["timestamp"] * 1000).astype('datetime64[ms]')
+        entry = {"timestamp": np.datetime_as_string(timestamps, unit='s').tolist()}
+        for key, values in arrays.items():
+            if key != "timestamp":
+                entry[key] = [None if np.isnan(v) else v for v in values.tolist()]
+        series[name] = entry
+    return dict(result, series=series)
+
+
+def downsampled_to_binary(result: Dict[str, Any]) -> bytes:
+    """
+    Serializa fetch_downsampled() al formato binario: la cabecera lista, por serie,
+    el número de puntos y los arrays float64 que siguen (timestamp en segundos epoch).
+    """
+    import numpy as np
+
+    layout = [{"field": name, "count": int(len(arrays["timestamp"])), "arrays": list(arrays)}
+              for name, arrays in result["series"].items()]
+    header = json.dumps({
+        "battery_id": result["battery_id"],
+        "method": result["method"],
+        "source_count": result["source_count"],
+        "truncated": result["truncated"],
+        "series": layout
+    }).encode('utf-8')
+    header += b' ' * (-(len(BINARY_MAGIC) + 4 + len(header)) % 8)
+
+    parts = [BINARY_MAGIC, struct.pack('<I', len(header)), header]
+    for arrays in result["series"].values():
+        for values in arrays.values():
+            parts.append(np.asarray(values, dtype='<f8').tobytes())
+    return b''.join(parts)
+
+
+def to_binary(page: Dict[str, Any]) -> bytes:
+    """Serializa una página columnar al formato binario (arrays float64)."""
+    count = page["count"]
+    columns = page["columns"]
+    names = ["timestamp"] + page["fields"]
+    header = json.dumps({
+        "battery_id": page["battery_id"],
+        "fields": names,
+        "count": count,
+        "next_cursor": page["next_cursor"]
+    }).encode('utf-8')
+    header += b' ' * (-(len(BINARY_MAGIC) + 4 + len(header)) % 8)
+
+    nan = float('nan')
+    arrays = [array('d', (_epoch(ts) for ts in columns["timestamp"]))]
+    for name in page["fields"]:
+        arrays.append(array('d', (nan if v is None or isinstance(v, str) else v for v in columns[name])))
+
+    parts = [BINARY_MAGIC, struct.pack('<I', len(header)), header]
+    for values in arrays:
+        if sys.byteorder == 'big':
+            values.byteswap()
+        parts.append(values.tobytes())
+    return b''.join(parts)
+
+
+# Instancia global (se renueva si la base de datos se reinicializa)
+_query_instance = None
+
+
+def get_history_query() -> HistoryQuery:
+    """Devuelve la instancia global de consultas de historial."""
+    global _query_instance
+    from .database import get_db
+    db = get_db()
+    if _query_instance is None or _query_instance.db is not db:
+        _query_instance = HistoryQuery(db)
+    return _query_instance
@@ -0,0 +1,192 @@
+# modbus_app/history/recording.py
+"""
+Decisión de grabación del historial a partir de cada lectura de polling.
+
+Modos:
+- interval: un registro cada `max_interval` segundos (comportamiento clásico).
+- deadband: se graba cuando algún campo se aleja de su último valor grabado más
+  que su tolerancia.
+- swinging_door: por campo se mantiene el "corredor" de pendientes desde el último
+  punto grabado que contiene todas las lecturas intermedias (±tolerancia); se graba
+  cuando una lectura cierra la puerta, es decir, cuando ninguna recta desde el punto
+  grabado pasa ya a menos de la tolerancia de todas ellas.
+
+En los modos por cambio `max_interval` actúa como latido: sin cambios se graba
+igualmente un registro cada `max_interval` segundos. `min_interval` separa los
+registros por cambio: un cambio detectado antes se recuerda y se graba con la
+primera lectura posterior a ese plazo (las puertas y las bandas se siguen evaluando
+con todas las lecturas).
+
+La lectura que dispara la grabación es la que se guarda (cada registro incluye los
+registros expandidos y las celdas, que solo se leen en el momento de grabar).
+"""
+
+import math
+import threading
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('history.recording')
+
+MODES = ("interval", "deadband", "swinging_door")
+
+# Tolerancias por defecto (unidades de battery_cache: V, A, %, °C)
+DEFAULT_DEADBANDS = {
+    "voltage": 0.2,
+    "pack_voltage": 0.2,
+    "current": 0.5,
+    "soc": 1,
+    "soh": 1,
+    "highest_cell_temp": 1,
+    "lowest_cell_temp": 1
+}
+
+
+def _number(value) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class _Door:
+    """Estado de puerta giratoria de un campo desde el último punto grabado."""
+
+    __slots__ = ('t0', 'v0', 'upper', 'lower')
+
+    def __init__(self, t0: float, v0: float):
+        self.t0 = t0
+        self.v0 = v0
+        self.upper = math.inf    # Pendiente máxima admisible
+        self.lower = -math.inf   # Pendiente mínima admisible
+
+    def closes(self, t: float, v: float, tolerance: float) -> bool:
+        """Estrecha la puerta con la lectura (t, v). True si la puerta se cierra."""
+        dt = t - self.t0
+        if dt <= 0:
+            return abs(v - self.v0) > tolerance
+        upper = min(self.upper, (v + tolerance - self.v0) / dt)
+        lower = max(self.lower, (v - tolerance - self.v0) / dt)
+        if lower > upper:
+            return True
+        self.upper, self.lower = upper, lower
+        return False
+
+
+# Separación mínima entre registros por cambio: una oscilación en el límite de una
+# banda no graba en cada ciclo de polling (los latidos no se ven afectados)
+DEFAULT_MIN_INTERVAL_SECONDS = 30
+
+
+class HistoryRecorder:
+    """Evalúa cada lectura de polling y decide si debe grabarse en el historial."""
+
+    def __init__(self, mode: str = "interval", max_interval: float = 120,
+                 deadbands: Dict[str, float] = None,
+                 min_interval: float = DEFAULT_MIN_INTERVAL_SECONDS):
+        """
+        Args:
+            mode: interval | deadband | swinging_door
+            max_interval: Segundos máximos entre registros (intervalo o latido)
+            deadbands: Tolerancia absoluta por campo de battery_cache
+            min_interval: Segundos mínimos entre registros por cambio (aplaza la
+                escritura, no la evaluación)
+        """
+        if mode not in MODES:
+            logger.warning(f"Modo de grabación desconocido '{mode}', se usa 'interval'")
+            mode = "interval"
+        self.mode = mode
+        self.max_interval = max_interval
+        self.min_interval = min_interval
+        self.deadbands = dict(DEFAULT_DEADBANDS if deadbands is None else deadbands)
+        self._state = {}  # battery_id -> {"time", "values", "doors"}
+        self._stats = {"evaluated": 0, "recorded": 0, "reasons": {}}
+        self._lock = threading.Lock()
+
+    def reset(self, battery_id: int = None):
+        """Olvida el último punto grabado (la siguiente lectura se graba)."""
+        with self._lock:
+            if battery_id is None:
+                self._state.clear()
+            else:
+                self._state.pop(battery_id, None)
+
+    def evaluate(self, battery_id: int, timestamp: float, values: Dict[str, Any]) -> Optional[str]:
+        """
+        Motivo para grabar la lectura ('initial', 'heartbeat', 'interval', 'deadband',
+        'swinging_door') o None si no hace falta. No modifica el punto grabado:
+        tras guardar con éxito se debe llamar a recorded().
+        """
+        with self._lock:
+            self._stats["evaluated"] += 1
+            state = self._state.get(battery_id)
+            if state is None:
+                return "initial"
+            elapsed = timestamp - state["time"]
+            if elapsed >= self.max_interval:
+                return "interval" if self.mode == "interval" else "heartbeat"
+            if self.mode == "interval":
+                return None
+
+            # Todas las lecturas estrechan las puertas y cuentan como salida de banda,
+            # también dentro de min_interval: este solo aplaza la escritura
+            reason = state.get("pending")
+            for name, tolerance in self.deadbands.items():
+                value = _number(values.get(name))
+                if value is None:
+                    continue
+                if self.mode == "deadband":
+                    last = state["values"].get(name)
+                    if last is None or abs(value - last) > tolerance:
+                        reason = "deadband"
+                else:
+                    door = state["doors"].get(name)
+                    if door is None:
+                        reason = "swinging_door"
+                    elif door.closes(timestamp, value, tolerance):
+                        reason = "swinging_door"
+                # Se sigue recorriendo para estrechar todas las puertas con esta lectura
+            if reason and elapsed < self.min_interval:
+                state["pending"] = reason
+                return None
+            return reason
+
+    def recorded(self, battery_id: int, timestamp: float, values: Dict[str, Any], reason: str = None):
+        """Registra que la lectura se grabó: pasa a ser el nuevo punto de referencia."""
+        numbers = {}
+        for name in self.deadbands:
+            value = _number(values.get(name))
+            if value is not None:
+                numbers[name] = value
+        with self._lock:
+            self._state[battery_id] = {
+                "time": timestamp,
+                "values": numbers,
+                "doors": {name: _Door(timestamp, value) for name, value in numbers.items()}
+            }
+            self._stats["recorded"] += 1
+            if reason:
+                self._stats["reasons"][reason] = self._stats["reasons"].get(reason, 0) + 1
+
+    def next_due(self, battery_id: int) -> Optional[float]:
+        """Instante en que vence el intervalo o el latido de una batería."""
+        with self._lock:
+            state = self._state.get(battery_id)
+            return state["time"] + self.max_interval if state else None
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            evaluated = self._stats["evaluated"]
+            return {
+                "mode": self.mode,
+                "max_interval_seconds": self.max_interval,
+                "min_interval_seconds": self.min_interval,
+                "deadbands": dict(self.deadbands),
+                "samples_evaluated": evaluated,
+                "records_written": self._stats["recorded"],
+                "reasons": dict(self._stats["reasons"]),
+                "recorded_ratio": round(self._stats["recorded"] / evaluated, 4) if evaluated else None
+            }
@@ -0,0 +1,581 @@
+# modbus_app/history/retention.py
+"""
+Retención del historial por niveles con borrado por lotes y vacuum incremental.
+
+Niveles (configurables en la sección `retention` de config.json):
+    raw      battery_history + celdas          (por defecto 30 días)
+    15min    history_rollup, resolution=900    (por defecto 730 días)
+    1d       history_rollup, resolution=86400  (por defecto sin límite)
+
+Al vencer, los registros de un nivel se agregan al siguiente y se eliminan en la
+misma transacción, por lotes acotados (las escrituras del monitor nunca esperan
+más que un lote). Las celdas se borran explícitamente por lote mediante su índice
+en lugar de depender de ON DELETE CASCADE fila a fila.
+
+Con el historial particionado por meses (ver partitions.py), el nivel crudo se
+aplica por archivo: cada mes completamente vencido se agrega y su archivo se borra.
+
+Los registros vencidos se siguen sirviendo agregados: las consultas de gráficas, la
+reducción y la exportación por intervalos completan con history_rollup la parte del
+rango anterior al corte (ver read_rollup). Las particiones agregadas quedan marcadas
+hasta que se borra su archivo, de modo que una ejecución interrumpida no las vuelve
+a sumar.
+
+Con auto_vacuum=INCREMENTAL, las páginas liberadas se devuelven al sistema de
+archivos con `PRAGMA incremental_vacuum`, manteniendo acotado el archivo .db.
+"""
+
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence
+
+from modbus_app.logger_config import log_to_cmd
+
+logger = logging.getLogger('history.retention')
+
+RESOLUTION_15MIN = 900
+RESOLUTION_1D = 86400
+
+DEFAULT_POLICY = {
+    "enabled": True,
+    "raw_days": 30,
+    "rollup_15min_days": 730,
+    "rollup_1d_days": None,          # None = conservar siempre
+    "batch_size": 5000,
+    "max_batches_per_run": 200,
+    "batch_pause_seconds": 0.05,
+    "interval_hours": 6,
+    "vacuum_pages_per_step": 2000,
+    "convert_to_incremental_vacuum": True
+}
+
+# Columnas del rollup: (columna destino, agregado sobre battery_history, agregado sobre el rollup)
+# Los agregados sobre el rollup combinan intervalos ponderando por número de muestras.
+ROLLUP_COLUMNS = (
+    ("pack_voltage_avg", "AVG(pack_voltage)", "SUM(pack_voltage_avg * samples) / SUM(samples)"),
+    ("pack_voltage_min", "MIN(pack_voltage)", "MIN(pack_voltage_min)"),
+    ("pack_voltage_max", "MAX(pack_voltage)", "MAX(pack_voltage_max)"),
+    ("battery_current_avg", "AVG(battery_current)", "SUM(battery_current_avg * samples) / SUM(samples)"),
+    ("battery_current_min", "MIN(battery_current)", "MIN(battery_current_min)"),
+    ("battery_current_max", "MAX(battery_current)", "MAX(battery_current_max)"),
+    ("soc_avg", "AVG(soc)", "SUM(soc_avg * samples) / SUM(samples)"),
+    ("soc_min", "MIN(soc)", "MIN(soc_min)"),
+    ("soc_max", "MAX(soc)", "MAX(soc_max)"),
+    ("soh_avg", "AVG(soh)", "SUM(soh_avg * samples) / SUM(samples)"),
+    ("temp_min", "MIN(temp_min)", "MIN(temp_min)"),
+    ("temp_max", "MAX(temp_max)", "MAX(temp_max)"),
+    ("cell_voltage_min", "MIN(cell_voltage_min)", "MIN(cell_voltage_min)"),
+    ("cell_voltage_max", "MAX(cell_voltage_max)", "MAX(cell_voltage_max)"),
+    ("cell_voltage_avg", "AVG(cell_voltage_avg)", "SUM(cell_voltage_avg * samples) / SUM(samples)"),
+    ("cell_temp_min", "MIN(cell_temp_min)", "MIN(cell_temp_min)"),
+    ("cell_temp_max", "MAX(cell_temp_max)", "MAX(cell_temp_max)"),
+    ("cell_temp_avg", "AVG(cell_temp_avg)", "SUM(cell_temp_avg * samples) / SUM(samples)"),
+    ("discharge_ah_accumulated", "MAX(discharge_ah_accumulated)", "MAX(discharge_ah_accumulated)"),
+    ("discharge_times_total", "MAX(discharge_times_total)", "MAX(discharge_times_total)"),
+    ("charge_cycles_accumulated", "MAX(charge_cycles_accumulated)", "MAX(charge_cycles_accumulated)")
+)
+
+# Combinación de un intervalo ya existente con uno nuevo (ON CONFLICT), por tipo de agregado
+def _merge_expression(column: str, aggregate: str) -> str:
+    if aggregate.startswith("MIN"):
+        return f"min(COALESCE({column}, excluded.{column}), COALESCE(excluded.{column}, {column}))"
+    if aggregate.startswith("MAX"):
+        return f"max(COALESCE({column}, excluded.{column}), COALESCE(excluded.{column}, {column}))"
+    # Media ponderada por muestras (los valores de la derecha son los previos a la actualización)
+    return (f"CASE WHEN {column} IS NULL THEN excluded.{column} "
+            f"WHEN excluded.{column} IS NULL THEN {column} "
+            f"ELSE ({column} * samples + excluded.{column} * excluded.samples) "
+            f"/ (samples + excluded.samples) END")
+
+
+ROLLUP_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS history_rollup (
+        battery_id INTEGER NOT NULL,
+        resolution INTEGER NOT NULL,      -- Segundos por intervalo (900, 86400)
+        bucket_start DATETIME NOT NULL,
+        samples INTEGER NOT NULL,
+        {', '.join(f'{column} REAL' for column, _, _ in ROLLUP_COLUMNS)},
+        PRIMARY KEY (battery_id, resolution, bucket_start)
+    ) WITHOUT ROWID
+"""
+
+ROLLUP_INDEX_SQL = ("CREATE INDEX IF NOT EXISTS idx_rollup_resolution_bucket "
+                    "ON history_rollup(resolution, bucket_start)")
+
+
+def _upsert_clause() -> str:
+    # SQLite evalúa todas las expresiones del SET con los valores previos de la fila
+    updates = [f"{column} = {_merge_expression(column, raw_aggregate)}"
+               for column, raw_aggregate, _ in ROLLUP_COLUMNS]
+    updates.append("samples = samples + excluded.samples")
+    return "ON CONFLICT(battery_id, resolution, bucket_start) DO UPDATE SET " + ", ".join(updates)
+
+
+# Particiones ya agregadas pendientes de borrar (una ejecución interrumpida entre el
+# rollup y el borrado del archivo no debe volver a agregarlas)
+ROLLED_PARTITIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS history_rollup_partitions (
+        month TEXT PRIMARY KEY,
+        rows INTEGER NOT NULL,
+        rolled_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def _db_time(value: datetime) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# ==================== LECTURA DE ROLLUPS ====================
+
+# Expresión que combina varias filas del rollup, por columna
+ROLLUP_MERGE = {column: rollup_aggregate for column, _, rollup_aggregate in ROLLUP_COLUMNS}
+
+
+def rollup_field_column(field: str) -> Optional[str]:
+    """Columna del rollup que representa un campo de battery_history (su media si la hay)."""
+    if f"{field}_avg" in ROLLUP_MERGE:
+        return f"{field}_avg"
+    if field in ROLLUP_MERGE:
+        return field
+    return None
+
+
+def read_rollup(conn, battery_id: int, fields: Sequence[str], start=None, end=None,
+                after: tuple = None, descending: bool = False, limit: int = -1) -> List[tuple]:
+    """
+    Intervalos agregados de una batería, filas (bucket_start, resolución, muestras, campos...).
+
+    Los registros crudos vencidos solo existen aquí: los lectores del historial
+    completan con estas filas la parte del rango anterior al corte de retención (los
+    niveles no se solapan). Los campos sin columna en el rollup salen como NULL.
+    `after` = (timestamp, id) de un cursor keyset; los intervalos cuentan como id 0.
+    """
+    selects = [rollup_field_column(field) or "NULL" for field in fields]
+    clauses = ["battery_id = ?"]
+    params = [battery_id]
+    if start:
+        clauses.append("bucket_start >= ?")
+        params.append(start)
+    if end:
+        clauses.append("bucket_start <= ?")
+        params.append(end)
+    if after:
+        clauses.append(f"(bucket_start, 0) {'<' if descending else '>'} (?, ?)")
+        params.extend(after)
+    direction = "DESC" if descending else "ASC"
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(
+        f"SELECT {', '.join(['bucket_start', 'resolution', 'samples'] + selects)} FROM history_rollup "
+        f"WHERE {' AND '.join(clauses)} ORDER BY bucket_start {direction} LIMIT ?",
+        params + [limit]
+    ).fetchall()
+
+
+class RetentionEngine:
+    """Aplica las políticas de retención sobre la base de datos de historial."""
+
+    def __init__(self, db, policy: Dict[str, Any] = None):
+        self.db = db
+        self.policy = dict(DEFAULT_POLICY)
+        if policy:
+            self.policy.update(policy)
+        self.last_report = None
+        self.last_run = None
+        self.running = False
+        self._run_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # ==================== ESQUEMA ====================
+
+    def ensure_schema(self, conn):
+        """Crea la tabla de rollups si no existe."""
+        conn.execute(ROLLUP_TABLE_SQL)
+        conn.execute(ROLLUP_INDEX_SQL)
+        conn.execute(ROLLED_PARTITIONS_SQL)
+        conn.commit()
+
+    def _ensure_incremental_vacuum(self, conn) -> bool:
+        """
+        Activa auto_vacuum=INCREMENTAL. En una base existente creada sin él, el cambio
+        requiere un VACUUM completo (una sola vez, si la política lo permite).
+        """
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode == 2:
+            return True
+        if not self.policy["convert_to_incremental_vacuum"]:
+            return False
+        log_to_cmd("RETENCIÓN: Convirtiendo base de datos a auto_vacuum=INCREMENTAL (VACUUM único)",
+                   "INFO", "RETENTION")
+        # Salir de WAL exige ser la única conexión: se cierran los escritores persistentes
+        with self.db.lock:
+            self.db.close()
+            try:
+                # En modo WAL el VACUUM no cambia auto_vacuum: se sale de WAL durante la conversión
+                conn.execute("PRAGMA journal_mode = DELETE")
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+            except Exception as e:
+                logger.warning(f"No se pudo convertir a auto_vacuum=INCREMENTAL: {str(e)}")
+            finally:
+                conn.execute("PRAGMA journal_mode = WAL")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    # ==================== LOTES ====================
+
+    def _pause(self):
+        pause = self.policy["batch_pause_seconds"]
+        if pause:
+            # Deja hueco al hilo de monitoreo entre lotes
+            self._stop_event.wait(pause)
+
+    @staticmethod
+    def _raw_rollup_sql(source: str, where: str) -> str:
+        """INSERT ... SELECT que agrega registros crudos de `source` a intervalos de 15 min."""
+        columns = ", ".join(column for column, _, _ in ROLLUP_COLUMNS)
+        aggregates = ", ".join(raw_aggregate for _, raw_aggregate, _ in ROLLUP_COLUMNS)
+        bucket = f"(CAST(strftime('%s', timestamp) AS INTEGER) / {RESOLUTION_15MIN})"
+        return (f"INSERT INTO main.history_rollup (battery_id, resolution, bucket_start, samples, {columns}) "
+                f"SELECT battery_id, {RESOLUTION_15MIN}, datetime({bucket} * {RESOLUTION_15MIN}, 'unixepoch'), "
+                f"COUNT(*), {aggregates} FROM {source} WHERE {where} "
+                f"GROUP BY battery_id, {bucket} "
+                f"{_upsert_clause()}")
+
+    def _rollup_raw_batch(self, conn, cutoff: str) -> Dict[str, int]:
+        """Agrega a 15 min y elimina un lote de registros crudos anteriores al corte."""
+        batch_size = self.policy["batch_size"]
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM temp.retention_batch")
+            conn.execute(
+                "INSERT INTO temp.retention_batch (id) "
+                "SELECT id FROM battery_history WHERE timestamp < ? ORDER BY timestamp LIMIT ?",
+                (cutoff, batch_size)
+            )
+            count = conn.execute("SELECT COUNT(*) FROM temp.retention_batch").fetchone()[0]
+            if not count:
+                conn.execute("COMMIT")
+                return {"rows": 0, "cells": 0}
+
+            conn.execute(self._raw_rollup_sql("main.battery_history",
+                                              "id IN (SELECT id FROM temp.retention_batch)"))
+            cells = conn.execute(
+                "DELETE FROM cell_voltages_history "
+                "WHERE battery_history_id IN (SELECT id FROM temp.retention_batch)"
+            ).rowcount
+            cells += conn.execute(
+                "DELETE FROM cell_temperatures_history "
+                "WHERE battery_history_id IN (SELECT id FROM temp.retention_batch)"
+            ).rowcount
+            rows = conn.execute(
+                "DELETE FROM battery_history WHERE id IN (SELECT id FROM temp.retention_batch)"
+            ).rowcount
+            conn.execute("COMMIT")
+            return {"rows": rows, "cells": cells}
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _drop_partitions(self, conn, cutoff: datetime, counters: dict) -> int:
+        """
+        Con particionado: agrega a 15 min cada mes completamente anterior al corte y
+        elimina su archivo. Devuelve los bytes liberados.
+        """
+        from .partitions import next_month
+        freed = 0
+        for month in self.db.partitions.months():
+            if next_month(month) > cutoff or self._stop_event.is_set():
+                break
+            key = month.strftime('%Y-%m')
+            conn.execute("ATTACH DATABASE ? AS expired", (self.db.partitions.path_for(month),))
+            try:
+                rows = conn.execute("SELECT COUNT(*) FROM expired.battery_history").fetchone()[0]
+                cells = sum(conn.execute(f"SELECT COUNT(*) FROM expired.{table}").fetchone()[0]
+                            for table in ("cell_voltages_history", "cell_temperatures_history"))
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # El rollup y la marca van en la misma transacción de la base principal:
+                    # si la ejecución se interrumpe antes de borrar el archivo, la siguiente
+                    # solo lo borra
+                    if not conn.execute("SELECT 1 FROM history_rollup_partitions WHERE month = ?",
+                                        (key,)).fetchone():
+                        conn.execute(self._raw_rollup_sql("expired.battery_history", "1"))
+                        conn.execute("INSERT INTO history_rollup_partitions (month, rows) VALUES (?, ?)",
+                                     (key, rows))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.execute("DETACH DATABASE expired")
+            freed += self.db.partitions.drop(month)
+            conn.execute("DELETE FROM history_rollup_partitions WHERE month = ?", (key,))
+            counters["raw_deleted"] += rows
+            counters["cells_deleted"] += cells
+            counters["partitions_dropped"] += 1
+            log_to_cmd(f"RETENCIÓN: Partición {key} agregada y eliminada ({rows} registros)",
+                       "INFO", "RETENTION")
+        return freed
+
+    def _rollup_15min_batch(self, conn, cutoff: str) -> int:
+        """Agrega a 1 día y elimina un lote de intervalos de 15 min anteriores al corte."""
+        batch_size = self.policy["batch_size"]
+        columns = ", ".join(column for column, _, _ in ROLLUP_COLUMNS)
+        aggregates = ", ".join(rollup_aggregate for _, _, rollup_aggregate in ROLLUP_COLUMNS)
+        day = "date(bucket_start)"
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM temp.retention_rollup_batch")
+            conn.execute(
+                "INSERT INTO temp.retention_rollup_batch (battery_id, bucket_start) "
+                "SELECT battery_id, bucket_start FROM history_rollup "
+                "WHERE resolution = ? AND bucket_start < ? ORDER BY bucket_start LIMIT ?",
+                (RESOLUTION_15MIN, cutoff, batch_size)
+            )
+            selection = ("resolution = ? AND (battery_id, bucket_start) IN "
+                         "(SELECT battery_id, bucket_start FROM temp.retention_rollup_batch)")
+            conn.execute(
+                f"INSERT INTO history_rollup (battery_id, resolution, bucket_start, samples, {columns}) "
+                f"SELECT battery_id, {RESOLUTION_1D}, {day} || ' 00:00:00', SUM(samples), {aggregates} "
+                f"FROM history_rollup WHERE {selection} "
+                f"GROUP BY battery_id, {day} "
+                f"{_upsert_clause()}",
+                (RESOLUTION_15MIN,)
+            )
+            rows = conn.execute(f"DELETE FROM history_rollup WHERE {selection}", (RESOLUTION_15MIN,)).rowcount
+            conn.execute("COMMIT")
+            return rows
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _delete_1d_batch(self, conn, cutoff: str) -> int:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "DELETE FROM history_rollup WHERE (battery_id, resolution, bucket_start) IN ("
+                "SELECT battery_id, resolution, bucket_start FROM history_rollup "
+                "WHERE resolution = ? AND bucket_start < ? LIMIT ?)",
+                (RESOLUTION_1D, cutoff, self.policy["batch_size"])
+            ).rowcount
+            conn.execute("COMMIT")
+            return rows
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _run_batches(self, step, conn, cutoff, counters: dict, key: str, budget: list):
+        """Ejecuta lotes de un paso hasta agotarlo o consumir el presupuesto de lotes."""
+        while budget[0] > 0 and not self._stop_event.is_set():
+            result = step(conn, cutoff)
+            budget[0] -= 1
+            if isinstance(result, dict):
+                counters[key] += result["rows"]
+                counters["cells_deleted"] += result["cells"]
+                done = result["rows"] < self.policy["batch_size"]
+            else:
+                counters[key] += result
+                done = result < self.policy["batch_size"]
+            if done:
+                return
+            self._pause()
+
+    # ==================== ESPACIO ====================
+
+    @staticmethod
+    def _space(conn) -> Dict[str, int]:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "page_size": page_size,
+            "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+            "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0]
+        }
+
+    def _incremental_vacuum(self, conn) -> int:
+        """Devuelve páginas libres al sistema de archivos por pasos. Retorna páginas liberadas."""
+        freed = 0
+        step = self.policy["vacuum_pages_per_step"]
+        while not self._stop_event.is_set():
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not before:
+                break
+            # execute() solo avanza un paso del PRAGMA (una página); executescript lo completa
+            conn.executescript(f"PRAGMA incremental_vacuum({step});")
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            freed += before - after
+            if after == 0 or after == before:
+                break
+            self._pause()
+        return freed
+
+    # ==================== EJECUCIÓN ====================
+
+    def run_once(self) -> Dict[str, Any]:
+        """Aplica todas las políticas una vez y devuelve un informe."""
+        if not self._run_lock.acquire(blocking=False):
+            return {"status": "error", "message": "La retención ya se está ejecutando"}
+
+        self.running = True
+        started = time.perf_counter()
+        now = datetime.now()
+        counters = {"raw_deleted": 0, "cells_deleted": 0, "rollup_15min_deleted": 0, "rollup_1d_deleted": 0,
+                    "partitions_dropped": 0}
+        partition_bytes = 0
+        try:
+            with self.db.get_connection() as conn:
+                # Transacciones explícitas por lote
+                conn.isolation_level = None
+                self.ensure_schema(conn)
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_batch (id INTEGER PRIMARY KEY)")
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_rollup_batch "
+                             "(battery_id INTEGER, bucket_start TEXT, PRIMARY KEY (battery_id, bucket_start))")
+                incremental = self._ensure_incremental_vacuum(conn)
+                file_before = os.path.getsize(self.db.db_path) if os.path.exists(self.db.db_path) else 0
+
+                budget = [self.policy["max_batches_per_run"]]
+
+                # Crudo -> 15 min (el corte se alinea al intervalo: solo se agregan intervalos completos)
+                raw_cutoff = now - timedelta(days=self.policy["raw_days"])
+                raw_cutoff = datetime.fromtimestamp(
+                    int(raw_cutoff.timestamp()) // RESOLUTION_15MIN * RESOLUTION_15MIN)
+                if self.db.partitioned:
+                    # Meses completos: agregar y borrar el archivo (los meses parciales
+                    # se conservan hasta que vencen enteros)
+                    partition_bytes = self._drop_partitions(conn, raw_cutoff, counters)
+                # Registros en la base principal (sin particionado o previos a migrar)
+                self._run_batches(self._rollup_raw_batch, conn, _db_time(raw_cutoff),
+                                  counters, "raw_deleted", budget)
+
+                # 15 min -> 1 día (corte alineado al día)
+                if self.policy["rollup_15min_days"] is not None:
+                    cutoff = (now - timedelta(days=self.policy["rollup_15min_days"])).replace(
+                        hour=0, minute=0, second=0, microsecond=0)
+                    self._run_batches(self._rollup_15min_batch, conn, _db_time(cutoff),
+                                      counters, "rollup_15min_deleted", budget)
+
+                # 1 día -> eliminación
+                if self.policy["rollup_1d_days"] is not None:
+                    cutoff = now - timedelta(days=self.policy["rollup_1d_days"])
+                    self._run_batches(self._delete_1d_batch, conn, _db_time(cutoff),
+                                      counters, "rollup_1d_deleted", budget)
+
+                space_before = self._space(conn)
+                freed_pages = self._incremental_vacuum(conn) if incremental else 0
+                space_after = self._space(conn)
+                # En WAL el truncado del vacuum no llega al archivo hasta el checkpoint
+                busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+                file_after = os.path.getsize(self.db.db_path) if os.path.exists(self.db.db_path) else 0
+
+            report = dict(counters)
+            report.update({
+                "status": "success",
+                "duration_seconds": round(time.perf_counter() - started, 3),
+                "batches_exhausted": budget[0] <= 0,
+                "incremental_vacuum": incremental,
+                "pages_freed": freed_pages,
+                "reclaimed_bytes": freed_pages * space_after["page_size"] + partition_bytes,
+                "file_size_before": file_before,
+                "file_size_after": file_after,
+                "wal_checkpoint": {"busy": bool(busy), "wal_frames": wal_frames,
+                                   "checkpointed_frames": checkpointed},
+                "free_pages_remaining": space_after["freelist_count"],
+                "page_count_before": space_before["page_count"],
+                "page_count_after": space_after["page_count"]
+            })
+            log_to_cmd(
+                f"RETENCIÓN: {counters['raw_deleted']} crudos, {counters['cells_deleted']} celdas, "
+                f"{counters['rollup_15min_deleted']} rollups 15min, {counters['rollup_1d_deleted']} rollups 1d "
+                f"eliminados; {report['reclaimed_bytes'] / 1048576:.1f} MB recuperados",
+                "INFO", "RETENTION")
+        except Exception as e:
+            logger.error(f"Error aplicando retención: {str(e)}")
+            report = dict(counters, status="error", message=str(e))
+        finally:
+            self.running = False
+            self.last_run = now.isoformat()
+            self._run_lock.release()
+
+        self.last_report = report
+        return report
+
+    # ==================== PLANIFICACIÓN ====================
+
+    def start(self) -> bool:
+        """Inicia el hilo que aplica la retención cada `interval_hours`."""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._scheduler_worker, name="history-retention", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        self._thread = None
+
+    def _scheduler_worker(self):
+        interval = self.policy["interval_hours"] * 3600
+        # Primera ejecución tras un breve retardo para no competir con el arranque
+        if self._stop_event.wait(60):
+            return
+        while not self._stop_event.is_set():
+            self.run_once()
+            if self._stop_event.wait(interval):
+                return
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "scheduler_active": bool(self._thread and self._thread.is_alive()),
+            "running": self.running,
+            "last_run": self.last_run,
+            "last_report": self.last_report
+        }
+
+
+# Instancia global
+_engine_instance = None
+_engine_lock = threading.Lock()
+
+
+def get_retention_engine() -> RetentionEngine:
+    """Devuelve el motor de retención global (configurado desde config.json)."""
+    global _engine_instance
+    from .database import get_db
+    db = get_db()
+    engine = _engine_instance
+    if engine is not None and engine.db is db:
+        return engine
+    with _engine_lock:
+        if _engine_instance is None or _engine_instance.db is not db:
+            policy = None
+            try:
+                from modbus_app import config_manager
+                policy = config_manager.load_config().get("retention")
+            except Exception as e:
+                logger.warning(f"No se pudo leer la configuración de retención: {str(e)}")
+            previous = _engine_instance
+            _engine_instance = RetentionEngine(db, policy)
+            if previous is not None and previous._thread and previous._thread.is_alive():
+                previous.stop()
+                _engine_instance.start()
+        return _engine_instance
+
+
+def start_retention_scheduler() -> Optional[RetentionEngine]:
+    """Inicia la retención programada si está habilitada."""
+    engine = get_retention_engine()
+    if not engine.policy.get("enabled", True):
+        return None
+    with _engine_lock:
+        engine.start()
+    return engine
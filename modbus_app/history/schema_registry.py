@@ -0,0 +1,104 @@
+# modbus_app/history/schema_registry.py
+"""
+Registro de columnas de battery_history para la escritura del historial.
+
+Mantiene en memoria las columnas de cada archivo de base de datos (principal o
+partición mensual) y la sentencia INSERT de cada combinación de columnas. Antes de
+insertar, las columnas nuevas (campos auto-expandidos) se añaden de una vez en una
+transacción de migración; la inserción en sí es siempre una sola sentencia ya
+preparada, sin reintentos tras un error "no such column".
+"""
+
+import threading
+import logging
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger('history.schema_registry')
+
+# Sentencias INSERT distintas en caché (combinaciones de columnas)
+MAX_STATEMENTS = 64
+
+
+def detect_column_type(value) -> str:
+    """Tipo de columna SQL para un valor."""
+    if value is None:
+        return "INTEGER"  # Tipo por defecto
+    if isinstance(value, (bool, int)):
+        return "INTEGER"  # SQLite guarda bool como INTEGER
+    if isinstance(value, float):
+        return "REAL"
+    return "TEXT"
+
+
+class HistorySchemaRegistry:
+    """Columnas conocidas por archivo y sentencias INSERT por conjunto de columnas."""
+
+    def __init__(self, table: str = "battery_history"):
+        self.table = table
+        self._columns = {}      # clave de archivo -> {columna: tipo}
+        self._statements = {}   # tupla de columnas -> SQL
+        self._lock = threading.Lock()
+
+    def columns(self, conn, key: str) -> Dict[str, str]:
+        """Columnas de la tabla en el archivo `key` (se leen una vez por archivo)."""
+        with self._lock:
+            columns = self._columns.get(key)
+        if columns is None:
+            columns = {row[1]: row[2] or "" for row in conn.execute(f"PRAGMA table_info({self.table})")}
+            with self._lock:
+                self._columns[key] = columns
+        return columns
+
+    def ensure_columns(self, conn, key: str, values: Dict) -> List[str]:
+        """
+        Añade en una sola transacción las columnas de `values` que no existen aún.
+        Devuelve las columnas añadidas.
+        """
+        known = self.columns(conn, key)
+        missing = [name for name in values if name not in known]
+        if not missing:
+            return []
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for name in missing:
+                conn.execute(f"ALTER TABLE {self.table} ADD COLUMN {name} {detect_column_type(values[name])}")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if "duplicate column name" not in str(e).lower():
+                raise
+            # Otra conexión añadió la columna: releer el esquema y completar lo que falte
+            self.invalidate(key)
+            known = self.columns(conn, key)
+            missing = [name for name in values if name not in known]
+            for name in missing:
+                conn.execute(f"ALTER TABLE {self.table} ADD COLUMN {name} {detect_column_type(values[name])}")
+            conn.commit()
+
+        with self._lock:
+            columns = dict(known)
+            columns.update((name, detect_column_type(values[name])) for name in missing)
+            self._columns[key] = columns
+        return missing
+
+    def insert_sql(self, columns: Sequence[str]) -> str:
+        """INSERT para un conjunto ordenado de columnas (cacheado)."""
+        key = tuple(columns)
+        sql = self._statements.get(key)
+        if sql is None:
+            sql = (f"INSERT INTO {self.table} ({', '.join(key)}) "
+                   f"VALUES ({', '.join('?' * len(key))})")
+            with self._lock:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    self._statements.clear()
+                self._statements[key] = sql
+        return sql
+
+    def invalidate(self, key: str = None):
+        """Descarta las columnas en caché de un archivo (o de todos)."""
+        with self._lock:
+            if key is None:
+                self._columns.clear()
+            else:
+                self._columns.pop(key, None)
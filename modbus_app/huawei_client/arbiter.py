@@ -0,0 +1,247 @@
+# modbus_app/huawei_client/arbiter.py
+"""
+Arbitraje del bus RS-485 entre clases de prioridad.
+
+Cada transacción del cliente (lectura, escritura, FC41, autenticación) solicita el
+bus al árbitro. Al liberarse, el bus se concede al siguiente solicitante según:
+
+1. Envejecimiento: una petición que espera más de `max_wait` se atiende primero
+   (ninguna clase queda bloqueada indefinidamente).
+2. Prioridad: crítico > interactivo > historial > diagnóstico, saltando las clases
+   que ya consumieron su presupuesto de tiempo de bus en la ventana actual
+   (si todas lo agotaron, se atiende la de mayor prioridad).
+3. FIFO dentro de cada clase.
+
+La preempción ocurre en los límites de transacción: un trabajo largo (descarga de
+historial, diagnóstico) cede el bus entre cada trama a las lecturas en vivo.
+
+La clase de prioridad se asocia al hilo que opera:
+
+    with bus_priority(PRIORITY_HISTORY):
+        ...  # todas las transacciones de este bloque usan la clase historial
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger('huawei_client.arbiter')
+
+# Clases de prioridad (de mayor a menor)
+PRIORITY_CRITICAL = "critical"          # Polling de estado en vivo
+PRIORITY_INTERACTIVE = "interactive"    # Peticiones de la API / usuario
+PRIORITY_HISTORY = "history"            # Historial, backfill, FC41 masivo
+PRIORITY_DIAGNOSTICS = "diagnostics"    # Lecturas completas de diagnóstico
+
+PRIORITY_CLASSES = (PRIORITY_CRITICAL, PRIORITY_INTERACTIVE, PRIORITY_HISTORY, PRIORITY_DIAGNOSTICS)
+
+# Fracción máxima del tiempo de bus por ventana cuando otras clases esperan (None = sin límite)
+DEFAULT_BUDGETS = {
+    PRIORITY_CRITICAL: None,
+    PRIORITY_INTERACTIVE: 0.6,
+    PRIORITY_HISTORY: 0.3,
+    PRIORITY_DIAGNOSTICS: 0.2
+}
+
+_thread_state = threading.local()
+
+
+def current_priority(default: str = PRIORITY_INTERACTIVE) -> str:
+    """Clase de prioridad activa para el hilo actual."""
+    return getattr(_thread_state, 'priority', None) or default
+
+
+@contextmanager
+def bus_priority(priority: str):
+    """Asigna una clase de prioridad a las transacciones del hilo actual."""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Clase de prioridad desconocida: {priority}")
+    previous = getattr(_thread_state, 'priority', None)
+    _thread_state.priority = priority
+    try:
+        yield
+    finally:
+        _thread_state.priority = previous
+
+
+class _Ticket:
+    __slots__ = ('priority', 'enqueued')
+
+    def __init__(self, priority: str, enqueued: float):
+        self.priority = priority
+        self.enqueued = enqueued
+
+
+class _ClassStats:
+    """Métricas y consumo de bus de una clase de prioridad."""
+
+    __slots__ = ('queue', 'usage', 'used', 'granted', 'total_wait', 'max_wait',
+                 'last_wait', 'bus_time', 'preempted')
+
+    def __init__(self):
+        self.queue = deque()
+        self.usage = deque()   # (fin, duración) dentro de la ventana
+        self.used = 0.0        # Suma de duraciones en la ventana
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        self.bus_time = 0.0
+        self.preempted = 0     # Concesiones perdidas frente a otra clase
+
+    def prune(self, now: float, window: float):
+        usage = self.usage
+        while usage and now - usage[0][0] > window:
+            self.used -= usage.popleft()[1]
+
+
+class BusArbiter:
+    """Árbitro del bus con prioridades, presupuestos y envejecimiento (reentrante por hilo)."""
+
+    def __init__(self, budgets: Dict[str, Optional[float]] = None, window: float = 10.0,
+                 max_wait: float = 5.0):
+        """
+        Args:
+            budgets: Fracción de tiempo de bus por clase en la ventana (None = sin límite)
+            window: Duración de la ventana de presupuesto en segundos
+            max_wait: Espera a partir de la cual una petición se atiende antes que el resto
+        """
+        self.budgets = dict(DEFAULT_BUDGETS)
+        if budgets:
+            self.budgets.update(budgets)
+        self.window = window
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {priority: _ClassStats() for priority in PRIORITY_CLASSES}
+        self._owner = None
+        self._owner_priority = None
+        self._depth = 0
+        self._granted_at = 0.0
+
+    # ==================== ADQUISICIÓN ====================
+
+    def acquire(self, priority: str = None):
+        """Espera hasta obtener el bus para una transacción."""
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return
+
+            priority = priority or current_priority()
+            stats = self._stats[priority]
+            ticket = _Ticket(priority, time.monotonic())
+            stats.queue.append(ticket)
+
+            while self._owner is not None or self._select(time.monotonic()) is not ticket:
+                self._cond.wait(self.max_wait)
+
+            stats.queue.popleft()
+            for other in self._stats.values():
+                if other.queue and other is not stats:
+                    other.preempted += 1
+            now = time.monotonic()
+            wait = now - ticket.enqueued
+            stats.granted += 1
+            stats.total_wait += wait
+            stats.last_wait = wait
+            if wait > stats.max_wait:
+                stats.max_wait = wait
+
+            self._owner = me
+            self._owner_priority = priority
+            self._depth = 1
+            self._granted_at = now
+
+    def release(self):
+        """Libera el bus al terminar la transacción."""
+        with self._cond:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("El bus no pertenece a este hilo")
+            self._depth -= 1
+            if self._depth:
+                return
+
+            now = time.monotonic()
+            duration = now - self._granted_at
+            stats = self._stats[self._owner_priority]
+            stats.usage.append((now, duration))
+            stats.used += duration
+            stats.bus_time += duration
+
+            self._owner = None
+            self._owner_priority = None
+            self._cond.notify_all()
+
+    @contextmanager
+    def transaction(self, priority: str = None):
+        """Context manager para una transacción en el bus."""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # ==================== SELECCIÓN ====================
+
+    def _over_budget(self, priority: str, now: float) -> bool:
+        budget = self.budgets.get(priority)
+        if budget is None:
+            return False
+        stats = self._stats[priority]
+        stats.prune(now, self.window)
+        return stats.used >= budget * self.window
+
+    def _select(self, now: float) -> Optional[_Ticket]:
+        """Elige el siguiente ticket a atender (llamar con el lock tomado)."""
+        heads = [self._stats[p].queue[0] for p in PRIORITY_CLASSES if self._stats[p].queue]
+        if not heads:
+            return None
+
+        chosen = None
+        aged = [t for t in heads if now - t.enqueued >= self.max_wait]
+        if aged:
+            chosen = min(aged, key=lambda t: t.enqueued)
+        else:
+            for ticket in heads:
+                if not self._over_budget(ticket.priority, now):
+                    chosen = ticket
+                    break
+            if chosen is None:
+                chosen = heads[0]
+
+        return chosen
+
+    # ==================== MÉTRICAS ====================
+
+    def get_status(self) -> Dict[str, Any]:
+        """Profundidad de cola, esperas y consumo de bus por clase."""
+        with self._cond:
+            now = time.monotonic()
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                stats = self._stats[priority]
+                stats.prune(now, self.window)
+                oldest = stats.queue[0].enqueued if stats.queue else None
+                classes[priority] = {
+                    "queue_depth": len(stats.queue),
+                    "oldest_wait": round(now - oldest, 4) if oldest is not None else 0.0,
+                    "granted": stats.granted,
+                    "avg_wait": round(stats.total_wait / stats.granted, 4) if stats.granted else 0.0,
+                    "max_wait": round(stats.max_wait, 4),
+                    "last_wait": round(stats.last_wait, 4),
+                    "bus_time_total": round(stats.bus_time, 4),
+                    "bus_share_window": round(stats.used / self.window, 4),
+                    "budget": self.budgets.get(priority),
+                    "preempted": stats.preempted
+                }
+            return {
+                "owner_priority": self._owner_priority,
+                "window_seconds": self.window,
+                "max_wait_seconds": self.max_wait,
+                "classes": classes
+            }
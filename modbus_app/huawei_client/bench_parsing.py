@@ -0,0 +1,120 @@
+# modbus_app/huawei_client/bench_parsing.py
+"""
+Micro-benchmarks de la capa de parseo de respuestas.
+Compara los parsers actuales (struct.unpack_from / tablas de bits) con la
+implementación anterior índice a índice.
+
+Uso:
+    python -m modbus_app.huawei_client.bench_parsing [iteraciones]
+"""
+
+import sys
+import struct
+import timeit
+
+from .parsing import (
+    parse_read_response,
+    parse_coil_response,
+    decode_ascii_payload,
+    decode_history_record
+)
+
+
+def _crc16(data: bytes) -> bytes:
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return struct.pack('<H', crc)
+
+
+def _frame(body: bytes) -> bytes:
+    return body + _crc16(body)
+
+
+# ==================== IMPLEMENTACIÓN ANTERIOR (REFERENCIA) ====================
+
+def _legacy_read(response, slave_id, function_code, count):
+    if len(response) < 5 or response[0] != slave_id or response[1] != function_code:
+        return {"success": False}
+    if response[2] != count * 2:
+        return {"success": False}
+    registers = []
+    for i in range(count):
+        reg_offset = 3 + (i * 2)
+        if reg_offset + 1 < len(response):
+            registers.append((response[reg_offset] << 8) | response[reg_offset + 1])
+    return {"success": True, "data": registers}
+
+
+def _legacy_coils(response, slave_id, function_code, count):
+    if len(response) < 4 or response[0] != slave_id or response[1] != function_code:
+        return {"success": False}
+    bits = []
+    for i in range(count):
+        byte_index = 3 + (i // 8)
+        if byte_index < len(response):
+            bits.append(bool(response[byte_index] & (1 << (i % 8))))
+        else:
+            bits.append(False)
+    return {"success": True, "data": bits}
+
+
+def _legacy_ascii(data_bytes):
+    text = data_bytes.decode('utf-8', errors='ignore')
+    return ''.join(c for c in text if (32 <= ord(c) <= 126) or c in ['\n', '\r', '\t'])
+
+
+def _legacy_history(d):
+    def s16(lo, hi):
+        v = lo | (hi << 8)
+        return v - 65536 if v > 32767 else v
+    return {
+        "pack_voltage": (d[8] | (d[9] << 8)) / 100.0,
+        "battery_current": s16(d[10], d[11]) / 100.0,
+        "temp_low": d[16],
+        "temp_high": d[18],
+        "soc": d[20],
+        "discharge_ah": d[24] | (d[25] << 8),
+        "discharge_times": d[28],
+        "battery_voltage": (d[30] | (d[31] << 8)) / 100.0
+    }
+
+
+# ==================== BENCHMARKS ====================
+
+def run_benchmarks(iterations: int = 20000):
+    """Ejecuta los micro-benchmarks e imprime µs por llamada."""
+    regs7 = _frame(bytes([217, 0x03, 14]) + struct.pack('>7H', 5444, 5411, 2012, 87, 94, 25, 23))
+    regs16 = _frame(bytes([217, 0x03, 32]) + struct.pack('>16H', *range(3300, 3316)))
+    coils64 = _frame(bytes([217, 0x01, 8]) + bytes(range(0xA0, 0xA8)))
+    ascii_payload = b'/$[ArchivesInfo Version]\r\n/$ArchivesInfoVersion=3.0\r\nBoardType=ESM-48150B1\r\n\x00\xff' * 3
+    history = bytes(range(32))
+
+    cases = [
+        ("FC03 x7 registros", lambda: _legacy_read(regs7, 217, 3, 7), lambda: parse_read_response(regs7, 217, 3, 7)),
+        ("FC03 x16 registros", lambda: _legacy_read(regs16, 217, 3, 16), lambda: parse_read_response(regs16, 217, 3, 16)),
+        ("FC01 x64 coils", lambda: _legacy_coils(coils64, 217, 1, 64), lambda: parse_coil_response(coils64, 217, 1, 64)),
+        ("FC41 texto ASCII", lambda: _legacy_ascii(ascii_payload), lambda: decode_ascii_payload(ascii_payload)),
+        ("FC41 registro histórico", lambda: _legacy_history(history), lambda: decode_history_record(history)),
+    ]
+
+    # Verificar equivalencia antes de medir
+    for name, legacy, current in cases:
+        old, new = legacy(), current()
+        old_data = old.get("data") if isinstance(old, dict) and "success" in old else old
+        new_data = new.data if hasattr(new, 'data') else new
+        if old_data != new_data:
+            raise AssertionError(f"Resultado distinto en '{name}': {old_data!r} != {new_data!r}")
+
+    print(f"{'Caso':<26}{'anterior (µs)':>15}{'actual (µs)':>14}{'mejora':>9}")
+    print("-" * 64)
+    for name, legacy, current in cases:
+        t_old = min(timeit.repeat(legacy, number=iterations, repeat=3)) / iterations * 1e6
+        t_new = min(timeit.repeat(current, number=iterations, repeat=3)) / iterations * 1e6
+        print(f"{name:<26}{t_old:>15.2f}{t_new:>14.2f}{t_old / t_new:>8.1f}x")
+
+
+if __name__ == '__main__':
+    run_benchmarks(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
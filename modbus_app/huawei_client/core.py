@@ -9,10 +9,17 @@ import threading
 import serial
 import logging
 from typing import Dict, List, Optional, Union, Any
+from contextlib import contextmanager
 from datetime import datetime
 
 from .protocol import ModbusProtocol
 from .authentication import HuaweiAuthentication
+from .slave_health import SlaveHealthTracker
+from .arbiter import BusArbiter
+from .parsing import ModbusResponse
+from .recorder import BusRecorder, ReplaySerial, default_recording_path
+from .. import metrics
+from ..tracing import span
 
 # Configurar logger
 logger = logging.getLogger('huawei_client.core')
@@ -62,6 +69,12 @@ class HuaweiModbusClient:
         # Estados de autenticación por batería
         self._authenticated_batteries = set()
         
+        # Salud por esclavo: latencia EWMA, timeout adaptativo y circuit breaker
+        self.health = SlaveHealthTracker()
+        
+        # Árbitro del bus: prioridad por clase de hilo (ver arbiter.bus_priority)
+        self.arbiter = BusArbiter()
+        
         # Configuraciones de timeout por función
         self._timeouts = {
             'FC01': 0.2,    # Read Coils
@@ -117,6 +130,8 @@ class HuaweiModbusClient:
     def close(self):
         """Cierra la conexión serial."""
         with self._lock:
+            if self.protocol.recorder is not None:
+                self.protocol.recorder.flush()
             if self._serial and self._serial.is_open:
                 try:
                     self._serial.close()
@@ -128,6 +143,43 @@ class HuaweiModbusClient:
                     self._is_connected = False
                     self._authenticated_batteries.clear()
     
+    def connect_replay(self, path: str, speed: float = 0.0) -> bool:
+        """
+        Conecta el cliente a una grabación del bus en lugar del puerto serial.
+        
+        Args:
+            path: Archivo de grabación (.hbr)
+            speed: 0 = sin esperas, 1.0 = tiempo real, N = N veces más rápido
+        """
+        with self._lock:
+            self.close()
+            self._serial = ReplaySerial(path, speed=speed, timeout=self.timeout)
+            self._is_connected = True
+            logger.info(f"Cliente conectado a grabación {path} ({self._serial.remaining} transacciones)")
+            return True
+    
+    def start_recording(self, path: str = None) -> str:
+        """
+        Inicia la grabación de tramas TX/RX del bus.
+        
+        Args:
+            path: Archivo de destino (por defecto bus_recordings/bus_<fecha>.hbr)
+            
+        Returns:
+            str: Ruta del archivo de grabación
+        """
+        with self._lock:
+            self.stop_recording()
+            self.protocol.recorder = BusRecorder(path or default_recording_path())
+            return self.protocol.recorder.path
+    
+    def stop_recording(self):
+        """Detiene la grabación del bus si está activa."""
+        with self._lock:
+            recorder, self.protocol.recorder = self.protocol.recorder, None
+            if recorder is not None:
+                recorder.close()
+    
     def is_socket_open(self) -> bool:
         """
         Verifica si la conexión está abierta.
@@ -215,7 +267,7 @@ class HuaweiModbusClient:
             logger.info(f"Batería {slave_id} ya está autenticada")
             return True
         
-        with self._lock:
+        with self._bus():
             try:
                 logger.info(f"Iniciando autenticación para batería {slave_id}")
                 
@@ -260,67 +312,55 @@ class HuaweiModbusClient:
         
         logger.info(f"Iniciando secuencia de despertar para batería {slave_id}")
         
-        with self._lock:
-            try:
-                # Configurar timeout específico para wake_up (más corto que autenticación)
-                old_timeout = self._serial.timeout if self._serial else self.timeout
-                wake_timeout = 0.8  # Timeout corto para cada intento individual
-                
-                if self._serial:
-                    self._serial.timeout = wake_timeout
+        wake_timeout = 0.8  # Timeout corto para cada intento individual
+        
+        try:
+            for attempt in range(1, max_attempts + 1):
+                logger.debug(f"Intento {attempt}/{max_attempts} de despertar batería {slave_id}")
                 
-                for attempt in range(1, max_attempts + 1):
-                    logger.debug(f"Intento {attempt}/{max_attempts} de despertar batería {slave_id}")
-                    
-                    try:
-                        # Intentar leer registro básico 0 (voltaje de batería)
-                        # Esta es la operación más básica y menos intrusiva
-                        result = self._execute_standard_function('FC03', slave_id, 0, 1)
-                        
-                        if not result.isError() and result.data:
-                            voltage_raw = result.data[0]
-                            voltage = voltage_raw * 0.01  # Factor de conversión estándar
-                            
-                            logger.info(f"¡Batería {slave_id} despertada exitosamente en intento {attempt}!")
-                            logger.info(f"Voltaje detectado: {voltage:.2f}V (raw: {voltage_raw})")
-                            
+                try:
+                    # Cada intento es una transacción: el bus queda libre durante la espera
+                    with self._bus():
+                        # Configurar timeout específico para wake_up (más corto que autenticación)
+                        old_timeout = self._serial.timeout if self._serial else self.timeout
+                        if self._serial:
+                            self._serial.timeout = wake_timeout
+                        try:
+                            # Intentar leer registro básico 0 (voltaje de batería)
+                            # Esta es la operación más básica y menos intrusiva
+                            # Se ignora el circuit breaker: despertar es justamente el sondeo
+                            result = self._execute_standard_function('FC03', slave_id, 0, 1, bypass_breaker=True)
+                        finally:
                             # Restaurar timeout original
                             if self._serial:
                                 self._serial.timeout = old_timeout
-                            
-                            return True
-                        else:
-                            error_msg = result.error if result.isError() else "Sin datos válidos"
-                            logger.warning(f"Intento {attempt} falló: {error_msg}")
-                            
-                    except Exception as e:
-                        logger.warning(f"Excepción en intento {attempt}: {str(e)}")
                     
-                    # Si no es el último intento, esperar con progresión exponencial
-                    if attempt < max_attempts:
-                        wait_time = 2 ** (attempt - 1)  # 1s, 2s, 4s, 8s, 16s
-                        logger.debug(f"Esperando {wait_time}s antes del siguiente intento...")
+                    if not result.isError() and result.data:
+                        voltage_raw = result.data[0]
+                        voltage = voltage_raw * 0.01  # Factor de conversión estándar
                         
-                        # Liberar el lock temporalmente durante la espera para no bloquear otras operaciones
-                        self._lock.release()
-                        try:
-                            time.sleep(wait_time)
-                        finally:
-                            self._lock.acquire()
-                
-                # Restaurar timeout original si llegamos aquí
-                if self._serial:
-                    self._serial.timeout = old_timeout
-                
-                logger.error(f"No se pudo despertar batería {slave_id} después de {max_attempts} intentos")
-                return False
+                        logger.info(f"¡Batería {slave_id} despertada exitosamente en intento {attempt}!")
+                        logger.info(f"Voltaje detectado: {voltage:.2f}V (raw: {voltage_raw})")
+                        return True
+                    else:
+                        error_msg = result.error if result.isError() else "Sin datos válidos"
+                        logger.warning(f"Intento {attempt} falló: {error_msg}")
+                        
+                except Exception as e:
+                    logger.warning(f"Excepción en intento {attempt}: {str(e)}")
                 
-            except Exception as e:
-                # Restaurar timeout en caso de excepción
-                if self._serial:
-                    self._serial.timeout = old_timeout
-                logger.error(f"Error crítico despertando batería {slave_id}: {str(e)}")
-                return False
+                # Si no es el último intento, esperar con progresión exponencial
+                if attempt < max_attempts:
+                    wait_time = 2 ** (attempt - 1)  # 1s, 2s, 4s, 8s, 16s
+                    logger.debug(f"Esperando {wait_time}s antes del siguiente intento...")
+                    time.sleep(wait_time)
+            
+            logger.error(f"No se pudo despertar batería {slave_id} después de {max_attempts} intentos")
+            return False
+            
+        except Exception as e:
+            logger.error(f"Error crítico despertando batería {slave_id}: {str(e)}")
+            return False
     
     
     def read_device_info(self, slave_id: int, info_index: int = 0) -> Dict[str, Any]:
@@ -343,15 +383,17 @@ class HuaweiModbusClient:
             if not self.authenticate_battery(slave_id):
                 return {"success": False, "error": "Fallo en autenticación"}
         
-        with self._lock:
+        with self._bus():
             try:
                 # Usar timeout especial para FC41
                 old_timeout = self._serial.timeout
                 self._serial.timeout = self._timeouts['FC41']
                 
+                start_time = time.perf_counter()
                 result = self.protocol.read_device_info_fc41(
                     self._serial, slave_id, info_index
                 )
+                self._record_metrics(slave_id, 'FC41', start_time)
                 
                 # Restaurar timeout
                 self._serial.timeout = old_timeout
@@ -381,14 +423,16 @@ class HuaweiModbusClient:
             if not self.authenticate_battery(slave_id):
                 return {"success": False, "error": "Fallo en autenticación"}
         
-        with self._lock:
+        with self._bus():
             try:
                 old_timeout = self._serial.timeout
                 self._serial.timeout = self._timeouts['FC41']
                 
+                start_time = time.perf_counter()
                 result = self.protocol.read_history_record_fc41(
                     self._serial, slave_id, record_number
                 )
+                self._record_metrics(slave_id, 'FC41', start_time)
                 
                 self._serial.timeout = old_timeout
                 return result
@@ -399,39 +443,50 @@ class HuaweiModbusClient:
     
     # ==================== MÉTODOS INTERNOS ====================
     
+    @contextmanager
+    def _bus(self):
+        """Transacción en el bus: turno concedido por el árbitro + lock del puerto."""
+        with span("bus.wait"):
+            self.arbiter.acquire()
+            try:
+                self._lock.acquire()
+            except BaseException:
+                self.arbiter.release()
+                raise
+        try:
+            yield
+        finally:
+            self._lock.release()
+            self.arbiter.release()
+    
     def _execute_standard_function(self, function_code: str, slave_id: int, 
-                                 address: int, count: int) -> 'ModbusResponse':
+                                 address: int, count: int, bypass_breaker: bool = False) -> 'ModbusResponse':
         """Ejecuta una función Modbus estándar."""
         if not self.is_socket_open():
             return ModbusResponse(success=False, error="No hay conexión activa")
         
-        with self._lock:
-            try:
-                # Configurar timeout específico
-                old_timeout = self._serial.timeout
-                self._serial.timeout = self._timeouts.get(function_code, 1.0)
-                
-                # Ejecutar función según el código
+        if not bypass_breaker and not self.health.allow_request(slave_id):
+            return ModbusResponse(success=False, error=f"Circuito abierto para esclavo {slave_id} (sin respuesta)")
+        
+        def operation():
+            # Ejecutar función según el código (el tiempo propio del span es el parseo)
+            with span(f"modbus.{function_code}", slave=slave_id, address=address, count=count):
                 if function_code == 'FC01':
-                    result = self.protocol.read_coils(self._serial, slave_id, address, count)
+                    return self.protocol.read_coils(self._serial, slave_id, address, count)
                 elif function_code == 'FC02':
-                    result = self.protocol.read_discrete_inputs(self._serial, slave_id, address, count)
+                    return self.protocol.read_discrete_inputs(self._serial, slave_id, address, count)
                 elif function_code == 'FC03':
-                    result = self.protocol.read_holding_registers(self._serial, slave_id, address, count)
+                    return self.protocol.read_holding_registers(self._serial, slave_id, address, count)
                 elif function_code == 'FC04':
-                    result = self.protocol.read_input_registers(self._serial, slave_id, address, count)
-                else:
-                    result = {"success": False, "error": f"Función {function_code} no implementada"}
-                
-                # Restaurar timeout
-                self._serial.timeout = old_timeout
-                
-                # Convertir a formato PyModbus compatible
-                return ModbusResponse.from_huawei_result(result)
-                
-            except Exception as e:
-                logger.error(f"Error ejecutando {function_code}: {str(e)}")
-                return ModbusResponse(success=False, error=str(e))
+                    return self.protocol.read_input_registers(self._serial, slave_id, address, count)
+                return ModbusResponse(success=False, error=f"Función {function_code} no implementada")
+        
+        # Bytes de la respuesta esperada: bits empaquetados (FC01/02) o registros (FC03/04)
+        if function_code in ('FC01', 'FC02'):
+            response_bytes = 5 + (count + 7) // 8
+        else:
+            response_bytes = 5 + 2 * count
+        return self._transaction(function_code, slave_id, operation, response_bytes)
     
     def _execute_write_function(self, function_code: str, slave_id: int, 
                               address: int, values: List[Union[bool, int]]) -> 'ModbusResponse':
@@ -439,28 +494,101 @@ class HuaweiModbusClient:
         if not self.is_socket_open():
             return ModbusResponse(success=False, error="No hay conexión activa")
         
-        with self._lock:
-            try:
+        if not self.health.allow_request(slave_id):
+            return ModbusResponse(success=False, error=f"Circuito abierto para esclavo {slave_id} (sin respuesta)")
+        
+        def operation():
+            if function_code == 'FC05':
+                return self.protocol.write_single_coil(self._serial, slave_id, address, values[0])
+            elif function_code == 'FC06':
+                return self.protocol.write_single_register(self._serial, slave_id, address, values[0])
+            elif function_code == 'FC15':
+                return self.protocol.write_multiple_coils(self._serial, slave_id, address, values)
+            elif function_code == 'FC16':
+                return self.protocol.write_multiple_registers(self._serial, slave_id, address, values)
+            return ModbusResponse(success=False, error=f"Función {function_code} no implementada")
+        
+        # Las escrituras responden con un eco de 8 bytes
+        return self._transaction(function_code, slave_id, operation, 8)
+    
+    def _frame_time(self, frame_bytes: int) -> float:
+        """Segundos que tarda en transmitirse una trama de `frame_bytes` al baudrate del puerto."""
+        bits_per_char = 1 + self.bytesize + self.stopbits + (0 if self.parity == 'N' else 1)
+        return frame_bytes * bits_per_char / self.baudrate
+    
+    def _transaction(self, function_code: str, slave_id: int, operation,
+                     response_bytes: int) -> 'ModbusResponse':
+        """
+        Ejecuta `operation` en el bus con el timeout adaptativo del esclavo.
+        El timeout adaptativo estima el tiempo de respuesta del esclavo (sin la
+        transmisión) y le suma el tiempo de transmisión de la respuesta esperada, de
+        modo que lo aprendido en lecturas cortas sirve también para las largas.
+        Cualquier excepción (timeout del puerto, parseo, bus) cuenta como fallo en el
+        seguimiento de salud: un sondeo half-open nunca queda sin resolver.
+        """
+        recorded = False
+        try:
+            with self._bus():
                 old_timeout = self._serial.timeout
-                self._serial.timeout = self._timeouts.get(function_code, 1.0)
-                
-                if function_code == 'FC05':
-                    result = self.protocol.write_single_coil(self._serial, slave_id, address, values[0])
-                elif function_code == 'FC06':
-                    result = self.protocol.write_single_register(self._serial, slave_id, address, values[0])
-                elif function_code == 'FC15':
-                    result = self.protocol.write_multiple_coils(self._serial, slave_id, address, values)
-                elif function_code == 'FC16':
-                    result = self.protocol.write_multiple_registers(self._serial, slave_id, address, values)
-                else:
-                    result = {"success": False, "error": f"Función {function_code} no implementada"}
-                
-                self._serial.timeout = old_timeout
-                return ModbusResponse.from_huawei_result(result)
-                
-            except Exception as e:
-                logger.error(f"Error ejecutando {function_code}: {str(e)}")
-                return ModbusResponse(success=False, error=str(e))
+                try:
+                    # Configurar timeout específico (adaptativo por esclavo)
+                    self._serial.timeout = self.health.get_timeout(
+                        slave_id, function_code, self._timeouts.get(function_code, 1.0),
+                        transmit_time=self._frame_time(response_bytes)
+                    )
+                    start_time = time.perf_counter()
+                    result = operation()
+                    recorded = True
+                    self._record_health(slave_id, function_code, start_time)
+                    return result
+                finally:
+                    # Restaurar timeout
+                    try:
+                        self._serial.timeout = old_timeout
+                    except Exception as e:
+                        logger.warning(f"No se pudo restaurar el timeout del puerto: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error ejecutando {function_code}: {str(e)}")
+            if not recorded:
+                self.health.record_failure(slave_id, function_code)
+            return ModbusResponse(success=False, error=str(e))
+    
+    def _record_health(self, slave_id: int, function_code: str, start_time: float):
+        """
+        Registra el resultado de la última transacción en el seguimiento de salud.
+        Cualquier respuesta (incluidas excepciones Modbus) cuenta como esclavo vivo;
+        sólo la ausencia total de bytes cuenta como fallo.
+        """
+        elapsed = self._record_metrics(slave_id, function_code, start_time)
+        rx_length = self.protocol.last_rx_length
+        if rx_length > 0:
+            # Latencia del esclavo: se descuenta la transmisión de los bytes recibidos
+            self.health.record_success(slave_id, function_code,
+                                       max(0.0, elapsed - self._frame_time(rx_length)))
+        else:
+            self.health.record_failure(slave_id, function_code)
+    
+    def _record_metrics(self, slave_id: int, function_code: str, start_time: float) -> float:
+        """
+        Contabiliza la última transacción en las métricas del bus (resultado, latencia,
+        timeouts y CRC). Devuelve la duración de la transacción en segundos.
+        """
+        elapsed = time.perf_counter() - start_time
+        response = self.protocol.last_response
+        if not response:
+            result = "timeout"
+            metrics.bus_timeouts.inc(slave_id, function_code)
+        else:
+            metrics.bus_latency.observe(elapsed, slave_id, function_code)
+            if not self.protocol.verify_crc(response):
+                result = "crc_error"
+                metrics.bus_crc_errors.inc(slave_id, function_code)
+            elif len(response) > 1 and response[1] & 0x80:
+                result = "exception"
+            else:
+                result = "ok"
+        metrics.bus_transactions.inc(slave_id, function_code, result)
+        return elapsed
     
     # ==================== UTILIDADES ====================
     
@@ -494,6 +622,16 @@ class HuaweiModbusClient:
         self._timeouts[function_code] = timeout
         logger.debug(f"Timeout para {function_code} configurado a {timeout}s")
     
+    def reset_slave_health(self, slave_id: int = None):
+        """
+        Reinicia el seguimiento de salud (y cierra el circuito).
+        
+        Args:
+            slave_id: ID específico a reiniciar, o None para todos
+        """
+        self.health.reset(slave_id)
+        logger.info(f"Salud de esclavo reiniciada para {'todos' if slave_id is None else slave_id}")
+    
     def get_connection_info(self) -> Dict[str, Any]:
         """Obtiene información de la conexión actual."""
         return {
@@ -504,39 +642,8 @@ class HuaweiModbusClient:
             "bytesize": self.bytesize,
             "timeout": self.timeout,
             "is_connected": self.is_socket_open(),
-            "authenticated_batteries": list(self._authenticated_batteries)
+            "authenticated_batteries": list(self._authenticated_batteries),
+            "slave_health": self.health.get_status(),
+            "bus_arbiter": self.arbiter.get_status(),
+            "bus_recording": self.protocol.recorder.get_status() if self.protocol.recorder else None
         }
-
-
-class ModbusResponse:
-    """
-    Clase de respuesta compatible con PyModbus.
-    Permite migración fácil del código existente.
-    """
-    
-    def __init__(self, success: bool = True, data: List = None, error: str = None):
-        self.success = success
-        self.data = data or []
-        self.error = error
-        
-        # Propiedades compatibles con PyModbus
-        self.registers = data if success and data else []
-        self.bits = data if success and data else []
-    
-    def isError(self) -> bool:
-        """Compatibilidad con PyModbus."""
-        return not self.success
-    
-    @classmethod
-    def from_huawei_result(cls, result: Dict[str, Any]) -> 'ModbusResponse':
-        """Crea ModbusResponse desde resultado de protocolo Huawei."""
-        if result.get("success", False):
-            return cls(success=True, data=result.get("data", []))
-        else:
-            return cls(success=False, error=result.get("error", "Error desconocido"))
-    
-    def __str__(self):
-        if self.success:
-            return f"ModbusResponse(success=True, data_count={len(self.data)})"
-        else:
-            return f"ModbusResponse(success=False, error='{self.error}')"
\ No newline at end of file
@@ -0,0 +1,172 @@
+# modbus_app/huawei_client/parsing.py
+"""
+Capa de parseo de respuestas Modbus RTU sin copias intermedias.
+Decodifica registros con struct.unpack_from directamente sobre el buffer recibido,
+desempaqueta bitmaps de coils por tablas y devuelve objetos ligeros con __slots__.
+"""
+
+import struct
+from itertools import chain, islice
+from typing import List, Optional, Dict, Any
+
+# Códigos de excepción Modbus
+EXCEPTION_CODES = {
+    0x01: "Función no soportada",
+    0x02: "Dirección no válida",
+    0x03: "Valor no válido",
+    0x04: "Error del dispositivo",
+    0x05: "Reconocimiento",
+    0x06: "Dispositivo ocupado",
+    0x07: "Conflicto",
+    0x08: "Error de memoria"
+}
+
+# Structs precompilados por número de registros ('>NH')
+_REGISTER_STRUCTS = {}
+
+# Tabla byte -> 8 bits (LSB primero, orden Modbus)
+_BIT_TABLE = tuple(tuple(bool(byte & (1 << bit)) for bit in range(8)) for byte in range(256))
+
+# Bytes a eliminar de los textos FC41: todo lo no imprimible salvo \t \n \r
+_NON_PRINTABLE = bytes(b for b in range(256) if not (32 <= b <= 126 or b in (9, 10, 13)))
+
+# Registro histórico FC41 de 32 bytes (little endian):
+# 8-9 pack_voltage, 10-11 corriente (con signo), 16 temp_low, 18 temp_high,
+# 20 soc, 24-25 discharge_ah, 28 discharge_times, 30-31 battery_voltage
+_HISTORY_RECORD = struct.Struct('<8xHh4xBxBxB3xH2xBxH')
+
+
+def register_struct(count: int) -> struct.Struct:
+    """Obtiene (y cachea) el struct big endian para `count` registros."""
+    st = _REGISTER_STRUCTS.get(count)
+    if st is None:
+        st = _REGISTER_STRUCTS[count] = struct.Struct(f'>{count}H')
+    return st
+
+
+class ModbusResponse:
+    """
+    Clase de respuesta compatible con PyModbus.
+    Permite migración fácil del código existente.
+    """
+
+    __slots__ = ('success', 'data', 'error')
+
+    def __init__(self, success: bool = True, data: List = None, error: str = None):
+        self.success = success
+        self.data = data or []
+        self.error = error
+
+    # Propiedades compatibles con PyModbus
+    @property
+    def registers(self) -> List:
+        return self.data if self.success else []
+
+    @property
+    def bits(self) -> List:
+        return self.data if self.success else []
+
+    def isError(self) -> bool:
+        """Compatibilidad con PyModbus."""
+        return not self.success
+
+    @classmethod
+    def from_huawei_result(cls, result: Dict[str, Any]) -> 'ModbusResponse':
+        """Crea ModbusResponse desde resultado de protocolo Huawei."""
+        if isinstance(result, cls):
+            return result
+        if result.get("success", False):
+            return cls(success=True, data=result.get("data", []))
+        else:
+            return cls(success=False, error=result.get("error", "Error desconocido"))
+
+    def __str__(self):
+        if self.success:
+            return f"ModbusResponse(success=True, data_count={len(self.data)})"
+        else:
+            return f"ModbusResponse(success=False, error='{self.error}')"
+
+
+def _error(message: str) -> ModbusResponse:
+    return ModbusResponse(False, None, message)
+
+
+def parse_read_response(response: bytes, slave_id: int, function_code: int, count: int) -> ModbusResponse:
+    """Parsea respuesta de lectura de registros (FC03/FC04)."""
+    if len(response) < 5:
+        return _error("Respuesta demasiado corta")
+
+    if response[0] != slave_id:
+        return _error(f"ID incorrecto: {response[0]} != {slave_id}")
+
+    fc = response[1]
+    if fc == (function_code | 0x80):
+        exc_code = response[2]
+        return _error(EXCEPTION_CODES.get(exc_code, f"Excepción: {exc_code}"))
+
+    if fc != function_code:
+        return _error(f"Función incorrecta: {fc}")
+
+    byte_count = response[2]
+    if byte_count != count * 2:
+        return _error(f"Longitud incorrecta: {byte_count}")
+
+    # Tolerar respuestas truncadas: decodificar sólo los registros completos
+    available = min(count, (len(response) - 3) // 2)
+    return ModbusResponse(True, list(register_struct(available).unpack_from(response, 3)), None)
+
+
+def parse_coil_response(response: bytes, slave_id: int, function_code: int, count: int) -> ModbusResponse:
+    """Parsea respuesta de lectura de coils/discrete inputs (FC01/FC02)."""
+    if len(response) < 4:
+        return _error("Respuesta demasiado corta")
+
+    if response[0] != slave_id or response[1] != function_code:
+        return _error("Respuesta inválida")
+
+    payload = memoryview(response)[3:3 + (count + 7) // 8]
+    bits = list(islice(chain.from_iterable(map(_BIT_TABLE.__getitem__, payload)), count))
+    if len(bits) < count:
+        bits.extend([False] * (count - len(bits)))
+    return ModbusResponse(True, bits, None)
+
+
+def parse_write_response(response: bytes, slave_id: int, function_code: int) -> ModbusResponse:
+    """Parsea respuesta de escritura (FC05/FC06/FC15/FC16)."""
+    if len(response) < 6:
+        return _error("Respuesta demasiado corta")
+
+    if response[0] != slave_id or response[1] != function_code:
+        return _error("Respuesta inválida")
+
+    return ModbusResponse(True, None, None)
+
+
+def decode_ascii_payload(data: bytes) -> str:
+    """Elimina bytes no imprimibles en bloque y decodifica como ASCII."""
+    return bytes(data).translate(None, _NON_PRINTABLE).decode('ascii')
+
+
+def decode_history_record(data: bytes, offset: int = 0) -> Dict[str, Any]:
+    """Decodifica un registro histórico FC41 de 32 bytes a partir de `offset`."""
+    if len(data) - offset < 32:
+        raise ValueError(f"Registro debe tener 32 bytes, recibido: {len(data) - offset}")
+
+    (pack_voltage, current, temp_low, temp_high, soc,
+     discharge_ah, discharge_times, battery_voltage) = _HISTORY_RECORD.unpack_from(data, offset)
+
+    return {
+        "pack_voltage": pack_voltage / 100.0,
+        "battery_current": current / 100.0,
+        "temp_low": temp_low,
+        "temp_high": temp_high,
+        "soc": soc,
+        "discharge_ah": discharge_ah,
+        "discharge_times": discharge_times,
+        "battery_voltage": battery_voltage / 100.0
+    }
+
+
+def registers_to_bytes(registers: List[int]) -> bytes:
+    """Convierte una lista de registros a bytes big endian (2 bytes por registro)."""
+    return register_struct(len(registers)).pack(*registers)
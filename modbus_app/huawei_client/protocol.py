@@ -9,36 +9,63 @@ import time
 import logging
 from typing import Dict, List, Union, Any
 
+from .parsing import (
+    EXCEPTION_CODES,
+    ModbusResponse,
+    parse_read_response,
+    parse_coil_response,
+    parse_write_response,
+    decode_ascii_payload,
+    decode_history_record
+)
+from ..tracing import span, annotate
+
 logger = logging.getLogger('huawei_client.protocol')
 
+# Longitud de una respuesta de excepción: ID + FC + código + CRC(2)
+EXCEPTION_FRAME_LENGTH = 5
+
+
+def _build_crc_table():
+    table = []
+    for value in range(256):
+        crc = value
+        for _ in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+# Tabla CRC16 Modbus (polinomio 0xA001): un acceso por byte en vez de 8 desplazamientos
+_CRC_TABLE = _build_crc_table()
+
 class ModbusProtocol:
     """Implementación del protocolo Modbus RTU con extensiones Huawei."""
     
     def __init__(self):
         # Códigos de excepción Modbus
-        self.exception_codes = {
-            0x01: "Función no soportada",
-            0x02: "Dirección no válida", 
-            0x03: "Valor no válido",
-            0x04: "Error del dispositivo",
-            0x05: "Reconocimiento",
-            0x06: "Dispositivo ocupado",
-            0x07: "Conflicto",
-            0x08: "Error de memoria"
-        }
+        self.exception_codes = EXCEPTION_CODES
+        
+        # Bytes recibidos en la última transacción (0 = esclavo sin respuesta)
+        self.last_rx_length = 0
+        
+        # Última trama recibida (para métricas de CRC/excepciones)
+        self.last_response = b''
+        
+        # Grabador opcional de tramas TX/RX (ver recorder.BusRecorder)
+        self.recorder = None
     
     # ==================== CRC Y UTILIDADES ====================
     
     def compute_crc16(self, data: bytes) -> bytes:
         """Calcula CRC16 para Modbus RTU."""
         crc = 0xFFFF
+        table = _CRC_TABLE
         for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x0001:
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc >>= 1
+            crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
         return struct.pack('<H', crc)
     
     def verify_crc(self, frame: bytes) -> bool:
@@ -50,15 +77,47 @@ class ModbusProtocol:
         calculated_crc = self.compute_crc16(data)
         return received_crc == calculated_crc
     
-    def send_command(self, serial_conn, command: bytes) -> bytes:
-        """Envía comando y lee respuesta."""
+    def send_command(self, serial_conn, command: bytes, expected_length: int = None) -> bytes:
+        """
+        Envía comando y lee respuesta.
+        
+        Args:
+            serial_conn: Conexión serial activa
+            command: Trama completa a enviar (con CRC)
+            expected_length: Longitud esperada de la respuesta. Si se indica, la lectura
+                termina en cuanto llega la trama completa en vez de agotar el timeout.
+        """
+        self.last_rx_length = 0
+        self.last_response = b''
+        with span("serial.send_command"):
+            return self._send_command(serial_conn, command, expected_length)
+    
+    def _send_command(self, serial_conn, command: bytes, expected_length: int = None) -> bytes:
         try:
             serial_conn.reset_input_buffer()
             serial_conn.reset_output_buffer()
             serial_conn.write(command)
-            logger.debug(f"TX: {' '.join([f'{b:02X}' for b in command])}")
-            response = serial_conn.read(256)
-            logger.debug(f"RX: {' '.join([f'{b:02X}' for b in response])}")
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.record_tx(command)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug("TX: %s", bytes(command).hex(' ').upper())
+            if expected_length:
+                # Leer primero la longitud de una trama de excepción (5 bytes)
+                response = serial_conn.read(EXCEPTION_FRAME_LENGTH)
+                if (len(response) == EXCEPTION_FRAME_LENGTH and not response[1] & 0x80
+                        and expected_length > EXCEPTION_FRAME_LENGTH):
+                    response += serial_conn.read(expected_length - EXCEPTION_FRAME_LENGTH)
+            else:
+                response = serial_conn.read(256)
+            if recorder is not None:
+                recorder.record_rx(response)
+            if debug:
+                logger.debug("RX: %s", response.hex(' ').upper())
+            self.last_rx_length = len(response)
+            self.last_response = response
+            annotate(tx_bytes=len(command), rx_bytes=len(response))
             return response
         except Exception as e:
             logger.error(f"Error en comunicación: {str(e)}")
@@ -66,7 +125,7 @@ class ModbusProtocol:
     
     # ==================== FUNCIONES MODBUS ESTÁNDAR ====================
     
-    def read_holding_registers(self, serial_conn, slave_id: int, address: int, count: int) -> Dict[str, Any]:
+    def read_holding_registers(self, serial_conn, slave_id: int, address: int, count: int) -> ModbusResponse:
         """Lee holding registers (FC03)."""
         command = bytearray([
             slave_id, 0x03,
@@ -75,10 +134,10 @@ class ModbusProtocol:
         ])
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 5 + count * 2)
         return self._parse_read_response(response, slave_id, 0x03, count)
     
-    def read_input_registers(self, serial_conn, slave_id: int, address: int, count: int) -> Dict[str, Any]:
+    def read_input_registers(self, serial_conn, slave_id: int, address: int, count: int) -> ModbusResponse:
         """Lee input registers (FC04)."""
         command = bytearray([
             slave_id, 0x04,
@@ -87,10 +146,10 @@ class ModbusProtocol:
         ])
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 5 + count * 2)
         return self._parse_read_response(response, slave_id, 0x04, count)
     
-    def read_coils(self, serial_conn, slave_id: int, address: int, count: int) -> Dict[str, Any]:
+    def read_coils(self, serial_conn, slave_id: int, address: int, count: int) -> ModbusResponse:
         """Lee coils (FC01)."""
         command = bytearray([
             slave_id, 0x01,
@@ -99,10 +158,10 @@ class ModbusProtocol:
         ])
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 5 + (count + 7) // 8)
         return self._parse_coil_response(response, slave_id, 0x01, count)
     
-    def read_discrete_inputs(self, serial_conn, slave_id: int, address: int, count: int) -> Dict[str, Any]:
+    def read_discrete_inputs(self, serial_conn, slave_id: int, address: int, count: int) -> ModbusResponse:
         """Lee discrete inputs (FC02)."""
         command = bytearray([
             slave_id, 0x02,
@@ -111,10 +170,10 @@ class ModbusProtocol:
         ])
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 5 + (count + 7) // 8)
         return self._parse_coil_response(response, slave_id, 0x02, count)
     
-    def write_single_coil(self, serial_conn, slave_id: int, address: int, value: bool) -> Dict[str, Any]:
+    def write_single_coil(self, serial_conn, slave_id: int, address: int, value: bool) -> ModbusResponse:
         """Escribe un coil (FC05)."""
         coil_value = 0xFF00 if value else 0x0000
         command = bytearray([
@@ -124,10 +183,10 @@ class ModbusProtocol:
         ])
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 8)
         return self._parse_write_response(response, slave_id, 0x05)
     
-    def write_single_register(self, serial_conn, slave_id: int, address: int, value: int) -> Dict[str, Any]:
+    def write_single_register(self, serial_conn, slave_id: int, address: int, value: int) -> ModbusResponse:
         """Escribe un registro (FC06)."""
         command = bytearray([
             slave_id, 0x06,
@@ -136,10 +195,10 @@ class ModbusProtocol:
         ])
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 8)
         return self._parse_write_response(response, slave_id, 0x06)
     
-    def write_multiple_coils(self, serial_conn, slave_id: int, address: int, values: List[bool]) -> Dict[str, Any]:
+    def write_multiple_coils(self, serial_conn, slave_id: int, address: int, values: List[bool]) -> ModbusResponse:
         """Escribe múltiples coils (FC15)."""
         count = len(values)
         byte_count = (count + 7) // 8
@@ -157,10 +216,10 @@ class ModbusProtocol:
             command.append(byte_val)
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 8)
         return self._parse_write_response(response, slave_id, 0x0F)
     
-    def write_multiple_registers(self, serial_conn, slave_id: int, address: int, values: List[int]) -> Dict[str, Any]:
+    def write_multiple_registers(self, serial_conn, slave_id: int, address: int, values: List[int]) -> ModbusResponse:
         """Escribe múltiples registros (FC16)."""
         count = len(values)
         byte_count = count * 2
@@ -174,7 +233,7 @@ class ModbusProtocol:
             command.extend([(value >> 8) & 0xFF, value & 0xFF])
         crc = self.compute_crc16(command)
         command.extend(crc)
-        response = self.send_command(serial_conn, command)
+        response = self.send_command(serial_conn, command, 8)
         return self._parse_write_response(response, slave_id, 0x10)
         # ==================== FUNCIONES HUAWEI (FC41) ====================
     
@@ -239,67 +298,17 @@ class ModbusProtocol:
     
     # ==================== PARSERS DE RESPUESTA ====================
     
-    def _parse_read_response(self, response: bytes, slave_id: int, function_code: int, count: int) -> Dict[str, Any]:
+    def _parse_read_response(self, response: bytes, slave_id: int, function_code: int, count: int) -> ModbusResponse:
         """Parsea respuesta de lectura de registros."""
-        if len(response) < 5:
-            return {"success": False, "error": "Respuesta demasiado corta"}
-        
-        if response[0] != slave_id:
-            return {"success": False, "error": f"ID incorrecto: {response[0]} != {slave_id}"}
-        
-        if response[1] == (function_code | 0x80):
-            exc_code = response[2] if len(response) > 2 else 0
-            error_msg = self.exception_codes.get(exc_code, f"Excepción: {exc_code}")
-            return {"success": False, "error": error_msg}
-        
-        if response[1] != function_code:
-            return {"success": False, "error": f"Función incorrecta: {response[1]}"}
-        
-        byte_count = response[2]
-        expected_bytes = count * 2
-        if byte_count != expected_bytes:
-            return {"success": False, "error": f"Longitud incorrecta: {byte_count}"}
-        
-        registers = []
-        for i in range(count):
-            reg_offset = 3 + (i * 2)
-            if reg_offset + 1 < len(response):
-                reg_value = (response[reg_offset] << 8) | response[reg_offset + 1]
-                registers.append(reg_value)
-        
-        return {"success": True, "data": registers}
+        return parse_read_response(response, slave_id, function_code, count)
     
-    def _parse_coil_response(self, response: bytes, slave_id: int, function_code: int, count: int) -> Dict[str, Any]:
+    def _parse_coil_response(self, response: bytes, slave_id: int, function_code: int, count: int) -> ModbusResponse:
         """Parsea respuesta de lectura de coils/discrete inputs."""
-        if len(response) < 4:
-            return {"success": False, "error": "Respuesta demasiado corta"}
-        
-        if response[0] != slave_id or response[1] != function_code:
-            return {"success": False, "error": "Respuesta inválida"}
-        
-        byte_count = response[2]
-        bits = []
-        
-        for i in range(count):
-            byte_index = 3 + (i // 8)
-            bit_index = i % 8
-            if byte_index < len(response):
-                bit_value = bool(response[byte_index] & (1 << bit_index))
-                bits.append(bit_value)
-            else:
-                bits.append(False)
-        
-        return {"success": True, "data": bits}
+        return parse_coil_response(response, slave_id, function_code, count)
     
-    def _parse_write_response(self, response: bytes, slave_id: int, function_code: int) -> Dict[str, Any]:
+    def _parse_write_response(self, response: bytes, slave_id: int, function_code: int) -> ModbusResponse:
         """Parsea respuesta de escritura."""
-        if len(response) < 6:
-            return {"success": False, "error": "Respuesta demasiado corta"}
-        
-        if response[0] != slave_id or response[1] != function_code:
-            return {"success": False, "error": "Respuesta inválida"}
-        
-        return {"success": True, "data": []}
+        return parse_write_response(response, slave_id, function_code)
     
     def _parse_fc41_device_info_response(self, response: bytes, slave_id: int, info_index: int) -> Dict[str, Any]:
         """Parsea respuesta FC41 de información del dispositivo."""
@@ -317,8 +326,7 @@ class ModbusProtocol:
         data_bytes = response[data_start:data_end]
         
         try:
-            ascii_text = data_bytes.decode('utf-8', errors='ignore')
-            ascii_text = ''.join(c for c in ascii_text if (ord(c) >= 32 and ord(c) <= 126) or c in ['\n', '\r', '\t'])
+            ascii_text = decode_ascii_payload(data_bytes)
         except Exception:
             ascii_text = ""
         
@@ -340,11 +348,11 @@ class ModbusProtocol:
         data_start = 7
         data_bytes = response[data_start:data_start + 32]
         
-        if all(b == 0xFF for b in data_bytes):
+        if data_bytes.count(0xFF) == len(data_bytes):
             return {"success": False, "error": "Registro vacío (fin del historial)"}
         
         try:
-            decoded_data = self._decode_history_record(data_bytes)
+            decoded_data = decode_history_record(data_bytes)
             decoded_data["record_number"] = record_number
             
             return {
@@ -359,17 +367,7 @@ class ModbusProtocol:
         """Decodifica un registro histórico de 32 bytes."""
         if len(data_bytes) != 32:
             raise ValueError(f"Registro debe tener 32 bytes, recibido: {len(data_bytes)}")
-        
-        return {
-            "pack_voltage": ((data_bytes[8] | (data_bytes[9] << 8)) / 100.0),
-            "battery_current": self._signed_int16(data_bytes[10], data_bytes[11]) / 100.0,
-            "temp_low": data_bytes[16],
-            "temp_high": data_bytes[18],
-            "soc": data_bytes[20],
-            "discharge_ah": data_bytes[24] | (data_bytes[25] << 8),
-            "discharge_times": data_bytes[28],
-            "battery_voltage": ((data_bytes[30] | (data_bytes[31] << 8)) / 100.0)
-        }
+        return decode_history_record(data_bytes)
     
     def _signed_int16(self, low_byte: int, high_byte: int) -> int:
         """Convierte dos bytes a entero con signo de 16 bits."""
@@ -0,0 +1,290 @@
+# modbus_app/huawei_client/recorder.py
+"""
+Grabación y reproducción de tráfico del bus Modbus.
+
+El grabador escribe las tramas TX/RX de ModbusProtocol.send_command en un archivo
+binario append-only:
+
+    Cabecera:  b'HBR1' + 4 bytes reservados
+    Registro:  <d timestamp><B dirección><H longitud> + trama
+
+Los registros son de longitud prefijada, por lo que el archivo se recorre con mmap
+sin parsear texto. ReplaySerial expone la interfaz de pyserial usada por el cliente y
+devuelve las respuestas grabadas, permitiendo reproducir incidentes offline y medir
+el pipeline de parseo con tráfico real más rápido que en tiempo real.
+
+Uso:
+    python -m modbus_app.huawei_client.recorder <archivo.hbr> [velocidad]
+"""
+
+import io
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Iterator, Tuple, Optional
+
+logger = logging.getLogger('huawei_client.recorder')
+
+FILE_MAGIC = b'HBR1'
+FILE_HEADER = FILE_MAGIC + b'\x00' * 4
+RECORD_HEADER = struct.Struct('<dBH')
+
+DIRECTION_TX = 0
+DIRECTION_RX = 1
+
+
+class BusRecorder:
+    """Grabador append-only de tramas del bus (thread-safe)."""
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        """
+        Args:
+            path: Archivo de grabación (se crea o se continúa si ya existe)
+            flush_interval: Segundos máximos que una trama permanece en el buffer
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.path = path
+        self.flush_interval = flush_interval
+        self.frames_recorded = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab', buffering=io.DEFAULT_BUFFER_SIZE * 8)
+        if new_file:
+            self._file.write(FILE_HEADER)
+        self._last_flush = time.monotonic()
+
+        logger.info(f"Grabación del bus iniciada en {path}")
+
+    def record(self, direction: int, frame: bytes, timestamp: float = None):
+        """Añade una trama a la grabación."""
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(RECORD_HEADER.pack(timestamp, direction, len(frame)))
+            self._file.write(frame)
+            self.frames_recorded += 1
+            now = time.monotonic()
+            if now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def record_tx(self, frame: bytes):
+        self.record(DIRECTION_TX, frame)
+
+    def record_rx(self, frame: bytes):
+        self.record(DIRECTION_RX, frame)
+
+    def flush(self):
+        """Vuelca el buffer al disco."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._last_flush = time.monotonic()
+
+    def close(self):
+        """Vuelca el buffer y cierra el archivo."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"Grabación del bus cerrada: {self.path} ({self.frames_recorded} tramas)")
+
+    def get_status(self) -> dict:
+        return {
+            "path": self.path,
+            "active": self._file is not None,
+            "frames_recorded": self.frames_recorded
+        }
+
+
+def default_recording_path(directory: str = "bus_recordings") -> str:
+    """Ruta de grabación con timestamp en el directorio indicado."""
+    return os.path.join(directory, f"bus_{datetime.now().strftime('%Y%m%d_%H%M%S')}.hbr")
+
+
+def iter_recording(path: str) -> Iterator[Tuple[float, int, bytes]]:
+    """
+    Recorre una grabación mediante mmap.
+
+    Yields:
+        (timestamp, dirección, trama)
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < len(FILE_HEADER):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(FILE_MAGIC)] != FILE_MAGIC:
+                raise ValueError(f"{path} no es una grabación del bus")
+
+            offset = len(FILE_HEADER)
+            end = len(data)
+            unpack_from = RECORD_HEADER.unpack_from
+            header_size = RECORD_HEADER.size
+            while offset + header_size <= end:
+                timestamp, direction, length = unpack_from(data, offset)
+                offset += header_size
+                if offset + length > end:
+                    # Registro truncado (grabación interrumpida)
+                    break
+                yield timestamp, direction, data[offset:offset + length]
+                offset += length
+
+
+def load_transactions(path: str) -> list:
+    """
+    Agrupa una grabación en transacciones (timestamp, tx, rx, latencia).
+    Una TX sin RX posterior se considera sin respuesta (rx = b'').
+    """
+    transactions = []
+    pending = None
+    for timestamp, direction, frame in iter_recording(path):
+        if direction == DIRECTION_TX:
+            if pending is not None:
+                transactions.append((pending[0], pending[1], b'', 0.0))
+            pending = (timestamp, frame)
+        elif pending is not None:
+            transactions.append((pending[0], pending[1], frame, timestamp - pending[0]))
+            pending = None
+    if pending is not None:
+        transactions.append((pending[0], pending[1], b'', 0.0))
+    return transactions
+
+
+class ReplaySerial:
+    """
+    Transporte compatible con pyserial que reproduce una grabación.
+
+    Cada write() se empareja con la siguiente TX grabada idéntica (buscando hacia
+    adelante si el flujo diverge) y prepara su RX para las siguientes lecturas.
+    Una TX sin correspondencia se comporta como un esclavo que no responde.
+    """
+
+    def __init__(self, path: str, speed: float = 0.0, timeout: float = 1.0):
+        """
+        Args:
+            path: Archivo de grabación
+            speed: 0 = sin esperas; 1.0 = latencias reales; 10 = 10x más rápido
+            timeout: Timeout nominal (solo informativo, compatible con pyserial)
+        """
+        self.path = path
+        self.port = f"replay:{path}"
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self._transactions = deque(load_transactions(path))
+        self._rx = b''
+        self._latency = 0.0
+        self.matched = 0
+        self.unmatched = 0
+
+    @property
+    def remaining(self) -> int:
+        return len(self._transactions)
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._rx)
+
+    def reset_input_buffer(self):
+        self._rx = b''
+
+    def reset_output_buffer(self):
+        pass
+
+    def write(self, data: bytes) -> int:
+        data = bytes(data)
+        transactions = self._transactions
+        for index, (_, tx, rx, latency) in enumerate(transactions):
+            if tx == data:
+                for _ in range(index + 1):
+                    transactions.popleft()
+                self._rx = bytes(rx)
+                self._latency = latency
+                self.matched += 1
+                return len(data)
+
+        self._rx = b''
+        self._latency = self.timeout
+        self.unmatched += 1
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        if self.speed and self._latency:
+            time.sleep(self._latency / self.speed)
+            self._latency = 0.0
+        chunk, self._rx = self._rx[:size], self._rx[size:]
+        return chunk
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def replay_through_client(path: str, speed: float = 0.0) -> dict:
+    """
+    Reinyecta todas las peticiones grabadas a través de HuaweiModbusClient
+    (parseo, salud por esclavo, etc.) y devuelve estadísticas de la reproducción.
+    """
+    from .core import HuaweiModbusClient
+
+    transactions = load_transactions(path)
+    client = HuaweiModbusClient(port=f"replay:{path}")
+    client.connect_replay(path, speed=speed)
+
+    readers = {
+        0x01: client.read_coils,
+        0x02: client.read_discrete_inputs,
+        0x03: client.read_holding_registers,
+        0x04: client.read_input_registers
+    }
+
+    ok = errors = raw = 0
+    start = time.perf_counter()
+    for _, tx, _, _ in transactions:
+        reader = readers.get(tx[1]) if len(tx) >= 8 else None
+        if reader is None:
+            # Funciones sin API de alto nivel equivalente: trama cruda
+            client.protocol.send_command(client._serial, tx)
+            raw += 1
+            continue
+        address, count = struct.unpack_from('>HH', tx, 2)
+        result = reader(address=address, count=count, slave=tx[0])
+        if result.isError():
+            errors += 1
+        else:
+            ok += 1
+    elapsed = time.perf_counter() - start
+
+    recorded_span = transactions[-1][0] - transactions[0][0] if transactions else 0.0
+    return {
+        "transactions": len(transactions),
+        "successful": ok,
+        "errors": errors,
+        "raw_frames": raw,
+        "unmatched": client._serial.unmatched,
+        "elapsed_seconds": elapsed,
+        "recorded_seconds": recorded_span,
+        "speedup": recorded_span / elapsed if elapsed > 0 else None
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    stats = replay_through_client(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
+    for key, value in stats.items():
+        print(f"{key:<18}{value}")
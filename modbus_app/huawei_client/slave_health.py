@@ -0,0 +1,261 @@
+# modbus_app/huawei_client/slave_health.py
+"""
+Seguimiento de salud por esclavo para HuaweiModbusClient.
+Mantiene latencias EWMA, timeout adaptativo y un circuit breaker por batería
+para que un pack silencioso no consuma el timeout completo en cada ronda de polling.
+"""
+
+import time
+import threading
+import logging
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger('huawei_client.slave_health')
+
+# Estados del circuit breaker
+CIRCUIT_CLOSED = "closed"        # Funcionamiento normal
+CIRCUIT_OPEN = "open"            # Esclavo marcado como caído, peticiones rechazadas
+CIRCUIT_HALF_OPEN = "half_open"  # Se permite una petición de prueba
+
+
+class LatencyEstimator:
+    """
+    Estimador EWMA de latencia al estilo RTO de TCP (Jacobson/Karels).
+    srtt + 4 * rttvar aproxima el percentil 99 de la latencia observada.
+    """
+
+    __slots__ = ('srtt', 'rttvar', 'samples', 'last')
+
+    ALPHA = 0.125  # Peso de la muestra nueva en la media
+    BETA = 0.25    # Peso de la muestra nueva en la desviación
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.last = None
+
+    def update(self, latency: float):
+        """Incorpora una nueva muestra de latencia (segundos)."""
+        if self.srtt is None:
+            self.srtt = latency
+            self.rttvar = latency / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - latency)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * latency
+        self.samples += 1
+        self.last = latency
+
+    def p99(self) -> Optional[float]:
+        """Estimación aproximada del percentil 99."""
+        if self.srtt is None:
+            return None
+        return self.srtt + 4 * self.rttvar
+
+
+class SlaveHealth:
+    """Estado de salud de un esclavo Modbus."""
+
+    def __init__(self, slave_id: int):
+        self.slave_id = slave_id
+        self.latency = {}  # function_code -> LatencyEstimator
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.rejected_requests = 0
+        self.opened_at = None
+        self.next_probe_at = None
+        self.probe_backoff = None
+        self.probe_deadline = None
+        self.last_success = None
+        self.last_failure = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable para get_connection_info()."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "rejected_requests": self.rejected_requests,
+            "opened_at": self.opened_at,
+            "next_probe_at": self.next_probe_at,
+            "probe_backoff": self.probe_backoff,
+            "probe_deadline": self.probe_deadline,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "latency": {
+                fc: {
+                    "ewma_ms": round(est.srtt * 1000, 2),
+                    "deviation_ms": round(est.rttvar * 1000, 2),
+                    "p99_ms": round(est.p99() * 1000, 2),
+                    "last_ms": round(est.last * 1000, 2),
+                    "samples": est.samples
+                }
+                for fc, est in self.latency.items() if est.srtt is not None
+            }
+        }
+
+
+class SlaveHealthTracker:
+    """
+    Registro thread-safe de salud por esclavo.
+
+    - Latencia EWMA por esclavo y código de función
+    - Timeout adaptativo ~p99 + margen + transmisión de la respuesta, limitado por el
+      timeout base de la función
+    - Circuit breaker tras N fallos consecutivos (sin respuesta)
+    - Sondeos half-open con backoff exponencial; un sondeo sin resultado dentro de
+      `probe_timeout` se da por perdido y el circuito se reabre
+    """
+
+    def __init__(self, failure_threshold: int = 3, timeout_margin: float = 0.05,
+                 min_timeout: float = 0.05, min_samples: int = 5,
+                 probe_interval: float = 5.0, max_probe_interval: float = 120.0,
+                 probe_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Fallos consecutivos que abren el circuito
+            timeout_margin: Margen en segundos añadido al p99 estimado
+            min_timeout: Timeout mínimo permitido en segundos
+            min_samples: Muestras necesarias antes de adaptar el timeout
+            probe_interval: Espera inicial antes del primer sondeo half-open
+            max_probe_interval: Espera máxima entre sondeos
+            probe_timeout: Plazo para resolver un sondeo half-open
+        """
+        self.failure_threshold = failure_threshold
+        self.timeout_margin = timeout_margin
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.probe_timeout = probe_timeout
+
+        self._slaves = {}
+        self._lock = threading.Lock()
+
+    def _get(self, slave_id: int) -> SlaveHealth:
+        health = self._slaves.get(slave_id)
+        if health is None:
+            health = self._slaves[slave_id] = SlaveHealth(slave_id)
+        return health
+
+    def allow_request(self, slave_id: int) -> bool:
+        """
+        Indica si se puede enviar una petición al esclavo.
+        Con el circuito abierto sólo se deja pasar un sondeo cuando vence su plazo.
+        """
+        with self._lock:
+            health = self._get(slave_id)
+            if health.state == CIRCUIT_CLOSED:
+                return True
+
+            now = time.time()
+            if health.state == CIRCUIT_HALF_OPEN and now >= health.probe_deadline:
+                # Sondeo perdido (sin éxito ni fallo registrado): reabrir y reprogramar
+                self._reopen(health, now)
+                logger.warning(f"Esclavo {slave_id}: sondeo sin resultado, próximo en {health.probe_backoff:.0f}s")
+
+            if health.state == CIRCUIT_OPEN and now >= health.next_probe_at:
+                health.state = CIRCUIT_HALF_OPEN
+                health.probe_deadline = now + self.probe_timeout
+                logger.info(f"Esclavo {slave_id}: circuito half-open, enviando sondeo")
+                return True
+
+            # Abierto sin sondeo vencido, o ya hay un sondeo en curso
+            health.rejected_requests += 1
+            return False
+
+    def get_timeout(self, slave_id: int, function_code: str, base_timeout: float,
+                    transmit_time: float = 0.0) -> float:
+        """
+        Calcula el timeout a usar para una petición.
+
+        Args:
+            slave_id: ID del esclavo
+            function_code: Código de función (ej. 'FC03')
+            base_timeout: Timeout configurado para la función (cota superior)
+            transmit_time: Transmisión de la respuesta esperada al baudrate del puerto
+                (las latencias registradas no la incluyen)
+        """
+        with self._lock:
+            health = self._slaves.get(slave_id)
+            if health is None:
+                return base_timeout
+            estimator = health.latency.get(function_code)
+            if estimator is None or estimator.samples < self.min_samples:
+                return base_timeout
+            adaptive = estimator.p99() + self.timeout_margin + transmit_time
+            return min(base_timeout, max(self.min_timeout, adaptive))
+
+    def record_success(self, slave_id: int, function_code: str, latency: float):
+        """
+        Registra una respuesta recibida del esclavo.
+        `latency` es el tiempo de respuesta sin la transmisión de la trama recibida.
+        """
+        with self._lock:
+            health = self._get(slave_id)
+            estimator = health.latency.get(function_code)
+            if estimator is None:
+                estimator = health.latency[function_code] = LatencyEstimator()
+            estimator.update(latency)
+
+            health.total_requests += 1
+            health.consecutive_failures = 0
+            health.last_success = time.time()
+
+            if health.state != CIRCUIT_CLOSED:
+                logger.info(f"Esclavo {slave_id}: respuesta recibida, circuito cerrado")
+                health.state = CIRCUIT_CLOSED
+                health.opened_at = None
+                health.next_probe_at = None
+                health.probe_backoff = None
+                health.probe_deadline = None
+
+    def record_failure(self, slave_id: int, function_code: str):
+        """Registra una petición sin respuesta del esclavo."""
+        with self._lock:
+            health = self._get(slave_id)
+            now = time.time()
+            health.total_requests += 1
+            health.total_failures += 1
+            health.consecutive_failures += 1
+            health.last_failure = now
+
+            if health.state == CIRCUIT_HALF_OPEN:
+                # Sondeo fallido: reabrir con backoff duplicado
+                self._reopen(health, now)
+                logger.warning(f"Esclavo {slave_id}: sondeo fallido, próximo en {health.probe_backoff:.0f}s")
+            elif health.state == CIRCUIT_CLOSED and health.consecutive_failures >= self.failure_threshold:
+                health.state = CIRCUIT_OPEN
+                health.opened_at = now
+                health.probe_backoff = self.probe_interval
+                health.next_probe_at = now + health.probe_backoff
+                logger.warning(f"Esclavo {slave_id}: {health.consecutive_failures} fallos consecutivos, circuito abierto")
+
+    def _reopen(self, health: SlaveHealth, now: float):
+        """Vuelve de half-open a abierto duplicando el backoff."""
+        health.probe_backoff = min(health.probe_backoff * 2, self.max_probe_interval)
+        health.state = CIRCUIT_OPEN
+        health.next_probe_at = now + health.probe_backoff
+        health.probe_deadline = None
+
+    def reset(self, slave_id: int = None):
+        """Reinicia el estado de salud de un esclavo o de todos."""
+        with self._lock:
+            if slave_id is None:
+                self._slaves.clear()
+            else:
+                self._slaves.pop(slave_id, None)
+
+    def is_open(self, slave_id: int) -> bool:
+        """Indica si el circuito del esclavo está abierto."""
+        with self._lock:
+            health = self._slaves.get(slave_id)
+            return health is not None and health.state != CIRCUIT_CLOSED
+
+    def get_status(self) -> Dict[int, Dict[str, Any]]:
+        """Obtiene el estado de salud de todos los esclavos conocidos."""
+        with self._lock:
+            return {slave_id: health.to_dict() for slave_id, health in self._slaves.items()}
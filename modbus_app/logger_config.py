@@ -5,24 +5,107 @@ Proporciona una configuración unificada para dirigir logs a la consola del serv
 y a la cola de mensajes para la consola web.
 """
 
+import io
 import logging
+import logging.handlers
+import queue
 import sys
 import os
 import json
+import time
+import atexit
+import threading
 from collections import deque
 
 # Definir un nivel NONE más alto que CRITICAL para suprimir todos los mensajes
 NONE_LEVEL = 100  # Un nivel más alto que cualquier otro (CRITICAL es 50)
 logging.addLevelName(NONE_LEVEL, "NONE")
 
-# Buffer circular para mensajes de consola web
-web_console_messages = deque(maxlen=500)
-
 # Formato predeterminado para los logs
 DEFAULT_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
+# Tamaño máximo de la cola de registros pendientes (los excedentes se descartan)
+DEFAULT_QUEUE_SIZE = 10000
+
+# Límite por punto de llamada para mensajes < WARNING (mensajes/segundo y ráfaga)
+DEFAULT_RATE_LIMIT = 2.0
+DEFAULT_RATE_BURST = 20
+
+_LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'CRITICAL': logging.CRITICAL
+}
+
+
+class ConsoleBuffer:
+    """
+    Buffer circular de mensajes para la consola web con identificadores crecientes.
+    Los clientes piden los mensajes posteriores a su último ID aunque el buffer ya
+    haya descartado los más antiguos.
+    """
+
+    def __init__(self, maxlen: int = 500):
+        self._messages = deque(maxlen=maxlen)
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def maxlen(self):
+        return self._messages.maxlen
+
+    def append(self, message: str):
+        with self._lock:
+            self._messages.append(message)
+            self._total += 1
+
+    def since(self, last_id: int):
+        """
+        Mensajes con ID > last_id.
+
+        Returns:
+            tuple: (mensajes, nuevo last_id)
+        """
+        with self._lock:
+            total = self._total
+            if last_id < 0 or last_id > total:
+                last_id = 0
+            pending = min(total - last_id, len(self._messages))
+            messages = list(self._messages)[len(self._messages) - pending:] if pending else []
+            return messages, total
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._messages))
+
+    def __len__(self):
+        return len(self._messages)
+
+
+class ConsoleCapturer(io.TextIOBase):
+    """Sustituto de sys.stdout que envía cada línea de print() al buffer de la consola web."""
+
+    def __init__(self, buffer: ConsoleBuffer):
+        super().__init__()
+        self._buffer = buffer
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text.strip():  # Ignorar líneas vacías
+            self._buffer.append(text.rstrip())
+        return len(text)
+
+
+# Buffer circular para mensajes de consola web
+web_console_messages = ConsoleBuffer(maxlen=500)
+
+
 class WebConsoleHandler(logging.Handler):
-    """Handler personalizado que redirige los mensajes de log a un buffer circular."""
+    """Handler personalizado que redirige los mensajes de log al buffer de la consola web."""
     
     def emit(self, record):
         """Procesa un registro de log y lo añade al buffer."""
@@ -32,6 +115,118 @@ class WebConsoleHandler(logging.Handler):
         except Exception:
             self.handleError(record)
 
+
+class _LoggerPrefixFilter(logging.Filter):
+    """Enruta registros por prefijo de logger dentro del listener compartido."""
+
+    def __init__(self, prefixes, include=True):
+        super().__init__()
+        self.prefixes = tuple(prefixes)
+        self.include = include
+
+    def filter(self, record):
+        name = record.name
+        matches = any(name == p or name.startswith(p + '.') for p in self.prefixes)
+        return matches == self.include
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket por punto de llamada (archivo:línea) para mensajes < WARNING.
+    Los mensajes suprimidos se cuentan y se informan en el siguiente que pase.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE_LIMIT, burst: int = DEFAULT_RATE_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._sites = {}  # (pathname, lineno) -> [tokens, última actualización, suprimidos]
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [float(self.burst), now, 0]
+            else:
+                site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+                site[1] = now
+
+            if site[0] < 1.0:
+                site[2] += 1
+                self.suppressed_total += 1
+                return False
+
+            site[0] -= 1.0
+            suppressed, site[2] = site[2], 0
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} (+{suppressed} mensajes similares suprimidos)"
+            record.args = None
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler con cola acotada: si el listener no da abasto, el registro se
+    descarta (y se cuenta) en vez de bloquear al hilo que registra.
+    El formateo completo (timestamp, formato) ocurre en el hilo del listener.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Solo resolver el mensaje (args pueden mutar después); el Formatter corre en el listener
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# Estado del pipeline asíncrono
+_listener = None
+_queue_handler = None
+_rate_filter = None
+_cmd_loggers = {}
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def get_logging_stats():
+    """Estado del pipeline de logging (cola, descartes y supresiones)."""
+    return {
+        "queue_size": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "queue_capacity": _queue_handler.queue.maxsize if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+        "rate_limited": _rate_filter.suppressed_total if _rate_filter else 0,
+        "console_buffer_size": len(web_console_messages)
+    }
+
 def load_config():
     """
     Carga la configuración desde el archivo config.json
@@ -71,15 +266,24 @@ def setup_logging():
         'device_info_manager', 'device_communication', 'device_cache', 'battery_monitor'
     ])
     
+    queue_size = log_config.get('queue_size', DEFAULT_QUEUE_SIZE)
+    rate_limit = log_config.get('rate_limit_per_site', DEFAULT_RATE_LIMIT)
+    rate_burst = log_config.get('rate_limit_burst', DEFAULT_RATE_BURST)
+    
     # Actualizar tamaño del buffer de mensajes si se especifica
-    global web_console_messages
+    global web_console_messages, _listener, _queue_handler, _rate_filter
     if web_console_messages.maxlen != max_console_messages:
-        web_console_messages = deque(maxlen=max_console_messages)
+        web_console_messages = ConsoleBuffer(maxlen=max_console_messages)
+    
+    # Detener un pipeline previo (setup_logging puede llamarse más de una vez)
+    _stop_listener()
+    _cmd_loggers.clear()
     
-    # Resetear handlers existentes en el logger raíz
+    # Resetear handlers existentes en el logger raíz y en los loggers especiales
     root_logger = logging.getLogger()
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
+    for logger_obj in (root_logger, logging.getLogger('console'), logging.getLogger('cmd')):
+        for handler in logger_obj.handlers[:]:
+            logger_obj.removeHandler(handler)
     
     # Convertir nombre de nivel a constante de logging
     if log_level == 'NONE':
@@ -92,47 +296,59 @@ def setup_logging():
     
     # Si el nivel es NONE, no añadimos handlers (suprimimos todos los mensajes)
     if log_level != 'NONE':
+        formatter = logging.Formatter(log_format)
+        special_loggers = ('console', 'cmd')
+        
         # Handler para consola del servidor
         server_handler = logging.StreamHandler(sys.stdout)
-        server_handler.setFormatter(logging.Formatter(log_format))
+        server_handler.setFormatter(formatter)
         server_handler.setLevel(numeric_level)
+        server_handler.addFilter(_LoggerPrefixFilter(special_loggers, include=False))
         
         # Handler para consola web
         web_handler = WebConsoleHandler()
-        web_handler.setFormatter(logging.Formatter(log_format))
+        web_handler.setFormatter(formatter)
         web_handler.setLevel(numeric_level)
+        web_handler.addFilter(_LoggerPrefixFilter(special_loggers, include=False))
+        
+        # Handler especial para mensajes de consola web sin formato
+        plain_web_handler = WebConsoleHandler()
+        plain_web_handler.setFormatter(logging.Formatter('%(message)s'))
+        plain_web_handler.addFilter(_LoggerPrefixFilter(('console',)))
+        
+        # Handler especial para mensajes de consola CMD con formato completo
+        cmd_handler = logging.StreamHandler(sys.stdout)
+        cmd_handler.setFormatter(formatter)
+        cmd_handler.addFilter(_LoggerPrefixFilter(('cmd',)))
+        
+        # Los hilos que registran solo encolan; un único listener formatea y escribe
+        _queue_handler = BoundedQueueHandler(queue.Queue(maxsize=queue_size))
+        _rate_filter = RateLimitFilter(rate_limit, rate_burst)
+        _queue_handler.addFilter(_rate_filter)
+        _listener = logging.handlers.QueueListener(
+            _queue_handler.queue,
+            server_handler, web_handler, plain_web_handler, cmd_handler,
+            respect_handler_level=True
+        )
+        _listener.start()
         
-        # Añadir ambos handlers al logger raíz
-        root_logger.addHandler(server_handler)
-        root_logger.addHandler(web_handler)
+        root_logger.addHandler(_queue_handler)
         
         # Configurar loggers específicos para módulos
         for module in verbose_modules:
             module_logger = logging.getLogger(f'modbus_app.{module}')
             module_logger.setLevel(logging.DEBUG)  # Nivel más detallado para estos módulos
         
-        # Configurar logger para mensajes de consola web puros (sin timestamp)
+        # Logger para mensajes de consola web puros (sin timestamp), sin propagar al raíz
         console_logger = logging.getLogger('console')
         console_logger.setLevel(logging.INFO)
-        
-        # Handler especial para mensajes de consola web sin formato
-        plain_web_handler = WebConsoleHandler()
-        plain_web_handler.setFormatter(logging.Formatter('%(message)s'))
-        console_logger.addHandler(plain_web_handler)
-        
-        # Evitar propagación para este logger especial
+        console_logger.addHandler(_queue_handler)
         console_logger.propagate = False
         
-        # Configurar logger para mensajes de consola CMD (con formato completo)
+        # Logger para mensajes de consola CMD (con formato completo), sin propagar al raíz
         cmd_logger = logging.getLogger('cmd')
         cmd_logger.setLevel(logging.INFO)
-        
-        # Handler especial para mensajes de consola CMD con formato completo
-        cmd_handler = logging.StreamHandler(sys.stdout)
-        cmd_handler.setFormatter(logging.Formatter(log_format))
-        cmd_logger.addHandler(cmd_handler)
-        
-        # Evitar propagación para este logger especial
+        cmd_logger.addHandler(_queue_handler)
         cmd_logger.propagate = False
     
     return web_console_messages
@@ -149,34 +365,46 @@ def log_to_web_console(message):
     logger.info(message)
 
 # Función auxiliar para enviar mensajes a la consola CMD (servidor) con formato completo
-def log_to_cmd(message, level='INFO', module='CMD'):
+def _get_cmd_logger(module):
+    logger = _cmd_loggers.get(module)
+    if logger is None:
+        logger = _cmd_loggers[module] = logging.getLogger(f'cmd.{module}')
+    return logger
+
+def cmd_enabled(level='INFO', module='CMD'):
+    """
+    Guarda de nivel barata para log_to_cmd: permite evitar construir mensajes costosos.
+    
+    Args:
+        level (str): Nivel de log
+        module (str): Nombre del módulo o componente
+    """
+    levelno = _LEVELS.get(level.upper())
+    if levelno is None:
+        return level.upper() != 'NONE'
+    return _get_cmd_logger(module).isEnabledFor(levelno)
+
+def log_to_cmd(message, level='INFO', module='CMD', *args):
     """
     Envía un mensaje a la consola CMD del servidor con formato completo.
     
     Args:
-        message (str): Mensaje a enviar
+        message (str): Mensaje a enviar (admite formato %-style con args, que solo
+            se aplica si el nivel está habilitado)
         level (str): Nivel de log (DEBUG, INFO, WARNING, ERROR, CRITICAL, NONE)
         module (str): Nombre del módulo o componente que envía el mensaje
     """
+    level_upper = level.upper()
+    
     # Si el nivel es NONE, no hacemos nada
-    if level.upper() == 'NONE':
+    if level_upper == 'NONE':
         return
-        
-    logger = logging.getLogger(f'cmd.{module}')
     
-    level_upper = level.upper()
-    if level_upper == 'DEBUG':
-        logger.debug(message)
-    elif level_upper == 'INFO':
-        logger.info(message)
-    elif level_upper == 'WARNING':
-        logger.warning(message)
-    elif level_upper == 'ERROR':
-        logger.error(message)
-    elif level_upper == 'CRITICAL':
-        logger.critical(message)
-    else:
-        logger.info(message)  # Nivel por defecto si se especifica uno no válido
+    # Nivel por defecto si se especifica uno no válido
+    levelno = _LEVELS.get(level_upper, logging.INFO)
+    logger = _get_cmd_logger(module)
+    if logger.isEnabledFor(levelno):
+        logger.log(levelno, message, *args, stacklevel=2)
 
 # Exportar la función para obtener loggers específicos
 def get_logger(name):
@@ -0,0 +1,308 @@
+# modbus_app/metrics.py
+"""
+Subsistema de métricas con exposición en formato de texto Prometheus/OpenMetrics.
+
+Los incrementos no toman locks: cada hilo acumula en su propio fragmento (shard)
+y los fragmentos se suman solo al generar /metrics. Los fragmentos de hilos
+terminados se consolidan en el siguiente scrape, por lo que el número de
+fragmentos no crece con los hilos por petición del servidor de desarrollo.
+"""
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets por defecto (segundos) orientados a transacciones RS-485 y peticiones HTTP
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels_text(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _ThreadShards:
+    """Fragmentos por hilo: cada hilo escribe solo en su diccionario."""
+
+    def __init__(self, merge: Callable):
+        self._local = threading.local()
+        self._shards = []    # (hilo, dict)
+        self._retired = {}   # Valores de hilos terminados
+        self._lock = threading.Lock()
+        self._merge = merge
+
+    def local(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def collect(self) -> dict:
+        """Suma todos los fragmentos (consolidando los de hilos terminados)."""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    for key, value in shard.items():
+                        self._retired[key] = self._merge(self._retired.get(key), value)
+            self._shards = alive
+
+            result = {key: self._merge(None, value) for key, value in self._retired.items()}
+            for _, shard in alive:
+                while True:
+                    try:
+                        items = list(shard.items())
+                        break
+                    except RuntimeError:
+                        # El hilo dueño insertó una clave durante la copia; reintentar
+                        continue
+                for key, value in items:
+                    result[key] = self._merge(result.get(key), value)
+            return result
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.kind}'
+        yield from self._samples()
+
+    def _samples(self) -> Iterable[str]:
+        return ()
+
+
+class Counter(_Metric):
+    """Contador monótono por conjunto de etiquetas."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._shards = _ThreadShards(lambda acc, value: value if acc is None else acc + value)
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shards.local()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> Dict[tuple, float]:
+        return self._shards.collect()
+
+    def _samples(self):
+        for labels, value in sorted(self.values().items()):
+            yield f'{self.name}{_labels_text(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    """Histograma con buckets fijos (acumulativos en la exposición)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards(self._merge)
+
+    @staticmethod
+    def _merge(acc, value):
+        if acc is None:
+            return [list(value[0]), value[1], value[2]]
+        counts = acc[0]
+        for i, count in enumerate(value[0]):
+            counts[i] += count
+        acc[1] += value[1]
+        acc[2] += value[2]
+        return acc
+
+    def observe(self, value: float, *labels):
+        shard = self._shards.local()
+        state = shard.get(labels)
+        if state is None:
+            state = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, *labels):
+        """Context manager que observa la duración del bloque."""
+        return _Timer(self, labels)
+
+    def values(self) -> Dict[tuple, list]:
+        return self._shards.collect()
+
+    def _samples(self):
+        bounds = self.buckets + (math.inf,)
+        for labels, (counts, total, count) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                yield f'{self.name}_bucket{_labels_text(self.labelnames, labels, le)} {cumulative}'
+            label_text = _labels_text(self.labelnames, labels)
+            yield f'{self.name}_sum{label_text} {_format_value(total)}'
+            yield f'{self.name}_count{label_text} {count}'
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_labels', '_start')
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+        return False
+
+
+class Gauge(_Metric):
+    """
+    Valor instantáneo; puede calcularse en el momento del scrape con set_function().
+    set() es una asignación atómica; inc()/dec() toman un lock (uso poco frecuente).
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set_function(self, function: Callable[[], Dict[tuple, float]]):
+        """Función que devuelve {etiquetas: valor} en cada scrape."""
+        self._function = function
+
+    def values(self) -> Dict[tuple, float]:
+        values = dict(self._values)
+        if self._function is not None:
+            try:
+                values.update(self._function())
+            except Exception:
+                pass
+        return values
+
+    def _samples(self):
+        for labels, value in sorted(self.values().items()):
+            if value is None:
+                continue
+            yield f'{self.name}{_labels_text(self.labelnames, labels)} {_format_value(value)}'
+
+
+class MetricsRegistry:
+    """Registro de métricas y generación del formato de texto."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# ==================== MÉTRICAS DE LA APLICACIÓN ====================
+
+# Bus Modbus
+bus_transactions = REGISTRY.counter(
+    'modbus_transactions_total', 'Transacciones Modbus por esclavo, función y resultado',
+    ('slave', 'function', 'result'))
+bus_latency = REGISTRY.histogram(
+    'modbus_transaction_seconds', 'Latencia de transacciones Modbus con respuesta',
+    ('slave', 'function'))
+bus_timeouts = REGISTRY.counter(
+    'modbus_timeouts_total', 'Transacciones sin respuesta del esclavo', ('slave', 'function'))
+bus_crc_errors = REGISTRY.counter(
+    'modbus_crc_errors_total', 'Respuestas recibidas con CRC inválido', ('slave', 'function'))
+bus_arbiter_queue = REGISTRY.gauge(
+    'modbus_arbiter_queue_depth', 'Peticiones esperando el bus por clase de prioridad', ('priority',))
+bus_arbiter_wait = REGISTRY.gauge(
+    'modbus_arbiter_avg_wait_seconds', 'Espera media por el bus por clase de prioridad', ('priority',))
+
+# Monitor de baterías
+poll_cycle = REGISTRY.histogram(
+    'monitor_poll_cycle_seconds', 'Duración de una ronda completa de polling',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0))
+cache_age = REGISTRY.gauge(
+    'monitor_cache_age_seconds', 'Antigüedad de los datos en caché por batería', ('battery',))
+
+# Base de datos de historial
+db_pending_writes = REGISTRY.gauge(
+    'history_db_pending_writes', 'Escrituras de historial en curso o en cola')
+db_pending_writes.set(0)
+db_commit_latency = REGISTRY.histogram(
+    'history_db_commit_seconds', 'Latencia de escritura+commit de registros de historial')
+
+# HTTP
+http_latency = REGISTRY.histogram(
+    'http_request_seconds', 'Latencia de peticiones HTTP por endpoint',
+    ('endpoint', 'method', 'status'))
+http_response_bytes = REGISTRY.counter(
+    'http_response_bytes_total', 'Bytes de respuestas comprimidas, sin comprimir (raw) y por codificación',
+    ('encoding',))
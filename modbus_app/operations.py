@@ -2,9 +2,29 @@
 import time
 from .huawei_client import get_huawei_client, HuaweiModbusClient
 from modbus_app.device_info.device_cache import get_device_info
+from .register_schema import get_schema
+from .huawei_client.arbiter import bus_priority, PRIORITY_DIAGNOSTICS
+from .tracing import traced
 import logging
 
 logger = logging.getLogger('operations')
+_schema = get_schema()
+
+# Decodificadores compilados para la lectura rápida de celdas (read_cells_data)
+_cells_basic_decoder = _schema.block_decoder("basic", rename={
+    "battery_current": "current",
+    "battery_soc": "soc",
+    "battery_soh": "soh",
+    "highest_cell_temp": "max_cell_temp",
+    "lowest_cell_temp": "min_cell_temp"
+})
+_cell_count_decoder = _schema.field_decoders[_schema.by_key["cell_count"].address]
+_cell_array_decoders = [
+    _schema.array_decoders[name] for name in (
+        "cell_voltages_block1", "cell_voltages_block2",
+        "cell_temperatures_block1", "cell_temperatures_block2"
+    )
+]
 
 
 def get_client():
@@ -43,6 +63,7 @@ def set_client(client):
     """Ya no es necesaria - el cliente se maneja automáticamente por BatteryInitializer."""  # ← 4 espacios
     pass  # Función vacía para compatibilidad  # ← 4 espacios
 
+@traced("operations.execute_read_operation")
 def execute_read_operation(slave_id, function, address, count):
     """Ejecuta una operación de lectura Modbus estándar usando HuaweiModbusClient."""
     if not is_client_connected():
@@ -187,6 +208,7 @@ def execute_read_device_info(slave_id, info_index):
             "status": "error",
             "message": f"Error al obtener información: {str(e)}"
         }
+@bus_priority(PRIORITY_DIAGNOSTICS)
 def verify_battery_cell_data(slave_id=217):
     """
     Función para verificar los datos de celdas individuales de la batería usando HuaweiModbusClient.
@@ -321,172 +343,10 @@ def verify_battery_cell_data(slave_id=217):
         print("-" * 40)
     
     return result
-# Mapa de registros Huawei revisado (mantenido igual para compatibilidad)
-HUAWEI_REGISTER_MAP_REVISED = {
-    # === REGISTROS BÁSICOS CONFIRMADOS ===
-    0x0000: {"name": "Voltaje de Batería", "factor": 0.01, "unit": "V", "json_field": "battery_voltage", "certainty": "CONFIRMADO"},
-    0x0001: {"name": "Voltaje del Pack", "factor": 0.01, "unit": "V", "json_field": "pack_voltage", "certainty": "CONFIRMADO"},
-    0x0002: {"name": "Corriente de Batería", "factor": 0.01, "unit": "A", "signed": True, "json_field": "battery_current", "certainty": "CONFIRMADO"},
-    0x0003: {"name": "Estado de Carga (SOC)", "factor": 1, "unit": "%", "json_field": "battery_soc", "certainty": "CONFIRMADO"},
-    0x0004: {"name": "Estado de Salud (SOH)", "factor": 1, "unit": "%", "json_field": "battery_soh", "certainty": "CONFIRMADO"},
-    0x0005: {"name": "Temperatura Máxima Celda", "factor": 1, "unit": "°C", "json_field": "highest_cell_temp", "certainty": "CONFIRMADO"},
-    0x0006: {"name": "Temperatura Mínima Celda", "factor": 1, "unit": "°C", "json_field": "lowest_cell_temp", "certainty": "CONFIRMADO"},
-
-    # === SISTEMA DE IDENTIFICACIÓN ===
-    0x0101: {"name": "Versión de Software", "factor": 1, "unit": "-", "json_field": "software_version", "decode_sw_version": True, "certainty": "CONFIRMADO"},
-    0x010F: {"name": "Número de Celdas", "factor": 1, "unit": "celdas", "json_field": "cell_count", "certainty": "CONFIRMADO"},
-
-    # === SISTEMA DE DIAGNÓSTICO Y ALARMAS ===
-    0x000A: {
-        "name": "Estado General (Bits de Control)", 
-        "factor": 1, 
-        "unit": "-", 
-        "json_field": "general_status_bits",
-        "certainty": "PROBABLE",
-        "notes": "Valor constante 0x0003 observado, posible máscara de bits de estado base"
-    },
-    
-    0x0046: {
-        "name": "Indicador de Fallas Hardware", 
-        "factor": 1, 
-        "unit": "-", 
-        "json_field": "hardware_fault_indicator",
-        "certainty": "PROBABLE",
-        "notes": "0x0000=OK, 0x0006=Sensores desconectados. NO refleja alarmas de estado (SOC/SOH)",
-        "bit_interpretation": {
-            0x0000: "Hardware funcionando correctamente",
-            0x0006: "Múltiples sensores desconectados (análisis pendiente de bits específicos)"
-        }
-    },
-    
-    0x0047: {
-        "name": "Reservado/Estado Auxiliar 1", 
-        "factor": 1, 
-        "unit": "-", 
-        "json_field": "auxiliary_status_1",
-        "certainty": "DESCONOCIDO",
-        "notes": "Siempre 0x0000 en todos los casos observados. Función por determinar"
-    },
-    
-    0x0048: {
-        "name": "Estado de Sensores Principales", 
-        "factor": 1, 
-        "unit": "-", 
-        "json_field": "main_sensors_status",
-        "certainty": "PROBABLE",
-        "notes": "0x0000=Sensores OK, 0x2000=Sensores críticos desconectados",
-        "bit_interpretation": {
-            0x0000: "Sensores principales funcionando",
-            0x2000: "Bit 13 activo - posible falla de sensores críticos"
-        }
-    },
-    
-    0x0049: {
-        "name": "Modo de Operación Batería", 
-        "factor": 1, 
-        "unit": "-", 
-        "json_field": "operation_mode",
-        "certainty": "CONFIRMADO",
-        "notes": "Indicador confiable del estado operativo de la batería",
-        "bit_interpretation": {
-            0x0000: "Modo desconocido/error",
-            0x0080: "Modo standby/flotación (bit 7)",
-            0x0800: "Modo descarga activa (bit 11)"
-        }
-    },
-    
-    0x004A: {
-        "name": "Estado de Subsistemas", 
-        "factor": 1, 
-        "unit": "-", 
-        "json_field": "subsystem_status",
-        "certainty": "EXPERIMENTAL",
-        "notes": "0x0000=OK, 0x0004=Posible falla en subsistema (bit 2)",
-        "bit_interpretation": {
-            0x0000: "Subsistemas funcionando correctamente",
-            0x0004: "Bit 2 activo - función por determinar"
-        }
-    },
-
-    # === ESTADÍSTICAS Y CONTADORES ===
-    0x0042: {"name": "Tiempos de Descarga", "factor": 1, "unit": "veces", "is_32bit": True, "json_field": "discharge_times", "certainty": "CONFIRMADO"},
-    0x0044: {"name": "Descarga AH Acumulada", "factor": 1, "unit": "AH", "is_32bit": True, "json_field": "discharge_ah", "certainty": "CONFIRMADO"},
-    0x7D6B: {"name": "Ciclos Acumulados", "factor": 1, "unit": "ciclos", "is_32bit": True, "json_field": "accumulated_cycle_times", "certainty": "CONFIRMADO"},
-
-    # === LÍMITES DE OPERACIÓN ===
-    0x100B: {"name": "Límite Corriente de Descarga", "factor": 0.001, "unit": "C", "json_field": "discharge_current_limit", "certainty": "CONFIRMADO"},
-    0x100D: {"name": "Límite Corriente de Carga", "factor": 0.001, "unit": "C", "json_field": "charge_current_limit", "certainty": "CONFIRMADO"},
-
-    # === REGISTROS EXPERIMENTALES/EN INVESTIGACIÓN ===
-    0x0106: {"name": "Parámetro Sistema 0x0106", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x0107: {"name": "Parámetro Sistema 0x0107", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x0206: {"name": "Estado Detallado Sistema", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x0320: {"name": "Registro de Control 0x0320", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x100F: {"name": "Configuración 0x100F", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x1010: {"name": "Configuración 0x1010", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x101B: {"name": "Configuración 0x101B", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x1118: {"name": "Info Dispositivo 0x1118", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-    0x1119: {"name": "Info Dispositivo 0x1119", "factor": 1, "unit": "-", "experimental": True, "certainty": "DESCONOCIDO"},
-}
-
-# Definición de arrays de celdas - CONFIRMADOS
-CELL_ARRAYS = {
-    "cell_temperatures_block1": {
-        "start_address": 0x0012,
-        "count": 16,
-        "factor": 1,
-        "unit": "°C",
-        "description": "Temperaturas Celdas 1-16",
-        "certainty": "CONFIRMADO",
-        "special_values": {
-            0x7FFF: "Sensor desconectado",
-            0xFC19: "Sensor fuera de rango"
-        }
-    },
-    "cell_voltages_block1": {
-        "start_address": 0x0022,
-        "count": 16,
-        "factor": 0.001,
-        "unit": "V",
-        "description": "Voltajes Celdas 1-16",
-        "certainty": "CONFIRMADO",
-        "special_values": {
-            0xFFFF: "Sensor desconectado"
-        }
-    },
-    "cell_temperatures_block2": {
-        "start_address": 0x0300,
-        "count": 8,
-        "factor": 1,
-        "unit": "°C",
-        "description": "Temperaturas Celdas 17-24",
-        "certainty": "EXPERIMENTAL"
-    },
-    "cell_voltages_block2": {
-        "start_address": 0x0310,
-        "count": 8,
-        "factor": 0.001,
-        "unit": "V",
-        "description": "Voltajes Celdas 17-24",
-        "certainty": "EXPERIMENTAL"
-    }
-}
-
-# Definición de strings ASCII - CONFIRMADOS
-ASCII_STRINGS = {
-    "battery_bar_code": {
-        "start_address": 0x010A,
-        "length": 10,
-        "description": "Código de Barras/Serial",
-        "certainty": "CONFIRMADO"
-    },
-    "battery_model": {
-        "start_address": 0x0332,
-        "length": 12,
-        "description": "Modelo de Batería",
-        "certainty": "CONFIRMADO"
-    }
-}
+# Vistas de compatibilidad derivadas del esquema declarativo (register_schema)
+HUAWEI_REGISTER_MAP_REVISED = _schema.legacy_register_map()
+CELL_ARRAYS = _schema.legacy_cell_arrays()
+ASCII_STRINGS = _schema.legacy_ascii_strings()
 
 # Excepciones conocidas por dispositivo (basado en observaciones reales)
 DEVICE_SPECIFIC_EXCEPTIONS = {
@@ -524,9 +384,50 @@ def interpret_sensor_status(value):
     }
     return status.get(value, {"description": f"Estado no documentado (0x{value:04X})", "status": "UNKNOWN"})
 
+def execute_read_plan(slave_id, plan):
+    """
+    Ejecuta un plan de lectura compilado (ver register_schema.CompiledSchema.read_plan).
+    Cada bloque se lee con una única petición; si falla, se reintenta campo a campo
+    para no perder los registros válidos del bloque.
+
+    Returns:
+        dict: {"status", "values": {campo: (raw, procesado)}, "errors": {campo: mensaje}}
+    """
+    values = {}
+    errors = {}
+
+    for block in plan:
+        result = execute_read_operation(slave_id, 'holding', block.start, block.count)
+        if result.get("status") == "success" and len(result["data"]) >= block.count:
+            values.update(block.decode_with_raw(result["data"][:block.count]))
+            continue
+
+        parts = block.split()
+        if len(parts) == 1:
+            errors[block.names[0]] = result.get("message", "Datos insuficientes")
+            continue
+
+        for part in parts:
+            part_result = execute_read_operation(slave_id, 'holding', part.start, part.count)
+            if part_result.get("status") == "success" and len(part_result["data"]) >= part.count:
+                values.update(part.decode_with_raw(part_result["data"][:part.count]))
+            else:
+                errors[part.names[0]] = part_result.get("message", "Datos insuficientes")
+
+    if not errors:
+        status = "success"
+    elif values:
+        status = "partial"
+    else:
+        status = "error"
+
+    return {"status": status, "values": values, "errors": errors}
+
+@bus_priority(PRIORITY_DIAGNOSTICS)
 def read_all_mapped_registers(slave_id):
     """
     Lee todos los registros mapeados con el nuevo formato estructurado usando HuaweiModbusClient.
+    Los registros contiguos del esquema se leen en bloque.
     
     Args:
         slave_id (int): ID del esclavo Modbus
@@ -556,62 +457,62 @@ def read_all_mapped_registers(slave_id):
     device_key = str(slave_id)
     known_exceptions = DEVICE_SPECIFIC_EXCEPTIONS.get(device_key, [])
     
-    # 1. Leer registros básicos individuales
+    # 1. Leer registros escalares agrupados en bloques contiguos
     print("Leyendo registros básicos...")
-    for address, reg_info in sorted(HUAWEI_REGISTER_MAP_REVISED.items()):
+    try:
+        plan_result = execute_read_plan(slave_id, _schema.read_plan(exclude=known_exceptions))
+    except Exception as e:
+        print(f"Excepción al leer registros escalares: {str(e)}")
+        plan_result = {"values": {}, "errors": {}, "exception": str(e)}
+
+    for reg in _schema.fields:
+        address = reg.address
+        key = f"0x{address:04X}"
+
         # Saltar registros con excepciones conocidas
         if address in known_exceptions:
-            print(f"Saltando registro 0x{address:04X} - excepción conocida")
+            print(f"Saltando registro {key} - excepción conocida")
             result["summary"]["skipped_exceptions"] += 1
             continue
-        
-        try:
-            register_result = _read_single_register(slave_id, address, reg_info)
-            result["summary"]["total_registers"] += 1
-            
-            if register_result["success"]:
-                result["summary"]["successful_reads"] += 1
-                
-                # Organizar por categoría
-                key = f"0x{address:04X}"
-                register_data = {
-                    "name": reg_info["name"],
-                    "raw_value": register_result["raw_value"],
-                    "processed_value": register_result["processed_value"],
-                    "unit": reg_info["unit"],
-                    "json_field": reg_info.get("json_field"),
-                    "address": address
-                }
-                
-                if reg_info.get("is_32bit"):
-                    register_data.update({
-                        "msw": register_result["msw"],
-                        "lsw": register_result["lsw"],
-                        "is_32bit": True
-                    })
-                
-                if reg_info.get("experimental", False):
-                    result["experimental_registers"][key] = register_data
-                else:
-                    result["basic_registers"][key] = register_data
-                    
-            else:
-                result["summary"]["failed_reads"] += 1
-                result["errors"].append({
-                    "address": f"0x{address:04X}",
-                    "name": reg_info["name"],
-                    "error": register_result["error"]
-                })
-                
-        except Exception as e:
-            print(f"Excepción al leer registro 0x{address:04X}: {str(e)}")
+
+        result["summary"]["total_registers"] += 1
+
+        if reg.key not in plan_result["values"]:
             result["summary"]["failed_reads"] += 1
+            error = plan_result["errors"].get(reg.key)
+            if error is None:
+                error = f"Excepción: {plan_result.get('exception', 'Error desconocido')}"
             result["errors"].append({
-                "address": f"0x{address:04X}",
-                "error": f"Excepción: {str(e)}"
+                "address": key,
+                "name": reg.name,
+                "error": error
             })
-        
-        
+            continue
+
+        result["summary"]["successful_reads"] += 1
+        raw_value, processed_value = plan_result["values"][reg.key]
+
+        register_data = {
+            "name": reg.name,
+            "raw_value": raw_value,
+            "processed_value": processed_value,
+            "unit": reg.unit,
+            "json_field": None if reg.experimental else reg.key,
+            "address": address
+        }
+
+        if reg.width == 2:
+            register_data.update({
+                "msw": raw_value >> 16,
+                "lsw": raw_value & 0xFFFF,
+                "is_32bit": True
+            })
+
+        # Organizar por categoría
+        if reg.experimental:
+            result["experimental_registers"][key] = register_data
+        else:
+            result["basic_registers"][key] = register_data
     
     # 2. Leer arrays de celdas
     print("Leyendo arrays de celdas...")
@@ -681,110 +582,114 @@ def read_all_mapped_registers(slave_id):
     print(f"Lectura finalizada: {result['message']}")
     return result
 
-def _read_single_register(slave_id, address, reg_info):
-    """Lee un registro individual con procesamiento según su tipo usando HuaweiModbusClient."""
-    is_32bit = reg_info.get("is_32bit", False)
+def read_cells_data(slave_id, include_basic=True):
+    """
+    Lectura rápida de lo necesario para la pestaña de celdas: registros básicos,
+    número de celdas y los cuatro bloques de tensiones y temperaturas.
     
-    try:
-        if is_32bit:
-            # Leer valor de 32 bits (MSW en address, LSW en address+1)
-            result_msw = execute_read_operation(slave_id, 'holding', address, 1)
-            result_lsw = execute_read_operation(slave_id, 'holding', address + 1, 1)
-            
-            if result_msw.get("status") == "success" and result_lsw.get("status") == "success":
-                msw = result_msw["data"][0]
-                lsw = result_lsw["data"][0]
-                raw_value = (msw << 16) | lsw
-                processed_value = raw_value * reg_info.get("factor", 1)
-                
-                return {
-                    "success": True,
-                    "raw_value": raw_value,
-                    "processed_value": processed_value,
-                    "msw": msw,
-                    "lsw": lsw
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Error leyendo 32-bit: MSW={result_msw.get('status')}, LSW={result_lsw.get('status')}"
-                }
-        else:
-            # Leer registro normal
-            result = execute_read_operation(slave_id, 'holding', address, 1)
-            
-            if result.get("status") == "success":
-                raw_value = result["data"][0]
-                
-                # Procesar valor con signo si es necesario
-                if reg_info.get("signed", False) and raw_value > 32767:
-                    signed_value = raw_value - 65536
-                    processed_value = signed_value * reg_info.get("factor", 1)
-                else:
-                    processed_value = raw_value * reg_info.get("factor", 1)
-                
-                # Decodificación especial para versión de software
-                if reg_info.get("decode_sw_version", False):
-                    processed_value = f"V{raw_value - 156}" if raw_value >= 156 else f"V{raw_value}"
-                
-                return {
-                    "success": True,
-                    "raw_value": raw_value,
-                    "processed_value": processed_value
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": result.get("message", "Error desconocido")
-                }
-                
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"Excepción: {str(e)}"
+    Args:
+        slave_id (int): ID del esclavo Modbus
+        include_basic (bool): False omite los registros básicos y el número de celdas
+            (el polling ya los tiene)
+        
+    Returns:
+        dict: Resultado con basic_data, cell_data y resumen de operaciones
+    """
+    result = {
+        "status": "success",
+        "battery_id": slave_id,
+        "timestamp": time.time(),
+        "basic_data": {},
+        "cell_data": {},
+        "summary": {
+            "total_operations": 0,
+            "successful_operations": 0,
+            "failed_operations": 0
         }
+    }
+
+    # ========== 1. LEER REGISTROS BÁSICOS NECESARIOS (1 OPERACIÓN) ==========
+    if include_basic:
+        logger.debug("Leyendo registros básicos para batería %s", slave_id)
+
+        # Leer registros 0x0000-0x0006 + 0x010F en operaciones agrupadas
+        basic_result = execute_read_operation(
+            slave_id, 'holding', _cells_basic_decoder.start, _cells_basic_decoder.count
+        )
+        cell_count_result = execute_read_operation(
+            slave_id, 'holding', _cell_count_decoder.start, _cell_count_decoder.count
+        )
+
+        result["summary"]["total_operations"] += 2
+
+        if basic_result.get("status") == "success" and len(basic_result["data"]) >= _cells_basic_decoder.count:
+            result["basic_data"] = _cells_basic_decoder.decode(basic_result["data"][:_cells_basic_decoder.count])
+            result["summary"]["successful_operations"] += 1
+        else:
+            result["summary"]["failed_operations"] += 1
+
+        if cell_count_result.get("status") == "success" and cell_count_result["data"]:
+            result["basic_data"].update(_cell_count_decoder.decode(cell_count_result["data"][:1]))
+            result["summary"]["successful_operations"] += 1
+        else:
+            result["basic_data"]["cell_count"] = 16  # Valor por defecto
+            result["summary"]["failed_operations"] += 1
+
+    # ========== 2. LEER DATOS DE CELDAS (4 OPERACIONES) ==========
+    logger.debug("Leyendo datos de celdas para batería %s", slave_id)
+
+    for decoder in _cell_array_decoders:
+        array = decoder.array
+        array_result = execute_read_operation(slave_id, 'holding', decoder.start, decoder.count)
+
+        result["summary"]["total_operations"] += 1
+
+        if array_result.get("status") == "success":
+            result["cell_data"][array.key] = {
+                "success": True,
+                "start_address": f"0x{decoder.start:04X}",
+                "count": decoder.count,
+                "unit": array.unit,
+                "factor": array.factor,
+                "cells": decoder.cells(array_result["data"], missing_status="DISCONNECTED")
+            }
+
+            result["summary"]["successful_operations"] += 1
+
+        else:
+            result["cell_data"][array.key] = {
+                "success": False,
+                "error": array_result.get("message", "Error desconocido")
+            }
+            result["summary"]["failed_operations"] += 1
+
+    # ========== 3. DETERMINAR ESTADO FINAL ==========
+    if result["summary"]["failed_operations"] == 0:
+        result["status"] = "success"
+        result["message"] = f"Datos de celdas leídos exitosamente ({result['summary']['total_operations']} operaciones)"
+    elif result["summary"]["successful_operations"] > 0:
+        result["status"] = "partial"
+        result["message"] = f"Datos parciales: {result['summary']['successful_operations']}/{result['summary']['total_operations']} operaciones exitosas"
+    else:
+        result["status"] = "error"
+        result["message"] = "No se pudieron leer los datos de celdas"
+
+    logger.debug("Lectura de celdas completada: %s", result["message"])
+    return result
 
 def _read_cell_array(slave_id, array_name, array_info):
     """Lee un array completo de celdas usando HuaweiModbusClient."""
-    start_address = array_info["start_address"]
-    count = array_info["count"]
-    factor = array_info["factor"]
+    decoder = _schema.array_decoders[array_name]
+    start_address = decoder.start
+    count = decoder.count
     
     try:
         # Leer todo el bloque
         result = execute_read_operation(slave_id, 'holding', start_address, count)
         
         if result.get("status") == "success":
-            raw_registers = result["data"]
-            cells = []
-            successful_count = 0
-            failed_count = 0
-            
-            for i, raw_value in enumerate(raw_registers):
-                cell_number = i + 1
-                if array_name.endswith("_block2"):
-                    cell_number += 16
-                
-                # Detectar valores especiales según tipo
-                if array_info["unit"] == "V" and raw_value == 0xFFFF:
-                    status = "N/A"
-                    processed_value = None
-                    failed_count += 1
-                elif array_info["unit"] == "°C" and raw_value == 0xFC19:  # 64537
-                    status = "N/A" 
-                    processed_value = None
-                    failed_count += 1
-                else:
-                    status = "OK"
-                    processed_value = raw_value * factor
-                    successful_count += 1
-                
-                cells.append({
-                    "cell_number": cell_number,
-                    "raw_value": raw_value,
-                    "processed_value": processed_value,
-                    "status": status
-                })
+            cells = decoder.cells(result["data"], missing_status="N/A")
+            failed_count = sum(1 for cell in cells if cell["processed_value"] is None)
             
             return {
                 "success": True,
@@ -792,9 +697,9 @@ def _read_cell_array(slave_id, array_name, array_info):
                 "start_address": f"0x{start_address:04X}",
                 "count": count,
                 "unit": array_info["unit"],
-                "factor": factor,
+                "factor": array_info["factor"],
                 "cells": cells,
-                "successful_count": successful_count,
+                "successful_count": len(cells) - failed_count,
                 "failed_count": failed_count
             }
         else:
@@ -813,8 +718,9 @@ def _read_cell_array(slave_id, array_name, array_info):
 
 def _read_ascii_string(slave_id, string_name, string_info):
     """Lee y decodifica un string ASCII usando HuaweiModbusClient."""
-    start_address = string_info["start_address"]
-    length = string_info["length"]
+    decoder = _schema.string_decoders[string_name]
+    start_address = decoder.start
+    length = decoder.count
     
     try:
         # Leer todos los registros
@@ -823,22 +729,13 @@ def _read_ascii_string(slave_id, string_name, string_info):
         if result.get("status") == "success":
             raw_data = result["data"]
             
-            # Convertir registros a bytes (cada registro = 2 bytes, big endian)
-            byte_data = bytearray()
-            for register_value in raw_data:
-                byte_data.extend([(register_value >> 8) & 0xFF, register_value & 0xFF])
-            
-            # Decodificar como ASCII
             try:
-                ascii_string = byte_data.decode('ascii', errors='ignore')
-                cleaned_string = ''.join(c for c in ascii_string if c.isprintable()).strip()
-                
                 return {
                     "success": True,
                     "description": string_info["description"],
                     "start_address": f"0x{start_address:04X}",
                     "length": length,
-                    "ascii_string": cleaned_string,
+                    "ascii_string": decoder.decode(raw_data),
                     "raw_registers": raw_data
                 }
             except Exception as decode_error:
@@ -859,4 +756,4 @@ def _read_ascii_string(slave_id, string_name, string_info):
             "success": False,
             "error": f"Excepción: {str(e)}",
             "description": string_info["description"]
-        }
\ No newline at end of file
+        }
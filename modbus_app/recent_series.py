@@ -0,0 +1,170 @@
+# modbus_app/recent_series.py
+"""
+Series temporales recientes en memoria (una por batería y métrica).
+
+Cada lectura de polling se añade a buffers circulares NumPy de tamaño fijo:
+append O(1) sin reservar memoria y consultas de ventana (rebanadas, min/max/media)
+sin tocar SQLite, que solo recibe un registro cada `history_interval`.
+"""
+
+import math
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger('modbus_app.recent_series')
+
+DEFAULT_WINDOW_HOURS = 6
+
+
+class RingBuffer:
+    """Buffer circular de capacidad fija respaldado por un array NumPy."""
+
+    __slots__ = ('_data', '_head', '_size')
+
+    def __init__(self, capacity: int, dtype=np.float32):
+        self._data = np.full(capacity, np.nan, dtype=dtype)
+        self._head = 0   # Próxima posición de escritura
+        self._size = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, value):
+        self._data[self._head] = value
+        self._head = (self._head + 1) % len(self._data)
+        if self._size < len(self._data):
+            self._size += 1
+
+    def values(self, last: int = None) -> np.ndarray:
+        """Copia de los últimos `last` valores (todos por defecto), del más antiguo al más reciente."""
+        count = self._size if last is None else min(last, self._size)
+        if count <= 0:
+            return self._data[:0].copy()
+        start = (self._head - count) % len(self._data)
+        if start + count <= len(self._data):
+            return self._data[start:start + count].copy()
+        return np.concatenate((self._data[start:], self._data[:self._head]))
+
+
+class RecentSeries:
+    """Muestras recientes de una batería: un buffer de timestamps y uno por métrica."""
+
+    def __init__(self, capacity: int, metrics: Sequence[str]):
+        self.metrics = tuple(metrics)
+        self.timestamps = RingBuffer(capacity, np.float64)
+        self.values = {name: RingBuffer(capacity) for name in self.metrics}
+
+    def append(self, timestamp: float, sample: Dict[str, Any]):
+        self.timestamps.append(timestamp)
+        for name, buffer in self.values.items():
+            value = sample.get(name)
+            buffer.append(np.nan if value is None else value)
+
+    def _count_since(self, since: Optional[float]) -> int:
+        """Número de muestras con timestamp >= since (los timestamps son crecientes)."""
+        timestamps = self.timestamps.values()
+        if since is None:
+            return len(timestamps)
+        return len(timestamps) - int(np.searchsorted(timestamps, since, side='left'))
+
+    def window(self, since: float = None, fields: Iterable[str] = None) -> Dict[str, np.ndarray]:
+        """Arrays de la ventana [since, ahora]: 'timestamp' y una entrada por métrica."""
+        count = self._count_since(since)
+        arrays = {"timestamp": self.timestamps.values(count)}
+        for name in fields or self.metrics:
+            arrays[name] = self.values[name].values(count)
+        return arrays
+
+
+def window_stats(values: np.ndarray) -> Dict[str, Any]:
+    """min/max/media/último de una serie ignorando huecos (NaN)."""
+    valid = values[~np.isnan(values)]
+    if not len(valid):
+        return {"count": 0, "min": None, "max": None, "mean": None, "last": None}
+    return {
+        "count": int(len(valid)),
+        "min": round(float(valid.min()), 4),
+        "max": round(float(valid.max()), 4),
+        "mean": round(float(valid.mean(dtype=np.float64)), 4),
+        "last": round(float(valid[-1]), 4)
+    }
+
+
+class RecentSeriesStore:
+    """Series recientes de todas las baterías monitoreadas."""
+
+    def __init__(self, metrics: Sequence[str], window_seconds: float, sample_interval: float):
+        """
+        Args:
+            metrics: Métricas numéricas a conservar (claves de battery_cache)
+            window_seconds: Ventana retenida
+            sample_interval: Periodo mínimo esperado entre muestras (dimensiona los buffers)
+        """
+        self.metrics = tuple(metrics)
+        self.window_seconds = window_seconds
+        self.capacity = max(2, int(math.ceil(window_seconds / max(sample_interval, 0.1))) + 1)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, battery_id: int, sample: Dict[str, Any], timestamp: float = None):
+        """Añade una lectura de polling."""
+        with self._lock:
+            series = self._series.get(battery_id)
+            if series is None:
+                series = self._series[battery_id] = RecentSeries(self.capacity, self.metrics)
+            series.append(timestamp or time.time(), sample)
+
+    def battery_ids(self) -> List[int]:
+        with self._lock:
+            return sorted(self._series)
+
+    def query(self, battery_id: int, fields: Sequence[str] = None, seconds: float = None) -> Optional[Dict[str, Any]]:
+        """
+        Ventana reciente de una batería: arrays por campo y estadísticas.
+        Devuelve None si la batería no tiene muestras.
+
+        Raises:
+            ValueError: campo no disponible
+        """
+        fields = list(fields or self.metrics)
+        unknown = [name for name in fields if name not in self.metrics]
+        if unknown:
+            raise ValueError(f"Campos no disponibles: {', '.join(unknown)}")
+        seconds = min(seconds, self.window_seconds) if seconds else self.window_seconds
+
+        with self._lock:
+            series = self._series.get(battery_id)
+            if series is None:
+                return None
+            arrays = series.window(time.time() - seconds, fields)
+
+        return {
+            "battery_id": battery_id,
+            "fields": fields,
+            "window_seconds": seconds,
+            "count": int(len(arrays["timestamp"])),
+            "series": arrays,
+            "stats": {name: window_stats(arrays[name]) for name in fields}
+        }
+
+
+def recent_to_json(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte los arrays de RecentSeriesStore.query() a listas (huecos a None).
+    Los timestamps van en ISO y hora local, como los del historial en SQLite.
+    """
+    arrays = result["series"]
+    columns = {"timestamp": [datetime.fromtimestamp(ts).isoformat(timespec='seconds')
+                             for ts in arrays["timestamp"].tolist()]}
+    for name in result["fields"]:
+        columns[name] = [None if math.isnan(v) else round(v, 4) for v in arrays[name].tolist()]
+    return dict(result, series=columns)
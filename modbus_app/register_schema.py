@@ -0,0 +1,458 @@
+# modbus_app/register_schema.py
+"""
+Esquema declarativo de registros de baterías Huawei ESM.
+
+Toda la semántica de registros (dirección, ancho, signo, factor, valores centinela
+y grupos) se declara una sola vez aquí. Al importar el módulo el esquema se compila
+en decodificadores por bloque y planes de lectura, de modo que decodificar el
+resultado de una lectura es una única pasada precalculada (struct.unpack sobre el
+bloque completo + conversiones por campo ya resueltas).
+"""
+
+import struct
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Any, Iterable
+
+# ==================== DEFINICIONES ====================
+
+
+@dataclass(frozen=True)
+class RegisterField:
+    """Registro escalar (16 o 32 bits, MSW primero)."""
+    address: int
+    key: str                      # Nombre canónico (json_field)
+    name: str
+    unit: str = "-"
+    factor: float = 1
+    width: int = 1                # 1 = 16 bits, 2 = 32 bits
+    signed: bool = False
+    groups: Tuple[str, ...] = ()
+    sentinels: Dict[int, str] = field(default_factory=dict)
+    history_column: Optional[str] = None   # Columna en battery_history
+    transform: Optional[str] = None        # Decodificación especial (ver _TRANSFORMS)
+    certainty: str = "CONFIRMADO"
+    experimental: bool = False
+    notes: Optional[str] = None
+    bit_interpretation: Optional[Dict[int, str]] = None
+
+
+@dataclass(frozen=True)
+class RegisterArray:
+    """Bloque contiguo de registros por celda."""
+    key: str
+    start_address: int
+    count: int
+    factor: float
+    unit: str
+    description: str
+    first_cell: int = 1
+    sentinels: Dict[int, str] = field(default_factory=dict)
+    certainty: str = "CONFIRMADO"
+
+
+@dataclass(frozen=True)
+class AsciiString:
+    """Cadena ASCII almacenada en registros (2 caracteres por registro, big endian)."""
+    key: str
+    start_address: int
+    length: int
+    description: str
+    certainty: str = "CONFIRMADO"
+
+
+_TEMP_SENTINELS = {0x7FFF: "Sensor desconectado", 0xFC19: "Sensor fuera de rango"}
+_VOLTAGE_SENTINELS = {0xFFFF: "Sensor desconectado"}
+
+REGISTERS = (
+    # === REGISTROS BÁSICOS CONFIRMADOS ===
+    RegisterField(0x0000, "battery_voltage", "Voltaje de Batería", "V", 0.01, groups=("basic",)),
+    RegisterField(0x0001, "pack_voltage", "Voltaje del Pack", "V", 0.01, groups=("basic",)),
+    RegisterField(0x0002, "battery_current", "Corriente de Batería", "A", 0.01, signed=True, groups=("basic",)),
+    RegisterField(0x0003, "battery_soc", "Estado de Carga (SOC)", "%", groups=("basic",)),
+    RegisterField(0x0004, "battery_soh", "Estado de Salud (SOH)", "%", groups=("basic",)),
+    RegisterField(0x0005, "highest_cell_temp", "Temperatura Máxima Celda", "°C", groups=("basic",)),
+    RegisterField(0x0006, "lowest_cell_temp", "Temperatura Mínima Celda", "°C", groups=("basic",)),
+
+    # === SISTEMA DE IDENTIFICACIÓN ===
+    RegisterField(0x0101, "software_version", "Versión de Software", transform="sw_version",
+                  groups=("identification",)),
+    RegisterField(0x010F, "cell_count", "Número de Celdas", "celdas", groups=("identification",)),
+
+    # === SISTEMA DE DIAGNÓSTICO Y ALARMAS ===
+    RegisterField(
+        0x000A, "general_status_bits", "Estado General (Bits de Control)",
+        groups=("diagnostics",), certainty="PROBABLE",
+        notes="Valor constante 0x0003 observado, posible máscara de bits de estado base"
+    ),
+    RegisterField(
+        0x0046, "hardware_fault_indicator", "Indicador de Fallas Hardware",
+        groups=("diagnostics", "history", "faults"), history_column="hardware_faults", certainty="PROBABLE",
+        notes="0x0000=OK, 0x0006=Sensores desconectados. NO refleja alarmas de estado (SOC/SOH)",
+        bit_interpretation={
+            0x0000: "Hardware funcionando correctamente",
+            0x0006: "Múltiples sensores desconectados (análisis pendiente de bits específicos)"
+        }
+    ),
+    RegisterField(
+        0x0047, "auxiliary_status_1", "Reservado/Estado Auxiliar 1",
+        groups=("diagnostics",), certainty="DESCONOCIDO",
+        notes="Siempre 0x0000 en todos los casos observados. Función por determinar"
+    ),
+    RegisterField(
+        0x0048, "main_sensors_status", "Estado de Sensores Principales",
+        groups=("diagnostics", "history", "faults"), history_column="sensor_status", certainty="PROBABLE",
+        notes="0x0000=Sensores OK, 0x2000=Sensores críticos desconectados",
+        bit_interpretation={
+            0x0000: "Sensores principales funcionando",
+            0x2000: "Bit 13 activo - posible falla de sensores críticos"
+        }
+    ),
+    RegisterField(
+        0x0049, "operation_mode", "Modo de Operación Batería",
+        groups=("diagnostics", "history", "faults"), history_column="operation_mode", certainty="CONFIRMADO",
+        notes="Indicador confiable del estado operativo de la batería",
+        bit_interpretation={
+            0x0000: "Modo desconocido/error",
+            0x0080: "Modo standby/flotación (bit 7)",
+            0x0800: "Modo descarga activa (bit 11)"
+        }
+    ),
+    RegisterField(
+        0x004A, "subsystem_status", "Estado de Subsistemas",
+        groups=("diagnostics", "history", "faults"), history_column="subsystem_status", certainty="EXPERIMENTAL",
+        notes="0x0000=OK, 0x0004=Posible falla en subsistema (bit 2)",
+        bit_interpretation={
+            0x0000: "Subsistemas funcionando correctamente",
+            0x0004: "Bit 2 activo - función por determinar"
+        }
+    ),
+
+    # === ESTADÍSTICAS Y CONTADORES ===
+    RegisterField(0x0042, "discharge_times", "Tiempos de Descarga", "veces", width=2,
+                  groups=("counters", "history"), history_column="discharge_times_total"),
+    RegisterField(0x0044, "discharge_ah", "Descarga AH Acumulada", "AH", width=2,
+                  groups=("counters", "history"), history_column="discharge_ah_accumulated"),
+    RegisterField(0x7D6B, "accumulated_cycle_times", "Ciclos Acumulados", "ciclos", width=2,
+                  groups=("counters",)),
+
+    # === LÍMITES DE OPERACIÓN ===
+    RegisterField(0x100B, "discharge_current_limit", "Límite Corriente de Descarga", "C", 0.001, groups=("limits",)),
+    RegisterField(0x100D, "charge_current_limit", "Límite Corriente de Carga", "C", 0.001, groups=("limits",)),
+
+    # === REGISTROS EXPERIMENTALES/EN INVESTIGACIÓN ===
+    RegisterField(0x0106, "reg_0x0106", "Parámetro Sistema 0x0106", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x0107, "reg_0x0107", "Parámetro Sistema 0x0107", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x0206, "reg_0x0206", "Estado Detallado Sistema", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x0320, "reg_0x0320", "Registro de Control 0x0320", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x100F, "reg_0x100F", "Configuración 0x100F", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x1010, "reg_0x1010", "Configuración 0x1010", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x101B, "reg_0x101B", "Configuración 0x101B", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x1118, "reg_0x1118", "Info Dispositivo 0x1118", experimental=True, certainty="DESCONOCIDO"),
+    RegisterField(0x1119, "reg_0x1119", "Info Dispositivo 0x1119", experimental=True, certainty="DESCONOCIDO"),
+)
+
+CELL_ARRAYS = (
+    RegisterArray("cell_temperatures_block1", 0x0012, 16, 1, "°C", "Temperaturas Celdas 1-16",
+                  sentinels=_TEMP_SENTINELS),
+    RegisterArray("cell_voltages_block1", 0x0022, 16, 0.001, "V", "Voltajes Celdas 1-16",
+                  sentinels=_VOLTAGE_SENTINELS),
+    RegisterArray("cell_temperatures_block2", 0x0300, 8, 1, "°C", "Temperaturas Celdas 17-24",
+                  first_cell=17, sentinels=_TEMP_SENTINELS, certainty="EXPERIMENTAL"),
+    RegisterArray("cell_voltages_block2", 0x0310, 8, 0.001, "V", "Voltajes Celdas 17-24",
+                  first_cell=17, sentinels=_VOLTAGE_SENTINELS, certainty="EXPERIMENTAL"),
+)
+
+ASCII_STRINGS = (
+    AsciiString("battery_bar_code", 0x010A, 10, "Código de Barras/Serial"),
+    AsciiString("battery_model", 0x0332, 12, "Modelo de Batería"),
+)
+
+
+def _sw_version(raw: int) -> str:
+    return f"V{raw - 156}" if raw >= 156 else f"V{raw}"
+
+
+_TRANSFORMS = {
+    "sw_version": _sw_version,
+}
+
+# Bytes no imprimibles eliminados al decodificar cadenas ASCII
+_NON_PRINTABLE = bytes(b for b in range(256) if not 32 <= b <= 126)
+
+
+# ==================== DECODIFICADORES COMPILADOS ====================
+
+
+def _converter(f: RegisterField):
+    """Resuelve una vez la conversión raw -> valor de un campo."""
+    sentinels = frozenset(f.sentinels)
+    transform = _TRANSFORMS.get(f.transform) if f.transform else None
+    factor = f.factor
+
+    if transform:
+        convert = transform
+    elif factor != 1:
+        def convert(raw, factor=factor):
+            return raw * factor
+    else:
+        def convert(raw):
+            return raw
+
+    if not sentinels:
+        return convert
+
+    def convert_checked(raw, sentinels=sentinels, convert=convert):
+        return None if raw in sentinels else convert(raw)
+    return convert_checked
+
+
+class BlockDecoder:
+    """
+    Decodificador precompilado para un bloque contiguo de registros.
+    El layout (relleno, signo y ancho de cada campo) se resuelve en un
+    struct.Struct, y las conversiones por campo en una tupla de callables.
+    """
+
+    __slots__ = ('start', 'count', 'fields', 'names', '_pack', '_layout', '_raw_layout', '_steps', '_parts')
+
+    def __init__(self, fields: Iterable[RegisterField], key_attr: str = 'key',
+                 rename: Dict[str, str] = None):
+        fields = tuple(sorted(fields, key=lambda f: f.address))
+        self.fields = fields
+        self.start = fields[0].address
+        self.count = fields[-1].address + fields[-1].width - self.start
+
+        layout = raw_layout = '>'
+        position = self.start
+        names = []
+        for f in fields:
+            padding = 'xx' * (f.address - position)
+            code = 'I' if f.width == 2 else 'H'
+            layout += padding + (code.lower() if f.signed else code)
+            raw_layout += padding + code
+            position = f.address + f.width
+            name = getattr(f, key_attr, None) or f.key
+            names.append(rename.get(name, name) if rename else name)
+
+        self.names = tuple(names)
+        self._pack = struct.Struct(f'>{self.count}H').pack
+        self._layout = struct.Struct(layout)
+        self._raw_layout = struct.Struct(raw_layout)
+        self._steps = tuple(zip(self.names, map(_converter, fields)))
+        self._parts = None
+        if len(fields) > 1:
+            self._parts = tuple(BlockDecoder((f,), key_attr, rename) for f in fields)
+
+    def unpack(self, registers: List[int]) -> tuple:
+        """Valores crudos por campo (32 bits ya combinados, signo aplicado)."""
+        return self._layout.unpack(self._pack(*registers))
+
+    def decode(self, registers: List[int]) -> Dict[str, Any]:
+        """Valores procesados por campo (factor, centinelas y transformaciones)."""
+        raw = self._layout.unpack(self._pack(*registers))
+        return {name: convert(value) for (name, convert), value in zip(self._steps, raw)}
+
+    def decode_available(self, registers: List[int]) -> Dict[str, Any]:
+        """
+        Como decode(), pero acepta respuestas cortas: decodifica los campos
+        completos presentes y deja en None los que faltan.
+        """
+        if len(registers) >= self.count:
+            return self.decode(registers[:self.count])
+        values = dict.fromkeys(self.names)
+        for part in self.split():
+            offset = part.start - self.start
+            if offset + part.count <= len(registers):
+                values.update(part.decode(registers[offset:offset + part.count]))
+        return values
+
+    def decode_with_raw(self, registers: List[int]) -> Dict[str, Tuple[int, Any]]:
+        """Pares (crudo sin signo, procesado) por campo."""
+        data = self._pack(*registers)
+        return {
+            name: (raw, convert(value))
+            for (name, convert), raw, value in zip(self._steps, self._raw_layout.unpack(data),
+                                                   self._layout.unpack(data))
+        }
+
+    def split(self) -> Tuple['BlockDecoder', ...]:
+        """Decodificadores de un solo campo (para reintentar lecturas fallidas)."""
+        return self._parts or (self,)
+
+
+class ArrayDecoder:
+    """Decodificador precompilado para un array de celdas."""
+
+    __slots__ = ('array', 'start', 'count', '_sentinels', '_factor', '_first')
+
+    def __init__(self, array: RegisterArray):
+        self.array = array
+        self.start = array.start_address
+        self.count = array.count
+        self._sentinels = frozenset(array.sentinels)
+        self._factor = array.factor
+        self._first = array.first_cell
+
+    def decode(self, registers: List[int]) -> List[Optional[float]]:
+        """Valores por celda (None para valores centinela)."""
+        sentinels, factor = self._sentinels, self._factor
+        if factor == 1:
+            return [None if r in sentinels else r for r in registers]
+        return [None if r in sentinels else r * factor for r in registers]
+
+    def cells(self, registers: List[int], ok_status: str = "OK",
+              missing_status: str = "DISCONNECTED") -> List[Dict[str, Any]]:
+        """Lista de celdas con el formato usado por la API."""
+        return [
+            {
+                "cell_number": number,
+                "raw_value": raw,
+                "processed_value": value,
+                "status": missing_status if value is None else ok_status
+            }
+            for number, raw, value in zip(range(self._first, self._first + len(registers)),
+                                          registers, self.decode(registers))
+        ]
+
+
+class StringDecoder:
+    """Decodificador precompilado para cadenas ASCII."""
+
+    __slots__ = ('string', 'start', 'count', '_pack')
+
+    def __init__(self, string: AsciiString):
+        self.string = string
+        self.start = string.start_address
+        self.count = string.length
+        self._pack = struct.Struct(f'>{string.length}H').pack
+
+    def decode(self, registers: List[int]) -> str:
+        data = self._pack(*registers) if len(registers) == self.count else \
+            struct.pack(f'>{len(registers)}H', *registers)
+        return data.translate(None, _NON_PRINTABLE).decode('ascii').strip()
+
+
+class CompiledSchema:
+    """Esquema compilado: índices, decodificadores y planes de lectura."""
+
+    def __init__(self, registers, cell_arrays, ascii_strings):
+        self.fields = tuple(sorted(registers, key=lambda f: f.address))
+        self.by_address = {f.address: f for f in self.fields}
+        self.by_key = {f.key: f for f in self.fields}
+        self.arrays = {a.key: a for a in cell_arrays}
+        self.strings = {s.key: s for s in ascii_strings}
+
+        self.groups = {}
+        for f in self.fields:
+            for group in f.groups:
+                self.groups.setdefault(group, []).append(f)
+        self.groups = {name: tuple(fields) for name, fields in self.groups.items()}
+
+        self.array_decoders = {key: ArrayDecoder(a) for key, a in self.arrays.items()}
+        self.string_decoders = {key: StringDecoder(s) for key, s in self.strings.items()}
+        self.field_decoders = {f.address: BlockDecoder((f,)) for f in self.fields}
+
+        self._plans = {}
+        for group in self.groups:
+            self.read_plan(group)
+
+    def group(self, name: str) -> Tuple[RegisterField, ...]:
+        """Campos de un grupo ordenados por dirección."""
+        return self.groups.get(name, ())
+
+    def read_plan(self, group: str = None, max_gap: int = 0, key_attr: str = 'key',
+                  rename: Dict[str, str] = None, exclude: Iterable[int] = ()) -> Tuple[BlockDecoder, ...]:
+        """
+        Plan de lectura para un grupo (o todos los campos si group es None):
+        bloques contiguos fusionados cuando el hueco entre campos es <= max_gap.
+        Los planes se cachean, por lo que se compilan una sola vez.
+        """
+        exclude = frozenset(exclude)
+        cache_key = (group, max_gap, key_attr, tuple(sorted(rename.items())) if rename else None, exclude)
+        plan = self._plans.get(cache_key)
+        if plan is not None:
+            return plan
+
+        fields = self.fields if group is None else self.group(group)
+        fields = [f for f in fields if f.address not in exclude]
+
+        blocks = []
+        current = []
+        for f in fields:
+            if current and f.address - (current[-1].address + current[-1].width) > max_gap:
+                blocks.append(current)
+                current = []
+            current.append(f)
+        if current:
+            blocks.append(current)
+
+        plan = tuple(BlockDecoder(block, key_attr, rename) for block in blocks)
+        self._plans[cache_key] = plan
+        return plan
+
+    def block_decoder(self, group: str, **kwargs) -> BlockDecoder:
+        """Decodificador para un grupo que se lee en un único bloque."""
+        plan = self.read_plan(group, **kwargs)
+        if len(plan) != 1:
+            raise ValueError(f"El grupo '{group}' no es contiguo ({len(plan)} bloques)")
+        return plan[0]
+
+    # ==================== VISTAS DE COMPATIBILIDAD ====================
+
+    def legacy_register_map(self) -> Dict[int, Dict[str, Any]]:
+        """Mapa en el formato histórico de HUAWEI_REGISTER_MAP_REVISED."""
+        result = {}
+        for f in self.fields:
+            info = {"name": f.name, "factor": f.factor, "unit": f.unit, "certainty": f.certainty}
+            if not f.experimental:
+                info["json_field"] = f.key
+            if f.signed:
+                info["signed"] = True
+            if f.width == 2:
+                info["is_32bit"] = True
+            if f.transform == "sw_version":
+                info["decode_sw_version"] = True
+            if f.experimental:
+                info["experimental"] = True
+            if f.notes:
+                info["notes"] = f.notes
+            if f.bit_interpretation:
+                info["bit_interpretation"] = dict(f.bit_interpretation)
+            result[f.address] = info
+        return result
+
+    def legacy_cell_arrays(self) -> Dict[str, Dict[str, Any]]:
+        """Arrays en el formato histórico de CELL_ARRAYS."""
+        return {
+            a.key: {
+                "start_address": a.start_address,
+                "count": a.count,
+                "factor": a.factor,
+                "unit": a.unit,
+                "description": a.description,
+                "certainty": a.certainty,
+                "special_values": dict(a.sentinels)
+            }
+            for a in self.arrays.values()
+        }
+
+    def legacy_ascii_strings(self) -> Dict[str, Dict[str, Any]]:
+        """Cadenas en el formato histórico de ASCII_STRINGS."""
+        return {
+            s.key: {
+                "start_address": s.start_address,
+                "length": s.length,
+                "description": s.description,
+                "certainty": s.certainty
+            }
+            for s in self.strings.values()
+        }
+
+
+# Esquema compilado una sola vez al importar el módulo
+_schema = CompiledSchema(REGISTERS, CELL_ARRAYS, ASCII_STRINGS)
+
+
+def get_schema() -> CompiledSchema:
+    """Obtiene el esquema de registros compilado."""
+    return _schema
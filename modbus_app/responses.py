@@ -0,0 +1,177 @@
+# modbus_app/responses.py
+"""
+Capa de respuestas de la API: serialización JSON rápida y compresión.
+
+- Serialización: `jsonify` pasa por FastJSONProvider, que usa orjson si está
+  instalado (claves enteras y arrays NumPy incluidos) y recurre al codificador de
+  Flask para lo que orjson no admite.
+- Formato columnar (opcional, `?format=columnar`): las listas largas de objetos con
+  las mismas claves se envían como {"format": "columnar", "length": n,
+  "columns": {clave: [valores...]}}, sin repetir los nombres de clave en cada fila.
+- Compresión: las respuestas de texto/JSON por encima de `min_size_bytes` se
+  comprimen con brotli (si está instalado y el cliente lo acepta) o gzip. Las
+  respuestas en streaming y las ya codificadas no se tocan.
+"""
+
+import gzip
+import json
+import logging
+from typing import Any, Dict
+
+from flask import request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+from modbus_app import metrics
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger('modbus_app.responses')
+
+DEFAULT_SETTINGS = {
+    "compression": True,
+    "min_size_bytes": 1024,
+    "gzip_level": 6,
+    "brotli_quality": 4,
+    "columnar_min_rows": 8
+}
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                       | orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def dumps_bytes(obj: Any, default=None, ensure_ascii: bool = True) -> bytes:
+    """JSON compacto en bytes (orjson si está disponible)."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Enteros de más de 64 bits u otros tipos no admitidos
+            pass
+    return json.dumps(obj, default=default, ensure_ascii=ensure_ascii,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def to_columnar(value: Any, min_rows: int = DEFAULT_SETTINGS["columnar_min_rows"]) -> Any:
+    """Convierte (recursivamente) las listas de objetos en columnas."""
+    if isinstance(value, dict):
+        return {key: to_columnar(item, min_rows) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) >= min_rows and all(isinstance(row, dict) for row in value):
+            keys = {}
+            for row in value:
+                for key in row:
+                    keys.setdefault(key, None)
+            return {
+                "format": "columnar",
+                "length": len(value),
+                "columns": {key: [to_columnar(row.get(key), min_rows) for row in value] for key in keys}
+            }
+        return [to_columnar(item, min_rows) for item in value]
+    return value
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask con orjson y salida columnar opcional."""
+
+    columnar_min_rows = DEFAULT_SETTINGS["columnar_min_rows"]
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return dumps_bytes(obj, self.default, self.ensure_ascii)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if ORJSON_AVAILABLE and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                # NaN/Infinity y otras extensiones que acepta el módulo json
+                pass
+        return super().loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        if has_request_context() and request.args.get('format') == 'columnar':
+            obj = to_columnar(obj, self.columnar_min_rows)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def _accepted_encoding(accept_encoding) -> str:
+    if BROTLI_AVAILABLE and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response, settings: Dict[str, Any]):
+    """Comprime la respuesta si procede (after_request)."""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _accepted_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < settings["min_size_bytes"]:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=settings["brotli_quality"])
+    else:
+        compressed = gzip.compress(data, compresslevel=settings["gzip_level"], mtime=0)
+    metrics.http_response_bytes.inc('raw', amount=len(data))
+    metrics.http_response_bytes.inc(encoding, amount=len(compressed))
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    # El cuerpo ya no es el mismo byte a byte: el ETag pasa a ser débil
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_responses(app):
+    """Instala el proveedor JSON y la compresión de respuestas en la app."""
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        from modbus_app import config_manager
+        settings.update(config_manager.load_config().get("api_responses", {}))
+    except Exception as e:
+        logger.warning(f"No se pudo leer la configuración de respuestas: {str(e)}")
+
+    # También como clase: register_debug_routes deriva de ella su proveedor con trazas
+    FastJSONProvider.columnar_min_rows = settings["columnar_min_rows"]
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+    if settings["compression"]:
+        @app.after_request
+        def _compress_response(response):
+            return compress_response(response, settings)
+
+    logger.info(f"Respuestas API: orjson={'sí' if ORJSON_AVAILABLE else 'no'}, "
+                f"brotli={'sí' if BROTLI_AVAILABLE else 'no'}, compresión={settings['compression']}")
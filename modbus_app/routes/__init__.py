@@ -2,16 +2,31 @@
 
 def register_routes(app):
     """Register all application routes with the Flask app."""
+    # Proveedor JSON y compresión (su after_request se ejecuta el último)
+    from modbus_app.responses import init_responses
+    init_responses(app)
+    
     # Import routes
     from modbus_app.routes.auth_routes import register_auth_routes
     from modbus_app.routes.battery_routes import register_battery_routes 
     from modbus_app.routes.modbus_routes import register_modbus_routes
     from modbus_app.routes.device_routes import register_device_routes
     from modbus_app.routes.console_routes import register_console_routes
+    from modbus_app.routes.history_routes import register_history_routes
+    from modbus_app.routes.metrics_routes import register_metrics_routes
+    from modbus_app.routes.analytics_routes import register_analytics_routes
+    from modbus_app.routes.alarm_routes import register_alarm_routes
+    from modbus_app.routes.debug_routes import register_debug_routes
     
     # Register routes with the app
     register_auth_routes(app)
     register_battery_routes(app)
     register_modbus_routes(app)
     register_device_routes(app)
-    register_console_routes(app)
\ No newline at end of file
+    register_console_routes(app)
+    register_history_routes(app)
+    register_metrics_routes(app)
+    register_analytics_routes(app)
+    register_alarm_routes(app)
+    # Debe ir al final: envuelve las vistas ya registradas con spans de trazas
+    register_debug_routes(app)
\ No newline at end of file
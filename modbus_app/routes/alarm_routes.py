@@ -0,0 +1,77 @@
+# modbus_app/routes/alarm_routes.py
+from flask import request, jsonify
+from modbus_app.logger_config import get_logger
+
+# Obtener un logger para este módulo
+logger = get_logger('routes.alarms')
+
+
+def _disabled():
+    return jsonify({
+        "status": "error",
+        "message": "Alarmas deshabilitadas en configuración"
+    })
+
+
+def register_alarm_routes(app):
+    """Register alarm engine routes with the Flask app."""
+
+    @app.route('/api/alarms', methods=['GET'])
+    def get_alarms():
+        """Alarmas activas (opcionalmente de una batería), reglas compiladas y estadísticas."""
+        from modbus_app.alarms import get_alarm_engine
+        engine = get_alarm_engine()
+        if engine is None:
+            return _disabled()
+        status = engine.get_status()
+        status["active"] = engine.get_active(request.args.get('battery_id', type=int))
+        status["status"] = "success"
+        return jsonify(status)
+
+    @app.route('/api/alarms/events', methods=['GET'])
+    def get_alarm_events():
+        """
+        Flujo en vivo de eventos (raised/cleared).
+
+        Query params:
+            last_id: Último ID recibido; se devuelven solo los eventos posteriores
+        """
+        from modbus_app.alarms import get_alarm_engine
+        engine = get_alarm_engine()
+        if engine is None:
+            return _disabled()
+        events, last_id = engine.events.since(request.args.get('last_id', 0, type=int))
+        return jsonify({
+            "status": "success",
+            "events": events,
+            "last_id": last_id
+        })
+
+    @app.route('/api/alarms/history', methods=['GET'])
+    def get_alarm_history():
+        """
+        Eventos guardados en la base de datos.
+
+        Query params:
+            battery_id: Filtra por batería (opcional)
+            limit: Máximo de eventos (por defecto 100, máx. 5000)
+            active: true para solo alarmas sin despejar
+        """
+        from modbus_app.alarms import get_history
+        try:
+            events = get_history(
+                battery_id=request.args.get('battery_id', type=int),
+                limit=min(request.args.get('limit', 100, type=int), 5000),
+                active_only=request.args.get('active', 'false').lower() == 'true'
+            )
+        except Exception as e:
+            logger.error(f"Error consultando historial de alarmas: {str(e)}")
+            return jsonify({
+                "status": "error",
+                "message": f"Error consultando historial de alarmas: {str(e)}"
+            }), 500
+        return jsonify({
+            "status": "success",
+            "count": len(events),
+            "events": events
+        })
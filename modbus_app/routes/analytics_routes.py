@@ -0,0 +1,70 @@
+# modbus_app/routes/analytics_routes.py
+from flask import request, jsonify
+from modbus_app.logger_config import get_logger
+
+# Obtener un logger para este módulo
+logger = get_logger('routes.analytics')
+
+
+def register_analytics_routes(app):
+    """Register fleet analytics routes with the Flask app."""
+
+    @app.route('/api/analytics/cells', methods=['GET'])
+    def get_cell_analytics_api():
+        """
+        Analítica de celdas de la flota: dispersión por batería, z-scores frente a la
+        flota y al pack, deriva y ranking de celdas débiles.
+
+        Query params:
+            weak: Número de celdas del ranking (por defecto 10)
+            battery_id: Limita el detalle por batería a una batería
+        """
+        from modbus_app.cell_analytics import get_cell_analytics
+
+        try:
+            analytics = get_cell_analytics()
+            weak = request.args.get('weak', type=int)
+            result = dict(analytics.analyze(weak) if weak else analytics.get_result())
+        except Exception as e:
+            logger.error(f"Error calculando analítica de celdas: {str(e)}")
+            return jsonify({
+                "status": "error",
+                "message": f"Error calculando analítica de celdas: {str(e)}"
+            }), 500
+
+        battery_id = request.args.get('battery_id', type=int)
+        if battery_id is not None:
+            result["batteries"] = {battery_id: result["batteries"][battery_id]} \
+                if battery_id in result["batteries"] else {}
+            result["weak_cells"] = [cell for cell in result["weak_cells"] if cell["battery_id"] == battery_id]
+
+        result["status"] = "success"
+        return jsonify(result)
+
+    @app.route('/api/analytics/energy', methods=['GET'])
+    def get_energy_analytics():
+        """Ah/Wh de carga y descarga, ciclos equivalentes y control con 0x0044 de toda la flota."""
+        from modbus_app.energy_estimator import get_energy_estimator
+        estimator = get_energy_estimator()
+        if estimator is None:
+            return jsonify({
+                "status": "error",
+                "message": "Estimador de energía deshabilitado en configuración"
+            })
+        result = estimator.get_fleet()
+        result["status"] = "success"
+        return jsonify(result)
+
+    @app.route('/api/analytics/energy/<int:battery_id>', methods=['GET'])
+    def get_battery_energy_analytics(battery_id):
+        """Conteo de culombios de una batería."""
+        from modbus_app.energy_estimator import get_energy_estimator
+        estimator = get_energy_estimator()
+        report = estimator.get_battery(battery_id) if estimator else None
+        if report is None:
+            return jsonify({
+                "status": "error",
+                "message": f"Sin datos de energía para la batería {battery_id}"
+            })
+        report["status"] = "success"
+        return jsonify(report)
@@ -1,6 +1,5 @@
 # modbus_app/routes/auth_routes.py
 from flask import request, jsonify
-from modbus_app.battery_initializer import BatteryInitializer
 from modbus_app.authentication_status import (
     format_all_batteries_status_for_api,
     format_battery_status_for_api,
@@ -65,6 +64,7 @@ def register_auth_routes(app):
         """Endpoint to retry initialization of a specific battery."""
         try:
             # Verify that the initializer exists
+            from modbus_app.battery_initializer import BatteryInitializer
             initializer = BatteryInitializer.get_instance()
             
             # Retry initialization
@@ -106,6 +106,7 @@ def register_auth_routes(app):
        
         try:
             # Create initializer instance
+            from modbus_app.battery_initializer import BatteryInitializer
             initializer = BatteryInitializer(
                 port=port, 
                 baudrate=baudrate, 
@@ -140,6 +141,7 @@ def register_auth_routes(app):
     def low_level_disconnect_api():
         """Endpoint to disconnect direct serial communication."""
         try:
+            from modbus_app.battery_initializer import BatteryInitializer
             initializer = BatteryInitializer.get_instance()
             if initializer.disconnect():
                 return jsonify({
@@ -162,6 +164,7 @@ def register_auth_routes(app):
         """Endpoint to initialize all configured batteries."""
         try:
             # Verify we have an initializer instance
+            from modbus_app.battery_initializer import BatteryInitializer
             initializer = BatteryInitializer.get_instance()
             
             # Get available battery IDs
@@ -228,6 +231,7 @@ def register_auth_routes(app):
         """Endpoint to verify low-level connection status."""
         try:
             # Try to get initializer instance
+            from modbus_app.battery_initializer import BatteryInitializer
             initializer = BatteryInitializer.get_instance()
             
             # Check if it exists and is connected
@@ -259,6 +263,7 @@ def register_auth_routes(app):
         """
         try:
             # Verify that the initializer exists
+            from modbus_app.battery_initializer import BatteryInitializer
             initializer = BatteryInitializer.get_instance()
             
             # Retry initialization
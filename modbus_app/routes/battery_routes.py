@@ -1,6 +1,5 @@
 # modbus_app/routes/battery_routes.py
-from flask import request, jsonify
-import time
+from flask import request, jsonify, Response
 from modbus_app.battery_monitor import BatteryMonitor
 from modbus_app.authentication_status import all_batteries_authenticated, get_failed_batteries
 from modbus_app.routes.device_routes import verify_authentication_complete
@@ -91,10 +90,17 @@ def register_battery_routes(app):
                 "status": "error",
                 "message": f"Error obteniendo información de base de datos: {str(e)}"
             })
-    @app.route('/api/batteries/history/create_backup', methods=['POST'])
+    @app.route('/api/batteries/history/create_backup', methods=['GET', 'POST'])
     def create_database_backup():
         """
         Endpoint para crear backup de la base de datos.
+        
+        POST body (opcional):
+            backup_name: Nombre del archivo
+            mode: full | incremental | differential
+            compress: true | false
+            wait: true espera a que termine; false (por defecto) responde al iniciar
+        GET: progreso del backup en curso y backups registrados.
         """
         # Verificar autenticación
         auth_error = verify_authentication_complete()
@@ -102,18 +108,70 @@ def register_battery_routes(app):
             return jsonify(auth_error)
         
         try:
-            data = request.json or {}
+            if request.method == 'GET':
+                from modbus_app.history.management import get_backup_status
+                return jsonify(get_backup_status())
+            
+            data = request.get_json(silent=True) or {}
             backup_name = data.get('backup_name', None)
             
             from modbus_app.history.management import create_backup
-            result = create_backup(backup_name)
+            result = create_backup(
+                backup_name,
+                mode=data.get('mode', 'full'),
+                compress=data.get('compress'),
+                wait=bool(data.get('wait', False))
+            )
             return jsonify(result)
             
         except Exception as e:
             return jsonify({
                 "status": "error",
                 "message": f"Error creando backup: {str(e)}"
-            })        
+            })
+    @app.route('/api/batteries/history/export', methods=['GET'])
+    def export_history():
+        """
+        Endpoint para exportar el historial en streaming (descarga por bloques).
+
+        Query params:
+            battery_id: ID o lista separada por comas (opcional, por defecto todas)
+            start, end: Fechas ISO (opcional)
+            resolution: raw | 15min | 1h | 1d
+            format: csv | parquet | arrow
+            include_cells: true para añadir columnas por celda (solo raw)
+        """
+        from datetime import datetime
+        from flask import Response, stream_with_context
+        from modbus_app.history.database import get_db
+        from modbus_app.history.export import HistoryExporter, ExportError
+
+        try:
+            battery_param = request.args.get('battery_id', '')
+            battery_ids = [int(b) for b in battery_param.split(',') if b.strip()]
+            start = request.args.get('start')
+            end = request.args.get('end')
+            exporter = HistoryExporter(
+                get_db(),
+                battery_ids=battery_ids,
+                start_date=datetime.fromisoformat(start) if start else None,
+                end_date=datetime.fromisoformat(end) if end else None,
+                resolution=request.args.get('resolution', 'raw'),
+                file_format=request.args.get('format', 'csv'),
+                include_cells=request.args.get('include_cells', 'false').lower() == 'true'
+            )
+        except (ExportError, ValueError) as e:
+            return jsonify({
+                "status": "error",
+                "message": f"Parámetros de exportación inválidos: {str(e)}"
+            }), 400
+
+        return Response(
+            stream_with_context(exporter.stream()),
+            mimetype=exporter.mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{exporter.suggested_filename()}"'}
+        )
+
     @app.route('/api/batteries', methods=['GET'])
     def list_batteries_api():
         """Endpoint to get configured available batteries."""
@@ -218,6 +276,16 @@ def register_battery_routes(app):
                 "batteries": []
             })
         
+        # Durante el polling se sirve la instantánea precalculada (sin lock ni serialización)
+        from modbus_app.fleet_snapshot import get_snapshot_publisher
+        snapshot = get_snapshot_publisher().current
+        if snapshot is not None and battery_monitor.polling_active:
+            response = Response(snapshot.body, mimetype='application/json')
+            response.set_etag(snapshot.etag)
+            response.headers['X-Snapshot-Version'] = str(snapshot.version)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+        
         # Get battery status
         battery_status = battery_monitor.get_all_battery_status()
         
@@ -280,8 +348,33 @@ def register_battery_routes(app):
             
             # Add device_info to battery object
             result["battery_data"]["device_info"] = device_info
-        
+
         return jsonify(result)
+
+    @app.route('/api/batteries/<int:battery_id>/recent', methods=['GET'])
+    def get_battery_recent(battery_id):
+        """
+        Lecturas recientes a resolución de polling, servidas desde memoria.
+
+        Query params:
+            fields: Métricas separadas por comas (por defecto todas)
+            seconds: Ventana en segundos (por defecto la ventana retenida completa)
+            stats_only: Si es true, solo min/max/media/último por métrica
+        """
+        from modbus_app.recent_series import recent_to_json
+        fields_param = request.args.get('fields')
+        fields = [f.strip() for f in fields_param.split(',') if f.strip()] if fields_param else None
+        result = battery_monitor.get_recent_series(
+            battery_id,
+            fields=fields,
+            seconds=request.args.get('seconds', type=float)
+        )
+        if result["status"] != "success":
+            return jsonify(result), 400
+        if request.args.get('stats_only', 'false').lower() == 'true':
+            result.pop("series")
+            return jsonify(result)
+        return jsonify(recent_to_json(result))
         
     @app.route('/api/batteries/load_detailed_info', methods=['POST'])
     def load_batteries_detailed_info():
@@ -380,130 +473,14 @@ def register_battery_routes(app):
             })
         
         try:
-            from modbus_app.operations import execute_read_operation
-            
-            result = {
-                "status": "success",
-                "battery_id": battery_id,
-                "timestamp": time.time(),
-                "basic_data": {},
-                "cell_data": {},
-                "summary": {
-                    "total_operations": 0,
-                    "successful_operations": 0,
-                    "failed_operations": 0
-                }
-            }
-            
-            # ========== 1. LEER REGISTROS BÁSICOS NECESARIOS (1 OPERACIÓN) ==========
-            print(f"Leyendo registros básicos para batería {battery_id}...")
-            
-            # Leer registros 0x0000-0x0006 + 0x010F en operaciones agrupadas
-            basic_result = execute_read_operation(battery_id, 'holding', 0x0000, 7)
-            cell_count_result = execute_read_operation(battery_id, 'holding', 0x010F, 1)
-            
-            result["summary"]["total_operations"] += 2
-            
-            if basic_result.get("status") == "success":
-                data = basic_result["data"]
-                result["basic_data"] = {
-                    "battery_voltage": data[0] * 0.01 if len(data) > 0 else None,
-                    "pack_voltage": data[1] * 0.01 if len(data) > 1 else None, 
-                    "current": _convert_signed_current(data[2]) if len(data) > 2 else None,
-                    "soc": data[3] if len(data) > 3 else None,
-                    "soh": data[4] if len(data) > 4 else None,
-                    "max_cell_temp": data[5] if len(data) > 5 else None,
-                    "min_cell_temp": data[6] if len(data) > 6 else None
-                }
-                result["summary"]["successful_operations"] += 1
-            else:
-                result["summary"]["failed_operations"] += 1
-                
-            if cell_count_result.get("status") == "success":
-                result["basic_data"]["cell_count"] = cell_count_result["data"][0]
-                result["summary"]["successful_operations"] += 1
-            else:
-                result["basic_data"]["cell_count"] = 16  # Valor por defecto
-                result["summary"]["failed_operations"] += 1
+            from modbus_app.operations import read_cells_data
+            result = read_cells_data(battery_id)
             
-            # ========== 2. LEER DATOS DE CELDAS (4 OPERACIONES) ==========
-            print(f"Leyendo datos de celdas para batería {battery_id}...")
+            # Matriz de la flota para /api/analytics/cells
+            if any(block.get("success") for block in result["cell_data"].values()):
+                from modbus_app.cell_analytics import get_cell_analytics
+                get_cell_analytics().update_from_cells(battery_id, result["cell_data"], result["timestamp"])
             
-            # Arrays de celdas definidos para lectura rápida
-            cell_arrays = {
-                "cell_voltages_block1": {"start": 0x0022, "count": 16, "factor": 0.001, "unit": "V"},
-                "cell_voltages_block2": {"start": 0x0310, "count": 8, "factor": 0.001, "unit": "V"},
-                "cell_temperatures_block1": {"start": 0x0012, "count": 16, "factor": 1, "unit": "°C"},
-                "cell_temperatures_block2": {"start": 0x0300, "count": 8, "factor": 1, "unit": "°C"}
-            }
-            
-            for array_name, array_config in cell_arrays.items():
-                array_result = execute_read_operation(
-                    battery_id, 'holding', 
-                    array_config["start"], 
-                    array_config["count"]
-                )
-                
-                result["summary"]["total_operations"] += 1
-                
-                if array_result.get("status") == "success":
-                    # Procesar datos del array
-                    processed_cells = []
-                    raw_data = array_result["data"]
-                    
-                    for i, raw_value in enumerate(raw_data):
-                        cell_number = i + 1
-                        if "block2" in array_name:
-                            cell_number += 16
-                        
-                        # Detectar valores especiales
-                        if array_config["unit"] == "V" and raw_value == 0xFFFF:
-                            status = "DISCONNECTED"
-                            processed_value = None
-                        elif array_config["unit"] == "°C" and raw_value in [0xFC19, 0x7FFF]:
-                            status = "DISCONNECTED" 
-                            processed_value = None
-                        else:
-                            status = "OK"
-                            processed_value = raw_value * array_config["factor"]
-                        
-                        processed_cells.append({
-                            "cell_number": cell_number,
-                            "raw_value": raw_value,
-                            "processed_value": processed_value,
-                            "status": status
-                        })
-                    
-                    result["cell_data"][array_name] = {
-                        "success": True,
-                        "start_address": f"0x{array_config['start']:04X}",
-                        "count": array_config["count"],
-                        "unit": array_config["unit"],
-                        "factor": array_config["factor"],
-                        "cells": processed_cells
-                    }
-                    
-                    result["summary"]["successful_operations"] += 1
-                    
-                else:
-                    result["cell_data"][array_name] = {
-                        "success": False,
-                        "error": array_result.get("message", "Error desconocido")
-                    }
-                    result["summary"]["failed_operations"] += 1
-            
-            # ========== 3. DETERMINAR ESTADO FINAL ==========
-            if result["summary"]["failed_operations"] == 0:
-                result["status"] = "success"
-                result["message"] = f"Datos de celdas leídos exitosamente ({result['summary']['total_operations']} operaciones)"
-            elif result["summary"]["successful_operations"] > 0:
-                result["status"] = "partial"
-                result["message"] = f"Datos parciales: {result['summary']['successful_operations']}/{result['summary']['total_operations']} operaciones exitosas"
-            else:
-                result["status"] = "error"
-                result["message"] = "No se pudieron leer los datos de celdas"
-            
-            print(f"Lectura de celdas completada: {result['message']}")
             return jsonify(result)
             
         except Exception as e:
@@ -511,9 +488,3 @@ def register_battery_routes(app):
                 "status": "error",
                 "message": f"Error al leer datos de celdas: {str(e)}"
             })
-
-    def _convert_signed_current(raw_current):
-        """Convierte corriente raw a valor con signo."""
-        if raw_current > 32767:
-            return (raw_current - 65536) * 0.01
-        return raw_current * 0.01
\ No newline at end of file
@@ -16,7 +16,7 @@ def register_console_routes(app):
         from app import console_messages
 
         # Registrar la solicitud en el log
-        logger.debug(f"Solicitud de mensajes de consola recibida. Params: {request.args}")
+        logger.debug("Solicitud de mensajes de consola recibida. Params: %s", request.args)
 
         # Get only new messages from last_id
         last_id = request.args.get('last_id', '0')
@@ -26,14 +26,14 @@ def register_console_routes(app):
             last_id = 0
             logger.warning(f"Valor inválido para last_id: {request.args.get('last_id')}, usando 0")
         
-        # Return the most recent messages with their IDs
-        messages = list(console_messages)[last_id:]
+        # Return the messages newer than last_id (IDs keep growing after the buffer wraps)
+        messages, new_last_id = console_messages.since(last_id)
         
         # Log informativo sobre el número de mensajes enviados
         if messages:
-            logger.debug(f"Enviando {len(messages)} mensajes, desde ID {last_id} hasta {last_id + len(messages)}")
+            logger.debug("Enviando %d mensajes, desde ID %d hasta %d", len(messages), last_id, new_last_id)
         
         return jsonify({
             "messages": messages,
-            "last_id": last_id + len(messages)
+            "last_id": new_last_id
         })
\ No newline at end of file
@@ -0,0 +1,89 @@
+# modbus_app/routes/debug_routes.py
+import functools
+from flask import request, jsonify, g
+from modbus_app.tracing import get_tracer, span
+from modbus_app.config_manager import load_config
+from modbus_app.logger_config import get_logger
+
+# Obtener un logger para este módulo
+logger = get_logger('routes.debug')
+
+
+def _traced_view(view):
+    """Envuelve una vista en el span del handler."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with span("route.handler", endpoint=request.endpoint):
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def register_debug_routes(app):
+    """
+    Register request tracing and the /api/debug/traces endpoint.
+    Must be called after all other routes so their views get wrapped.
+    """
+    tracer = get_tracer()
+    try:
+        tracer.configure(load_config().get("tracing", {}))
+    except Exception as e:
+        logger.warning(f"No se pudo leer la configuración de trazas: {str(e)}")
+
+    # Spans del handler en todas las vistas registradas
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != 'static':
+            app.view_functions[endpoint] = _traced_view(view)
+
+    # Span de codificación JSON en jsonify()
+    base_provider = app.json_provider_class
+
+    class TracedJSONProvider(base_provider):
+        def dumps(self, obj, **kwargs):
+            with span("json.encode"):
+                return super().dumps(obj, **kwargs)
+
+        if hasattr(base_provider, "dumps_bytes"):
+            # jsonify() con FastJSONProvider serializa directamente a bytes
+            def dumps_bytes(self, obj):
+                with span("json.encode"):
+                    return super().dumps_bytes(obj)
+
+    app.json_provider_class = TracedJSONProvider
+    app.json = TracedJSONProvider(app)
+
+    @app.before_request
+    def _start_trace():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g.trace_token = tracer.start_trace(f"{request.method} {rule}")
+
+    @app.after_request
+    def _record_status(response):
+        g.trace_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc):
+        token = g.pop('trace_token', None)
+        if token is not None:
+            tracer.finish_trace(token, status=g.pop('trace_status', 500))
+
+    @app.route('/api/debug/startup', methods=['GET'])
+    def get_debug_startup():
+        """Fases de arranque y estado del calentamiento en segundo plano."""
+        from modbus_app.startup import get_startup_report
+        return jsonify({
+            "status": "success",
+            "startup": get_startup_report()
+        })
+
+    @app.route('/api/debug/traces', methods=['GET'])
+    def get_debug_traces():
+        """Trazas recientes (lentas y muestreadas) con desglose por span."""
+        limit = request.args.get('limit', 20, type=int)
+        min_ms = request.args.get('min_ms', 0.0, type=float)
+        name_filter = request.args.get('name')
+        return jsonify({
+            "status": "success",
+            "tracer": tracer.get_status(),
+            "traces": tracer.get_traces(limit=limit, min_duration_ms=min_ms, name_filter=name_filter)
+        })
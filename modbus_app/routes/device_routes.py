@@ -1,7 +1,6 @@
 # modbus_app/routes/device_routes.py
 from flask import request, jsonify
 from modbus_app.authentication_status import all_batteries_authenticated, get_failed_batteries
-from modbus_app import operations
 
 def is_client_connected():
     """Verifica si hay conexión activa."""
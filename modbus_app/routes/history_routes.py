@@ -0,0 +1,110 @@
+# modbus_app/routes/history_routes.py
+from datetime import datetime
+from flask import request, jsonify, Response
+from modbus_app.logger_config import get_logger
+
+# Obtener un logger para este módulo
+logger = get_logger('routes.history')
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def register_history_routes(app):
+    """Register history query routes with the Flask app."""
+
+    @app.route('/api/history/<int:battery_id>', methods=['GET'])
+    def query_battery_history(battery_id):
+        """
+        Consulta columnar del historial de una batería.
+
+        Query params:
+            fields: Columnas separadas por comas (por defecto soc,pack_voltage,battery_current)
+            start, end: Fechas ISO (opcional)
+            limit: Registros por página (máx. 20000)
+            cursor: Cursor devuelto en next_cursor de la página anterior
+            order: asc | desc
+            format: json | binary
+            points: Si se indica, devuelve cada serie del rango completo reducida a
+                ese número de puntos (sin paginación)
+            method: lttb | minmax (con points)
+        """
+        from modbus_app.history.query import (get_history_query, to_binary, downsampled_to_json,
+                                              downsampled_to_binary, QueryError, BINARY_MIMETYPE)
+
+        try:
+            fields_param = request.args.get('fields')
+            fields = [f.strip() for f in fields_param.split(',') if f.strip()] if fields_param else None
+            points = request.args.get('points', type=int)
+            if points:
+                result = get_history_query().fetch_downsampled(
+                    battery_id,
+                    fields=fields,
+                    start=_parse_datetime(request.args.get('start')),
+                    end=_parse_datetime(request.args.get('end')),
+                    points=points,
+                    method=request.args.get('method', 'lttb')
+                )
+                if request.args.get('format') == 'binary':
+                    return Response(downsampled_to_binary(result), mimetype=BINARY_MIMETYPE)
+                result = downsampled_to_json(result)
+                result["status"] = "success"
+                return jsonify(result)
+
+            page = get_history_query().fetch(
+                battery_id,
+                fields=fields,
+                start=_parse_datetime(request.args.get('start')),
+                end=_parse_datetime(request.args.get('end')),
+                limit=request.args.get('limit', 1000, type=int),
+                cursor=request.args.get('cursor'),
+                order=request.args.get('order', 'asc')
+            )
+        except (QueryError, ValueError) as e:
+            return jsonify({
+                "status": "error",
+                "message": f"Parámetros de consulta inválidos: {str(e)}"
+            }), 400
+        except Exception as e:
+            logger.error(f"Error consultando historial de batería {battery_id}: {str(e)}")
+            return jsonify({
+                "status": "error",
+                "message": f"Error consultando historial: {str(e)}"
+            }), 500
+
+        if request.args.get('format') == 'binary':
+            return Response(to_binary(page), mimetype=BINARY_MIMETYPE)
+
+        page["status"] = "success"
+        return jsonify(page)
+
+    @app.route('/api/history/fields', methods=['GET'])
+    def get_history_fields():
+        """Columnas disponibles para proyección."""
+        from modbus_app.history.query import get_history_query
+        return jsonify({
+            "status": "success",
+            "fields": get_history_query().available_fields()
+        })
+
+    @app.route('/api/history/retention', methods=['GET'])
+    def get_retention_status():
+        """Política de retención, estado del planificador y último informe."""
+        from modbus_app.history.retention import get_retention_engine
+        status = get_retention_engine().get_status()
+        status["status"] = "success"
+        return jsonify(status)
+
+    @app.route('/api/history/retention/run', methods=['POST'])
+    def run_retention():
+        """Aplica la retención inmediatamente y devuelve el informe (espacio recuperado incluido)."""
+        from modbus_app.history.retention import get_retention_engine
+        engine = get_retention_engine()
+        if engine.running:
+            return jsonify({
+                "status": "error",
+                "message": "La retención ya se está ejecutando"
+            }), 409
+        report = engine.run_once()
+        return jsonify(report), 200 if report.get("status") == "success" else 500
@@ -0,0 +1,51 @@
+# modbus_app/routes/metrics_routes.py
+import time
+from flask import request, g, Response
+from modbus_app import metrics
+from modbus_app.logger_config import get_logger
+
+# Obtener un logger para este módulo
+logger = get_logger('routes.metrics')
+
+
+def _arbiter_status():
+    """Estado del árbitro del bus del cliente activo (o None si no hay cliente)."""
+    from modbus_app.client import get_client
+    client = get_client()
+    arbiter = getattr(client, 'arbiter', None)
+    return arbiter.get_status() if arbiter else None
+
+
+def _arbiter_metric(field):
+    def collect():
+        status = _arbiter_status()
+        if not status:
+            return {}
+        return {(priority,): values[field] for priority, values in status["classes"].items()}
+    return collect
+
+
+def register_metrics_routes(app):
+    """Register the Prometheus metrics endpoint and HTTP latency instrumentation."""
+
+    metrics.bus_arbiter_queue.set_function(_arbiter_metric("queue_depth"))
+    metrics.bus_arbiter_wait.set_function(_arbiter_metric("avg_wait"))
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request_latency(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            # Etiquetar por regla de URL (no por ruta concreta) para acotar la cardinalidad
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.http_latency.observe(time.perf_counter() - start,
+                                         endpoint, request.method, response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Métricas en formato de texto Prometheus."""
+        return Response(metrics.REGISTRY.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
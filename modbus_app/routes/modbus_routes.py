@@ -1,7 +1,6 @@
 # modbus_app/routes/modbus_routes.py
 from flask import request, jsonify
 from modbus_app.authentication_status import all_batteries_authenticated, get_failed_batteries
-from modbus_app import operations
 import sys
 
 def log_stdout(message):
@@ -45,6 +44,7 @@ def register_modbus_routes(app):
        address = int(data.get('address', 0))
        count = int(data.get('count', 1))
 
+       from modbus_app import operations
        result = operations.execute_read_operation(slave_id, function, address, count)
        return jsonify(result)
 
@@ -62,6 +62,7 @@ def register_modbus_routes(app):
        address = int(data.get('address', 0))
        values = data.get('values')  # Operation function handles validation
 
+       from modbus_app import operations
        result = operations.execute_write_operation(slave_id, function, address, values)
        return jsonify(result)
        
@@ -90,6 +91,7 @@ def register_modbus_routes(app):
        print(f"Starting verification for device {slave_id}")
        
        # Execute verification function (prints results to console)
+       from modbus_app import operations
        result = operations.verify_battery_cell_data(slave_id)
        
        # Return simplified data (full detail is in the console)
@@ -0,0 +1,366 @@
+# modbus_app/serving.py
+"""
+Servidor de producción con un único propietario del bus serie.
+
+Modelo de procesos:
+- Proceso de adquisición (propietario): el único que importa `app`, construye el
+  BatteryMonitor y abre el puerto COM. No atiende HTTP cuando hay workers; expone un
+  canal IPC local (multiprocessing.connection, solo 127.0.0.1 y con authkey).
+- Workers HTTP (procesos, `workers` > 1): comparten el socket de escucha y atienden
+  las peticiones con hilos. La instantánea de la flota (/api/batteries/status) se sirve
+  desde memoria del worker, pidiendo al propietario solo los bytes de versiones nuevas;
+  el resto de /api/* se reenvía por el canal al propietario, que ejecuta la vista
+  original. La serialización final, la compresión y los ficheros estáticos se
+  reparten entre los workers.
+
+Con `workers` = 1 el propio proceso de adquisición sirve HTTP con hilos.
+En ambos casos se usa waitress si está instalado y, si no, el servidor con hilos de
+Werkzeug (sin depuración ni recargador).
+"""
+
+import os
+import socket
+import threading
+import logging
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger('modbus_app.serving')
+
+DEFAULT_SETTINGS = {
+    "host": "0.0.0.0",
+    "port": 5000,
+    "threads": 8,
+    "workers": 1
+}
+
+# Cabeceras que no se reenvían entre worker y propietario
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length",
+               "content-encoding", "accept-encoding", "upgrade", "te", "trailer"}
+
+# Tamaño al que se agrupan los fragmentos de una respuesta reenviada
+STREAM_CHUNK_BYTES = 64 * 1024
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        from modbus_app import config_manager
+        settings.update(config_manager.load_config().get("server", {}))
+    except Exception as e:
+        logger.warning(f"No se pudo leer la configuración del servidor: {str(e)}")
+    return settings
+
+
+# ==================== CANAL IPC (PROPIETARIO) ====================
+
+class StateServer:
+    """Canal local por el que los workers consultan al proceso propietario del bus."""
+
+    def __init__(self, app, monitor, address: Tuple[str, int] = ('127.0.0.1', 0), authkey: bytes = None):
+        self.app = app
+        self.monitor = monitor
+        self.authkey = authkey or os.urandom(32)
+        self._listener = Listener(address, authkey=self.authkey)
+        self.address = self._listener.address
+        self._running = False
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True, name="StateServer").start()
+        logger.info(f"Canal de estado escuchando en {self.address[0]}:{self.address[1]}")
+
+    def stop(self):
+        self._running = False
+        try:
+            self._listener.close()
+        except OSError:
+            pass
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._running:
+                    logger.warning(f"Conexión rechazada en el canal de estado: {str(e)}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while self._running:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                replies = self.handle(message)
+                try:
+                    for reply in replies:
+                        conn.send(reply)
+                except (EOFError, OSError):
+                    # Worker caído o respuesta abandonada a medias
+                    return
+                finally:
+                    replies.close()
+
+    def handle(self, message):
+        """Respuestas a un mensaje del canal (varias para las peticiones reenviadas)."""
+        kind = message[0]
+        try:
+            if kind == "snapshot":
+                yield self._snapshot(message[1])
+            elif kind == "request":
+                yield from self._request(*message[1:])
+            else:
+                yield ("error", f"Mensaje desconocido: {kind}")
+        except Exception as e:
+            logger.error(f"Error atendiendo el canal de estado: {str(e)}")
+            yield ("error", str(e))
+
+    def _snapshot(self, known_version: Optional[int]):
+        from modbus_app.client import is_client_connected
+        from modbus_app.fleet_snapshot import get_snapshot_publisher
+        snapshot = get_snapshot_publisher().current
+        if snapshot is None or not self.monitor.polling_active or not is_client_connected():
+            return ("unavailable",)
+        if snapshot.version == known_version:
+            return ("not_modified", snapshot.version)
+        return ("snapshot", snapshot.version, snapshot.etag, snapshot.body)
+
+    def _request(self, method: str, path: str, query_string: bytes, headers, body: bytes, remote_addr: str):
+        """
+        Ejecuta una petición reenviada sobre la app original. La respuesta viaja en
+        varios mensajes: ("response", estado, cabeceras), ("chunk", bytes)... y ("end",),
+        de modo que las respuestas en streaming (exportación CSV) no se cargan enteras
+        en memoria. Los fragmentos pequeños se agrupan hasta STREAM_CHUNK_BYTES.
+        """
+        from werkzeug.test import EnvironBuilder, run_wsgi_app
+        builder = EnvironBuilder(path=path, method=method, query_string=query_string,
+                                 headers=headers, data=body,
+                                 environ_base={"REMOTE_ADDR": remote_addr})
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        app_iter, status, response_headers = run_wsgi_app(self.app, environ, buffered=False)
+        try:
+            yield ("response", status, [(k, v) for k, v in response_headers.items()
+                                        if k.lower() not in HOP_HEADERS])
+            pending, size = [], 0
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+                pending.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_CHUNK_BYTES:
+                    yield ("chunk", b"".join(pending))
+                    pending, size = [], 0
+            if pending:
+                yield ("chunk", b"".join(pending))
+            yield ("end",)
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+
+# ==================== CANAL IPC (WORKERS) ====================
+
+class StateClient:
+    """Conexión al propietario, una por hilo del worker."""
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def call(self, message):
+        for attempt in (0, 1):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = Client(self.address, authkey=self.authkey)
+            try:
+                conn.send(message)
+                return conn.recv()
+            except (EOFError, OSError):
+                # Propietario reiniciado o conexión cerrada: un reintento con conexión nueva
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def stream(self, message) -> Iterator[tuple]:
+        """
+        Respuestas de una petición reenviada, de ("response", ...) a ("end",) o
+        ("error", ...). La conexión del hilo queda ocupada hasta consumirlas; si se
+        abandonan a medias (cliente HTTP desconectado) se descarta.
+        """
+        reply = self.call(message)
+        finished = reply[0] != "response"
+        try:
+            yield reply
+            while not finished:
+                reply = self._local.conn.recv()
+                finished = reply[0] in ("end", "error")
+                yield reply
+        finally:
+            if not finished:
+                self._discard()
+
+    def _discard(self):
+        conn, self._local.conn = getattr(self._local, "conn", None), None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+def create_worker_app(address: Tuple[str, int], authkey: bytes):
+    """App Flask de un worker HTTP: estado desde memoria y el resto reenviado al propietario."""
+    from flask import Flask, Response, request, render_template
+    from modbus_app.responses import init_responses
+
+    app = Flask("app", root_path=PROJECT_ROOT)
+    init_responses(app)
+    channel = StateClient(address, authkey)
+    cached = {"version": None, "etag": None, "body": None}
+    cached_lock = threading.Lock()
+
+    def forward():
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_HEADERS]
+        replies = channel.stream(("request", request.method, request.path, request.query_string,
+                                  headers, request.get_data(), request.remote_addr or ""))
+        reply = next(replies)
+        if reply[0] != "response":
+            return Response(f"Error en el proceso de adquisición: {reply[1]}", status=502)
+        _, status, response_headers = reply
+
+        # Un solo fragmento: respuesta normal (puede comprimirse en el worker)
+        first = next(replies)
+        second = next(replies) if first[0] == "chunk" else first
+        if "error" in (first[0], second[0]):
+            replies.close()
+            error = first if first[0] == "error" else second
+            return Response(f"Error en el proceso de adquisición: {error[1]}", status=502)
+        if first[0] == "end":
+            return Response(b"", status=status, headers=response_headers)
+        if second[0] == "end":
+            return Response(first[1], status=status, headers=response_headers)
+
+        def body():
+            try:
+                yield first[1]
+                yield second[1]
+                for reply in replies:
+                    if reply[0] == "chunk":
+                        yield reply[1]
+                    elif reply[0] == "error":
+                        logger.error(f"Respuesta de {request_path} interrumpida: {reply[1]}")
+            finally:
+                replies.close()
+
+        request_path = request.path
+        return Response(body(), status=status, headers=response_headers)
+
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    @app.route('/api/batteries/status', methods=['GET'])
+    def fleet_status():
+        reply = channel.call(("snapshot", cached["version"]))
+        if reply[0] == "snapshot":
+            with cached_lock:
+                _, cached["version"], cached["etag"], cached["body"] = reply
+        elif reply[0] != "not_modified":
+            # Sin polling o sin conexión: la vista original decide la respuesta
+            return forward()
+        with cached_lock:
+            version, etag, body = cached["version"], cached["etag"], cached["body"]
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['X-Snapshot-Version'] = str(version)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+    @app.route('/metrics', methods=['GET'])
+    @app.route('/api/<path:path>', methods=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
+    def proxy(path=None):
+        return forward()
+
+    return app
+
+
+# ==================== ARRANQUE ====================
+
+def run_http(app, host: str, port: int, threads: int, sock: socket.socket = None):
+    """Sirve `app` con waitress si está disponible o con el servidor con hilos de Werkzeug."""
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+
+    if waitress_serve is not None:
+        if sock is not None:
+            waitress_serve(app, sockets=[sock], threads=threads)
+        else:
+            waitress_serve(app, host=host, port=port, threads=threads)
+        return
+
+    from werkzeug.serving import make_server
+    server = make_server(host, port, app, threaded=True,
+                         fd=sock.fileno() if sock is not None else None)
+    server.serve_forever()
+
+
+def _worker_main(sock, address, authkey, host, port, threads):
+    """Punto de entrada de un proceso worker."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [worker %(process)d] %(levelname)s %(message)s")
+    app = create_worker_app(address, authkey)
+    run_http(app, host, port, threads, sock)
+
+
+def serve(app, monitor, settings: Dict[str, Any] = None):
+    """
+    Arranca el servidor de producción en el proceso actual, que queda como propietario
+    del bus. Bloquea hasta que se interrumpe.
+    """
+    settings = dict(load_settings(), **(settings or {}))
+    host, port = settings["host"], int(settings["port"])
+    threads, workers = int(settings["threads"]), int(settings["workers"])
+
+    if workers <= 1:
+        logger.info(f"Servidor en {host}:{port} ({threads} hilos, proceso único)")
+        run_http(app, host, port, threads)
+        return
+
+    state_server = StateServer(app, monitor)
+    state_server.start()
+
+    # Socket de escucha compartido por todos los workers
+    sock = socket.create_server((host, port), backlog=128)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_worker_main, name=f"http-worker-{i}", daemon=True,
+                        args=(sock, state_server.address, state_server.authkey, host, port, threads))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Servidor en {host}:{port} ({workers} workers x {threads} hilos); "
+                f"bus en el proceso {os.getpid()}")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        state_server.stop()
+        sock.close()
@@ -0,0 +1,359 @@
+# modbus_app/shared_state.py
+"""
+Segmento de memoria compartida con el estado en vivo de la flota.
+
+El proceso de adquisición escribe en cada ciclo de polling un bloque de tamaño fijo
+(multiprocessing.shared_memory) que cualquier proceso puede leer sin locks ni IPC:
+workers HTTP, herramientas de línea de comandos o exportadores.
+
+Disposición (little-endian, ver HEADER_DTYPE y battery_dtype):
+- Cabecera: magic, versión de la disposición, contador de secuencia (seqlock),
+  capacidad (baterías y celdas), número de baterías escritas, PID del escritor y
+  hora de escritura.
+- Un registro por batería: id, flags, estado, lecturas básicas y los arrays de
+  tensiones y temperaturas de celda (NaN = sin dato).
+
+Seqlock: el escritor pone la secuencia en impar, copia los registros y la deja en
+par. El lector toma la secuencia (par), copia y la vuelve a leer; si cambió, repite.
+
+Uso desde otro proceso:
+    reader = SharedStateReader()
+    state = reader.read()            # copia coherente
+    view = reader.records()          # vista NumPy sin copia (comprobar con reader.stable)
+
+    python -m modbus_app.shared_state   # volcado por consola
+"""
+
+import atexit
+import os
+import sys
+import time
+import threading
+import logging
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger('modbus_app.shared_state')
+
+MAGIC = 0x48424D53  # "HBMS"
+LAYOUT_VERSION = 2
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "name": "huawei_bms_state",
+    "max_batteries": 32,
+    "max_cells": 32
+}
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("layout_version", "<u4"),
+    ("sequence", "<u8"),
+    ("max_batteries", "<u4"),
+    ("max_cells", "<u4"),
+    ("battery_count", "<u4"),
+    ("writer_pid", "<u4"),
+    ("written_at", "<f8")
+])
+
+# Campos básicos de battery_cache que se publican
+BASIC_FIELDS = ("voltage", "pack_voltage", "current", "soc", "soh",
+                "highest_cell_temp", "lowest_cell_temp")
+
+STATES = ("Desconocido", "Cargando", "Descargando", "Inactivo")
+
+FLAG_VALID = 0x1   # Registro con lecturas
+FLAG_ERROR = 0x2   # Última lectura con error
+FLAG_CELLS = 0x4   # Arrays de celdas con datos
+
+
+def battery_dtype(max_cells: int) -> np.dtype:
+    return np.dtype([
+        ("id", "<i4"),
+        ("flags", "<u4"),
+        ("state", "<i4"),
+        ("reserved", "<i4"),
+        ("last_updated", "<f8"),
+        *[(name, "<f8") for name in BASIC_FIELDS],
+        ("cells_updated_at", "<f8"),
+        ("cell_voltages", "<f8", (max_cells,)),
+        ("cell_temperatures", "<f8", (max_cells,))
+    ])
+
+
+def segment_size(max_batteries: int, max_cells: int) -> int:
+    return HEADER_DTYPE.itemsize + max_batteries * battery_dtype(max_cells).itemsize
+
+
+def _pid_alive(pid: int) -> bool:
+    if sys.platform == "win32":
+        # En Windows el segmento desaparece al cerrarse el último proceso que lo usa:
+        # si existe, su escritor sigue activo (y os.kill terminaría el proceso)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _segment_owner(shm: shared_memory.SharedMemory) -> Optional[int]:
+    """PID del escritor de un segmento existente (None si no tiene esta disposición)."""
+    if shm.size < HEADER_DTYPE.itemsize:
+        return None
+    header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+    try:
+        if int(header["magic"]) != MAGIC or int(header["layout_version"]) != LAYOUT_VERSION:
+            return None
+        return int(header["writer_pid"]) or None
+    finally:
+        del header
+
+
+def _number(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+class _Segment:
+    """Vistas NumPy (sin copia) sobre el bloque compartido."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, max_batteries: int, max_cells: int):
+        self.shm = shm
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        self.batteries = np.ndarray((max_batteries,), dtype=battery_dtype(max_cells),
+                                    buffer=shm.buf, offset=HEADER_DTYPE.itemsize)
+
+    def release(self):
+        # Las vistas deben soltarse antes de cerrar el bloque
+        self.header = None
+        self.batteries = None
+        self.shm.close()
+
+
+class SharedStateWriter:
+    """Escritor (único, en el proceso de adquisición)."""
+
+    def __init__(self, name: str = DEFAULT_SETTINGS["name"],
+                 max_batteries: int = DEFAULT_SETTINGS["max_batteries"],
+                 max_cells: int = DEFAULT_SETTINGS["max_cells"]):
+        self.name = name
+        self.max_batteries = max_batteries
+        self.max_cells = max_cells
+        size = segment_size(max_batteries, max_cells)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            owner = _segment_owner(stale)
+            if (owner is None and sys.platform == "win32") or (
+                    owner is not None and owner != os.getpid() and _pid_alive(owner)):
+                # Otro proceso de adquisición en marcha (p. ej. app.py y serve.py a la vez)
+                if sys.platform != "win32":
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(stale._name, "shared_memory")
+                stale.close()
+                raise RuntimeError(f"El segmento de estado '{name}' está en uso por el proceso "
+                                   f"{owner or 'desconocido'}")
+            # Resto de una ejecución anterior que no se cerró: se reemplaza
+            logger.warning(f"Reemplazando el segmento de estado '{name}' de una ejecución anterior "
+                           f"(proceso {owner or 'desconocido'})")
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._segment = _Segment(shm, max_batteries, max_cells)
+        self._local = np.zeros(max_batteries, dtype=battery_dtype(max_cells))
+        self._lock = threading.Lock()
+
+        header = self._segment.header
+        header["magic"] = MAGIC
+        header["layout_version"] = LAYOUT_VERSION
+        header["max_batteries"] = max_batteries
+        header["max_cells"] = max_cells
+        header["writer_pid"] = os.getpid()
+        atexit.register(self.close)
+        logger.info(f"Segmento de estado '{name}' creado ({size} bytes)")
+
+    def publish(self, batteries: List[Dict[str, Any]], cells: Dict[int, tuple] = None) -> int:
+        """
+        Escribe el estado de la flota.
+
+        Args:
+            batteries: Entradas de battery_cache (copias)
+            cells: battery_id -> (tensiones, temperaturas, updated_at) como arrays
+        Returns:
+            Número de baterías escritas
+        """
+        cells = cells or {}
+        with self._lock:
+            if self._segment is None:
+                return 0
+            local = self._local
+            local.fill(0)
+            count = min(len(batteries), self.max_batteries)
+            if len(batteries) > self.max_batteries:
+                logger.warning(f"Segmento de estado lleno: {len(batteries)} baterías, "
+                               f"capacidad {self.max_batteries}")
+            for slot, battery in enumerate(batteries[:count]):
+                record = local[slot]
+                battery_id = battery.get("id")
+                record["id"] = battery_id
+                record["last_updated"] = battery.get("last_updated", 0.0)
+                record["cell_voltages"] = np.nan
+                record["cell_temperatures"] = np.nan
+                record["cells_updated_at"] = np.nan
+                if "error" in battery:
+                    record["flags"] = FLAG_ERROR
+                    for name in BASIC_FIELDS:
+                        record[name] = np.nan
+                else:
+                    record["flags"] = FLAG_VALID
+                    status = battery.get("status")
+                    record["state"] = STATES.index(status) if status in STATES else 0
+                    for name in BASIC_FIELDS:
+                        record[name] = _number(battery.get(name))
+                if battery_id in cells:
+                    voltages, temperatures, updated_at = cells[battery_id]
+                    width = min(len(voltages), self.max_cells)
+                    record["cell_voltages"][:width] = voltages[:width]
+                    width = min(len(temperatures), self.max_cells)
+                    record["cell_temperatures"][:width] = temperatures[:width]
+                    record["cells_updated_at"] = updated_at
+                    record["flags"] |= FLAG_CELLS
+
+            header = self._segment.header
+            sequence = int(header["sequence"])
+            header["sequence"] = sequence + 1          # Impar: escritura en curso
+            self._segment.batteries[:] = local
+            header["battery_count"] = count
+            header["written_at"] = time.time()
+            header["sequence"] = sequence + 2          # Par: datos coherentes
+            return count
+
+    def close(self):
+        """Cierra y elimina el segmento (al terminar el proceso de adquisición)."""
+        with self._lock:
+            if self._segment is None:
+                return
+            shm = self._segment.shm
+            self._segment.release()
+            self._segment = None
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedStateReader:
+    """Lector sin locks del segmento (cualquier proceso)."""
+
+    def __init__(self, name: str = DEFAULT_SETTINGS["name"]):
+        shm = shared_memory.SharedMemory(name=name)
+        if sys.platform != "win32" and _writer is None:
+            # En POSIX el resource_tracker eliminaría el segmento al salir el lector
+            # (en el proceso del escritor el registro es el del propio escritor)
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        header = np.ndarray((), dtype=HEADER_DTYPE, buffer=shm.buf)
+        if int(header["magic"]) != MAGIC or int(header["layout_version"]) != LAYOUT_VERSION:
+            del header
+            shm.close()
+            raise ValueError(f"El segmento '{name}' no tiene la disposición esperada")
+        self._segment = _Segment(shm, int(header["max_batteries"]), int(header["max_cells"]))
+
+    @property
+    def sequence(self) -> int:
+        return int(self._segment.header["sequence"])
+
+    def stable(self, sequence: int) -> bool:
+        """True si no hubo escrituras desde `sequence` (y esta era par)."""
+        return sequence % 2 == 0 and self.sequence == sequence
+
+    def records(self) -> np.ndarray:
+        """
+        Vista sin copia de los registros escritos. El escritor puede modificarla en
+        cualquier momento: tomar `sequence` antes y comprobar `stable()` después.
+        """
+        return self._segment.batteries[:int(self._segment.header["battery_count"])]
+
+    def read(self, retries: int = 100) -> Dict[str, Any]:
+        """Copia coherente de la cabecera y los registros."""
+        for _ in range(retries):
+            sequence = self.sequence
+            if sequence % 2:
+                time.sleep(0)
+                continue
+            header = self._segment.header.copy()
+            records = self.records().copy()
+            if self.sequence == sequence:
+                return {
+                    "sequence": sequence,
+                    "written_at": float(header["written_at"]),
+                    "batteries": records
+                }
+        raise TimeoutError("No se obtuvo una lectura coherente del segmento de estado")
+
+    def close(self):
+        self._segment.release()
+
+
+def records_to_dicts(records: np.ndarray) -> List[Dict[str, Any]]:
+    """Registros del segmento con el formato de battery_cache (más celdas)."""
+    result = []
+    for record in records:
+        flags = int(record["flags"])
+        entry = {"id": int(record["id"]), "last_updated": float(record["last_updated"])}
+        if flags & FLAG_ERROR:
+            entry["error"] = True
+        else:
+            entry["status"] = STATES[int(record["state"])]
+            for name in BASIC_FIELDS:
+                value = float(record[name])
+                entry[name] = None if value != value else value
+        if flags & FLAG_CELLS:
+            entry["cell_voltages"] = [None if v != v else v for v in record["cell_voltages"].tolist()]
+            entry["cell_temperatures"] = [None if t != t else t for t in record["cell_temperatures"].tolist()]
+            entry["cells_updated_at"] = float(record["cells_updated_at"])
+        result.append(entry)
+    return result
+
+
+_writer = None
+_writer_loaded = False
+_writer_lock = threading.Lock()
+
+
+def get_shared_state_writer() -> Optional[SharedStateWriter]:
+    """Escritor global (None si está deshabilitado o no se pudo crear el segmento)."""
+    global _writer, _writer_loaded
+    if _writer_loaded:
+        return _writer
+    with _writer_lock:
+        if not _writer_loaded:
+            settings = dict(DEFAULT_SETTINGS)
+            try:
+                from modbus_app import config_manager
+                settings.update(config_manager.load_config().get("shared_state", {}))
+            except Exception as e:
+                logger.warning(f"No se pudo leer la configuración del segmento de estado: {str(e)}")
+            if settings["enabled"]:
+                try:
+                    _writer = SharedStateWriter(settings["name"], settings["max_batteries"],
+                                                settings["max_cells"])
+                except Exception as e:
+                    logger.error(f"No se pudo crear el segmento de estado: {str(e)}")
+            _writer_loaded = True
+        return _writer
+
+
+if __name__ == "__main__":
+    import json
+    name = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SETTINGS["name"]
+    reader = SharedStateReader(name)
+    state = reader.read()
+    print(json.dumps({"sequence": state["sequence"], "written_at": state["written_at"],
+                      "batteries": records_to_dicts(state["batteries"])}, indent=2))
+    reader.close()
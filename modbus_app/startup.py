@@ -0,0 +1,218 @@
+# modbus_app/startup.py
+"""
+Perfil de arranque y calentamiento en segundo plano.
+
+El arranque se mide por fases de reloj (`phase`): importar app.py, configurar el
+logging, registrar rutas... Las partes pesadas que no hacen falta para servir la
+página y el estado en caché (pila serie, SQLite, subsistema de historial, NumPy y
+analítica) se cargan después de arrancar el servidor, en un hilo (`start_warm_up`),
+y también quedan medidas como fases.
+
+Informe de importaciones al estilo `-X importtime`:
+
+    python -m modbus_app.startup [--top 25]
+
+ejecuta `python -X importtime -c "import app"` en un proceso aparte y muestra los
+módulos más costosos (tiempo propio y acumulado) junto con las fases de arranque.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+logger = logging.getLogger('modbus_app.startup')
+
+# Referencia: primera importación de este módulo (lo primero que hace app.py)
+_T0 = time.perf_counter()
+_phases = []
+_phases_lock = threading.Lock()
+_warm_up = {"state": "idle", "started_at": None, "finished_at": None, "errors": {}}
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def elapsed_ms() -> float:
+    """Milisegundos desde el inicio del arranque."""
+    return (time.perf_counter() - _T0) * 1000
+
+
+@contextmanager
+def phase(name: str):
+    """Mide una fase de arranque."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        with _phases_lock:
+            _phases.append({
+                "name": name,
+                "start_ms": round((start - _T0) * 1000, 2),
+                "duration_ms": round((end - start) * 1000, 2),
+                "thread": threading.current_thread().name
+            })
+
+
+def mark(name: str):
+    """Registra un hito instantáneo (p. ej. 'http_ready')."""
+    with _phases_lock:
+        _phases.append({"name": name, "start_ms": round(elapsed_ms(), 2), "duration_ms": 0.0,
+                        "thread": threading.current_thread().name})
+
+
+def get_startup_report() -> Dict[str, Any]:
+    with _phases_lock:
+        phases = list(_phases)
+    return {
+        "elapsed_ms": round(elapsed_ms(), 2),
+        "phases": phases,
+        "warm_up": dict(_warm_up, errors=dict(_warm_up["errors"]))
+    }
+
+
+# ==================== CALENTAMIENTO ====================
+
+def _warm_up_steps(monitor) -> List[tuple]:
+    def serial_stack():
+        from modbus_app import client, operations, battery_initializer  # noqa: F401
+
+    def history_db():
+        from modbus_app.history.database import get_db
+        get_db()
+
+    def history_retention():
+        from modbus_app.history.retention import start_retention_scheduler
+        start_retention_scheduler()
+
+    def analytics():
+        from modbus_app.cell_analytics import get_cell_analytics
+        get_cell_analytics()
+        if monitor is not None:
+            monitor.recent_series
+
+    def alarms():
+        from modbus_app.alarms import get_alarm_engine
+        get_alarm_engine()
+
+    def energy():
+        from modbus_app.energy_estimator import get_energy_estimator
+        get_energy_estimator()
+
+    return [("warm.serial_stack", serial_stack),
+            ("warm.history_db", history_db),
+            ("warm.history_retention", history_retention),
+            ("warm.analytics", analytics),
+            ("warm.alarms", alarms),
+            ("warm.energy_estimator", energy)]
+
+
+def _run_warm_up(monitor):
+    _warm_up["state"] = "running"
+    _warm_up["started_at"] = round(elapsed_ms(), 2)
+    for name, step in _warm_up_steps(monitor):
+        try:
+            with phase(name):
+                step()
+        except Exception as e:
+            _warm_up["errors"][name] = str(e)
+            logger.error(f"Error en el calentamiento ({name}): {str(e)}")
+    _warm_up["finished_at"] = round(elapsed_ms(), 2)
+    _warm_up["state"] = "done"
+    logger.info(f"Calentamiento completado en {_warm_up['finished_at'] - _warm_up['started_at']:.0f} ms")
+
+
+def start_warm_up(monitor=None) -> bool:
+    """Carga en segundo plano los subsistemas diferidos (una sola vez)."""
+    with _phases_lock:
+        if _warm_up["state"] != "idle":
+            return False
+        _warm_up["state"] = "starting"
+    threading.Thread(target=_run_warm_up, args=(monitor,), daemon=True, name="WarmUp").start()
+    return True
+
+
+# ==================== INFORME DE IMPORTACIONES ====================
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(text: str) -> List[Dict[str, Any]]:
+    """Entradas de `-X importtime` (tiempos en ms y profundidad de anidamiento)."""
+    entries = []
+    for line in text.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append({
+                "module": module,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(indent) - 1) // 2
+            })
+    return entries
+
+
+def profile_imports(target: str = "app") -> Dict[str, Any]:
+    """Importa `target` en un proceso nuevo con -X importtime y devuelve el perfil."""
+    import subprocess
+    code = (f"import {target}\n"
+            "import json, sys\n"
+            "from modbus_app.startup import get_startup_report\n"
+            "sys.__stdout__.write(json.dumps(get_startup_report()))\n")
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                             cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=120)
+    wall_ms = (time.perf_counter() - started) * 1000
+    report = {}
+    lines = process.stdout.strip().splitlines()
+    if lines:
+        try:
+            report = json.loads(lines[-1])
+        except ValueError:
+            pass
+    return {
+        "returncode": process.returncode,
+        "process_wall_ms": round(wall_ms, 1),
+        "imports": parse_importtime(process.stderr),
+        "startup": report
+    }
+
+
+def _print_profile(profile: Dict[str, Any], top: int):
+    imports = profile["imports"]
+    print(f"Proceso completo: {profile['process_wall_ms']:.0f} ms (código de salida {profile['returncode']})")
+    if imports:
+        total = max(entry["cumulative_ms"] for entry in imports)
+        print(f"Importaciones: {len(imports)} módulos, {total:.1f} ms la más larga\n")
+        print(f"{'propio ms':>10} | {'acum. ms':>10} | módulo")
+        for entry in sorted(imports, key=lambda e: e["self_ms"], reverse=True)[:top]:
+            print(f"{entry['self_ms']:10.1f} | {entry['cumulative_ms']:10.1f} | {entry['module']}")
+        print(f"\n{'acum. ms':>10} | módulo (raíces de importación)")
+        roots = [entry for entry in imports if entry["depth"] == 0]
+        for entry in sorted(roots, key=lambda e: e["cumulative_ms"], reverse=True)[:top]:
+            print(f"{entry['cumulative_ms']:10.1f} | {entry['module']}")
+    phases = profile["startup"].get("phases", [])
+    if phases:
+        print(f"\n{'inicio ms':>10} | {'duración ms':>11} | fase")
+        for entry in phases:
+            print(f"{entry['start_ms']:10.1f} | {entry['duration_ms']:11.1f} | {entry['name']}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Perfil de arranque de la aplicación")
+    parser.add_argument("--top", type=int, default=25, help="Módulos a mostrar")
+    parser.add_argument("--target", default="app", help="Módulo a importar")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+    result = profile_imports(args.target)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_profile(result, args.top)
@@ -0,0 +1,268 @@
+# modbus_app/tracing.py
+"""
+Trazas de latencia ligeras: desde la petición HTTP hasta la trama serial.
+
+Cada petición HTTP abre una traza raíz; las capas inferiores (operaciones, espera
+del bus, send_command, parseo, base de datos, codificación JSON) añaden spans hijos
+a través de un ContextVar, sin pasar objetos entre funciones. Fuera de una traza
+(p.ej. el hilo de polling) `span()` solo consulta el ContextVar y no registra nada.
+
+Política de muestreo (al terminar la traza, así no se pierden las lentas):
+- Se conservan todas las trazas que superan `slow_threshold_ms`.
+- Del resto se conserva una fracción `sample_rate`.
+
+Las trazas conservadas se guardan en un buffer circular en memoria y se exponen
+en /api/debug/traces con un desglose tipo flame graph.
+"""
+
+import random
+import threading
+import time
+import functools
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+_current_span: ContextVar = ContextVar('current_span', default=None)
+
+DEFAULT_SAMPLE_RATE = 0.05
+DEFAULT_SLOW_THRESHOLD_MS = 500.0
+DEFAULT_BUFFER_SIZE = 100
+
+
+class Span:
+    """Intervalo de tiempo con nombre dentro de una traza."""
+
+    __slots__ = ('name', 'start', 'end', 'attrs', 'children')
+
+    def __init__(self, name: str, attrs: Optional[dict] = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+        self.children = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        duration = self.duration
+        child_time = sum(child.duration for child in self.children)
+        node = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            "self_ms": round(max(duration - child_time, 0.0) * 1000, 3),
+            "children": [child.to_dict(origin) for child in self.children]
+        }
+        if self.attrs:
+            node["attrs"] = self.attrs
+        return node
+
+
+class _SpanContext:
+    """Context manager de un span hijo (no hace nada si no hay traza activa)."""
+
+    __slots__ = ('_name', '_attrs', '_span', '_token')
+
+    def __init__(self, name: str, attrs: Optional[dict]):
+        self._name = name
+        self._attrs = attrs
+        self._span = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is not None:
+            self._span = Span(self._name, self._attrs)
+            parent.children.append(self._span)
+            self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self._span
+        if span is not None:
+            span.end = time.perf_counter()
+            if exc_type is not None:
+                span.attrs = dict(span.attrs or {}, error=exc_type.__name__)
+            _current_span.reset(self._token)
+        return False
+
+
+def span(name: str, **attrs) -> _SpanContext:
+    """Abre un span hijo del span activo: `with span("db.query"): ...`"""
+    return _SpanContext(name, attrs or None)
+
+
+def traced(name: str = None):
+    """Decorador que envuelve la función en un span."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with _SpanContext(span_name, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attrs):
+    """Añade atributos al span activo (si existe)."""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs = dict(current.attrs or {}, **attrs)
+
+
+class Tracer:
+    """Inicia/termina trazas raíz, aplica el muestreo y guarda las conservadas."""
+
+    def __init__(self, sample_rate: float = DEFAULT_SAMPLE_RATE,
+                 slow_threshold_ms: float = DEFAULT_SLOW_THRESHOLD_MS,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, enabled: bool = True):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        self._traces = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.started = 0
+        self.kept = 0
+
+    def configure(self, config: dict):
+        """Aplica la sección `tracing` de config.json."""
+        self.enabled = config.get("enabled", self.enabled)
+        self.sample_rate = float(config.get("sample_rate", self.sample_rate))
+        self.slow_threshold_ms = float(config.get("slow_threshold_ms", self.slow_threshold_ms))
+        buffer_size = int(config.get("buffer_size", self._traces.maxlen))
+        with self._lock:
+            if buffer_size != self._traces.maxlen:
+                self._traces = deque(self._traces, maxlen=buffer_size)
+
+    def start_trace(self, name: str, **attrs):
+        """Abre la traza raíz en el contexto actual. Devuelve un token para finish_trace()."""
+        if not self.enabled:
+            return None
+        root = Span(name, attrs or None)
+        self.started += 1
+        return root, _current_span.set(root)
+
+    def finish_trace(self, token, **attrs):
+        """Cierra la traza raíz y decide si se conserva."""
+        if token is None:
+            return
+        root, context_token = token
+        root.end = time.perf_counter()
+        if attrs:
+            root.attrs = dict(root.attrs or {}, **attrs)
+        try:
+            _current_span.reset(context_token)
+        except ValueError:
+            # Cerrada desde otro contexto (p.ej. teardown en otro hilo)
+            _current_span.set(None)
+
+        duration_ms = root.duration * 1000
+        slow = duration_ms >= self.slow_threshold_ms
+        if not slow and random.random() >= self.sample_rate:
+            return
+
+        with self._lock:
+            self._next_id += 1
+            self.kept += 1
+            self._traces.append({
+                "id": self._next_id,
+                "timestamp": time.time() - root.duration,
+                "duration_ms": round(duration_ms, 3),
+                "slow": slow,
+                "root": root
+            })
+
+    def get_traces(self, limit: int = 20, min_duration_ms: float = 0.0,
+                   name_filter: str = None) -> List[Dict[str, Any]]:
+        """Trazas conservadas más recientes con su árbol, desglose y pilas plegadas."""
+        with self._lock:
+            traces = list(self._traces)
+
+        result = []
+        for trace in reversed(traces):
+            if trace["duration_ms"] < min_duration_ms:
+                continue
+            if name_filter and name_filter not in trace["root"].name:
+                continue
+            root = trace["root"]
+            result.append({
+                "id": trace["id"],
+                "name": root.name,
+                "timestamp": trace["timestamp"],
+                "duration_ms": trace["duration_ms"],
+                "slow": trace["slow"],
+                "breakdown": breakdown(root),
+                "folded": folded_stacks(root),
+                "tree": root.to_dict(root.start)
+            })
+            if len(result) >= limit:
+                break
+        return result
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "buffer_size": self._traces.maxlen,
+            "buffered": len(self._traces),
+            "started": self.started,
+            "kept": self.kept
+        }
+
+
+def _walk(node: Span, path: tuple, visit):
+    path = path + (node.name,)
+    child_time = sum(child.duration for child in node.children)
+    visit(node, path, max(node.duration - child_time, 0.0))
+    for child in node.children:
+        _walk(child, path, visit)
+
+
+def breakdown(root: Span) -> List[Dict[str, Any]]:
+    """Tiempo propio (sin hijos) acumulado por nombre de span, de mayor a menor."""
+    totals = {}
+
+    def visit(node, path, self_time):
+        entry = totals.setdefault(node.name, [0.0, 0])
+        entry[0] += self_time
+        entry[1] += 1
+
+    _walk(root, (), visit)
+    total = root.duration or 1e-9
+    rows = [{
+        "name": name,
+        "self_ms": round(self_time * 1000, 3),
+        "percent": round(self_time / total * 100, 1),
+        "calls": calls
+    } for name, (self_time, calls) in totals.items()]
+    rows.sort(key=lambda row: row["self_ms"], reverse=True)
+    return rows
+
+
+def folded_stacks(root: Span) -> List[str]:
+    """Pilas en formato plegado (`a;b;c <microsegundos>`) para herramientas de flame graph."""
+    stacks = {}
+
+    def visit(node, path, self_time):
+        key = ';'.join(path)
+        stacks[key] = stacks.get(key, 0) + int(self_time * 1_000_000)
+
+    _walk(root, (), visit)
+    return [f"{stack} {value}" for stack, value in stacks.items() if value > 0]
+
+
+# Instancia global
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Devuelve el tracer global."""
+    return _tracer
@@ -8,4 +8,7 @@ import sys
 if __name__ == "__main__":
     import app  # Importa app.py desde el directorio raíz
     print("Iniciando servidor Modbus RTU...")
+    # Subsistemas diferidos en segundo plano (solo en el proceso que sirve, no en el del recargador)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        app.start_warm_up(app.battery_monitor)
     app.app.run(host='0.0.0.0', port=5000, debug=True)  # app.app hace referencia a la instancia Flask
\ No newline at end of file
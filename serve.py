@@ -0,0 +1,46 @@
+# serve.py
+"""
+Servidor de producción para la aplicación Modbus RTU.
+
+A diferencia de `python app.py` (servidor de desarrollo de Werkzeug con depuración y
+recargador, que arranca un segundo proceso con su propio BatteryMonitor), aquí un
+único proceso es propietario del puerto serie y los workers HTTP, si se configuran,
+le consultan por un canal local. Ver modbus_app/serving.py.
+
+Uso:
+    python serve.py [--host 0.0.0.0] [--port 5000] [--threads 8] [--workers 1]
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de producción Modbus RTU")
+    parser.add_argument("--host", help="Dirección de escucha (config.json: server.host)")
+    parser.add_argument("--port", type=int, help="Puerto HTTP (server.port)")
+    parser.add_argument("--threads", type=int, help="Hilos por proceso HTTP (server.threads)")
+    parser.add_argument("--workers", type=int, help="Procesos HTTP; 1 = proceso único (server.workers)")
+    args = parser.parse_args()
+    overrides = {name: value for name, value in vars(args).items() if value is not None}
+
+    # Solo este proceso importa la app: BatteryMonitor y cliente Modbus viven aquí
+    from app import app
+    from modbus_app.logger_config import log_to_cmd
+    from modbus_app.routes.battery_routes import battery_monitor
+    from modbus_app.serving import serve
+
+    from modbus_app.startup import start_warm_up
+
+    # Pila serie, SQLite, historial (con la retención programada) y analítica en
+    # segundo plano mientras el servidor ya atiende
+    start_warm_up(battery_monitor)
+
+    log_to_cmd("Iniciando servidor de producción", "INFO", "APP")
+    try:
+        serve(app, battery_monitor, overrides)
+    finally:
+        if battery_monitor.polling_active:
+            battery_monitor.stop_polling()
+
+
+if __name__ == "__main__":
+    main()